@@ -0,0 +1,212 @@
+"""
+Runs the skia-builder benchmark suite against a synthetic workspace.
+
+Usage:
+    python -m benchmarks.run [--scenario NAME ...] [--repeat N] [--scale X]
+                             [--workspace DIR] [--compare RESULTS.json]
+
+Each repetition of each scenario runs in a fresh worker process, reporting wall time, CPU time
+(of the worker and its children, e.g. the fake gn/ninja) and peak RSS. Results are written to
+`benchmarks/results/<commit>.json`.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.tree import create_workspace
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+WORKSPACE_STAMP = ".benchmark_workspace.json"
+METRICS = ("wall", "cpu", "peak_rss_kib", "peak_child_rss_kib")
+
+
+def _cpu_time(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_worker(name, setup_only):
+    """Runs one scenario phase in this process and prints its measurements as JSON."""
+    from benchmarks.scenarios import get_scenario
+
+    setup, bench = get_scenario(name)
+    if setup_only:
+        setup()
+        return
+
+    cpu_started = _cpu_time(resource.RUSAGE_SELF) + _cpu_time(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    bench()
+    wall = time.perf_counter() - started
+    cpu = _cpu_time(resource.RUSAGE_SELF) + _cpu_time(resource.RUSAGE_CHILDREN) - cpu_started
+
+    measurement = {
+        "wall": wall,
+        "cpu": cpu,
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "peak_child_rss_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    }
+    print(json.dumps(measurement))
+
+
+def _spawn_worker(workspace, name, setup_only=False):
+    command = [sys.executable, "-m", "benchmarks.run", "--worker", name]
+    if setup_only:
+        command.append("--setup-only")
+    python_path = os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")]))
+    env = {**os.environ, "PYTHONPATH": python_path}
+    process = subprocess.run(command, cwd=workspace, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        sys.exit(
+            f"Scenario {name} failed ({'setup' if setup_only else 'run'}):\n"
+            f"{process.stdout}{process.stderr}"
+        )
+    return None if setup_only else json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def prepare_workspace(workspace, scale):
+    """Generates the synthetic workspace, unless `workspace` already holds one of this scale."""
+    stamp_path = os.path.join(workspace, WORKSPACE_STAMP)
+    try:
+        with open(stamp_path) as f:
+            if json.load(f) == {"scale": scale}:
+                return
+    except (OSError, ValueError):
+        pass
+
+    print(f"Generating synthetic workspace in {workspace} (scale {scale})...")
+    shutil.rmtree(workspace, ignore_errors=True)
+    create_workspace(workspace, scale=scale)
+    with open(stamp_path, "w") as f:
+        json.dump({"scale": scale}, f)
+
+
+def run_scenarios(workspace, names, repeat):
+    results = {}
+    for name in names:
+        samples = []
+        for _ in range(repeat):
+            _spawn_worker(workspace, name, setup_only=True)
+            samples.append(_spawn_worker(workspace, name))
+
+        results[name] = {
+            metric: {
+                "median": statistics.median(sample[metric] for sample in samples),
+                "min": min(sample[metric] for sample in samples),
+            }
+            for metric in METRICS
+        }
+        results[name]["samples"] = samples
+        summary = results[name]
+        print(
+            f"{name:<28} wall {summary['wall']['median']:8.3f}s  "
+            f"cpu {summary['cpu']['median']:8.3f}s  "
+            f"rss {summary['peak_rss_kib']['median'] / 1024:7.1f}MiB  "
+            f"child rss {summary['peak_child_rss_kib']['median'] / 1024:7.1f}MiB"
+        )
+    return results
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    print(f"\nComparison against {baseline_path} ({baseline.get('commit')}), median values:")
+    for name, summary in results.items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            print(f"{name:<28} (not in baseline)")
+            continue
+
+        changes = []
+        for metric in METRICS:
+            before, after = previous[metric]["median"], summary[metric]["median"]
+            change = (after - before) / before * 100 if before else 0.0
+            changes.append(f"{metric} {change:+6.1f}%")
+        print(f"{name:<28} " + "  ".join(changes))
+
+
+def main():
+    from benchmarks.scenarios import SCENARIOS
+
+    parser = argparse.ArgumentParser(description="Benchmark skia-builder's hot paths.")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="Scenario to run (can be repeated). Defaults to all of them.",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of each scenario.")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Size of the synthetic Skia tree (1.0 ~ m141)."
+    )
+    parser.add_argument(
+        "--workspace",
+        help="Directory of the synthetic workspace, kept and reused across runs. "
+        "A temporary one is used by default.",
+    )
+    parser.add_argument("--compare", metavar="RESULTS", help="Results file to compare against.")
+    parser.add_argument("--output", help="Results file path (default: results/<commit>.json).")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--setup-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.setup_only)
+        return
+
+    workspace = args.workspace or tempfile.mkdtemp(prefix="skia-builder-bench-")
+    try:
+        prepare_workspace(os.path.abspath(workspace), args.scale)
+        results = run_scenarios(
+            os.path.abspath(workspace), args.scenario or list(SCENARIOS), args.repeat
+        )
+    finally:
+        if not args.workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    report = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "scenarios": results,
+    }
+
+    output_path = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
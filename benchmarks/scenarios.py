@@ -0,0 +1,122 @@
+"""
+Benchmark scenarios.
+
+Each scenario has a `setup` and a `run` function, both called with the workspace path as the
+current directory. They run in separate worker processes, so that only `run` is measured and
+its peak memory is not inflated by the setup.
+"""
+
+import os
+import shutil
+import sys
+
+from skia_builder.config import get_build_args, parse_override_build_args
+from skia_builder.platforms.linux import LinuxPlatformManager
+from skia_builder.utils import archive_build_output, log_sink, run_command, store_includes
+
+# Lines printed by the fake ninja for the `run_command` throughput scenario
+RUN_COMMAND_EDGES = 50000
+# Number of arguments of the base and override strings for `parse_override_build_args`
+OVERRIDE_ARG_COUNT = 2000
+
+BENCH_OUT_DIR = os.path.join("skia", "out", "bench")
+BENCH_OUTPUT_DIR = os.path.join("output", "bench")
+
+
+def _discard_logs():
+    """Drops log output, so that the terminal is not part of what is measured."""
+    log_sink.set(lambda message: None)
+
+
+def _remove(*paths):
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _run_fake_ninja(out_dir, *extra_args):
+    os.makedirs(out_dir, exist_ok=True)
+    run_command([os.path.join("depot_tools", "ninja"), "-C", out_dir, *extra_args], "Fake ninja")
+
+
+def setup_run_command():
+    os.makedirs(BENCH_OUT_DIR, exist_ok=True)
+
+
+def bench_run_command():
+    _discard_logs()
+    os.environ["FAKE_NINJA_EDGES"] = str(RUN_COMMAND_EDGES)
+    os.environ["FAKE_NINJA_LIBRARY_SIZE"] = "0"
+    _run_fake_ninja(BENCH_OUT_DIR, "--force")
+
+
+def setup_store_includes():
+    _remove(BENCH_OUTPUT_DIR)
+
+
+def bench_store_includes():
+    _discard_logs()
+    store_includes(os.path.abspath("skia"), output_dir=BENCH_OUTPUT_DIR)
+
+
+def setup_archive_build_output():
+    _discard_logs()
+    _remove(BENCH_OUTPUT_DIR)
+    if not os.path.exists(os.path.join(BENCH_OUT_DIR, "libskia.a")):
+        _run_fake_ninja(BENCH_OUT_DIR, "--force")
+    store_includes(os.path.abspath("skia"), output_dir=BENCH_OUTPUT_DIR)
+
+
+def bench_archive_build_output():
+    _discard_logs()
+    archive_build_output(os.path.abspath(BENCH_OUT_DIR), "linux", output_dir=BENCH_OUTPUT_DIR)
+
+
+def setup_parse_override_build_args():
+    pass
+
+
+def bench_parse_override_build_args():
+    base_args = " ".join(f'skia_fake_arg_{i}="value{i}"' for i in range(OVERRIDE_ARG_COUNT))
+    # Override every other argument, last ones first (the worst case of the linear lookup)
+    override_args = " ".join(
+        f"skia_fake_arg_{i}='override{i}'" for i in range(OVERRIDE_ARG_COUNT - 1, 0, -2)
+    )
+    parse_override_build_args(base_args, override_args)
+    parse_override_build_args(get_build_args("linux-x64"), "is_debug=true is_official_build=false")
+
+
+def setup_build_cold():
+    _remove(os.path.join("skia", "out", "linux-x64"), os.path.join("output", "linux-x64"))
+
+
+def bench_build_cold():
+    _discard_logs()
+    LinuxPlatformManager._build("x64", archive_output=True, overwrite_output=True)
+
+
+def setup_build_warm():
+    _discard_logs()
+    if not os.path.exists(os.path.join("skia", "out", "linux-x64", "libskia.a")):
+        LinuxPlatformManager._build("x64", overwrite_output=True)
+
+
+def bench_build_warm():
+    _discard_logs()
+    LinuxPlatformManager._build("x64", overwrite_output=True)
+
+
+SCENARIOS = {
+    "run_command": (setup_run_command, bench_run_command),
+    "store_includes": (setup_store_includes, bench_store_includes),
+    "archive_build_output": (setup_archive_build_output, bench_archive_build_output),
+    "parse_override_build_args": (setup_parse_override_build_args, bench_parse_override_build_args),
+    "build_cold": (setup_build_cold, bench_build_cold),
+    "build_warm": (setup_build_warm, bench_build_warm),
+}
+
+
+def get_scenario(name):
+    try:
+        return SCENARIOS[name]
+    except KeyError:
+        sys.exit(f"Unknown scenario: {name}. Available: {', '.join(SCENARIOS)}")
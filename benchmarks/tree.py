@@ -0,0 +1,68 @@
+"""Generates synthetic workspaces shaped like a prepared Skia checkout."""
+
+import os
+import random
+import shutil
+import stat
+
+FAKE_TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_tools")
+
+# Approximate file counts of a Skia milestone checkout, per directory copied by `store_includes`
+TREE_SHAPE = {
+    "include": 700,
+    "src": 4200,
+    "modules": 2600,
+}
+# Median and spread (log-normal sigma) of source file sizes in bytes
+MEDIAN_FILE_SIZE = 12 * 1024
+FILE_SIZE_SIGMA = 1.0
+# Fan-out of the generated directory hierarchy
+FILES_PER_DIR = 40
+SUBDIRS_PER_DIR = 6
+
+
+def _write_tree(root, file_count, rng, extensions):
+    filler = ("// synthetic skia source\n" * 4096).encode("ascii")
+    dirs = [root]
+    written = 0
+    while written < file_count:
+        directory = dirs.pop(0)
+        os.makedirs(directory, exist_ok=True)
+        for _ in range(min(FILES_PER_DIR, file_count - written)):
+            size = min(len(filler), int(rng.lognormvariate(0, FILE_SIZE_SIGMA) * MEDIAN_FILE_SIZE))
+            name = f"SkSynthetic{written}{rng.choice(extensions)}"
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(filler[:size])
+            written += 1
+        dirs.extend(os.path.join(directory, f"dir{i}") for i in range(SUBDIRS_PER_DIR))
+
+
+def _install_tool(name, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.copy(os.path.join(FAKE_TOOLS_DIR, name), destination)
+    os.chmod(destination, os.stat(destination).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def create_workspace(root, scale=1.0, seed=0):
+    """
+    Creates a workspace at `root` with a synthetic `skia/` tree and stub `gn`/`ninja` executables
+    at the locations skia-builder expects them.
+
+    Args:
+        root (str): Workspace directory, created if missing.
+        scale (float): Multiplier applied to the file counts of `TREE_SHAPE`.
+        seed (int): Seed making the generated tree reproducible.
+    """
+    rng = random.Random(seed)
+    skia_path = os.path.join(root, "skia")
+
+    for folder, count in TREE_SHAPE.items():
+        extensions = [".h"] if folder == "include" else [".cpp", ".cpp", ".h", ".gn"]
+        _write_tree(os.path.join(skia_path, folder), max(1, int(count * scale)), rng, extensions)
+
+    with open(os.path.join(skia_path, "LICENSE"), "w") as f:
+        f.write("Synthetic license\n")
+
+    _install_tool("gn", os.path.join(skia_path, "bin", "gn"))
+    _install_tool("ninja", os.path.join(root, "depot_tools", "ninja"))
+    return root
@@ -0,0 +1,372 @@
+"""
+Build agent of a coordinator (`skia-builder agent`, see coordinator.py).
+
+An agent runs in a prepared workspace (see `setup-env`), registers with the coordinator with the
+targets and milestones that workspace can build, and then builds the jobs it leases one at a
+time: it checks out the job's Skia commit, checks that it resolves the same GN arguments as the
+coordinator, builds and archives the target like `build --archive` and uploads the archives.
+Heartbeats are sent while building, so that the coordinator hands the job to another agent if
+this one goes away.
+"""
+
+import asyncio
+import collections
+import json
+import os
+import re
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from skia_builder.config import AGENT_POLL_INTERVAL, AGENT_TIMEOUT, ANDROID_NDK_DIR
+from skia_builder.coordinator import resolve_job_args
+from skia_builder.errors import ClusterError, SkiaBuilderError
+from skia_builder.manifest import hash_file
+from skia_builder.platforms import PLATFORM_MANAGERS
+from skia_builder.platforms.common import SubPlatform
+from skia_builder.utils import Logger, log_sink, run_command
+from skia_builder.versions import ANDROID_NDK, SKIA_VERSION
+from skia_builder.workspace import (
+    SKIA_DIR,
+    WORKTREES_DIR,
+    get_skia_path,
+    get_skia_version,
+    use_skia_version,
+)
+
+# Lines of the build log sent to the coordinator when a job fails
+LOG_TAIL_LINES = 20
+REQUEST_TIMEOUT = 60
+
+
+def get_buildable_targets(host_platform):
+    """
+    Returns the targets the workspace can build: the ones of the platforms of this host, except
+    the cross-compiled ones without a sysroot and the Android ones without the NDK.
+    """
+    targets = []
+    for manager in PLATFORM_MANAGERS.values():
+        if manager.HOST_PLATFORM is None or manager.HOST_PLATFORM.value != host_platform:
+            continue
+        if manager.TARGET_PLATFORM == SubPlatform.ANDROID and not os.path.isdir(
+            os.path.join(ANDROID_NDK_DIR, ANDROID_NDK)
+        ):
+            continue
+        for target_cpu in manager.SUPPORTED_ARCHITECTURES:
+            try:
+                manager.get_sysroot(target_cpu)
+            except SkiaBuilderError:
+                continue
+            targets.append(manager.get_build_target(target_cpu))
+    return targets
+
+
+def get_skia_versions():
+    """Returns the milestones set up in the workspace."""
+    versions = [SKIA_VERSION] if os.path.isdir(SKIA_DIR) else []
+    try:
+        names = sorted(os.listdir(WORKTREES_DIR))
+    except OSError:
+        names = []
+    versions.extend(
+        name
+        for name in names
+        if re.fullmatch(r"m\d+", name) and os.path.isdir(os.path.join(WORKTREES_DIR, name))
+    )
+    return versions
+
+
+class CoordinatorClient:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def request(self, method, path, payload=None, data=None, headers=None):
+        """
+        Sends a request to the coordinator.
+
+        Raises:
+            OSError: If the coordinator can't be reached.
+
+        Returns:
+            tuple[int, dict]: The HTTP status, and the JSON body (None if empty).
+        """
+        if payload is not None:
+            data = json.dumps(payload).encode("utf-8")
+            headers = {**(headers or {}), "Content-Type": "application/json"}
+        request = urllib.request.Request(
+            f"{self.url}{path}", data=data, headers=headers or {}, method=method
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+        try:
+            return status, json.loads(body) if body else None
+        except ValueError:
+            return status, {"error": body.decode("utf-8", "replace")}
+
+    def upload(self, job, path):
+        """
+        Uploads an artifact of a leased job.
+
+        Raises:
+            ClusterError: If the coordinator rejects the upload.
+            OSError: If the coordinator can't be reached.
+        """
+        name = os.path.basename(path)
+        with open(path, "rb") as f:
+            status, body = self.request(
+                "PUT",
+                f"/jobs/{job['id']}/artifacts/{name}",
+                data=f,
+                headers={
+                    "Content-Length": str(os.path.getsize(path)),
+                    "Content-Type": "application/octet-stream",
+                    "X-Lease": job["lease"],
+                    "X-Content-SHA256": hash_file(path),
+                },
+            )
+        if status != 200:
+            raise ClusterError(f"Upload of {name} rejected: {(body or {}).get('error', status)}")
+
+
+def _checkout(commit, host_platform):
+    """Checks out `commit` in the selected checkout, fetching it first if it is unknown."""
+    skia_path = get_skia_path()
+    if not os.path.isdir(skia_path):
+        raise ClusterError(
+            f"Skia {get_skia_version()} is not set up in this workspace. "
+            f"Run `skia-builder setup-env --skia-version {get_skia_version()}` first."
+        )
+    head = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=skia_path, capture_output=True, text=True
+    ).stdout.strip()
+    if head == commit:
+        return
+
+    main_skia_path = os.path.join(os.getcwd(), SKIA_DIR)
+    known = subprocess.run(
+        ["git", "cat-file", "-e", f"{commit}^{{commit}}"],
+        cwd=main_skia_path,
+        capture_output=True,
+    )
+    if known.returncode != 0:
+        run_command(["git", "fetch", "origin"], "Fetching Skia Repository", cwd=main_skia_path)
+    PLATFORM_MANAGERS[host_platform].checkout_revision(commit)
+
+
+def _build_job(job, host_platform):
+    """
+    Builds and archives the target of a job in this workspace.
+
+    Raises:
+        ClusterError: If the job can't be built in this workspace, or its GN arguments resolve
+            differently than on the coordinator.
+        SkiaBuilderError: If the build fails.
+
+    Returns:
+        BuildResult: The result of the build.
+    """
+    manager = PLATFORM_MANAGERS.get(job["platform"])
+    if manager is None:
+        raise ClusterError(f"Unsupported target platform: {job['platform']}")
+
+    with use_skia_version(job["skia_version"]):
+        build_args = resolve_job_args(
+            manager,
+            job["target_cpu"],
+            job["override_build_args"],
+            job["profile"],
+            job["x86_64_level"],
+            job["debug_symbols"],
+        )
+        if build_args != job["build_args"]:
+            raise ClusterError(
+                "The GN arguments resolved by this agent differ from the coordinator's (are they "
+                f"running the same skia-builder version?)\n  coordinator: {job['build_args']}\n"
+                f"  agent: {build_args}"
+            )
+        _checkout(job["skia_commit"], host_platform)
+        return asyncio.run(
+            manager.build_async(
+                job["target_cpu"],
+                None,
+                job["override_build_args"],
+                archive_output=True,
+                overwrite_output=True,
+                profile=job["profile"],
+                x86_64_level=job["x86_64_level"],
+                debug_symbols=job["debug_symbols"],
+            )
+        )
+
+
+def _send_heartbeats(client, agent_id, stop):
+    while not stop.wait(AGENT_POLL_INTERVAL):
+        try:
+            client.request("POST", f"/agents/{agent_id}/heartbeat", {})
+        except OSError as e:
+            Logger.debug(f"Heartbeat failed: {e}")
+
+
+def run_job(client, agent_id, job, host_platform):
+    """Builds a leased job and reports its outcome (and uploads its archives) to the coordinator."""
+    Logger.custom(
+        f"\n--- Building {job['build_name']} (Skia {job['skia_version']} at "
+        f"{job['skia_commit'][:12]}) ---",
+        Logger.BRIGHT_YELLOW,
+    )
+    stop = threading.Event()
+    heartbeats = threading.Thread(
+        target=_send_heartbeats, args=(client, agent_id, stop), daemon=True
+    )
+    heartbeats.start()
+
+    log_tail = collections.deque(maxlen=LOG_TAIL_LINES)
+    parent_sink = log_sink.get()
+
+    def sink(message):
+        log_tail.extend(message.splitlines())
+        if parent_sink is not None:
+            parent_sink(message)
+        else:
+            print(message, flush=True)
+
+    token = log_sink.set(sink)
+    try:
+        result = _build_job(job, host_platform)
+        artifacts = [
+            path for path in (result.archive, result.manifest, result.debug_archive) if path
+        ]
+        for path in artifacts:
+            Logger.info(f"Uploading {os.path.basename(path)}")
+            client.upload(job, path)
+        report = {
+            "lease": job["lease"],
+            "status": "succeeded",
+            "artifacts": {os.path.basename(path): hash_file(path) for path in artifacts},
+            "result": {
+                "duration": result.duration,
+                "timings": result.timings,
+                "cache": result.cache,
+                "build_args": result.build_args,
+                "ninja_edges": result.ninja_edges,
+                "peak_rss_kib": result.peak_rss_kib,
+            },
+        }
+    except Exception as e:
+        # Any failure is reported, else the job would stay leased to this agent until it times out
+        if isinstance(e, (SkiaBuilderError, OSError)):
+            error = str(e)
+        else:
+            error = f"Unexpected error: {type(e).__name__}: {e}"
+        Logger.error(error)
+        report = {
+            "lease": job["lease"],
+            "status": "failed",
+            "error": error,
+            "log_tail": list(log_tail),
+        }
+    finally:
+        log_sink.reset(token)
+        stop.set()
+        heartbeats.join()
+
+    try:
+        status, body = client.request("POST", f"/jobs/{job['id']}/result", report)
+    except OSError as e:
+        Logger.warning(f"Unable to report the result of {job['build_name']}: {e}")
+        return
+    if status != 200:
+        Logger.warning(
+            f"The coordinator rejected the result of {job['build_name']}: "
+            f"{(body or {}).get('error', status)}"
+        )
+    elif report["status"] == "succeeded":
+        Logger.info(f"Built and uploaded {job['build_name']} in {result.duration:.1f}s")
+
+
+def run_agent(coordinator_url, host_platform, name=None, targets=None, keep_running=False):
+    """
+    Builds the jobs of a coordinator in the workspace of the current directory.
+
+    Args:
+        coordinator_url (str): URL of the coordinator, e.g. `http://build-1:8766`.
+        host_platform (str): Host platform name (e.g. "Linux").
+        name (str): Name of the agent in the coordinator's logs. Defaults to `<hostname>-<pid>`.
+        targets (list[str]): Targets to build, among the ones the workspace can build. Defaults to
+            all of them.
+        keep_running (bool): Whether to wait for the next coordinator once every job is finished
+            or the coordinator is gone, instead of exiting.
+
+    Raises:
+        ClusterError: If the workspace can't build any (or one of `targets`) target.
+    """
+    name = name or f"{socket.gethostname()}-{os.getpid()}"
+    buildable = get_buildable_targets(host_platform)
+    if targets:
+        if unknown := [target for target in targets if target not in buildable]:
+            raise ClusterError(
+                f"This workspace can't build {', '.join(unknown)} (buildable targets: "
+                f"{', '.join(buildable) or 'none'})"
+            )
+        buildable = list(targets)
+    skia_versions = get_skia_versions()
+    if not buildable or not skia_versions:
+        raise ClusterError(
+            f"Nothing can be built in {os.getcwd()}. Run `skia-builder setup-env` first."
+        )
+
+    client = CoordinatorClient(coordinator_url)
+    registration = {
+        "name": name,
+        "host": socket.gethostname(),
+        "targets": buildable,
+        "skia_versions": skia_versions,
+    }
+    agent_id = None
+    unreachable_since = None
+    Logger.info(f"Agent {name} building {', '.join(buildable)} for {coordinator_url}")
+    while True:
+        try:
+            if agent_id is None:
+                status, body = client.request("POST", "/agents", registration)
+                if status != 201:
+                    raise ClusterError(
+                        f"Registration rejected by {coordinator_url}: "
+                        f"{(body or {}).get('error', status)}"
+                    )
+                agent_id = body["id"]
+                Logger.info(f"Registered with {coordinator_url}")
+            status, body = client.request("POST", f"/agents/{agent_id}/lease", {})
+            unreachable_since = None
+        except OSError as e:
+            # Agents may be started before the coordinator, and wait for it
+            if unreachable_since is None:
+                unreachable_since = time.monotonic()
+                Logger.info(f"Waiting for the coordinator at {coordinator_url} ({e})")
+            elif agent_id is not None and time.monotonic() - unreachable_since > AGENT_TIMEOUT:
+                if not keep_running:
+                    Logger.info("The coordinator is gone, stopping.")
+                    return
+                agent_id = None
+            time.sleep(AGENT_POLL_INTERVAL)
+            continue
+
+        if status == 200:
+            run_job(client, agent_id, body, host_platform)
+        elif status == 404:
+            # The coordinator restarted, or considered this agent gone
+            agent_id = None
+        elif status == 410:
+            if not keep_running:
+                Logger.info("Every job of the coordinator is finished, stopping.")
+                return
+            agent_id = None
+            time.sleep(AGENT_POLL_INTERVAL)
+        else:
+            time.sleep(AGENT_POLL_INTERVAL)
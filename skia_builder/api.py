@@ -0,0 +1,248 @@
+"""
+Library API to drive Skia builds in-process.
+
+Example:
+    builder = SkiaBuilder(max_concurrent_builds=4)
+    result = await builder.build("linux-x64", archive=True)
+    results = await builder.build_many(
+        ["android-arm64", {"target": "android-x64", "archive": True}]
+    )
+    # Milestones other than the pinned one are built from their worktree (see `setup-env`)
+    results = await builder.build_many(
+        [{"target": "linux-x64", "skia_version": version} for version in ("m141", "m142")]
+    )
+    # x86-64 microarchitecture level variants are targets suffixed with the level
+    results = await builder.build_many(["linux-x64", "linux-x64-v2", "linux-x64-v3"])
+    # Predicted duration and cache status from the history of the workspace
+    plan = builder.plan("linux-x64")
+
+Failures are reported with the exceptions from `skia_builder.errors`, and each build returns a
+`BuildResult` with its artifact paths, timings and cache status.
+"""
+
+import asyncio
+import contextlib
+import math
+
+from skia_builder.config import X86_64_LEVELS
+from skia_builder.errors import (
+    SkiaBuilderError,
+    UnsupportedArchitectureError,
+    UnsupportedPlatformError,
+)
+from skia_builder.platforms import PLATFORM_MANAGERS
+from skia_builder.platforms.common import CommonSubPlatformManager, HostPlatform
+from skia_builder.results import BuildResult
+from skia_builder.trace import span
+from skia_builder.workspace import get_skia_version, use_skia_version
+
+__all__ = ["BuildResult", "SkiaBuilder", "resolve_target", "split_x86_64_level"]
+
+
+def resolve_target(target, host_platform=None):
+    """
+    Resolves a build target name (e.g. `android-arm64`) to its platform manager and CPU.
+
+    Args:
+        target (str): Build target name, without x86-64 level suffix (see
+            `split_x86_64_level`).
+        host_platform (str): Host platform name (e.g. "Linux") the target must be buildable from.
+            Any host if None, e.g. to name the builds of other hosts.
+
+    Raises:
+        UnsupportedPlatformError: If the target platform is unknown, or can't be built from
+            `host_platform`.
+        UnsupportedArchitectureError: If the CPU is not supported by the target platform.
+    """
+    platform_name, _, target_cpu = target.rpartition("-")
+    for manager in PLATFORM_MANAGERS.values():
+        if manager.TARGET_PLATFORM.lowercase != platform_name:
+            continue
+
+        is_host_target = manager.TARGET_PLATFORM.value == host_platform
+        if (
+            host_platform is not None
+            and not is_host_target
+            and not issubclass(manager, CommonSubPlatformManager)
+        ):
+            raise UnsupportedPlatformError(
+                f"Target {target} can't be built on a {host_platform} host"
+            )
+        if target_cpu not in manager.SUPPORTED_ARCHITECTURES:
+            raise UnsupportedArchitectureError(
+                f"Unsupported CPU architecture for {manager.TARGET_PLATFORM.value}: "
+                f"{target_cpu}. Supported architectures are: "
+                f"{', '.join(manager.SUPPORTED_ARCHITECTURES)}"
+            )
+        return manager, target_cpu
+
+    raise UnsupportedPlatformError(f"Unsupported build target: {target}")
+
+
+def split_x86_64_level(target, x86_64_level=None):
+    """
+    Splits the x86-64 level suffix off a build target name (e.g. `linux-x64-v3`).
+
+    Returns:
+        tuple[str, str]: The target without suffix, and `x86_64_level`, else the suffix (None if
+            the target has none).
+    """
+    base_target, _, level_suffix = target.rpartition("-")
+    if level_suffix in X86_64_LEVELS:
+        return base_target, x86_64_level or level_suffix
+    return target, x86_64_level
+
+
+class SkiaBuilder:
+    def __init__(self, host_platform=None, max_concurrent_builds=None):
+        """
+        Args:
+            host_platform (str): Host platform name (e.g. "Linux"). Defaults to the current one.
+            max_concurrent_builds (int): Maximum number of builds running at once. Unlimited by
+                default; builds of the same target are always serialized since they share an
+                out dir.
+        """
+        self.host_platform = host_platform or HostPlatform.get_current().value
+        self._max_concurrent_builds = max_concurrent_builds
+        self._semaphore = None
+        self._target_locks = {}
+
+    def resolve_target(self, target):
+        """
+        Resolves a build target name (e.g. `android-arm64`) to its platform manager and CPU.
+
+        Raises:
+            UnsupportedPlatformError: If the target platform can't be built from this host.
+            UnsupportedArchitectureError: If the CPU is not supported by the target platform.
+        """
+        return resolve_target(target, self.host_platform)
+
+    def plan(
+        self,
+        target,
+        args=None,
+        override_args=None,
+        skia_version=None,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+        pgo=None,
+        **_,
+    ):
+        """
+        Predicts what a build would do from the history of the workspace, without doing any
+        work. Takes the same arguments as `build()`, ignoring the ones that don't affect it.
+
+        Returns:
+            dict: The plan of the build (see `CommonPlatformManager.plan_build`).
+        """
+        target, x86_64_level = split_x86_64_level(target, x86_64_level)
+        manager, target_cpu = self.resolve_target(target)
+        with use_skia_version(skia_version):
+            return manager.plan_build(
+                target_cpu, args, override_args, profile, x86_64_level, debug_symbols, pgo
+            )
+
+    def _predict_duration(self, spec):
+        try:
+            prediction = self.plan(**spec)["prediction"]
+        except (SkiaBuilderError, ValueError):
+            prediction = None
+        # Builds without history may be the longest, they start first
+        return prediction["duration"] if prediction else math.inf
+
+    async def build(
+        self,
+        target,
+        args=None,
+        override_args=None,
+        archive=False,
+        overwrite=True,
+        skia_version=None,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+        incremental=False,
+        pgo=None,
+    ):
+        """
+        Builds a target.
+
+        Args:
+            target (str): Build target name, e.g. `linux-x64` or `android-arm64`, optionally
+                suffixed with an x86-64 microarchitecture level, e.g. `linux-x64-v3`.
+            args (str): Custom GN arguments replacing the default ones.
+            override_args (str): GN arguments overriding values of the default or custom ones.
+            archive (bool): Whether to archive the build output.
+            overwrite (bool): Whether an existing output directory is replaced.
+            skia_version (str): Skia milestone to build, e.g. `m142`. Defaults to the pinned one.
+            profile (str): Build profile, e.g. `speed`. Defaults to `size`.
+            x86_64_level (str): x86-64 microarchitecture level to target, e.g. `v3`. Defaults
+                to the one suffixing `target`, if any, else to the baseline.
+            debug_symbols (str): Debug info mode, `none` (the default) or `split` to archive the
+                debug info separately from the stripped libraries.
+            incremental (bool): Whether an existing output directory is refreshed in place
+                instead of being replaced (see `skia_builder.watch`).
+            pgo (str): `instrument` to build a variant instrumented for PGO training, or the path
+                of a merged profile to optimize with (see `skia_builder.pgo`).
+
+        Returns:
+            BuildResult: The result of the build.
+        """
+        target, x86_64_level = split_x86_64_level(target, x86_64_level)
+        manager, target_cpu = self.resolve_target(target)
+
+        if self._semaphore is None and self._max_concurrent_builds:
+            self._semaphore = asyncio.Semaphore(self._max_concurrent_builds)
+
+        with use_skia_version(skia_version):
+            # Builds of different milestones, profiles or levels have separate out dirs and can
+            # run concurrently
+            build_name = manager.get_build_name(target_cpu, profile, x86_64_level, pgo)
+            lock_key = (get_skia_version(), build_name)
+            if lock_key not in self._target_locks:
+                self._target_locks[lock_key] = asyncio.Lock()
+            target_lock = self._target_locks[lock_key]
+
+            async with target_lock, self._semaphore or contextlib.nullcontext():
+                with span(f"build {build_name}", "build"):
+                    return await manager.build_async(
+                        target_cpu,
+                        args,
+                        override_args,
+                        archive,
+                        overwrite,
+                        profile,
+                        x86_64_level,
+                        debug_symbols,
+                        incremental,
+                        pgo,
+                    )
+
+    async def build_many(self, builds, return_exceptions=False):
+        """
+        Runs several builds concurrently, within the `max_concurrent_builds` limit. The builds
+        predicted to take the longest (see `plan()`) start first, so that the run doesn't end
+        waiting for a long build started last.
+
+        Args:
+            builds (Iterable[str | dict]): Target names, or dicts of `build()` keyword arguments.
+            return_exceptions (bool): Whether failures are returned in place of their result
+                instead of being raised (cancelling the remaining builds).
+
+        Returns:
+            list[BuildResult | Exception]: Results, in the order of `builds`.
+        """
+        specs = [{"target": spec} if isinstance(spec, str) else spec for spec in builds]
+        durations = [self._predict_duration(spec) for spec in specs]
+        tasks = [None] * len(specs)
+        for index in sorted(range(len(specs)), key=lambda index: -durations[index]):
+            tasks[index] = asyncio.ensure_future(self.build(**specs[index]))
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        finally:
+            # Make sure the child processes of cancelled builds are gone before returning
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
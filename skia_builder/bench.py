@@ -0,0 +1,294 @@
+"""
+Rendering benchmarks of the libraries skia-builder produces, with Skia's nanobench (`skia-builder
+bench`).
+
+nanobench is built for each configuration (a build profile, milestone and/or x86-64 level) with
+the GN arguments of the shipped library plus the tools, then runs the selected benches on the CPU
+raster backend. The runs of the configurations are interleaved, so that a change of the machine's
+state (e.g. thermal throttling) affects them alike. Every configuration is compared to the first
+one bench by bench, with a bootstrap confidence interval of the ratio of their median times, and
+the results are written to a JSON report.
+"""
+
+import asyncio
+import datetime
+import json
+import math
+import os
+import statistics
+
+from skia_builder import stats
+from skia_builder.api import SkiaBuilder
+from skia_builder.config import (
+    BENCH_SAMPLES,
+    DEFAULT_BUILD_PROFILE,
+    NANOBENCH_CONFIG,
+    X86_64_LEVELS,
+    build_profiles,
+)
+from skia_builder.errors import BenchError
+from skia_builder.sysroot import get_host_cpu
+from skia_builder.trace import span
+from skia_builder.utils import Logger, run_command
+from skia_builder.workspace import get_skia_path, parse_skia_version, use_skia_version
+
+BENCH_REPORT = "report.json"
+BENCH_REPORT_VERSION = 1
+# Keys of a configuration, and how their values are validated
+BENCH_CONFIG_KEYS = {
+    "profile": lambda value: value if value in build_profiles else None,
+    "skia_version": parse_skia_version,
+    "x86_64_level": lambda value: value if value in X86_64_LEVELS else None,
+}
+
+
+def parse_bench_config(value):
+    """
+    Parses a configuration to benchmark, e.g. `profile=speed,skia_version=m142`.
+
+    Raises:
+        ValueError: If a key or value is invalid.
+    """
+    config = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        key, separator, item_value = item.partition("=")
+        key = key.strip().replace("-", "_")
+        if not separator or key not in BENCH_CONFIG_KEYS:
+            raise ValueError(
+                f"Invalid configuration item: {item!r} (expected one of "
+                f"{', '.join(f'{name}=...' for name in BENCH_CONFIG_KEYS)})"
+            )
+        if BENCH_CONFIG_KEYS[key](item_value.strip()) is None:
+            raise ValueError(f"Invalid {key}: {item_value.strip()!r}")
+        config[key] = item_value.strip()
+    return config
+
+
+def describe_config(config):
+    return ",".join(f"{key}={value}" for key, value in config.items()) or "default"
+
+
+def load_nanobench_results(path):
+    """
+    Reads the samples of a nanobench `--outResultsFile`.
+
+    Raises:
+        BenchError: If the file can't be read or has no results.
+
+    Returns:
+        dict[str, list[float]]: Milliseconds per iteration of each bench, by bench name.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f).get("results", {})
+    except (OSError, ValueError, AttributeError) as e:
+        raise BenchError(f"Unable to read the nanobench results {path}: {e}") from e
+
+    samples = {}
+    for name, configs in results.items():
+        entry = configs.get(NANOBENCH_CONFIG) if isinstance(configs, dict) else None
+        if not isinstance(entry, dict):
+            continue
+        # Results written without samples (e.g. with --ms) only have the minimum
+        values = entry.get("samples") or [entry[key] for key in ("min_ms",) if key in entry]
+        if values:
+            samples[name] = [float(value) for value in values]
+    if not samples:
+        raise BenchError(f"nanobench reported no {NANOBENCH_CONFIG} results in {path}")
+    return samples
+
+
+def run_nanobench(executable, skia_path, results_path, match=None, samples=BENCH_SAMPLES, env=None):
+    """
+    Runs nanobench on the CPU raster backend, from the Skia checkout (where its resources are).
+
+    Args:
+        match (list[str]): nanobench `--match` patterns selecting the benches (all by default).
+        env (dict): Environment variables set for nanobench, e.g. where a build instrumented for
+            PGO writes its profile.
+
+    Raises:
+        CommandError: If nanobench fails.
+
+    Returns:
+        dict[str, list[float]]: Milliseconds per iteration of each bench, by bench name.
+    """
+    run_command(
+        [
+            executable,
+            "--config",
+            NANOBENCH_CONFIG,
+            "--samples",
+            str(samples),
+            "--outResultsFile",
+            results_path,
+            *(["--match", *match] if match else []),
+        ],
+        "Running nanobench",
+        cwd=skia_path,
+        env=env,
+    )
+    return load_nanobench_results(results_path)
+
+
+def compare_results(baseline, candidate):
+    """
+    Compares the samples of two configurations, bench by bench.
+
+    Returns:
+        dict: `benches`, the comparison of each bench both configurations ran, with the `ratio`
+            of the candidate median to the baseline one, its `ci95` and a `verdict` (`faster`
+            or `slower` when the interval excludes 1, else `same`), and `geomean`, the geometric
+            mean of the ratios.
+    """
+    benches = {}
+    for name in sorted(baseline.keys() & candidate.keys()):
+        baseline_median = statistics.median(baseline[name])
+        candidate_median = statistics.median(candidate[name])
+        if not baseline_median:
+            continue
+        ci95 = stats.median_ratio_ci95(baseline[name], candidate[name])
+        verdict = "same"
+        if ci95 and ci95[1] < 1:
+            verdict = "faster"
+        elif ci95 and ci95[0] > 1:
+            verdict = "slower"
+        benches[name] = {
+            "baseline_ms": baseline_median,
+            "candidate_ms": candidate_median,
+            "ratio": candidate_median / baseline_median,
+            "ci95": ci95,
+            "verdict": verdict,
+        }
+    ratios = [bench["ratio"] for bench in benches.values() if bench["ratio"] > 0]
+    geomean = math.exp(statistics.fmean(map(math.log, ratios))) if ratios else None
+    return {"benches": benches, "geomean": geomean}
+
+
+def _log_comparison(label, baseline_label, comparison):
+    benches = comparison["benches"]
+    name_width = min(60, max((len(name) for name in benches), default=0))
+    Logger.custom(f"\n{label} compared to {baseline_label}:", Logger.BRIGHT_YELLOW, bold=True)
+    Logger.info(f"{'bench':<{name_width}} {'baseline':>10} {'candidate':>10}  ratio [95% CI]")
+    for name, bench in benches.items():
+        ci95 = "[{:.3f}, {:.3f}]".format(*bench["ci95"]) if bench["ci95"] else "[n/a]"
+        line = (
+            f"{name[:name_width]:<{name_width}} {bench['baseline_ms']:>8.3f}ms "
+            f"{bench['candidate_ms']:>8.3f}ms  {bench['ratio']:.3f} {ci95}"
+        )
+        if bench["verdict"] == "same":
+            Logger.info(line)
+        else:
+            Logger.custom(
+                f"{line} {bench['verdict']}",
+                Logger.GREEN if bench["verdict"] == "faster" else Logger.RED,
+            )
+    verdicts = [bench["verdict"] for bench in benches.values()]
+    if comparison["geomean"] is not None:
+        Logger.info(
+            f"Geometric mean of the time ratios: {comparison['geomean']:.3f} "
+            f"({verdicts.count('faster')} faster, {verdicts.count('slower')} slower, "
+            f"{verdicts.count('same')} unchanged)"
+        )
+
+
+def bench(
+    target,
+    configs=None,
+    match=None,
+    samples=BENCH_SAMPLES,
+    repeats=1,
+    output_dir=None,
+    host_platform=None,
+):
+    """
+    Builds nanobench for each configuration and compares their rendering times.
+
+    Args:
+        target (str): Build target, which must run on this host, e.g. `linux-x64`.
+        configs (list[dict]): Configurations to benchmark (see `parse_bench_config`), compared to
+            the first one. Defaults to the default build of the pinned milestone.
+        match (list[str]): nanobench `--match` patterns selecting the benches.
+        samples (int): Samples nanobench takes of each bench, per run.
+        repeats (int): Number of interleaved nanobench runs of each configuration.
+        output_dir (str): Directory of the nanobench results and report. Defaults to
+            `output/bench/<target>-<timestamp>`.
+        host_platform (str): Host platform name (e.g. "Linux"). Defaults to the current one.
+
+    Raises:
+        BenchError: If the target can't run on this host, or nanobench reports no results.
+        CommandError: If nanobench can't be built or fails.
+
+    Returns:
+        dict: The report, also written to `<output_dir>/report.json`.
+    """
+    configs = configs or [{}]
+    if samples < 1 or repeats < 1:
+        raise BenchError("At least one sample and one run are needed")
+
+    builder = SkiaBuilder(host_platform)
+    manager, target_cpu = builder.resolve_target(target)
+    if manager.TARGET_PLATFORM.value != builder.host_platform or target_cpu != get_host_cpu():
+        raise BenchError(f"nanobench only runs on its host, {target} can't be benchmarked here")
+
+    started = datetime.datetime.now(datetime.timezone.utc)
+    output_dir = output_dir or os.path.join(
+        "output", "bench", f"{target}-{started.strftime('%Y%m%d-%H%M%S')}"
+    )
+    os.makedirs(output_dir, exist_ok=True)
+
+    labels = [describe_config(config) for config in configs]
+    executables = []
+    for label, config in zip(labels, configs):
+        with use_skia_version(config.get("skia_version")), span(f"nanobench {label}", "bench"):
+            Logger.custom(f"\n--- Building nanobench ({label}) ---", Logger.BRIGHT_YELLOW)
+            executable = asyncio.run(
+                manager.build_nanobench_async(
+                    target_cpu,
+                    profile=config.get("profile", DEFAULT_BUILD_PROFILE),
+                    x86_64_level=config.get("x86_64_level"),
+                )
+            )
+            executables.append((executable, get_skia_path()))
+
+    results = [{} for _ in configs]
+    for repeat in range(repeats):
+        for index, (label, (executable, skia_path)) in enumerate(zip(labels, executables)):
+            Logger.custom(
+                f"\n--- Benchmarking {label} (run {repeat + 1}/{repeats}) ---",
+                Logger.BRIGHT_YELLOW,
+            )
+            results_path = os.path.abspath(
+                os.path.join(output_dir, f"config{index}-run{repeat}.json")
+            )
+            with span(f"nanobench run {label}", "bench"):
+                run_samples = run_nanobench(executable, skia_path, results_path, match, samples)
+            for name, values in run_samples.items():
+                results[index].setdefault(name, []).extend(values)
+
+    report = {
+        "version": BENCH_REPORT_VERSION,
+        "target": target,
+        "time": started.isoformat(timespec="seconds"),
+        "nanobench_config": NANOBENCH_CONFIG,
+        "match": match or [],
+        "configs": [
+            {
+                "label": label,
+                **config,
+                "benches": {name: stats.summarize(values) for name, values in result.items()},
+            }
+            for label, config, result in zip(labels, configs, results)
+        ],
+        "comparisons": [],
+    }
+    for label, result in zip(labels[1:], results[1:]):
+        comparison = compare_results(results[0], result)
+        report["comparisons"].append({"baseline": labels[0], "candidate": label, **comparison})
+        _log_comparison(label, labels[0], comparison)
+
+    report_path = os.path.join(output_dir, BENCH_REPORT)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    Logger.info(f"Report written to {report_path}")
+    return report
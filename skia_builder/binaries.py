@@ -0,0 +1,114 @@
+"""
+Minimal readers of the `ar` archives (static libraries, Debian packages) and ELF headers handled
+by skia-builder.
+"""
+
+import os
+
+AR_MAGIC = b"!<arch>\n"
+AR_THIN_MAGIC = b"!<thin>\n"
+AR_HEADER_SIZE = 60
+ELF_MAGIC = b"\x7fELF"
+
+# `e_machine` values of the ELF objects built for each target CPU
+ELF_MACHINES = {
+    "x86": 3,
+    "arm": 40,
+    "x64": 62,
+    "arm64": 183,
+}
+
+
+def iter_ar_members(path):
+    """
+    Yields the members of an `ar` archive.
+
+    Yields:
+        tuple[str, int, int]: The name, data offset and size of each regular member. Members of
+            thin archives are not stored in the archive, their offset is None.
+
+    Raises:
+        ValueError: If `path` is not an `ar` archive.
+    """
+    with open(path, "rb") as f:
+        magic = f.read(len(AR_MAGIC))
+        if magic not in (AR_MAGIC, AR_THIN_MAGIC):
+            raise ValueError(f"{path} is not an ar archive")
+        thin = magic == AR_THIN_MAGIC
+
+        long_names = b""
+        while header := f.read(AR_HEADER_SIZE):
+            if len(header) < AR_HEADER_SIZE:
+                raise ValueError(f"Truncated ar archive: {path}")
+            name = header[:16].decode("ascii", errors="replace").rstrip()
+            size = int(header[48:58].decode("ascii").strip() or 0)
+            offset = f.tell()
+
+            if name == "//":
+                long_names = f.read(size)
+            elif name.startswith("#1/"):
+                # BSD archives store long names at the start of the data
+                name_size = int(name[3:])
+                name = f.read(name_size).decode("utf-8", errors="replace").rstrip("\0")
+                yield name, offset + name_size, size - name_size
+            elif name in ("/", "/SYM64/", "__.SYMDEF", "__.SYMDEF SORTED"):
+                pass
+            else:
+                if name.startswith("/") and name[1:].isdigit():
+                    start = int(name[1:])
+                    name = long_names[start : long_names.index(b"\n", start)].decode("utf-8")
+                name = name.rstrip("/")
+                if thin:
+                    # The data of thin archive members is not stored after their header
+                    yield name, None, size
+                    continue
+                yield name, offset, size
+
+            f.seek(offset + size + size % 2)
+
+
+def read_ar_member(path, member_name):
+    """Returns the content of an `ar` archive member."""
+    for name, offset, size in iter_ar_members(path):
+        if name == member_name:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                return f.read(size)
+    raise KeyError(f"{member_name} not found in {path}")
+
+
+def get_elf_machine(header):
+    """Returns the `e_machine` of an ELF header, or None if `header` is not ELF."""
+    if len(header) < 20 or not header.startswith(ELF_MAGIC):
+        return None
+    byteorder = "little" if header[5] == 1 else "big"
+    return int.from_bytes(header[18:20], byteorder)
+
+
+def get_library_machine(path):
+    """
+    Returns the `e_machine` of a shared library, or of the first ELF object of a static library.
+
+    Returns:
+        int | None: The ELF machine, or None if the library is neither ELF nor an archive of ELF
+            objects.
+    """
+    with open(path, "rb") as f:
+        header = f.read(20)
+    if header.startswith(ELF_MAGIC):
+        return get_elf_machine(header)
+    if not header.startswith((AR_MAGIC, AR_THIN_MAGIC)):
+        return None
+
+    for name, offset, _ in iter_ar_members(path):
+        if offset is None:
+            # Members of thin archives are paths relative to the archive
+            with open(os.path.join(os.path.dirname(path), name), "rb") as f:
+                machine = get_elf_machine(f.read(20))
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                machine = get_elf_machine(f.read(20))
+        if machine is not None:
+            return machine
+    return None
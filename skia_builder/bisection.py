@@ -0,0 +1,425 @@
+"""
+Bisection of a range of Skia commits for the first one regressing a benchmark (`skia-builder
+bisect`).
+
+Candidates are checked out one after the other in a dedicated worktree,
+`./skia-worktrees/bisect`, whose out dir is kept between steps so that ninja only rebuilds what
+the commits changed (and `SKIA_BUILDER_CC_WRAPPER` reuses the objects compiled by earlier steps or
+other checkouts). The benchmark command then runs against the built libraries several times, and
+a commit is bad when the median of its samples is worse than the one of the good commit by more
+than the threshold, with a one-sided Mann-Whitney U test (see stats.py) ruling out noise.
+
+Every step is appended to a JSON-lines log. Samples already measured for a commit with the same
+benchmark and build settings are reused from it, so an interrupted bisection, or one rerun with
+another threshold, doesn't rebuild or measure those commits again.
+"""
+
+import asyncio
+import datetime
+import json
+import math
+import os
+import re
+import subprocess
+import time
+
+from skia_builder import stats
+from skia_builder.api import SkiaBuilder
+from skia_builder.config import BISECT_RUNS, BISECT_SIGNIFICANCE, BISECT_WARMUP_RUNS
+from skia_builder.errors import BisectError, CommandError
+from skia_builder.trace import span
+from skia_builder.utils import Logger
+from skia_builder.workspace import SKIA_DIR, get_skia_path, use_skia_checkout
+
+BISECT_CHECKOUT = "bisect"
+BISECT_LOG_VERSION = 1
+# Metrics of a benchmark run: its wall time, or the last number it prints
+BISECT_METRICS = ("time", "output")
+
+NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def parse_threshold(value):
+    """
+    Parses a regression threshold, a relative change given as a fraction (`0.05`) or a
+    percentage (`5%`).
+
+    Raises:
+        ValueError: If `value` is not a positive number.
+    """
+    text = value.strip()
+    threshold = float(text[:-1]) / 100 if text.endswith("%") else float(text)
+    if not threshold > 0:
+        raise ValueError(f"Invalid threshold: {value!r} (expected e.g. 0.05 or 5%)")
+    return threshold
+
+
+def _git(skia_path, *args):
+    try:
+        completed = subprocess.run(
+            ["git", *args],
+            cwd=skia_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+    except OSError as e:
+        raise BisectError(f"Unable to run git: {e}") from e
+    if completed.returncode != 0:
+        raise BisectError(f"git {' '.join(args)} failed: {completed.stderr.strip()}")
+    return completed.stdout
+
+
+def resolve_commits(skia_path, good, bad):
+    """
+    Resolves the bounds of a bisection in the Skia repository.
+
+    Raises:
+        BisectError: If a commit is unknown, or `good` is not an ancestor of `bad`.
+
+    Returns:
+        tuple[dict, list[dict]]: The good commit, and the commits after it up to the bad one
+            (oldest first, following first parents), each with its `commit` hash and `subject`.
+    """
+    shas = []
+    for revision in (good, bad):
+        try:
+            shas.append(_git(skia_path, "rev-parse", "--verify", f"{revision}^{{commit}}").strip())
+        except BisectError as e:
+            raise BisectError(
+                f"Unknown Skia commit {revision!r}, fetch it into {skia_path} first ({e})"
+            ) from e
+    good_sha, bad_sha = shas
+    try:
+        _git(skia_path, "merge-base", "--is-ancestor", good_sha, bad_sha)
+    except BisectError as e:
+        raise BisectError(f"The good commit {good} is not an ancestor of the bad one {bad}") from e
+
+    def describe(sha):
+        return {"commit": sha, "subject": _git(skia_path, "log", "-1", "--format=%s", sha).strip()}
+
+    log = _git(
+        skia_path,
+        "log",
+        "--first-parent",
+        "--reverse",
+        "--format=%H%x00%s",
+        f"{good_sha}..{bad_sha}",
+    )
+    commits = [
+        {"commit": sha, "subject": subject}
+        for sha, subject in (line.split("\0", 1) for line in log.splitlines())
+    ]
+    if not commits or commits[-1]["commit"] != bad_sha:
+        raise BisectError(f"{bad} is not reachable from {good} following first parents")
+    return describe(good_sha), commits
+
+
+def run_benchmark(command, runs, warmup_runs=0, metric="time", env=None):
+    """
+    Runs a benchmark command through the shell and returns one sample per run.
+
+    Args:
+        command (str): Benchmark command.
+        runs (int): Number of measured runs.
+        warmup_runs (int): Number of runs before the measured ones, whose samples are discarded.
+        metric (str): `time` for the wall time of each run in seconds, or `output` for the last
+            number it prints.
+        env (dict): Environment of the command.
+
+    Raises:
+        BisectError: If a run fails, or prints no number with the `output` metric.
+
+    Returns:
+        list[float]: The samples of the measured runs.
+    """
+    samples = []
+    for run in range(warmup_runs + runs):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            command,
+            shell=True,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        elapsed = time.perf_counter() - started
+        if completed.returncode != 0:
+            last_lines = "\n".join(completed.stdout.splitlines()[-5:])
+            raise BisectError(
+                f"Benchmark failed with exit code {completed.returncode}:\n{last_lines}"
+            )
+        if run < warmup_runs:
+            continue
+        if metric == "time":
+            samples.append(elapsed)
+        elif numbers := NUMBER_PATTERN.findall(completed.stdout):
+            samples.append(float(numbers[-1]))
+        else:
+            raise BisectError("The benchmark printed no number to use as its metric")
+    return samples
+
+
+def _load_log(log_path, settings):
+    """Returns the samples of the commits of a previous bisection log with the same settings."""
+    measured = {}
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("type") == "step" and record.get("settings") == settings:
+                    measured[record["commit"]] = record
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        raise BisectError(f"Unable to read the bisection log {log_path}: {e}") from e
+    return measured
+
+
+def _append_log(log_path, record):
+    record = {
+        "version": BISECT_LOG_VERSION,
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        **record,
+    }
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def _format_change(change):
+    return f"{change * 100:+.1f}%"
+
+
+def bisect(
+    target,
+    good,
+    bad,
+    command,
+    threshold,
+    runs=BISECT_RUNS,
+    warmup_runs=BISECT_WARMUP_RUNS,
+    metric="time",
+    higher_is_better=False,
+    profile=None,
+    x86_64_level=None,
+    override_args=None,
+    log_path=None,
+    host_platform=None,
+):
+    """
+    Finds the first commit between `good` and `bad` that regresses a benchmark.
+
+    The benchmark command runs from the current directory with `SKIA_BUILDER_COMMIT` (the commit
+    being measured), `SKIA_BUILDER_SKIA_DIR` (its checkout) and `SKIA_BUILDER_OUT_DIR` (the out dir
+    holding its libraries) set. Commits whose build or benchmark fails are skipped, like
+    `git bisect skip` does.
+
+    Args:
+        target (str): Build target, e.g. `linux-x64`.
+        good (str): Commit (or any git revision) known not to have the regression.
+        bad (str): Later commit known to have it.
+        command (str): Benchmark command, run through the shell.
+        threshold (float): Relative change of the median, e.g. `0.05`, above which a commit is
+            regressed.
+        runs (int): Number of measured benchmark runs per commit.
+        warmup_runs (int): Number of discarded benchmark runs before the measured ones.
+        metric (str): `time` (wall time of the command) or `output` (last number it prints).
+        higher_is_better (bool): Whether greater metric values are better, e.g. for throughputs.
+        profile (str): Build profile, e.g. `speed`.
+        x86_64_level (str): x86-64 microarchitecture level to target, e.g. `v3`.
+        override_args (str): GN arguments overriding values of the default ones.
+        log_path (str): JSON-lines log of every step. Defaults to
+            `output/bisect/<good>..<bad>.jsonl`.
+        host_platform (str): Host platform name (e.g. "Linux"). Defaults to the current one.
+
+    Raises:
+        BisectError: If the commits or settings are invalid, `bad` doesn't regress compared to
+            `good`, or one of them can't be built and measured.
+        CommandError: If a commit can't be checked out or its dependencies synced.
+
+    Returns:
+        dict: The `first_bad` commit (None if skipped commits leave it ambiguous), the
+            `candidates` that may be the first bad one, and the path of the `log`.
+    """
+    if metric not in BISECT_METRICS:
+        raise BisectError(f"Unknown metric: {metric}. Available metrics are: time, output")
+    if runs < 1 or warmup_runs < 0:
+        raise BisectError("At least one benchmark run is needed per commit")
+    if stats.min_p_value(runs) > BISECT_SIGNIFICANCE:
+        raise BisectError(
+            f"{runs} runs per commit can't tell a regression from noise at a significance of "
+            f"{BISECT_SIGNIFICANCE}, use more runs"
+        )
+
+    main_skia_path = os.path.join(os.getcwd(), SKIA_DIR)
+    if not os.path.isdir(main_skia_path):
+        raise BisectError("Skia is not set up in this workspace. Run `skia-builder setup-env`.")
+    good_commit, commits = resolve_commits(main_skia_path, good, bad)
+
+    builder = SkiaBuilder(host_platform, max_concurrent_builds=1)
+    manager, _ = builder.resolve_target(target)
+    settings = {
+        "target": target,
+        "profile": profile,
+        "x86_64_level": x86_64_level,
+        "override_args": override_args,
+        "command": command,
+        "metric": metric,
+        "runs": runs,
+        "warmup_runs": warmup_runs,
+    }
+    log_path = log_path or os.path.join(
+        "output",
+        BISECT_CHECKOUT,
+        f"{good_commit['commit'][:12]}..{commits[-1]['commit'][:12]}.jsonl",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    measured = _load_log(log_path, settings)
+    _append_log(
+        log_path,
+        {
+            "type": "start",
+            "good": good_commit["commit"],
+            "bad": commits[-1]["commit"],
+            "commits": len(commits),
+            "threshold": threshold,
+            "higher_is_better": higher_is_better,
+            "settings": settings,
+        },
+    )
+    Logger.info(
+        f"Bisecting {len(commits)} commits after {good_commit['commit'][:12]} "
+        f"(about {math.ceil(math.log2(len(commits))) if len(commits) > 1 else 0} steps), "
+        f"logging to {log_path}"
+    )
+
+    def measure(commit):
+        """Returns the samples of a commit, or None if it can't be built or measured."""
+        sha = commit["commit"]
+        if (previous := measured.get(sha)) is not None:
+            Logger.info(f"Reusing the samples of {sha[:12]} from {log_path}")
+            return previous["samples"]
+
+        record = {"type": "step", "commit": sha, "subject": commit["subject"]}
+        with span(f"bisect {sha[:12]}", "bisect"):
+            Logger.custom(
+                f"\n--- Measuring {sha[:12]} {commit['subject']} ---", Logger.BRIGHT_YELLOW
+            )
+            manager.checkout_revision(sha)
+            try:
+                result = asyncio.run(
+                    builder.build(
+                        target,
+                        override_args=override_args,
+                        overwrite=True,
+                        profile=profile,
+                        x86_64_level=x86_64_level,
+                    )
+                )
+            except CommandError as e:
+                Logger.warning(f"Skipping {sha[:12]}, which doesn't build: {e}")
+                _append_log(log_path, {**record, "status": "build_failed", "error": str(e)})
+                return None
+            record["build"] = {"duration": result.duration, "cache": result.cache}
+
+            env = {
+                **os.environ,
+                "SKIA_BUILDER_COMMIT": sha,
+                "SKIA_BUILDER_SKIA_DIR": get_skia_path(),
+                "SKIA_BUILDER_OUT_DIR": result.out_dir,
+            }
+            try:
+                samples = run_benchmark(command, runs, warmup_runs, metric, env)
+            except BisectError as e:
+                Logger.warning(f"Skipping {sha[:12]}: {e}")
+                _append_log(log_path, {**record, "status": "benchmark_failed", "error": str(e)})
+                return None
+
+        summary = stats.summarize(samples)
+        Logger.info(
+            f"{sha[:12]}: median {summary['median']:.6g} over {len(samples)} runs "
+            f"(min {summary['min']:.6g}, max {summary['max']:.6g})"
+        )
+        _append_log(
+            log_path,
+            {
+                **record,
+                "status": "measured",
+                "settings": settings,
+                "samples": samples,
+                "stats": summary,
+            },
+        )
+        measured[sha] = {"samples": samples}
+        return samples
+
+    def classify(commit, samples, baseline):
+        comparison = stats.compare(baseline, samples, higher_is_better)
+        is_bad = comparison["change"] > threshold and comparison["p_value"] <= BISECT_SIGNIFICANCE
+        verdict = "bad" if is_bad else "good"
+        Logger.info(
+            f"{commit['commit'][:12]} is {verdict}: {_format_change(comparison['change'])} "
+            f"compared to {good_commit['commit'][:12]} (p={comparison['p_value']:.3g})"
+        )
+        _append_log(
+            log_path,
+            {"type": "verdict", "commit": commit["commit"], "verdict": verdict, **comparison},
+        )
+        return is_bad
+
+    with use_skia_checkout(BISECT_CHECKOUT):
+        baseline = measure(good_commit)
+        if baseline is None:
+            raise BisectError(f"The good commit {good} can't be built and measured")
+        bad_samples = measure(commits[-1])
+        if bad_samples is None:
+            raise BisectError(f"The bad commit {bad} can't be built and measured")
+        if not classify(commits[-1], bad_samples, baseline):
+            raise BisectError(
+                f"{bad} doesn't regress by more than {_format_change(threshold)} compared to "
+                f"{good}, there is nothing to bisect"
+            )
+
+        # Indexes of the last known good and first known bad commits (-1 is the good commit)
+        low, high = -1, len(commits) - 1
+        skipped = set()
+        while remaining := [index for index in range(low + 1, high) if index not in skipped]:
+            middle = (low + high) // 2
+            index = min(remaining, key=lambda i: (abs(i - middle), i))
+            Logger.info(
+                f"{high - low - 1} commits left to bisect, about "
+                f"{math.ceil(math.log2(high - low))} steps"
+            )
+            samples = measure(commits[index])
+            if samples is None:
+                skipped.add(index)
+            elif classify(commits[index], samples, baseline):
+                high = index
+            else:
+                low = index
+
+    candidates = commits[low + 1 : high + 1]
+    first_bad = commits[high] if len(candidates) == 1 else None
+    _append_log(
+        log_path,
+        {
+            "type": "result",
+            "first_bad": first_bad and first_bad["commit"],
+            "candidates": [commit["commit"] for commit in candidates],
+        },
+    )
+    if first_bad:
+        Logger.custom(
+            f"First bad commit: {first_bad['commit']} {first_bad['subject']}",
+            Logger.BRIGHT_YELLOW,
+            bold=True,
+        )
+    else:
+        Logger.warning(
+            "Commits that couldn't be built or measured leave the first bad commit ambiguous, "
+            "it is one of:"
+        )
+        for commit in candidates:
+            Logger.warning(f"  {commit['commit']} {commit['subject']}")
+    return {"first_bad": first_bad, "candidates": candidates, "log": log_path}
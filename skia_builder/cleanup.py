@@ -0,0 +1,316 @@
+"""
+Garbage collection of the disk space used by a workspace (`skia-builder gc`, and a pass before
+each build when `GC_BUDGET` is set).
+
+The entries that can be evicted are the out dirs of the Skia checkouts, the build outputs (and
+archives) in `output/`, the entries of the download cache, the provisioned sysroots and the ThinLTO
+cache. Builds and downloads record when they use an entry in `GC_INDEX`, which also caches the
+size of each entry until it is used again, so that a collection only walks the entries that
+changed. When the total exceeds the budget, the least recently used entries are deleted first,
+except the ones of the current build and any used within `GC_GRACE_PERIOD`.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from skia_builder.config import (
+    DEFAULT_OUTPUT_DIR,
+    DOWNLOAD_CACHE_DIR,
+    GC_BUDGET,
+    GC_GRACE_PERIOD,
+    GC_INDEX,
+    SYSROOTS_DIR,
+    THINLTO_CACHE_DIR,
+)
+from skia_builder.errors import SkiaBuilderError
+from skia_builder.trace import traced
+from skia_builder.utils import Logger
+from skia_builder.workspace import SKIA_DIR, WORKTREES_DIR
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+# Directories of `output/` holding the outputs of several builds rather than one
+OUTPUT_GROUP_DIRS = ("bench", "bisect")
+
+_index_lock = threading.Lock()
+_collect_lock = threading.Lock()
+
+
+def parse_size(value):
+    """
+    Parses a size such as `50G`, `512M` or `1073741824` (in bytes, with binary units).
+
+    Raises:
+        ValueError: If `value` is not a size.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", value or "", re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {value!r} (expected e.g. 50G or 512M)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def get_default_budget():
+    """
+    Returns the budget configured with `SKIA_BUILDER_GC_BUDGET`, in bytes, or None if unset.
+
+    Raises:
+        SkiaBuilderError: If the budget is not a size.
+    """
+    if not GC_BUDGET:
+        return None
+    try:
+        return parse_size(GC_BUDGET)
+    except ValueError as e:
+        raise SkiaBuilderError(f"Invalid SKIA_BUILDER_GC_BUDGET: {e}") from e
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def _load_index():
+    try:
+        with open(GC_INDEX, "r", encoding="utf-8") as f:
+            return json.load(f).get("entries", {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def _save_index(entries):
+    os.makedirs(os.path.dirname(GC_INDEX), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(GC_INDEX), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f)
+        os.replace(temp_path, GC_INDEX)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def record_use(*paths):
+    """
+    Records that entries were just used (e.g. an out dir by a build), which also invalidates their
+    cached size. Failures are only logged, since they must not fail the build.
+    """
+    now = time.time()
+    with _index_lock:
+        try:
+            entries = _load_index()
+            for path in paths:
+                entries[os.path.abspath(path)] = {"last_used": now, "size": None}
+            _save_index(entries)
+        except OSError as e:
+            Logger.warning(f"Unable to record the use of {', '.join(paths)}: {e}")
+
+
+def _iter_child_dirs(path):
+    try:
+        return sorted(entry.path for entry in os.scandir(path) if entry.is_dir())
+    except OSError:
+        return []
+
+
+def iter_entries():
+    """Yields the kind (e.g. `out`) and absolute path of every entry of the workspace."""
+    workspace = os.getcwd()
+    checkouts = [
+        os.path.join(workspace, SKIA_DIR),
+        *_iter_child_dirs(os.path.join(workspace, WORKTREES_DIR)),
+    ]
+    for checkout in checkouts:
+        for path in _iter_child_dirs(os.path.join(checkout, "out")):
+            yield "out", path
+
+    # `output/<build>`, and the builds of other milestones in `output/<milestone>/<build>`
+    for path in _iter_child_dirs(DEFAULT_OUTPUT_DIR):
+        name = os.path.basename(path)
+        if re.fullmatch(r"m\d+", name) or name in OUTPUT_GROUP_DIRS:
+            for nested_path in _iter_child_dirs(path):
+                yield "output", nested_path
+        else:
+            yield "output", path
+
+    sha256_dir = os.path.join(DOWNLOAD_CACHE_DIR, "sha256")
+    try:
+        names = sorted(os.listdir(sha256_dir))
+    except OSError:
+        names = []
+    for name in names:
+        if "." not in name:
+            yield "download", os.path.join(sha256_dir, name)
+    for path in _iter_child_dirs(os.path.join(DOWNLOAD_CACHE_DIR, "url")):
+        yield "download", path
+
+    for path in _iter_child_dirs(SYSROOTS_DIR):
+        yield "sysroot", path
+    if os.path.isdir(THINLTO_CACHE_DIR):
+        yield "thinlto", THINLTO_CACHE_DIR
+
+
+def _companion_paths(kind, path):
+    """Files stored next to an entry and deleted with it (e.g. download metadata)."""
+    if kind == "download" and not os.path.isdir(path):
+        return [f"{path}.json", f"{path}.part", f"{path}.part.segments"]
+    return []
+
+
+def _measure(path):
+    try:
+        stat_result = os.lstat(path)
+    except OSError:
+        return 0
+    if not os.path.isdir(path):
+        return stat_result.st_size
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _remove(kind, path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+    for companion in _companion_paths(kind, path):
+        if os.path.exists(companion):
+            os.remove(companion)
+
+
+def scan():
+    """
+    Lists the entries of the workspace with their size and last use, measuring the ones whose
+    size isn't cached, and drops the entries that no longer exist from the index.
+
+    Returns:
+        list[dict]: `kind`, `path`, `size` and `last_used` (a timestamp) of each entry.
+    """
+    with _index_lock:
+        index = _load_index()
+    entries, changed = [], False
+    for kind, path in iter_entries():
+        record = index.get(path) or {}
+        size = record.get("size")
+        if size is None:
+            size = _measure(path) + sum(map(_measure, _companion_paths(kind, path)))
+            changed = True
+        last_used = record.get("last_used")
+        if last_used is None:
+            # Entries created before usage was recorded are as old as their last change
+            try:
+                last_used = os.stat(path).st_mtime
+            except OSError:
+                continue
+        entries.append({"kind": kind, "path": path, "size": size, "last_used": last_used})
+
+    present = {entry["path"] for entry in entries}
+    with _index_lock:
+        # Uses recorded while scanning win over the measured sizes
+        latest = _load_index()
+        updated = {
+            path: record
+            for path, record in latest.items()
+            if path in present or time.time() - record.get("last_used", 0) < GC_GRACE_PERIOD
+        }
+        for entry in entries:
+            record = updated.get(entry["path"])
+            if record is None or record.get("last_used", 0) <= entry["last_used"]:
+                updated[entry["path"]] = {"last_used": entry["last_used"], "size": entry["size"]}
+        if changed or updated.keys() != latest.keys():
+            try:
+                _save_index(updated)
+            except OSError as e:
+                Logger.warning(f"Unable to update {GC_INDEX}: {e}")
+    return entries
+
+
+def _is_protected(path, protected):
+    return any(
+        path == protected_path or path.startswith(protected_path + os.sep)
+        for protected_path in protected
+    )
+
+
+@traced("collect_garbage")
+def collect_garbage(budget, protected=(), dry_run=False):
+    """
+    Evicts the least recently used entries of the workspace until it fits in `budget`.
+
+    Args:
+        budget (int): Maximum total size of the entries, in bytes.
+        protected (Iterable[str]): Paths of entries that are never evicted (e.g. the out dir and
+            output of the build about to run).
+        dry_run (bool): Whether the entries are only reported, not deleted.
+
+    Returns:
+        dict: `total` size before the collection, `reclaimed` bytes and the `evicted` entries.
+    """
+    protected = [os.path.abspath(path) for path in protected]
+    # Concurrent builds of a server collect one after the other
+    with _collect_lock:
+        entries = scan()
+        total = sum(entry["size"] for entry in entries)
+        evicted, reclaimed = [], 0
+        if total > budget:
+            now = time.time()
+            for entry in sorted(entries, key=lambda entry: entry["last_used"]):
+                if total - reclaimed <= budget:
+                    break
+                if _is_protected(entry["path"], protected):
+                    continue
+                if now - entry["last_used"] < GC_GRACE_PERIOD:
+                    continue
+                if not dry_run:
+                    try:
+                        _remove(entry["kind"], entry["path"])
+                    except OSError as e:
+                        Logger.warning(f"Unable to evict {entry['path']}: {e}")
+                        continue
+                evicted.append(entry)
+                reclaimed += entry["size"]
+
+    action = "Would evict" if dry_run else "Evicted"
+    for entry in evicted:
+        days = (time.time() - entry["last_used"]) / 86400
+        Logger.info(
+            f"{action} {entry['kind']} {entry['path']} ({format_size(entry['size'])}, "
+            f"unused for {days:.1f} days)"
+        )
+    remaining = total - reclaimed
+    if evicted:
+        Logger.info(
+            f"{'Would reclaim' if dry_run else 'Reclaimed'} {format_size(reclaimed)} from "
+            f"{len(evicted)} entries, {format_size(remaining)} of {format_size(budget)} used"
+        )
+    if remaining > budget:
+        Logger.warning(
+            f"{format_size(remaining)} is still used, over the {format_size(budget)} budget: the "
+            "remaining entries are in use or were used recently"
+        )
+    return {"total": total, "reclaimed": reclaimed, "evicted": evicted}
+
+
+def report_usage():
+    """Logs the disk space used by each kind of entry. Returns the entries (see `scan`)."""
+    entries = scan()
+    by_kind = {}
+    for entry in entries:
+        count, size = by_kind.get(entry["kind"], (0, 0))
+        by_kind[entry["kind"]] = (count + 1, size + entry["size"])
+    for kind, (count, size) in sorted(by_kind.items()):
+        Logger.info(f"{kind}: {count} entries, {format_size(size)}")
+    Logger.info(f"Total: {format_size(sum(entry['size'] for entry in entries))}")
+    return entries
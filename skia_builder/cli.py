@@ -1,20 +1,69 @@
 import argparse
+import asyncio
+import os
 import platform
 import sys
 
-from skia_builder.config import parse_custom_build_args
-from skia_builder.platforms import android, ios, iossimulator, linux, macos, windows
+from skia_builder.agent import run_agent
+from skia_builder.api import SkiaBuilder
+from skia_builder.bench import bench, parse_bench_config
+from skia_builder.bisection import BISECT_METRICS, bisect, parse_threshold
+from skia_builder.cleanup import (
+    collect_garbage,
+    format_size,
+    get_default_budget,
+    parse_size,
+    report_usage,
+)
+from skia_builder.config import (
+    BENCH_SAMPLES,
+    BISECT_RUNS,
+    BISECT_WARMUP_RUNS,
+    COORDINATOR_PORT,
+    DEBUG_SYMBOLS_MODES,
+    DEFAULT_BUILD_PROFILE,
+    DEFAULT_DEBUG_SYMBOLS,
+    X86_64_LEVELS,
+    build_profiles,
+    parse_custom_build_args,
+)
+from skia_builder.coordinator import coordinate
+from skia_builder.errors import SkiaBuilderError, UnsupportedPlatformError, VariantsError
+from skia_builder.history import report_history
+from skia_builder.install import install
+from skia_builder.manifest import verify
+from skia_builder.pgo import (
+    build_with_pgo,
+    describe_training,
+    get_instrumented_build,
+    load_cached_profile,
+)
+from skia_builder.platforms import PLATFORM_MANAGERS
+from skia_builder.server import serve
+from skia_builder.snapshot import create_snapshot, get_default_snapshot_name, restore_snapshot
+from skia_builder.trace import span, start_tracing, stop_tracing
 from skia_builder.utils import Logger
+from skia_builder.variants import load_variants_manifest, package_variants, pick_variant
+from skia_builder.watch import watch_builds
+from skia_builder.workspace import (
+    get_output_dir,
+    get_skia_path,
+    parse_skia_version,
+    use_skia_version,
+)
 
 
-PLATFORM_MANAGERS = {
-    "Android": android.AndroidPlatformManager,
-    "iOS": ios.IOSPlatformManager,
-    "iOSSimulator": iossimulator.IOSSimulatorPlatformManager,
-    "Linux": linux.LinuxPlatformManager,
-    "macOS": macos.MacOSPlatformManager,
-    "Windows": windows.WindowsPlatformManager,
-}
+def parse_jobs(value):
+    """
+    Parses a number of threads or shards.
+
+    Raises:
+        ValueError: If `value` is not a positive integer.
+    """
+    jobs = int(value)
+    if jobs < 1:
+        raise ValueError(f"Invalid number of jobs: {value!r} (expected at least 1)")
+    return jobs
 
 
 def get_supported_architectures(target_platform):
@@ -30,12 +79,26 @@ def setup_env(host_platform, sub_env=None, skip_llvm_instalation=False):
 
     manager = PLATFORM_MANAGERS.get(target_platform)
     if manager is None:
-        Logger.error(f"Unsupported target platform: {target_platform}")
-        sys.exit(1)
+        raise UnsupportedPlatformError(f"Unsupported target platform: {target_platform}")
 
     manager.setup_env(skip_llvm_instalation)
 
 
+def upgrade(host_platform):
+    manager = PLATFORM_MANAGERS.get(host_platform)
+    if manager is None:
+        raise UnsupportedPlatformError(f"Unsupported platform: {host_platform}")
+
+    result = manager.upgrade_checkout()
+    if result["old_revision"] != result["new_revision"]:
+        refreshed = ", ".join(result["tools"]) or "no tools"
+        Logger.info(
+            f"Upgraded to {result['new_revision'][:12]} ({len(result['deps'])} changed "
+            f"dependencies, refreshed {refreshed}). Out dirs were kept, the next builds are "
+            "incremental."
+        )
+
+
 def build(
     host_platform,
     target_cpu,
@@ -43,29 +106,236 @@ def build(
     override_build_args,
     archive_build_output,
     sub_env=None,
+    profile=None,
+    x86_64_levels=None,
+    debug_symbols=None,
+    watch=False,
+    plan=False,
+    pgo=False,
+    pgo_training_command=None,
+    pgo_match=None,
+    pgo_retrain=False,
 ):
     # Use sub_env if provided, otherwise default to the detected platform
     target_platform = sub_env if sub_env else host_platform
 
     manager = PLATFORM_MANAGERS.get(target_platform)
     if manager is None:
-        Logger.error(f"Unsupported target platform: {target_platform}")
+        raise UnsupportedPlatformError(f"Unsupported target platform: {target_platform}")
+
+    build_target = manager.get_build_target(target_cpu)
+    # The baseline build, and one per requested x86-64 level variant
+    levels = [None, *(x86_64_levels or [])]
+    # Reject levels the target doesn't support before the baseline is built
+    for level in levels[1:]:
+        manager.resolve_build_args(target_cpu, profile=profile, x86_64_level=level)
+    builder = SkiaBuilder(host_platform, max_concurrent_builds=1)
+
+    if plan:
+        for level in levels:
+            pgo_profile = None
+            if pgo:
+                pgo_profile = load_cached_profile(
+                    manager.get_build_name(target_cpu, profile, level),
+                    describe_training(pgo_training_command, pgo_match),
+                    get_instrumented_build(
+                        manager, target_cpu, override_build_args or None, profile, level
+                    ),
+                )
+                if pgo_profile is None or pgo_retrain:
+                    Logger.info(
+                        f"{manager.get_build_name(target_cpu, profile, level, pgo)} will be "
+                        "trained first, its optimized build can't be predicted."
+                    )
+                    continue
+            report_build_plan(
+                builder.plan(
+                    build_target,
+                    custom_build_args or None,
+                    override_build_args or None,
+                    profile=profile,
+                    x86_64_level=level,
+                    debug_symbols=debug_symbols,
+                    pgo=pgo_profile,
+                )
+            )
+        return
+
+    overwrite_output = False
+    for level in levels:
+        output_dir = get_output_dir(manager.get_build_name(target_cpu, profile, level, pgo))
+        if os.path.exists(output_dir) and not overwrite_output:
+            Logger.warning(f"The directory '{output_dir}' already exists.")
+            response = input("Do you want to overwrite it? [y/N]: ").strip().lower()
+            if response != "y":
+                Logger.warning("Exiting without changes.")
+                sys.exit(1)
+            overwrite_output = True
+
+    # Variants are built one after the other, since each ninja run already uses every core
+    builds = [
+        {
+            "target": build_target,
+            "args": custom_build_args or None,
+            "override_args": override_build_args or None,
+            "archive": archive_build_output,
+            "overwrite": overwrite_output,
+            "profile": profile,
+            "x86_64_level": level,
+            "debug_symbols": debug_symbols,
+        }
+        for level in levels
+    ]
+    package = archive_build_output and bool(x86_64_levels)
+
+    if pgo:
+        # Each variant is trained on its own, since its code differs
+        results = [
+            build_with_pgo(
+                build_target,
+                pgo_training_command,
+                pgo_match,
+                override_build_args or None,
+                archive_build_output,
+                overwrite_output,
+                profile,
+                level,
+                debug_symbols,
+                pgo_retrain,
+                host_platform,
+            )
+            for level in levels
+        ]
+        report_build_results(results, package)
+        return
+
+    def on_rebuilt(results):
+        # Variants are only packaged again when every build succeeded
+        report_build_results(results, package and len(results) == len(builds))
+
+    async def run_builds():
+        report_build_results(await builder.build_many(builds), package)
+        if watch:
+            await watch_builds(builder, builds, get_skia_path(), on_results=on_rebuilt)
+
+    try:
+        asyncio.run(run_builds())
+    except KeyboardInterrupt:
+        if not watch:
+            raise
+        Logger.info("Stopped watching for changes.")
+
+
+def report_build_plan(plan):
+    Logger.custom(
+        f"\n--- Plan for {plan['build_name']} (Skia {plan['skia_version']}) ---",
+        Logger.BRIGHT_YELLOW,
+    )
+    if not plan["out_dir_exists"]:
+        Logger.info("The out dir doesn't exist yet, everything will be built.")
+    elif not plan["gn_up_to_date"]:
+        Logger.info("The out dir was generated with other arguments, gn gen will run again.")
+    prediction = plan["prediction"]
+    if prediction is None:
+        Logger.info("No build of this target recorded yet, nothing to predict from.")
+        return
+    for name, step in prediction["steps"].items():
+        cache = f" (expected {step['cache']}" if step["cache"] else ""
+        if cache and step["hit_rate"] is not None:
+            cache += f", {step['hit_rate']:.0%} hits so far"
+        Logger.info(f"{name}: {step['duration']:.1f}s{cache + ')' if cache else ''}")
+    basis = "these arguments" if prediction["basis"] == "arguments" else "other arguments"
+    Logger.info(
+        f"Predicted duration: {prediction['duration']:.1f}s, from the last "
+        f"{prediction['samples']} build(s) with {basis}"
+    )
+
+
+def report_build_results(results, package_variants_output=False):
+    for result in results:
+        timings = ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in result.timings.items())
+        level = f", x86-64-{result.x86_64_level}" if result.x86_64_level else ""
+        Logger.info(
+            f"Built {result.target} ({result.skia_version}, {result.profile} profile{level}) "
+            f"in {result.duration:.1f}s ({timings})"
+        )
+        for artifact in result.artifacts:
+            Logger.info(f"Artifact: {artifact}")
+
+    if package_variants_output:
+        Logger.info(f"Artifact: {package_variants(results)}")
+
+
+def pick_build_variant(path):
+    try:
+        manifest = load_variants_manifest(path)
+        variant = pick_variant(manifest)
+    except (OSError, ValueError, VariantsError) as e:
+        Logger.error(f"Unable to pick a variant from {path}: {e}")
         sys.exit(1)
 
-    manager.build(target_cpu, custom_build_args, override_build_args, archive_build_output)
+    level = f"x86-64-{variant['x86_64_level']}" if variant["x86_64_level"] else "baseline"
+    Logger.info(f"Picked {variant['name']} ({level}) for this CPU")
+    package_dir = path if os.path.isdir(path) else os.path.dirname(path)
+    print(os.path.abspath(os.path.join(package_dir, variant["archive"])))
 
 
 def list_build_arguments(host_platform):
     manager = PLATFORM_MANAGERS.get(host_platform)
     if manager is None:
-        Logger.error(f"Unsupported target platform: {host_platform}")
-        sys.exit(1)
+        raise UnsupportedPlatformError(f"Unsupported target platform: {host_platform}")
 
     manager.list_build_arguments()
 
 
+def verify_build_output(path, manifest_path=None, jobs=None):
+    try:
+        mismatches = verify(path, manifest_path, workers=jobs)
+    except (OSError, ValueError) as e:
+        Logger.error(f"Unable to verify {path}: {e}")
+        sys.exit(1)
+
+    if mismatches:
+        for file_path, reason in mismatches:
+            Logger.error(f"{file_path}: {reason}")
+        Logger.error(f"Verification failed: {len(mismatches)} mismatch(es) found in {path}")
+        sys.exit(1)
+
+    Logger.info(f"Verification succeeded: {path} matches its manifest")
+
+
+def gc(budget=None, dry_run=False):
+    report_usage()
+    budget = budget if budget is not None else get_default_budget()
+    if budget is None:
+        Logger.info("No budget set (--budget or SKIA_BUILDER_GC_BUDGET), nothing evicted.")
+        return
+    result = collect_garbage(budget, dry_run=dry_run)
+    if not result["evicted"]:
+        Logger.info(
+            f"{format_size(result['total'])} used, within the {format_size(budget)} budget."
+        )
+
+
+def add_skia_version_argument(parser):
+    parser.add_argument(
+        "--skia-version",
+        type=parse_skia_version,
+        help=(
+            "Skia milestone to use (e.g. m142). Milestones other than the pinned one are managed "
+            "as git worktrees under ./skia-worktrees"
+        ),
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(prog="skia-builder", description="Skia Builder Script")
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="PATH",
+        help="Record a Chrome trace-event timeline of the command (viewable in Perfetto) to PATH",
+    )
     subparsers = parser.add_subparsers(dest="command")
 
     # setup-env subcommand
@@ -81,8 +351,20 @@ def main():
         action="store_true",
         help="Skip the installation of LLVM during environment setup",
     )
+    add_skia_version_argument(setup_env_parser)
     setup_env_parser.set_defaults(func=setup_env)
 
+    # upgrade subcommand
+    upgrade_parser = subparsers.add_parser(
+        "upgrade",
+        help=(
+            "Move a set up checkout to the revision of its milestone in place (e.g. after bumping "
+            "SKIA_VERSION), only refreshing what changed"
+        ),
+    )
+    add_skia_version_argument(upgrade_parser)
+    upgrade_parser.set_defaults(func=upgrade)
+
     # build subcommand
     build_parser = subparsers.add_parser("build", help="Builds the skia binaries")
     build_parser.add_argument(
@@ -108,20 +390,446 @@ def main():
     build_parser.add_argument(
         "--archive", action="store_true", help="Archive the build output after compilation"
     )
+    build_parser.add_argument(
+        "--profile",
+        type=str,
+        choices=list(build_profiles),
+        default=DEFAULT_BUILD_PROFILE,
+        help=(
+            "Build profile layered onto the default build flags: size (default), speed, or "
+            "speed-thinlto (ThinLTO bitcode libraries, to be linked with an LLVM linker)"
+        ),
+    )
+    build_parser.add_argument(
+        "--x86-64-levels",
+        type=str,
+        nargs="+",
+        choices=list(X86_64_LEVELS),
+        help=(
+            "Also build variants of an x86-64 target for these microarchitecture levels "
+            "(-march=x86-64-<level>). With --archive, the variants are packaged together with a "
+            "VARIANTS.json manifest of the CPU features they require"
+        ),
+    )
+    build_parser.add_argument(
+        "--debug-symbols",
+        type=str,
+        choices=list(DEBUG_SYMBOLS_MODES),
+        default=DEFAULT_DEBUG_SYMBOLS,
+        help=(
+            "Debug info of the libraries: none (default), or split to compile with compressed "
+            "DWARF, archive stripped libraries and package their debug info in a separate "
+            "<build>.debug.tar.gz (Linux and Android targets)"
+        ),
+    )
+    build_parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "After building, keep watching the Skia sources and rebuild on changes, only running "
+            "ninja and refreshing the output (and archive) in place"
+        ),
+    )
+    build_parser.add_argument(
+        "--plan",
+        action="store_true",
+        help=(
+            "Only print the predicted duration and expected cache hits of each build, from the "
+            "history of the workspace, without building"
+        ),
+    )
+    build_parser.add_argument(
+        "--pgo",
+        action="store_true",
+        help=(
+            "Optimize with a profile of a training workload: build an instrumented variant, run "
+            "the workload, merge its profiles with llvm-profdata and rebuild with them (Linux "
+            "targets of the host CPU, with clang). Profiles are cached per milestone"
+        ),
+    )
+    build_parser.add_argument(
+        "--pgo-training-command",
+        type=str,
+        help=(
+            "Shell command of the PGO training workload (defaults to nanobench), run with the "
+            "instrumented out dir in SKIA_BUILDER_OUT_DIR"
+        ),
+    )
+    build_parser.add_argument(
+        "--pgo-match",
+        type=str,
+        nargs="+",
+        help="nanobench --match patterns selecting the PGO training benches (all by default)",
+    )
+    build_parser.add_argument(
+        "--pgo-retrain",
+        action="store_true",
+        help="Train again even if a PGO profile of the same workload is cached",
+    )
+    add_skia_version_argument(build_parser)
     build_parser.set_defaults(func=build)
 
     # list-available-args subcommand
     list_args_parser = subparsers.add_parser(
         "list-available-args", help="List available build arguments"
     )
+    add_skia_version_argument(list_args_parser)
     list_args_parser.set_defaults(func=list_build_arguments)
 
+    # verify subcommand
+    verify_parser = subparsers.add_parser(
+        "verify", help="Verify an archive or extracted build output against its manifest"
+    )
+    verify_parser.add_argument("path", type=str, help="Path to a .tar.gz archive or a directory")
+    verify_parser.add_argument(
+        "--manifest",
+        type=str,
+        help="Manifest to verify against (defaults to the one embedded in the archive or tree)",
+    )
+    verify_parser.add_argument("--jobs", type=parse_jobs, help="Number of hashing threads")
+    verify_parser.set_defaults(func=verify_build_output)
+
+    # pick-variant subcommand
+    pick_variant_parser = subparsers.add_parser(
+        "pick-variant", help="Print the archive of the x86-64 variant best suited to this CPU"
+    )
+    pick_variant_parser.add_argument(
+        "path", type=str, help="Path to a VARIANTS.json or the directory containing it"
+    )
+    pick_variant_parser.set_defaults(func=pick_build_variant)
+
+    # snapshot subcommand
+    snapshot_parser = subparsers.add_parser(
+        "snapshot", help="Pack the prepared workspace into a single file for offline setup"
+    )
+    snapshot_parser.add_argument(
+        "--output",
+        type=str,
+        help="Snapshot to write (defaults to skia-workspace-<version>-<os>-<machine>.tar)",
+    )
+    snapshot_parser.add_argument(
+        "--jobs", type=parse_jobs, help="Number of shards, compressed in parallel"
+    )
+    snapshot_parser.set_defaults(func=create_snapshot)
+
+    # restore subcommand
+    restore_parser = subparsers.add_parser(
+        "restore", help="Set up the workspace from a snapshot, without network access"
+    )
+    restore_parser.add_argument("path", type=str, help="Path to the snapshot")
+    restore_parser.add_argument("--jobs", type=parse_jobs, help="Number of extraction threads")
+    restore_parser.add_argument(
+        "--force",
+        action="store_true",
+        help=(
+            "Replace an existing workspace, and restore a snapshot made for another Skia version "
+            "or host"
+        ),
+    )
+    restore_parser.set_defaults(func=restore_snapshot)
+
+    # install subcommand
+    install_parser = subparsers.add_parser(
+        "install", help="Download and extract a prebuilt archive instead of building"
+    )
+    install_parser.add_argument("target", type=str, help="Build target (e.g. linux-x64)")
+    install_parser.add_argument(
+        "--dest",
+        type=str,
+        default="skia-prebuilt",
+        help="Project directory to install into (defaults to ./skia-prebuilt)",
+    )
+    install_parser.add_argument(
+        "--source",
+        type=str,
+        help=(
+            "Base URL or directory of the prebuilt archives (defaults to "
+            "SKIA_BUILDER_ARTIFACT_SOURCE)"
+        ),
+    )
+    install_parser.add_argument(
+        "--profile",
+        type=str,
+        choices=list(build_profiles),
+        default=DEFAULT_BUILD_PROFILE,
+        help="Build profile of the archive",
+    )
+    install_parser.add_argument(
+        "--x86-64-level",
+        type=str,
+        choices=[*X86_64_LEVELS, "auto"],
+        help="x86-64 level variant to install, or auto to pick the one best suited to this CPU",
+    )
+    install_parser.add_argument("--jobs", type=parse_jobs, help="Number of extraction threads")
+    add_skia_version_argument(install_parser)
+    install_parser.set_defaults(func=install)
+
+    # bisect subcommand
+    bisect_parser = subparsers.add_parser(
+        "bisect", help="Find the first Skia commit of a range that regresses a benchmark"
+    )
+    bisect_parser.add_argument("target", type=str, help="Build target (e.g. linux-x64)")
+    bisect_parser.add_argument(
+        "--good", type=str, required=True, help="Skia commit without the regression"
+    )
+    bisect_parser.add_argument(
+        "--bad", type=str, required=True, help="Later Skia commit with the regression"
+    )
+    bisect_parser.add_argument(
+        "--command",
+        type=str,
+        required=True,
+        dest="benchmark_command",
+        help=(
+            "Benchmark command, run through the shell with SKIA_BUILDER_COMMIT, "
+            "SKIA_BUILDER_SKIA_DIR and SKIA_BUILDER_OUT_DIR set"
+        ),
+    )
+    bisect_parser.add_argument(
+        "--threshold",
+        type=parse_threshold,
+        required=True,
+        help="Relative slowdown of the median making a commit bad (e.g. 5%% or 0.05)",
+    )
+    bisect_parser.add_argument(
+        "--runs",
+        type=int,
+        default=BISECT_RUNS,
+        help=f"Measured benchmark runs per commit (defaults to {BISECT_RUNS})",
+    )
+    bisect_parser.add_argument(
+        "--warmup-runs",
+        type=int,
+        default=BISECT_WARMUP_RUNS,
+        help=(
+            f"Discarded benchmark runs before the measured ones (defaults to {BISECT_WARMUP_RUNS})"
+        ),
+    )
+    bisect_parser.add_argument(
+        "--metric",
+        type=str,
+        choices=list(BISECT_METRICS),
+        default="time",
+        help="Wall time of the benchmark command (default), or the last number it prints",
+    )
+    bisect_parser.add_argument(
+        "--higher-is-better",
+        action="store_true",
+        help="Greater metric values are better (e.g. a throughput printed by the benchmark)",
+    )
+    bisect_parser.add_argument(
+        "--profile",
+        type=str,
+        choices=list(build_profiles),
+        default=DEFAULT_BUILD_PROFILE,
+        help="Build profile of the candidates",
+    )
+    bisect_parser.add_argument(
+        "--x86-64-level",
+        type=str,
+        choices=list(X86_64_LEVELS),
+        help="x86-64 microarchitecture level the candidates target",
+    )
+    bisect_parser.add_argument(
+        "--override-build-args",
+        type=str,
+        help="Arguments overriding specific values of the default build configuration",
+    )
+    bisect_parser.add_argument(
+        "--log",
+        type=str,
+        help="JSON-lines log of every step (defaults to output/bisect/<good>..<bad>.jsonl)",
+    )
+    bisect_parser.set_defaults(func=bisect)
+
+    # bench subcommand
+    bench_parser = subparsers.add_parser(
+        "bench", help="Build nanobench and compare the rendering times of build configurations"
+    )
+    bench_parser.add_argument(
+        "target", type=str, help="Build target running on this host (e.g. linux-x64)"
+    )
+    bench_parser.add_argument(
+        "--config",
+        type=parse_bench_config,
+        action="append",
+        dest="bench_configs",
+        help=(
+            "Configuration to benchmark, e.g. profile=speed or skia_version=m142,x86_64_level=v3 "
+            "(repeatable, the others are compared to the first one)"
+        ),
+    )
+    bench_parser.add_argument(
+        "--match", type=str, nargs="+", help="nanobench --match patterns selecting the benches"
+    )
+    bench_parser.add_argument(
+        "--samples",
+        type=int,
+        default=BENCH_SAMPLES,
+        help=f"Samples of each bench per nanobench run (defaults to {BENCH_SAMPLES})",
+    )
+    bench_parser.add_argument(
+        "--repeats",
+        type=int,
+        default=1,
+        help="Interleaved nanobench runs of each configuration (defaults to 1)",
+    )
+    bench_parser.add_argument(
+        "--output",
+        type=str,
+        help="Directory of the results and report (defaults to output/bench/<target>-<time>)",
+    )
+    bench_parser.set_defaults(func=bench)
+
+    # gc subcommand
+    gc_parser = subparsers.add_parser(
+        "gc", help="Evict the least recently used out dirs, outputs and caches over a disk budget"
+    )
+    gc_parser.add_argument(
+        "--budget",
+        type=parse_size,
+        help="Disk budget, e.g. 50G (defaults to SKIA_BUILDER_GC_BUDGET)",
+    )
+    gc_parser.add_argument(
+        "--dry-run", action="store_true", help="Report what would be evicted without deleting it"
+    )
+    gc_parser.set_defaults(func=gc)
+
+    # history subcommand
+    history_parser = subparsers.add_parser(
+        "history", help="Show the recent builds of the workspace and their duration trends"
+    )
+    history_parser.add_argument(
+        "target",
+        type=str,
+        nargs="?",
+        help="Build target or build name (e.g. linux-x64 or linux-x64-v3-speed), all by default",
+    )
+    history_parser.add_argument(
+        "--limit", type=int, default=20, help="Maximum number of builds (or setups) shown"
+    )
+    history_parser.add_argument(
+        "--setup", action="store_true", help="Show the recent setups and their steps instead"
+    )
+    history_parser.add_argument(
+        "--skia-version",
+        type=parse_skia_version,
+        help="Only show the builds (or setups) of this Skia milestone (e.g. m142)",
+    )
+    history_parser.set_defaults(func=report_history)
+
+    # serve subcommand
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve build requests from a long-running process with a warm workspace"
+    )
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to bind")
+    serve_parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on")
+    serve_parser.add_argument(
+        "--socket", type=str, help="Listen on this Unix socket instead of a TCP port"
+    )
+    serve_parser.add_argument(
+        "--max-concurrent-builds",
+        type=int,
+        default=1,
+        help="Maximum number of builds running at the same time",
+    )
+    serve_parser.set_defaults(func=serve)
+
+    # coordinate subcommand
+    coordinate_parser = subparsers.add_parser(
+        "coordinate", help="Fan out the builds of several targets to build agents on other hosts"
+    )
+    coordinate_parser.add_argument(
+        "targets",
+        type=str,
+        nargs="+",
+        help="Build targets (e.g. linux-x64 linux-x64-v3 linux-arm64 android-arm64)",
+    )
+    coordinate_parser.add_argument(
+        "--profile",
+        type=str,
+        choices=list(build_profiles),
+        default=DEFAULT_BUILD_PROFILE,
+        help="Build profile of the targets",
+    )
+    coordinate_parser.add_argument(
+        "--debug-symbols",
+        type=str,
+        choices=list(DEBUG_SYMBOLS_MODES),
+        default=DEFAULT_DEBUG_SYMBOLS,
+        help="Debug info of the libraries: none (default) or split",
+    )
+    coordinate_parser.add_argument(
+        "--override-build-args",
+        type=str,
+        help="Arguments overriding specific values of the default build configuration",
+    )
+    coordinate_parser.add_argument(
+        "--overwrite", action="store_true", help="Replace existing output directories"
+    )
+    coordinate_parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to bind (e.g. 0.0.0.0 for agents on other hosts)",
+    )
+    coordinate_parser.add_argument(
+        "--port", type=int, default=COORDINATOR_PORT, help="TCP port to listen on"
+    )
+    add_skia_version_argument(coordinate_parser)
+    coordinate_parser.set_defaults(func=coordinate)
+
+    # agent subcommand
+    agent_parser = subparsers.add_parser(
+        "agent", help="Build the jobs of a coordinator in this workspace and upload the archives"
+    )
+    agent_parser.add_argument(
+        "coordinator", type=str, help="URL of the coordinator (e.g. http://build-1:8766)"
+    )
+    agent_parser.add_argument(
+        "--name", type=str, help="Name of the agent (defaults to <hostname>-<pid>)"
+    )
+    agent_parser.add_argument(
+        "--targets",
+        type=str,
+        nargs="+",
+        help="Targets to build (defaults to every target this workspace can build)",
+    )
+    agent_parser.add_argument(
+        "--keep-running",
+        action="store_true",
+        help="Wait for the next coordinator once its jobs are finished instead of exiting",
+    )
+    agent_parser.set_defaults(func=run_agent)
+
     args = parser.parse_args()
     current_platform = "macOS" if platform.system() == "Darwin" else platform.system()
 
+    if args.trace:
+        start_tracing()
+
+    try:
+        with (
+            span(f"skia-builder {args.command}", "cli"),
+            use_skia_version(getattr(args, "skia_version", None)),
+        ):
+            run(args, current_platform)
+    except SkiaBuilderError as e:
+        Logger.error(str(e))
+        sys.exit(e.exit_code)
+    finally:
+        if args.trace:
+            stop_tracing(args.trace)
+            Logger.info(f"Trace written to {args.trace}")
+
+
+def run(args, current_platform):
     if args.command == "setup-env":
         setup_env(current_platform, args.sub_env, args.skip_llvm_instalation)
 
+    elif args.command == "upgrade":
+        upgrade(current_platform)
+
     elif args.command == "build":
         if not args.target_cpu:
             Logger.error("Error: --target-cpu must be specified for the build command.")
@@ -139,6 +847,13 @@ def main():
             )
             sys.exit(1)
 
+        if args.pgo and (args.custom_build_args or args.watch):
+            Logger.error("Error: --pgo can't be combined with --custom-build-args or --watch.")
+            sys.exit(1)
+        if not args.pgo and (args.pgo_training_command or args.pgo_match or args.pgo_retrain):
+            Logger.error("Error: the --pgo-* options need --pgo.")
+            sys.exit(1)
+
         # Parse custom build arguments if provided
         custom_build_args, override_build_args = (
             (parse_custom_build_args(arg) if arg else {})
@@ -152,11 +867,89 @@ def main():
             override_build_args,
             args.archive,
             args.sub_env,
+            args.profile,
+            args.x86_64_levels,
+            args.debug_symbols,
+            args.watch,
+            args.plan,
+            args.pgo,
+            args.pgo_training_command,
+            args.pgo_match,
+            args.pgo_retrain,
         )
 
     elif args.command == "list-available-args":
         list_build_arguments(current_platform)
 
+    elif args.command == "verify":
+        verify_build_output(args.path, args.manifest, args.jobs)
+
+    elif args.command == "snapshot":
+        create_snapshot(
+            args.output or get_default_snapshot_name(current_platform), current_platform, args.jobs
+        )
+
+    elif args.command == "restore":
+        restore_snapshot(args.path, current_platform, args.jobs, args.force)
+
+    elif args.command == "pick-variant":
+        pick_build_variant(args.path)
+
+    elif args.command == "install":
+        install(args.target, args.dest, args.source, args.profile, args.x86_64_level, args.jobs)
+
+    elif args.command == "bisect":
+        bisect(
+            args.target,
+            args.good,
+            args.bad,
+            args.benchmark_command,
+            args.threshold,
+            args.runs,
+            args.warmup_runs,
+            args.metric,
+            args.higher_is_better,
+            args.profile,
+            args.x86_64_level,
+            parse_custom_build_args(args.override_build_args) if args.override_build_args else None,
+            args.log,
+            current_platform,
+        )
+
+    elif args.command == "bench":
+        bench(
+            args.target,
+            args.bench_configs,
+            args.match,
+            args.samples,
+            args.repeats,
+            args.output,
+            current_platform,
+        )
+
+    elif args.command == "gc":
+        gc(args.budget, args.dry_run)
+
+    elif args.command == "history":
+        report_history(args.target, args.skia_version, args.limit, args.setup)
+
+    elif args.command == "serve":
+        serve(current_platform, args.host, args.port, args.socket, args.max_concurrent_builds)
+
+    elif args.command == "coordinate":
+        coordinate(
+            args.targets,
+            args.profile,
+            args.debug_symbols,
+            parse_custom_build_args(args.override_build_args) if args.override_build_args else None,
+            args.overwrite,
+            args.host,
+            args.port,
+        )
+
+    elif args.command == "agent":
+        run_agent(args.coordinator, current_platform, args.name, args.targets, args.keep_running)
+
     else:
         Logger.error(f"Unsupported command: {args.command}")
         sys.exit(1)
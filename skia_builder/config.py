@@ -1,8 +1,160 @@
 import os
+
+from skia_builder.errors import (
+    DebugSymbolsError,
+    PGOError,
+    UnsupportedArchitectureError,
+    UnsupportedBuildProfileError,
+)
 from skia_builder.versions import ANDROID_NDK
 
 INCLUDE_DIRS = ["include", "modules", "src"]  # , "third_party"]
 DEFAULT_OUTPUT_DIR = os.path.join(os.getcwd(), "output")
+DEFAULT_CACHE_DIR = os.environ.get(
+    "SKIA_BUILDER_CACHE_DIR", os.path.join(os.getcwd(), ".skia-builder-cache")
+)
+DOWNLOAD_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "downloads")
+ANDROID_NDK_DIR = os.path.join(os.getcwd(), "Android_NDK")
+THINLTO_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "thinlto")
+
+# Disk budget (e.g. `50G`) of the out dirs, outputs and caches of the workspace, kept by evicting
+# the least recently used ones before each build and with `gc` (unset disables the pre-build pass).
+# Entries used in the last `GC_GRACE_PERIOD` seconds, e.g. by a concurrent build, are never evicted.
+GC_BUDGET = os.environ.get("SKIA_BUILDER_GC_BUDGET")
+GC_GRACE_PERIOD = float(os.environ.get("SKIA_BUILDER_GC_GRACE_PERIOD", "3600"))
+# Last use and size of every entry, so that collections don't measure unchanged entries again
+GC_INDEX = os.path.join(DEFAULT_CACHE_DIR, "usage.json")
+
+# SQLite database recording the timings, cache status and sizes of the setups and builds of the
+# workspace (`history`), used to predict build durations (empty disables it), and the number of
+# recent builds the predictions are based on
+HISTORY_DB = os.environ.get(
+    "SKIA_BUILDER_HISTORY_DB", os.path.join(DEFAULT_CACHE_DIR, "history.db")
+)
+HISTORY_WINDOW = int(os.environ.get("SKIA_BUILDER_HISTORY_WINDOW", "10"))
+
+# Set to 1 to always check out the full Skia tree and sync every DEPS entry
+FULL_CHECKOUT = os.environ.get("SKIA_BUILDER_FULL_CHECKOUT", "") == "1"
+
+# Sysroots of the Linux targets cross-compiled from a host of another CPU architecture, by target
+# CPU: an extracted sysroot, a tarball of one, or a directory of Debian packages (e.g. an apt
+# archive cache) from which `SYSROOT_PACKAGES` are extracted. Provisioned sysroots are cached.
+SYSROOT_SOURCES = {
+    "arm64": os.environ.get("SKIA_BUILDER_SYSROOT_ARM64"),
+    "x64": os.environ.get("SKIA_BUILDER_SYSROOT_X64"),
+}
+SYSROOTS_DIR = os.path.join(DEFAULT_CACHE_DIR, "sysroots")
+
+# Debian packages (fnmatch patterns, the latest matching version is used) making up a sysroot:
+# the C/C++ runtimes, and the fontconfig, EGL/GLES and X11 headers Skia builds against
+SYSROOT_PACKAGES = [
+    "libc6",
+    "libc6-dev",
+    "linux-libc-dev",
+    "libgcc-s1",
+    "libgcc-*-dev",
+    "libstdc++6",
+    "libstdc++-*-dev",
+    "libexpat1",
+    "libfontconfig1",
+    "libfontconfig-dev",
+    "libglvnd0",
+    "libglvnd-dev",
+    "libgl1",
+    "libgl-dev",
+    "libglx0",
+    "libglx-dev",
+    "libegl1",
+    "libegl-dev",
+    "libgles2",
+    "libgles-dev",
+    "libx11-dev",
+    "x11proto-dev",
+]
+
+# Compiler launcher prefixed to every compile command (GN's `cc_wrapper`), e.g. `ccache` or
+# `sccache`, so that objects compiled before (by another out dir, worktree or bisection step) are
+# reused
+CC_WRAPPER = os.environ.get("SKIA_BUILDER_CC_WRAPPER")
+
+# Status line ninja prints before each edge it runs (its default), whatever `NINJA_STATUS` the user
+# has set, so that the edges of a build can be counted from its output
+NINJA_STATUS = "[%f/%t] "
+
+# Maximum number of setup steps (clones, dependency syncs, installers) running at the same time
+SETUP_JOBS = int(os.environ.get("SKIA_BUILDER_SETUP_JOBS", "4"))
+
+# Where `install` fetches prebuilt archives from: an HTTP(S) base URL or a directory, under which
+# each archive is found at `ARTIFACT_PATH` (formatted with the Skia milestone and build name), next
+# to its `.manifest.json`
+ARTIFACT_SOURCE = os.environ.get("SKIA_BUILDER_ARTIFACT_SOURCE")
+ARTIFACT_PATH = os.environ.get(
+    "SKIA_BUILDER_ARTIFACT_PATH", "{skia_version}/{build_name}/{build_name}.tar.gz"
+)
+
+# Defaults of `bisect`: benchmark runs measured per commit (after discarded warmup runs), and the
+# p-value under which a commit slower than the threshold is considered regressed rather than noisy
+BISECT_RUNS = int(os.environ.get("SKIA_BUILDER_BISECT_RUNS", "5"))
+BISECT_WARMUP_RUNS = int(os.environ.get("SKIA_BUILDER_BISECT_WARMUP_RUNS", "1"))
+BISECT_SIGNIFICANCE = float(os.environ.get("SKIA_BUILDER_BISECT_SIGNIFICANCE", "0.05"))
+
+# GN arguments layered onto the ones of the library to build nanobench (`bench`), the nanobench
+# config it runs (the CPU raster backend), and the number of samples it takes of each bench
+NANOBENCH_BUILD_ARGS = "skia_enable_tools=true"
+NANOBENCH_CONFIG = "8888"
+BENCH_SAMPLES = int(os.environ.get("SKIA_BUILDER_BENCH_SAMPLES", "10"))
+
+# Profile-guided optimization (`build --pgo`): merged profiles are cached by milestone in
+# `PGO_PROFILES_DIR`, and nanobench training runs take `PGO_TRAINING_SAMPLES` samples of each bench
+PGO_PROFILES_DIR = os.path.join(DEFAULT_CACHE_DIR, "pgo")
+PGO_TRAINING_SAMPLES = int(os.environ.get("SKIA_BUILDER_PGO_TRAINING_SAMPLES", "3"))
+
+# Build agents (`agent`) ask the coordinator (`coordinate`) for a job every `AGENT_POLL_INTERVAL`
+# seconds while idle, and send a heartbeat as often while building. An agent not heard from for
+# `AGENT_TIMEOUT` seconds is considered gone, and its job is handed to another agent, up to
+# `CLUSTER_JOB_ATTEMPTS` attempts per job.
+COORDINATOR_PORT = 8766
+AGENT_POLL_INTERVAL = float(os.environ.get("SKIA_BUILDER_AGENT_POLL_INTERVAL", "5"))
+AGENT_TIMEOUT = float(os.environ.get("SKIA_BUILDER_AGENT_TIMEOUT", "60"))
+CLUSTER_JOB_ATTEMPTS = int(os.environ.get("SKIA_BUILDER_CLUSTER_JOB_ATTEMPTS", "2"))
+
+# Directories of the Skia checkout watched by `build --watch` (along with its top-level files, e.g.
+# BUILD.gn), how long changes must settle before rebuilding, in seconds, and the file names
+# (fnmatch patterns) of editor temporary files that don't trigger rebuilds
+WATCH_DIRS = [*INCLUDE_DIRS, "gn"]
+WATCH_DEBOUNCE = float(os.environ.get("SKIA_BUILDER_WATCH_DEBOUNCE", "0.5"))
+WATCH_IGNORED = ["*~", ".*.sw?", ".#*", "#*#", "4913", "*.tmp"]
+
+
+# Third-party dependencies (entries of Skia's DEPS) and Skia directories that are only needed when
+# one of the listed GN arguments is enabled. Setup skips a dependency, or the sources of a
+# directory (its GN files are always checked out, since GN may import them), when every build
+# target of the workspace sets all of its arguments to false.
+DEPS_REQUIRED_BY_ARGS = {
+    "third_party/externals/angle2": ["skia_use_angle"],
+    "third_party/externals/d3d12allocator": ["skia_use_direct3d"],
+    "third_party/externals/dawn": ["skia_use_dawn"],
+    "third_party/externals/imgui": ["skia_enable_tools"],
+    "third_party/externals/microhttpd": ["skia_enable_tools"],
+    "third_party/externals/spirv-cross": ["skia_use_vulkan", "skia_use_dawn"],
+    "third_party/externals/spirv-headers": ["skia_use_vulkan", "skia_use_dawn"],
+    "third_party/externals/spirv-tools": ["skia_use_vulkan", "skia_use_dawn"],
+    "third_party/externals/vulkan-headers": ["skia_use_vulkan", "skia_use_dawn"],
+    "third_party/externals/vulkan-tools": ["skia_use_vulkan", "skia_use_dawn"],
+    "third_party/externals/vulkan-utility-libraries": ["skia_use_vulkan", "skia_use_dawn"],
+    "third_party/externals/vulkanmemoryallocator": ["skia_use_vulkan", "skia_use_dawn"],
+}
+SKIA_DIRS_REQUIRED_BY_ARGS = {
+    "bench": ["skia_enable_tools"],
+    "dm": ["skia_enable_tools"],
+    "fuzz": ["skia_enable_tools"],
+    "gm": ["skia_enable_tools"],
+    "resources": ["skia_enable_tools", "skia_compile_sksl_tests"],
+    "samplecode": ["skia_enable_tools"],
+    "tests": ["skia_enable_tools"],
+}
+# Skia directories never needed to build the libraries
+SKIA_DIRS_NOT_REQUIRED = ["demos.skia.org", "docs", "experimental", "infra", "site", "specs"]
 
 
 bin_extensions_by_platform = {
@@ -63,7 +215,7 @@ android_base_flags = {
     "skia_use_metal": False,
     # build env configs
     "target_os": "android",
-    "ndk": os.path.join(os.getcwd(), "Android_NDK", ANDROID_NDK),
+    "ndk": os.path.join(ANDROID_NDK_DIR, ANDROID_NDK),
     "cc": "clang",
     "cxx": "clang++",
     "extra_cflags_cc": ["-std=c++17"],
@@ -136,7 +288,7 @@ platform_specific_flags = {
         "clang_win": "C:/Program Files/LLVM",
         # Unreal Engine Dynamic CRT linkage /MD
         "extra_cflags_cc": ["/std:c++17", "/MD"],
-        "extra_cflags": ["/MD"]
+        "extra_cflags": ["/MD"],
     },
     "linux-x64": {
         **linux_base_flags,
@@ -211,6 +363,233 @@ platform_specific_flags = {
 }
 
 
+DEFAULT_BUILD_PROFILE = "size"
+
+_speed_flags = {
+    "skia_enable_optimize_size": False,
+    "extra_cflags": ["-O3", "-ffunction-sections", "-fdata-sections"],
+    "extra_cflags_cc": ["-fvisibility-inlines-hidden"],
+}
+_speed_thinlto_flags = {
+    **_speed_flags,
+    "extra_cflags": [*_speed_flags["extra_cflags"], "-flto=thin"],
+    # Objects are LLVM bitcode, which needs llvm-ar (Apple's libtool handles it natively)
+    "ar": "llvm-ar",
+}
+
+# Presets layered onto `platform_specific_flags` (list values are appended), keyed by profile and
+# then by `target_os` ("default" applies to the others). The default profile, `size`, is what
+# `platform_specific_flags` is tuned for. Objects built with ThinLTO are LLVM bitcode, so the
+# libraries must be linked with an LTO-capable LLVM linker; the link cache of the binaries linked
+# by the build (e.g. nanobench) is kept in `THINLTO_CACHE_DIR`, with flags only lld accepts where
+# clang would otherwise link with the system linker (GNU ld or gold on Linux).
+build_profiles = {
+    "size": {
+        "default": {},
+    },
+    "speed": {
+        "default": _speed_flags,
+        "win": {
+            "skia_enable_optimize_size": False,
+            "extra_cflags": ["/O2", "/Gy", "/Gw"],
+        },
+    },
+    "speed-thinlto": {
+        "default": {
+            **_speed_thinlto_flags,
+            "extra_ldflags": [
+                "-flto=thin",
+                "-fuse-ld=lld",
+                f"-Wl,--thinlto-cache-dir={THINLTO_CACHE_DIR}",
+                "-Wl,--thinlto-cache-policy=prune_after=168h:cache_size_bytes=10g",
+            ],
+        },
+        "mac": {
+            **_speed_thinlto_flags,
+            "extra_ldflags": ["-flto=thin", f"-Wl,-cache_path_lto,{THINLTO_CACHE_DIR}"],
+        },
+        "ios": {
+            **_speed_thinlto_flags,
+            "extra_ldflags": ["-flto=thin", f"-Wl,-cache_path_lto,{THINLTO_CACHE_DIR}"],
+        },
+        # The Windows toolchain archives with lib.exe, which can't index bitcode objects
+        "win": None,
+    },
+}
+
+
+def apply_build_profile(flags, profile):
+    """
+    Returns `flags` with the preset of `profile` layered on top of them.
+
+    Raises:
+        UnsupportedBuildProfileError: If the profile is unknown or unsupported for the target OS.
+    """
+    if profile not in build_profiles:
+        raise UnsupportedBuildProfileError(
+            f"Unknown build profile: {profile}. Available profiles are: {', '.join(build_profiles)}"
+        )
+
+    presets = build_profiles[profile]
+    target_os = flags.get("target_os")
+    profile_flags = presets.get(target_os, presets["default"])
+    if profile_flags is None:
+        raise UnsupportedBuildProfileError(
+            f"The {profile} build profile is not supported for {target_os} targets"
+        )
+
+    layered_flags = dict(flags)
+    for key, value in profile_flags.items():
+        if isinstance(value, list):
+            layered_flags[key] = [*layered_flags.get(key, []), *value]
+        else:
+            layered_flags[key] = value
+    return layered_flags
+
+
+# x86-64 microarchitecture levels (from the x86-64 psABI) that x64 targets can additionally be
+# built for, with the CPU features each one requires on top of the previous level (named as in
+# the `flags` of /proc/cpuinfo)
+X86_64_LEVELS = {
+    "v2": ["cx16", "lahf_lm", "popcnt", "pni", "sse4_1", "sse4_2", "ssse3"],
+    "v3": ["abm", "avx", "avx2", "bmi1", "bmi2", "f16c", "fma", "movbe", "xsave"],
+    "v4": ["avx512bw", "avx512cd", "avx512dq", "avx512f", "avx512vl"],
+}
+
+
+def get_x86_64_level_features(level):
+    """Returns every CPU feature required by an x86-64 microarchitecture level."""
+    levels = list(X86_64_LEVELS)
+    return sorted(
+        feature
+        for previous in levels[: levels.index(level) + 1]
+        for feature in X86_64_LEVELS[previous]
+    )
+
+
+def apply_x86_64_level(flags, level):
+    """
+    Returns `flags` targeting an x86-64 microarchitecture level (`-march=x86-64-<level>`).
+
+    Raises:
+        UnsupportedArchitectureError: If the level is unknown or the target is not x86-64.
+    """
+    if level not in X86_64_LEVELS:
+        raise UnsupportedArchitectureError(
+            f"Unknown x86-64 level: {level}. Available levels are: {', '.join(X86_64_LEVELS)}"
+        )
+    # clang-cl only supports /arch:, which doesn't map to the psABI levels
+    if flags.get("target_cpu") not in ("x86_64", "x64") or flags.get("target_os") == "win":
+        raise UnsupportedArchitectureError(
+            f"x86-64 level variants are not supported for {flags.get('target_os')} "
+            f"{flags.get('target_cpu')} targets"
+        )
+    return {**flags, "extra_cflags": [*flags.get("extra_cflags", []), f"-march=x86-64-{level}"]}
+
+
+# Clang target triples of the Linux targets, by GN `target_cpu`
+LINUX_TARGET_TRIPLES = {
+    "arm64": "aarch64-linux-gnu",
+    "x86_64": "x86_64-linux-gnu",
+}
+
+
+def apply_sysroot(flags, sysroot):
+    """
+    Returns `flags` cross-compiling a Linux target against `sysroot`.
+
+    Raises:
+        UnsupportedArchitectureError: If the target can't be cross-compiled.
+    """
+    triple = LINUX_TARGET_TRIPLES.get(flags.get("target_cpu"))
+    if flags.get("target_os") != "linux" or triple is None:
+        raise UnsupportedArchitectureError(
+            f"Cross-compiling {flags.get('target_os')} {flags.get('target_cpu')} targets against "
+            "a sysroot is not supported"
+        )
+    cross_flags = [f"--target={triple}", f"--sysroot={sysroot}"]
+    return {
+        **flags,
+        **{
+            key: [*flags.get(key, []), *cross_flags]
+            for key in ("extra_asmflags", "extra_cflags", "extra_ldflags")
+        },
+    }
+
+
+# Modes of `--debug-symbols`: `none` builds without debug info (`-g0`, see `common_flags`), `split`
+# compiles with compressed DWARF, ships stripped libraries and packages their debug info in a
+# separate archive. The compilation dir is recorded as `.` so that the debug info doesn't depend on
+# where the workspace is.
+DEBUG_SYMBOLS_MODES = ("none", "split")
+DEFAULT_DEBUG_SYMBOLS = "none"
+DEBUG_SYMBOLS_CFLAGS = ["-g", "-gz=zlib", "-fdebug-compilation-dir=."]
+# `target_os` of the targets whose objects are ELF, which objcopy can strip
+DEBUG_SYMBOLS_TARGET_OS = ("linux", "android")
+
+
+def apply_debug_symbols(flags, mode):
+    """
+    Returns `flags` compiling with the debug info of a `--debug-symbols` mode.
+
+    Raises:
+        DebugSymbolsError: If the mode is unknown or unsupported for the target OS.
+    """
+    if mode not in DEBUG_SYMBOLS_MODES:
+        raise DebugSymbolsError(
+            f"Unknown debug symbols mode: {mode}. Available modes are: "
+            f"{', '.join(DEBUG_SYMBOLS_MODES)}"
+        )
+    if mode == DEFAULT_DEBUG_SYMBOLS:
+        return flags
+    if flags.get("target_os") not in DEBUG_SYMBOLS_TARGET_OS:
+        raise DebugSymbolsError(
+            f"Split debug symbols are not supported for {flags.get('target_os')} targets"
+        )
+    extra_cflags = [flag for flag in flags.get("extra_cflags", []) if flag != "-g0"]
+    return {**flags, "extra_cflags": [*extra_cflags, *DEBUG_SYMBOLS_CFLAGS]}
+
+
+# PGO builds of clang: the instrumented variant writes raw profiles when the binaries linked with it
+# exit (to the path of `LLVM_PROFILE_FILE`), and the final build optimizes with the merged profile.
+# Functions the training doesn't reach, and a profile of another revision of a source, only warn.
+PGO_INSTRUMENT = "instrument"
+PGO_INSTRUMENT_FLAGS = ["-fprofile-instr-generate"]
+PGO_USE_CFLAGS = [
+    "-Wno-profile-instr-out-of-date",
+    "-Wno-profile-instr-unprofiled",
+    "-Wno-backend-plugin",
+]
+# `target_os` of the targets built with clang and trained on the host
+PGO_TARGET_OS = ("linux",)
+
+
+def apply_pgo(flags, pgo):
+    """
+    Returns `flags` instrumented for PGO training (`pgo` is `PGO_INSTRUMENT`), or optimized with
+    the merged profile at the path `pgo`.
+
+    Raises:
+        PGOError: If PGO is not supported for the target OS.
+    """
+    if flags.get("target_os") not in PGO_TARGET_OS:
+        raise PGOError(f"PGO is not supported for {flags.get('target_os')} targets")
+    if pgo != PGO_INSTRUMENT:
+        return {
+            **flags,
+            "extra_cflags": [
+                *flags.get("extra_cflags", []),
+                f"-fprofile-instr-use={pgo}",
+                *PGO_USE_CFLAGS,
+            ],
+        }
+    return {
+        **flags,
+        "extra_cflags": [*flags.get("extra_cflags", []), *PGO_INSTRUMENT_FLAGS],
+        "extra_ldflags": [*flags.get("extra_ldflags", []), *PGO_INSTRUMENT_FLAGS],
+    }
+
+
 def parse_override_build_args(base_args_str, override_args_str):
     base_args = base_args_str.replace("'", '"').split()
     override_args = override_args_str.replace("'", '"').split()
@@ -228,8 +607,22 @@ def parse_override_build_args(base_args_str, override_args_str):
     return " ".join(base_args)
 
 
-def get_build_args(target_platform):
+def get_build_args(
+    target_platform, profile=None, x86_64_level=None, sysroot=None, debug_symbols=None, pgo=None
+):
     flags = platform_specific_flags.get(target_platform, {})
+    if profile and profile != DEFAULT_BUILD_PROFILE:
+        flags = apply_build_profile(flags, profile)
+    if x86_64_level:
+        flags = apply_x86_64_level(flags, x86_64_level)
+    if debug_symbols:
+        flags = apply_debug_symbols(flags, debug_symbols)
+    if pgo:
+        flags = apply_pgo(flags, pgo)
+    if sysroot:
+        flags = apply_sysroot(flags, sysroot)
+    if CC_WRAPPER:
+        flags = {**flags, "cc_wrapper": CC_WRAPPER}
 
     args_list = []
     for key, value in flags.items():
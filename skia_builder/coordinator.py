@@ -0,0 +1,689 @@
+"""
+Fan-out of whole-target builds to build agents on other hosts (`skia-builder coordinate`, see
+agent.py for `skia-builder agent`).
+
+The coordinator turns every requested target into a job: the build target, its resolved GN
+arguments and the Skia commit to build. Agents register with it, listing the targets and
+milestones their workspace can build, then lease the jobs one at a time, build them in their own
+workspace and upload the archives back. Each upload is checked against its checksum, and the
+archive against its embedded manifest, before the output is moved to `output/`, where a local
+build would have put it. The jobs of agents that stop sending heartbeats, and failed ones, are
+handed to another agent, up to `CLUSTER_JOB_ATTEMPTS` attempts per job. The jobs predicted to
+take the longest (see history.py) are handed out first, and successful ones are recorded in the
+history of the coordinator's workspace.
+
+GN arguments are exchanged in a host independent form (see `resolve_job_args`), since the
+workspace, cache and sysroot paths and the compiler wrapper differ from one host to another.
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from skia_builder import history
+from skia_builder.api import resolve_target, split_x86_64_level
+from skia_builder.cleanup import record_use
+from skia_builder.debuginfo import DEBUG_ARCHIVE_SUFFIX
+from skia_builder.config import (
+    AGENT_POLL_INTERVAL,
+    AGENT_TIMEOUT,
+    CLUSTER_JOB_ATTEMPTS,
+    COORDINATOR_PORT,
+    DEFAULT_BUILD_PROFILE,
+    DEFAULT_CACHE_DIR,
+    DEFAULT_DEBUG_SYMBOLS,
+    get_build_args,
+    parse_override_build_args,
+)
+from skia_builder.errors import ClusterError, OutputExistsError
+from skia_builder.manifest import hash_file, verify_archive
+from skia_builder.utils import Logger
+from skia_builder.versions import SKIA_COMMIT
+from skia_builder.workspace import (
+    get_output_dir,
+    get_skia_path,
+    get_skia_version,
+    is_default_version,
+)
+
+SKIA_REPOSITORY = "https://skia.googlesource.com/skia.git"
+# Placeholders of the host specific paths in the GN arguments of a job
+WORKSPACE_PLACEHOLDER = "{workspace}"
+CACHE_PLACEHOLDER = "{cache}"
+# Uploads of the running jobs, moved to the output dir once the job succeeded and was verified
+UPLOADS_DIR = os.path.join(DEFAULT_CACHE_DIR, "uploads")
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+class ClusterRequestError(ValueError):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def resolve_job_args(
+    manager,
+    target_cpu,
+    override_build_args=None,
+    profile=None,
+    x86_64_level=None,
+    debug_symbols=None,
+):
+    """
+    Returns the GN arguments of a job in their host independent form: the default arguments of
+    the target without the sysroot it is cross-compiled against and `cc_wrapper`, which every host
+    adds for itself, and with the workspace and cache paths replaced by placeholders.
+
+    Raises:
+        UnsupportedBuildProfileError: If the profile is not supported for the target.
+        UnsupportedArchitectureError: If the x86-64 level is not supported for the target.
+        DebugSymbolsError: If split debug symbols are not supported for the target.
+    """
+    build_args = get_build_args(
+        manager.get_build_target(target_cpu), profile, x86_64_level, None, debug_symbols
+    )
+    if override_build_args:
+        build_args = parse_override_build_args(build_args, override_build_args)
+    build_args = " ".join(arg for arg in build_args.split() if not arg.startswith("cc_wrapper="))
+    # The cache is usually inside the workspace, so it is replaced first
+    for path, placeholder in (
+        (DEFAULT_CACHE_DIR, CACHE_PLACEHOLDER),
+        (os.getcwd(), WORKSPACE_PLACEHOLDER),
+    ):
+        build_args = build_args.replace(os.path.abspath(path), placeholder)
+    return build_args
+
+
+def resolve_commit(skia_version=None):
+    """
+    Returns the Skia commit the jobs of a milestone build: the one checked out in this workspace,
+    else the pinned one, else the head of the milestone's branch.
+
+    Raises:
+        ClusterError: If the commit can't be resolved.
+    """
+    skia_version = skia_version or get_skia_version()
+    skia_path = get_skia_path(skia_version)
+    if os.path.isdir(skia_path):
+        command, cwd = ["git", "rev-parse", "HEAD"], skia_path
+    elif is_default_version(skia_version) and SKIA_COMMIT:
+        return SKIA_COMMIT
+    else:
+        command = ["git", "ls-remote", SKIA_REPOSITORY, f"refs/heads/chrome/{skia_version}"]
+        cwd = None
+
+    try:
+        output = subprocess.run(
+            command, cwd=cwd, capture_output=True, text=True, check=True
+        ).stdout.split()
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise ClusterError(f"Unable to resolve the Skia commit of {skia_version}: {e}") from e
+    if not output:
+        raise ClusterError(f"No chrome/{skia_version} branch found in {SKIA_REPOSITORY}")
+    return output[0]
+
+
+class ClusterJob:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(
+        self,
+        manager,
+        target_cpu,
+        skia_version,
+        skia_commit,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+        override_build_args=None,
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.manager = manager
+        self.target_cpu = target_cpu
+        self.skia_version = skia_version
+        self.skia_commit = skia_commit
+        self.profile = profile or DEFAULT_BUILD_PROFILE
+        self.x86_64_level = x86_64_level
+        self.debug_symbols = debug_symbols or DEFAULT_DEBUG_SYMBOLS
+        self.override_build_args = override_build_args
+        self.build_target = manager.get_build_target(target_cpu)
+        self.build_name = manager.get_build_name(target_cpu, self.profile, x86_64_level)
+        self.build_args = resolve_job_args(
+            manager,
+            target_cpu,
+            override_build_args,
+            self.profile,
+            x86_64_level,
+            self.debug_symbols,
+        )
+        self.output_dir = get_output_dir(self.build_name, skia_version)
+        self.status = ClusterJob.QUEUED
+        self.attempts = 0
+        self.agent = None
+        self.lease = None
+        self.failed_agents = set()
+        self.errors = []
+        self.result = None
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in (ClusterJob.SUCCEEDED, ClusterJob.FAILED)
+
+    @property
+    def upload_dir(self):
+        return os.path.join(UPLOADS_DIR, f"{self.id}-{self.attempts}")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "target": self.build_target,
+            "platform": self.manager.TARGET_PLATFORM.value,
+            "target_cpu": self.target_cpu,
+            "skia_version": self.skia_version,
+            "skia_commit": self.skia_commit,
+            "profile": self.profile,
+            "x86_64_level": self.x86_64_level,
+            "debug_symbols": self.debug_symbols,
+            "override_build_args": self.override_build_args,
+            "build_args": self.build_args,
+            "build_name": self.build_name,
+            "status": self.status,
+            "attempts": self.attempts,
+            "agent": self.agent,
+            "errors": self.errors,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+        }
+
+
+class Coordinator:
+    """
+    Hands out jobs to the registered agents and collects their outputs.
+
+    Jobs are leased in order to the first agent that can build them, and a job that failed on an
+    agent is only handed back to it when no other live agent can build it.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = {job.id: job for job in jobs}
+        self.agents = {}
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return all(job.finished for job in self.jobs.values())
+
+    def _get_agent(self, agent_id):
+        agent = self.agents.get(agent_id)
+        if agent is None:
+            raise ClusterRequestError(404, f"Unknown agent: {agent_id}")
+        agent["last_seen"] = time.monotonic()
+        return agent
+
+    def _get_leased_job(self, job_id, lease):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ClusterRequestError(404, f"Unknown job: {job_id}")
+        if job.status != ClusterJob.RUNNING or not lease or job.lease != lease:
+            raise ClusterRequestError(409, f"The lease of job {job_id} is no longer valid")
+        if agent := self.agents.get(job.agent):
+            agent["last_seen"] = time.monotonic()
+        return job
+
+    def register(self, payload):
+        if not isinstance(payload, dict):
+            raise ClusterRequestError(400, "Request body must be a JSON object")
+        targets, skia_versions = payload.get("targets"), payload.get("skia_versions")
+        if not isinstance(targets, list) or not isinstance(skia_versions, list):
+            raise ClusterRequestError(400, "An agent must list its targets and skia_versions")
+
+        agent_id = uuid.uuid4().hex[:12]
+        agent = {
+            "id": agent_id,
+            "name": str(payload.get("name") or agent_id),
+            "host": payload.get("host"),
+            "targets": targets,
+            "skia_versions": skia_versions,
+            "job": None,
+            "done": False,
+            "last_seen": time.monotonic(),
+        }
+        with self._condition:
+            self.agents[agent_id] = agent
+        Logger.info(
+            f"Agent {agent['name']} registered ({', '.join(targets) or 'no targets'}; "
+            f"{', '.join(skia_versions) or 'no milestones'})"
+        )
+        return agent
+
+    @staticmethod
+    def _can_build(agent, job):
+        return job.build_target in agent["targets"] and job.skia_version in agent["skia_versions"]
+
+    def lease(self, agent_id):
+        """
+        Leases the next job an agent can build.
+
+        Returns:
+            ClusterJob: The job, or None if none is ready for the agent.
+
+        Raises:
+            ClusterRequestError: If the agent is unknown, or (410) every job is finished.
+        """
+        with self._condition:
+            agent = self._get_agent(agent_id)
+            if self.finished:
+                agent["done"] = True
+                raise ClusterRequestError(410, "Every job is finished")
+
+            for job in self.jobs.values():
+                if job.status != ClusterJob.QUEUED or not self._can_build(agent, job):
+                    continue
+                if agent_id in job.failed_agents and any(
+                    other_id not in job.failed_agents and self._can_build(other, job)
+                    for other_id, other in self.agents.items()
+                ):
+                    continue
+
+                job.status = ClusterJob.RUNNING
+                job.attempts += 1
+                job.agent = agent_id
+                job.lease = uuid.uuid4().hex
+                job.started_at = time.time()
+                agent["job"] = job.id
+                shutil.rmtree(job.upload_dir, ignore_errors=True)
+                os.makedirs(job.upload_dir)
+                Logger.info(
+                    f"Leased {job.build_name} to {agent['name']} "
+                    f"(attempt {job.attempts}/{CLUSTER_JOB_ATTEMPTS})"
+                )
+                return job
+        return None
+
+    def heartbeat(self, agent_id):
+        with self._condition:
+            agent = self._get_agent(agent_id)
+            job = self.jobs.get(agent["job"])
+            return {"job": job.id if job and job.agent == agent_id else None}
+
+    def _fail_attempt(self, job, error):
+        """Records a failed attempt of a running job, queueing it again if attempts remain."""
+        agent = self.agents.get(job.agent)
+        agent_name = agent["name"] if agent else job.agent
+        if agent:
+            agent["job"] = None
+        job.errors.append({"agent": agent_name, "attempt": job.attempts, "error": error})
+        job.failed_agents.add(job.agent)
+        shutil.rmtree(job.upload_dir, ignore_errors=True)
+        job.lease = None
+
+        if job.attempts < CLUSTER_JOB_ATTEMPTS:
+            job.status = ClusterJob.QUEUED
+            Logger.warning(f"{job.build_name} failed on {agent_name}, retrying: {error}")
+        else:
+            job.status = ClusterJob.FAILED
+            job.finished_at = time.time()
+            Logger.error(f"{job.build_name} failed on {agent_name}: {error}")
+        self._condition.notify_all()
+
+    def store_artifact(self, job_id, lease, name, stream, length, sha256):
+        """
+        Stores an artifact uploaded for a leased job, checking it against its SHA-256.
+
+        Raises:
+            ClusterRequestError: If the lease is not valid, or the upload is incomplete or
+                doesn't match its checksum.
+        """
+        if not name or os.path.basename(name) != name or name.startswith("."):
+            raise ClusterRequestError(400, f"Invalid artifact name: {name!r}")
+        with self._condition:
+            job = self._get_leased_job(job_id, lease)
+            path = os.path.join(job.upload_dir, name)
+
+        digest = hashlib.sha256()
+        remaining = length
+        with open(f"{path}.part", "wb") as f:
+            while remaining > 0:
+                chunk = stream.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                digest.update(chunk)
+                remaining -= len(chunk)
+        if remaining:
+            os.remove(f"{path}.part")
+            raise ClusterRequestError(400, f"Upload of {name} is incomplete")
+        if digest.hexdigest() != sha256:
+            os.remove(f"{path}.part")
+            raise ClusterRequestError(400, f"Upload of {name} doesn't match its SHA-256")
+
+        with self._condition:
+            # The job may have been handed to another agent meanwhile
+            self._get_leased_job(job_id, lease)
+            os.replace(f"{path}.part", path)
+
+    def _verify_upload(self, job, artifacts):
+        """Returns why the uploaded output of a job can't be accepted, or None if it can."""
+        archive_name = f"{job.build_name}.tar.gz"
+        if archive_name not in artifacts:
+            return f"The archive {archive_name} was not uploaded"
+        for name, sha256 in artifacts.items():
+            path = os.path.join(job.upload_dir, os.path.basename(name))
+            if not os.path.isfile(path) or hash_file(path) != sha256:
+                return f"The artifact {name} is missing or doesn't match its SHA-256"
+        try:
+            mismatches = verify_archive(os.path.join(job.upload_dir, archive_name))
+        except (OSError, ValueError, tarfile.TarError) as e:
+            return f"Unable to verify {archive_name}: {e}"
+        if mismatches:
+            path, reason = mismatches[0]
+            return f"{archive_name} doesn't match its manifest ({path}: {reason})"
+        return None
+
+    def complete(self, job_id, payload):
+        """
+        Records the outcome an agent reported for a leased job, moving its uploaded output to the
+        output dir once verified.
+
+        Raises:
+            ClusterRequestError: If the lease is not valid, or the output can't be verified.
+        """
+        if not isinstance(payload, dict):
+            raise ClusterRequestError(400, "Request body must be a JSON object")
+        lease = payload.get("lease")
+        with self._condition:
+            job = self._get_leased_job(job_id, lease)
+            agent_name = self.agents[job.agent]["name"] if job.agent in self.agents else job.agent
+            if payload.get("status") != ClusterJob.SUCCEEDED:
+                for line in payload.get("log_tail") or []:
+                    Logger.info(f"[{agent_name}] {line}")
+                self._fail_attempt(job, str(payload.get("error") or "Build failed"))
+                return job
+
+        artifacts = payload.get("artifacts") or {}
+        error = self._verify_upload(job, artifacts)
+        with self._condition:
+            job = self._get_leased_job(job_id, lease)
+            if error:
+                self._fail_attempt(job, error)
+                raise ClusterRequestError(422, error)
+
+            if os.path.exists(job.output_dir):
+                shutil.rmtree(job.output_dir)
+            os.makedirs(os.path.dirname(os.path.abspath(job.output_dir)), exist_ok=True)
+            shutil.move(job.upload_dir, job.output_dir)
+            record_use(job.output_dir)
+
+            build = payload.get("result") or {}
+            job.result = {
+                "agent": agent_name,
+                "duration": build.get("duration"),
+                "timings": build.get("timings"),
+                "cache": build.get("cache"),
+                "build_args": build.get("build_args"),
+                "ninja_edges": build.get("ninja_edges"),
+                "peak_rss_kib": build.get("peak_rss_kib"),
+                "output_dir": os.path.abspath(job.output_dir),
+                "artifacts": [
+                    os.path.abspath(os.path.join(job.output_dir, name)) for name in artifacts
+                ],
+            }
+            job.status = ClusterJob.SUCCEEDED
+            job.finished_at = time.time()
+            job.lease = None
+            if agent := self.agents.get(job.agent):
+                agent["job"] = None
+            self._condition.notify_all()
+
+        self._record_history(job, build, agent_name)
+        duration = build.get("duration")
+        duration = f" in {duration:.1f}s" if isinstance(duration, (int, float)) else ""
+        Logger.info(f"{job.build_name} built by {agent_name}{duration}")
+        return job
+
+    @staticmethod
+    def _record_history(job, build, agent_name):
+        if not isinstance(build.get("duration"), (int, float)):
+            return
+        sizes = {}
+        for path in job.result["artifacts"]:
+            if path.endswith(DEBUG_ARCHIVE_SUFFIX):
+                sizes["debug_archive"] = os.path.getsize(path)
+            elif path.endswith(".tar.gz"):
+                sizes["archive"] = os.path.getsize(path)
+        history.record_build(
+            job.build_target,
+            job.build_name,
+            job.skia_version,
+            job.build_args,
+            build["duration"],
+            build.get("timings") or {},
+            build.get("cache") or {},
+            build.get("ninja_edges"),
+            build.get("peak_rss_kib"),
+            sizes,
+            agent_name,
+        )
+
+    def expire_agents(self):
+        """Forgets the agents not heard from for `AGENT_TIMEOUT`, failing their running job."""
+        with self._condition:
+            now = time.monotonic()
+            for agent_id, agent in list(self.agents.items()):
+                if now - agent["last_seen"] < AGENT_TIMEOUT:
+                    continue
+                Logger.warning(f"Agent {agent['name']} stopped responding")
+                job = self.jobs.get(agent["job"])
+                if job and job.agent == agent_id and job.status == ClusterJob.RUNNING:
+                    self._fail_attempt(job, f"Agent {agent['name']} stopped responding")
+                del self.agents[agent_id]
+
+    def wait(self):
+        """Blocks until every job is finished, then until the agents were told so."""
+        while True:
+            self.expire_agents()
+            with self._condition:
+                if self.finished:
+                    break
+                self._condition.wait(timeout=1)
+
+        # Agents learn that the run is over from their next lease request
+        deadline = time.monotonic() + AGENT_POLL_INTERVAL + 1
+        with self._condition:
+            while time.monotonic() < deadline and not all(
+                agent["done"] for agent in self.agents.values()
+            ):
+                self._condition.wait(timeout=0.2)
+
+
+class CoordinatorRequestHandler(BaseHTTPRequestHandler):
+    """
+    Endpoints:
+        POST /agents                        Register an agent ({"name", "host", "targets",
+                                            "skia_versions"}).
+        POST /agents/<id>/lease             Lease the next job the agent can build (204 when none
+                                            is ready, 410 once every job is finished).
+        POST /agents/<id>/heartbeat         Keep the agent and its leased job alive.
+        PUT  /jobs/<id>/artifacts/<name>    Upload an artifact of a leased job (with X-Lease and
+                                            X-Content-SHA256 headers).
+        POST /jobs/<id>/result              Report the outcome of a leased job ({"lease",
+                                            "status", "error", "artifacts", "result",
+                                            "log_tail"}).
+        GET  /jobs                          List the jobs and their status.
+    """
+
+    protocol_version = "HTTP/1.1"
+    coordinator = None
+
+    def log_message(self, format, *args):
+        Logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            raise ClusterRequestError(400, f"Invalid JSON body: {e}") from e
+
+    def _handle(self, method):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        try:
+            if method == "POST" and parts == ["agents"]:
+                agent = self.coordinator.register(self._read_json())
+                self._send_json(201, {"id": agent["id"]})
+            elif method == "POST" and len(parts) == 3 and parts[0] == "agents":
+                self._read_json()
+                if parts[2] == "lease":
+                    job = self.coordinator.lease(parts[1])
+                    if job is None:
+                        self.send_response(204)
+                        self.end_headers()
+                    else:
+                        self._send_json(200, {**job.to_dict(), "lease": job.lease})
+                elif parts[2] == "heartbeat":
+                    self._send_json(200, self.coordinator.heartbeat(parts[1]))
+                else:
+                    raise ClusterRequestError(404, f"Unknown endpoint: {self.path}")
+            elif method == "PUT" and len(parts) == 4 and parts[::2] == ["jobs", "artifacts"]:
+                self.coordinator.store_artifact(
+                    parts[1],
+                    self.headers.get("X-Lease"),
+                    parts[3],
+                    self.rfile,
+                    int(self.headers.get("Content-Length", 0)),
+                    self.headers.get("X-Content-SHA256"),
+                )
+                self._send_json(200, {"stored": parts[3]})
+            elif method == "POST" and len(parts) == 3 and parts[::2] == ["jobs", "result"]:
+                job = self.coordinator.complete(parts[1], self._read_json())
+                self._send_json(200, job.to_dict())
+            elif method == "GET" and parts == ["jobs"]:
+                self._send_json(200, [job.to_dict() for job in self.coordinator.jobs.values()])
+            else:
+                raise ClusterRequestError(404, f"Unknown endpoint: {self.path}")
+        except ClusterRequestError as e:
+            # Unread request bodies (e.g. of rejected uploads) can't be followed by another request
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+
+def coordinate(
+    targets,
+    profile=None,
+    debug_symbols=None,
+    override_build_args=None,
+    overwrite=False,
+    host="127.0.0.1",
+    port=COORDINATOR_PORT,
+):
+    """
+    Serves the builds of `targets` to build agents until every one of them is finished.
+
+    Args:
+        targets (list[str]): Build targets, e.g. `linux-x64`, `linux-x64-v3` or `android-arm64`.
+        profile (str): Build profile of the targets. Defaults to `size`.
+        debug_symbols (str): Debug info mode of the targets, `none` (the default) or `split`.
+        override_build_args (str): GN arguments overriding values of the default ones.
+        overwrite (bool): Whether existing output directories are replaced.
+        host (str): Address to bind, e.g. `0.0.0.0` for agents on other hosts.
+        port (int): TCP port to listen on.
+
+    Raises:
+        UnsupportedPlatformError: If a target platform is not supported.
+        UnsupportedArchitectureError: If a target CPU is not supported by its platform.
+        OutputExistsError: If the output directory of a target exists and `overwrite` is False.
+        ClusterError: If the Skia commit can't be resolved, or some builds failed.
+
+    Returns:
+        list[dict]: The jobs, with their status and result.
+    """
+    skia_version = get_skia_version()
+    skia_commit = resolve_commit(skia_version)
+    jobs = []
+    for target in dict.fromkeys(targets):
+        base_target, x86_64_level = split_x86_64_level(target)
+        manager, target_cpu = resolve_target(base_target)
+        job = ClusterJob(
+            manager,
+            target_cpu,
+            skia_version,
+            skia_commit,
+            profile,
+            x86_64_level,
+            debug_symbols,
+            override_build_args,
+        )
+        if os.path.exists(job.output_dir) and not overwrite:
+            raise OutputExistsError(job.output_dir)
+        jobs.append(job)
+
+    def predict_duration(job):
+        prediction = history.predict(job.build_name, skia_version, job.build_args)
+        # Jobs without history may be the longest, they are handed out first
+        return prediction["duration"] if prediction else math.inf
+
+    jobs.sort(key=predict_duration, reverse=True)
+    coordinator = Coordinator(jobs)
+    handler = type("Handler", (CoordinatorRequestHandler,), {"coordinator": coordinator})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    server_thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    server_thread.start()
+
+    Logger.info(
+        f"Coordinating {len(jobs)} build(s) of Skia {skia_version} at {skia_commit[:12]} on "
+        f"http://{host}:{httpd.server_address[1]}. Start agents with "
+        f"`skia-builder agent http://<this host>:{httpd.server_address[1]}`."
+    )
+    try:
+        coordinator.wait()
+    except KeyboardInterrupt:
+        Logger.info("Shutting down the coordinator")
+        return [job.to_dict() for job in jobs]
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        shutil.rmtree(UPLOADS_DIR, ignore_errors=True)
+
+    failed = [job for job in jobs if job.status == ClusterJob.FAILED]
+    for job in jobs:
+        if job.status == ClusterJob.SUCCEEDED:
+            Logger.info(f"{job.build_name}: built by {job.result['agent']}")
+            for artifact in job.result["artifacts"]:
+                Logger.info(f"Artifact: {artifact}")
+        else:
+            errors = "; ".join(f"{error['agent']}: {error['error']}" for error in job.errors)
+            Logger.error(f"{job.build_name}: failed after {job.attempts} attempt(s) ({errors})")
+    if failed:
+        raise ClusterError(f"{len(failed)} of {len(jobs)} build(s) failed")
+    return [job.to_dict() for job in jobs]
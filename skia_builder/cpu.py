@@ -0,0 +1,39 @@
+import platform
+
+from skia_builder.config import X86_64_LEVELS, get_x86_64_level_features
+
+
+def get_cpu_features():
+    """
+    Returns the feature flags of the current CPU, as named in the `flags` of /proc/cpuinfo.
+    Features are only detected on Linux; an empty set is returned elsewhere.
+    """
+    if platform.system() != "Linux":
+        return set()
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key.strip() == "flags":
+                    return set(value.split())
+    except OSError:
+        pass
+    return set()
+
+
+def get_x86_64_level(features=None):
+    """
+    Returns the highest x86-64 microarchitecture level (e.g. `v3`) supported by a CPU, or None
+    when only the baseline is.
+
+    Args:
+        features (set): CPU feature flags. Defaults to the ones of the current CPU.
+    """
+    if features is None:
+        features = get_cpu_features()
+    supported = None
+    for level in X86_64_LEVELS:
+        if not set(get_x86_64_level_features(level)) <= features:
+            break
+        supported = level
+    return supported
@@ -0,0 +1,142 @@
+"""
+Concurrent execution of a dependency graph of steps (used by `setup-env`).
+
+Each step starts as soon as the steps it requires have succeeded, within a parallelism limit,
+and holds its exclusive resources (e.g. the apt/dpkg lock) while running. The lines logged by a
+step are prefixed with its name. The first failure cancels every other step, killing the child
+processes of the ones running `run_command_async`, and is raised once they have stopped.
+"""
+
+import asyncio
+import contextlib
+import inspect
+import time
+from collections import defaultdict
+
+from skia_builder.trace import span
+from skia_builder.utils import Logger, log_prefix
+
+
+class Step:
+    def __init__(self, name, action, requires=(), resources=()):
+        """
+        Args:
+            name (str): Name of the step, prefixing its log lines.
+            action (Callable): Coroutine function, or plain function run in a worker thread (which
+                can't be interrupted when a sibling step fails).
+            requires (Iterable[str]): Names of the steps that must succeed before this one starts.
+            resources (Iterable[str]): Names of exclusive resources held while the step runs.
+        """
+        self.name = name
+        self.action = action
+        self.requires = tuple(requires)
+        self.resources = tuple(sorted(resources))
+
+    def __repr__(self):
+        return f"Step({self.name!r}, requires={list(self.requires)})"
+
+
+def sort_steps(steps):
+    """
+    Returns `steps` in an order where every step comes after the ones it requires.
+
+    Raises:
+        ValueError: If a step name is duplicated, a required step is unknown, or the steps
+            require each other in a cycle.
+    """
+    steps_by_name = {}
+    for step in steps:
+        if step.name in steps_by_name:
+            raise ValueError(f"Duplicate step: {step.name}")
+        steps_by_name[step.name] = step
+
+    ordered = []
+    state = {}  # "visiting" or "done"
+
+    def visit(step, path):
+        if state.get(step.name) == "done":
+            return
+        if state.get(step.name) == "visiting":
+            raise ValueError(f"Steps require each other: {' -> '.join([*path, step.name])}")
+        state[step.name] = "visiting"
+        for name in step.requires:
+            if name not in steps_by_name:
+                raise ValueError(f"Step {step.name} requires unknown step {name}")
+            visit(steps_by_name[name], [*path, step.name])
+        state[step.name] = "done"
+        ordered.append(step)
+
+    for step in steps:
+        visit(step, [])
+    return ordered
+
+
+async def run_steps_async(steps, max_parallel=None, timings=None):
+    """
+    Runs a graph of steps concurrently.
+
+    Args:
+        steps (Iterable[Step]): The steps to run.
+        max_parallel (int): Maximum number of steps running at once. Unlimited by default.
+        timings (dict): Filled with the duration of each successful step in seconds, by name.
+
+    Raises:
+        ValueError: If the graph is invalid (see `sort_steps`).
+        Exception: The error of the first step to fail.
+
+    Returns:
+        dict: The return value of each step, by name.
+    """
+    ordered = sort_steps(steps)
+    semaphore = asyncio.Semaphore(max_parallel) if max_parallel else None
+    resource_locks = defaultdict(asyncio.Lock)
+    tasks = {}
+
+    async def run_step(step):
+        for name in step.requires:
+            # Shielded so that a step being cancelled doesn't cancel the steps it waits for
+            await asyncio.shield(tasks[name])
+
+        async with contextlib.AsyncExitStack() as stack:
+            for resource in step.resources:
+                await stack.enter_async_context(resource_locks[resource])
+            if semaphore is not None:
+                await stack.enter_async_context(semaphore)
+
+            with log_prefix(step.name), span(step.name, "step"):
+                started = time.perf_counter()
+                if inspect.iscoroutinefunction(step.action):
+                    result = await step.action()
+                else:
+                    result = await asyncio.to_thread(step.action)
+                duration = time.perf_counter() - started
+                if timings is not None:
+                    timings[step.name] = duration
+                Logger.info(f"Done in {duration:.1f}s")
+                return result
+
+    for step in ordered:
+        tasks[step.name] = asyncio.create_task(run_step(step), name=step.name)
+
+    try:
+        pending = set(tasks.values())
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            failed = [task for task in done if not task.cancelled() and task.exception()]
+            if failed:
+                # Dependents of a failed step re-raise its error, report the step itself
+                task = next(task for task in tasks.values() if task in failed)
+                Logger.error(f"Step {task.get_name()} failed, cancelling the remaining steps")
+                raise task.exception()
+    finally:
+        running = [task for task in tasks.values() if not task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    return {name: task.result() for name, task in tasks.items()}
+
+
+def run_steps(steps, max_parallel=None, timings=None):
+    """Synchronous wrapper of `run_steps_async`."""
+    return asyncio.run(run_steps_async(steps, max_parallel, timings))
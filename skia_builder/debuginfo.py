@@ -0,0 +1,164 @@
+"""
+Split debug info of the builds made with `--debug-symbols=split`.
+
+The libraries shipped in the release archive are stripped of their debug sections, while the
+unstripped libraries are packaged in a separate `<build name>.debug.tar.gz`. Static libraries have
+no build ID of their own (the linker of the final binary computes it), so the debug archive maps
+the SHA-1 of the bytes of every stripped object (`stripped_sha1`, not an ELF `NT_GNU_BUILD_ID`),
+which is what consumers link, to the object holding its debug info.
+"""
+
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import time
+
+from skia_builder.binaries import AR_MAGIC, AR_THIN_MAGIC, ELF_MAGIC, iter_ar_members
+from skia_builder.errors import DebugSymbolsError
+from skia_builder.manifest import hash_file
+from skia_builder.trace import traced
+from skia_builder.utils import Logger, run_command
+
+DEBUG_SYMBOLS_INDEX = "DEBUG_SYMBOLS.json"
+DEBUG_SYMBOLS_VERSION = 2
+DEBUG_ARCHIVE_SUFFIX = ".debug.tar.gz"
+
+
+def find_objcopy(search_dirs=()):
+    """
+    Returns the objcopy used to strip libraries: the first `llvm-objcopy` of `search_dirs` (e.g. a
+    toolchain of the target), `llvm-objcopy` on the PATH or its latest versioned name (as installed
+    by apt.llvm.org), then GNU `objcopy`.
+
+    Raises:
+        DebugSymbolsError: If no objcopy is found.
+    """
+    for directory in search_dirs:
+        for name in ("llvm-objcopy", "llvm-objcopy.exe"):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+
+    if path := shutil.which("llvm-objcopy"):
+        return path
+    versioned = {}
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        for path in glob.glob(os.path.join(directory, "llvm-objcopy-*")):
+            if match := re.fullmatch(r"llvm-objcopy-(\d+)", os.path.basename(path)):
+                versioned.setdefault(int(match.group(1)), path)
+    if versioned:
+        return versioned[max(versioned)]
+    if path := shutil.which("objcopy"):
+        return path
+    raise DebugSymbolsError("llvm-objcopy or objcopy is needed to strip the debug info")
+
+
+def _is_object_library(path):
+    with open(path, "rb") as f:
+        return f.read(len(AR_MAGIC)).startswith((AR_MAGIC, AR_THIN_MAGIC, ELF_MAGIC))
+
+
+def strip_libraries(libraries, objcopy):
+    """Strips the debug sections of libraries in place, skipping data files (e.g. ICU's .dat)."""
+    for library in libraries:
+        if not _is_object_library(library):
+            continue
+        run_command([objcopy, "--strip-debug", library], f"Stripping {os.path.basename(library)}")
+
+
+def _iter_member_digests(path, algorithm):
+    """Yields the name and digest of each object of a static library (or of a single object)."""
+    with open(path, "rb") as f:
+        if f.read(len(ELF_MAGIC)) == ELF_MAGIC:
+            f.seek(0)
+            yield os.path.basename(path), hashlib.file_digest(f, algorithm).hexdigest()
+            return
+
+    for name, offset, size in iter_ar_members(path):
+        if offset is None:
+            # Members of thin archives are paths relative to the archive
+            with open(os.path.join(os.path.dirname(path), name), "rb") as f:
+                data = f.read()
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size)
+        yield name, hashlib.new(algorithm, data).hexdigest()
+
+
+def _describe_library(stripped_path, debug_path):
+    # Archives may hold several members of the same name, so objects are paired by position
+    objects = [
+        {"name": name, "stripped_sha1": stripped_sha1, "debug_sha256": debug_sha256}
+        for (name, stripped_sha1), (_, debug_sha256) in zip(
+            _iter_member_digests(stripped_path, "sha1"),
+            _iter_member_digests(debug_path, "sha256"),
+            strict=True,
+        )
+    ]
+    return {
+        "name": os.path.basename(stripped_path),
+        "sha256": hash_file(stripped_path),
+        "debug_sha256": hash_file(debug_path),
+        "objects": objects,
+    }
+
+
+@traced("package_debug_symbols")
+def package_debug_symbols(debug_libraries, stripped_libraries, output_dir, build_name, metadata):
+    """
+    Packages the unstripped libraries of a build in `<build_name>.debug.tar.gz`, next to the
+    release archive.
+
+    Args:
+        debug_libraries (list[str]): Paths of the unstripped libraries (in the out dir).
+        stripped_libraries (list[str]): Paths of the stripped copies shipped in the release archive.
+        output_dir (str): Directory of the release archive.
+        build_name (str): Name of the build, e.g. `linux-x64`.
+        metadata (dict): Description of the build, recorded as `build` in the index.
+
+    Raises:
+        DebugSymbolsError: If a stripped library doesn't match its unstripped counterpart.
+
+    Returns:
+        str: The path of the debug archive.
+    """
+    stripped_by_name = {os.path.basename(path): path for path in stripped_libraries}
+    libraries, debug_paths = [], []
+    for debug_path in sorted(debug_libraries):
+        name = os.path.basename(debug_path)
+        if name not in stripped_by_name or not _is_object_library(debug_path):
+            continue
+        try:
+            libraries.append(_describe_library(stripped_by_name[name], debug_path))
+        except ValueError as e:
+            raise DebugSymbolsError(f"Unable to map the objects of {name}: {e}") from e
+        debug_paths.append(debug_path)
+
+    index = {
+        "version": DEBUG_SYMBOLS_VERSION,
+        "build": metadata,
+        "libraries": libraries,
+    }
+    archive_path = os.path.join(output_dir, f"{build_name}{DEBUG_ARCHIVE_SUFFIX}")
+    index_data = json.dumps(index, indent=2).encode("utf-8")
+    with tarfile.open(archive_path, "w:gz") as tar:
+        # The index goes first so that symbolicators can read it without unpacking everything
+        index_info = tarfile.TarInfo(DEBUG_SYMBOLS_INDEX)
+        index_info.size = len(index_data)
+        index_info.mtime = int(time.time())
+        index_info.mode = 0o644
+        tar.addfile(index_info, io.BytesIO(index_data))
+        for debug_path in debug_paths:
+            tar.add(debug_path, arcname=f"lib/{os.path.basename(debug_path)}")
+
+    objects = sum(len(library["objects"]) for library in libraries)
+    Logger.info(
+        f"Debug info of {len(libraries)} libraries ({objects} objects) archived to {archive_path}"
+    )
+    return archive_path
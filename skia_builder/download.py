@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+from skia_builder.cleanup import record_use
+from skia_builder.config import DOWNLOAD_CACHE_DIR
+from skia_builder.errors import DownloadError
+from skia_builder.manifest import hash_file
+from skia_builder.trace import span
+from skia_builder.utils import Logger
+
+CHUNK_SIZE = 1 << 20
+REQUEST_TIMEOUT = 60
+# Files at least this large are split into concurrent range requests when the server allows it
+SEGMENTED_DOWNLOAD_THRESHOLD = 64 << 20
+DEFAULT_SEGMENTS = 4
+
+
+def _open(url, headers=None, method="GET"):
+    return urlopen(Request(url, headers=headers or {}, method=method), timeout=REQUEST_TIMEOUT)
+
+
+def _cache_entry_path(url, sha256, cache_dir):
+    """Pinned files are stored by content, unpinned ones by URL."""
+    if sha256:
+        return os.path.join(cache_dir, "sha256", sha256.lower())
+
+    url_key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    name = os.path.basename(urlparse(url).path) or "download"
+    return os.path.join(cache_dir, "url", url_key, name)
+
+
+def _read_metadata(entry_path):
+    try:
+        with open(f"{entry_path}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_metadata(entry_path, metadata):
+    with open(f"{entry_path}.json", "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def _probe(url):
+    """
+    Returns (size, supports_ranges, headers) for `url`, or (None, False, {}) if the server won't
+    say. The headers hold the validators (ETag/Last-Modified) of the probed content.
+    """
+    try:
+        with _open(url, method="HEAD") as response:
+            size = response.headers.get("Content-Length")
+            accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            return (int(size) if size else None), accepts_ranges, response.headers
+    except (HTTPError, URLError, ValueError):
+        return None, False, {}
+
+
+def _download_stream(url, part_path, conditional_headers=None):
+    """
+    Downloads `url` into `part_path` with a single request, resuming from any bytes already
+    present in `part_path` if the content is unchanged since: the validator (ETag or
+    Last-Modified) it was downloaded with is kept next to it, and sent as `If-Range`. The download
+    starts over when there is no validator or the server sends the whole content.
+
+    Returns:
+        tuple: (response headers, not_modified)
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = _read_metadata(part_path).get("validator") if offset else None
+    headers = dict(conditional_headers or {})
+    if offset and validator:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+
+    try:
+        response = _open(url, headers)
+    except HTTPError as e:
+        if e.code == 304:
+            return e.headers, True
+        if e.code == 416 and "Range" in headers:
+            # The partial file already holds the complete payload
+            return e.headers, False
+        raise
+
+    with response:
+        if "Range" in headers and response.status == 206:
+            mode = "ab"
+        else:
+            mode = "wb"
+            # Stored before the content, so that an interrupted download can be resumed
+            _write_metadata(
+                part_path,
+                {
+                    "validator": response.headers.get("ETag")
+                    or response.headers.get("Last-Modified")
+                },
+            )
+        with open(part_path, mode) as f:
+            shutil.copyfileobj(response, f, CHUNK_SIZE)
+        return response.headers, False
+
+
+def _download_segments(url, part_path, size, segments, validator=None):
+    """
+    Downloads `url` into `part_path` using `segments` concurrent range requests. Progress of each
+    segment is persisted next to the partial file so an interrupted download can be resumed, as
+    long as the content still has the same size and `validator` (its ETag or Last-Modified).
+    """
+    state_path = f"{part_path}.segments"
+    segment_size = -(-size // segments)
+    ranges = [
+        (start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)
+    ]
+
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if (
+            state.get("size") != size
+            or state.get("validator") != validator
+            or len(state.get("done", [])) != len(ranges)
+        ):
+            raise ValueError("stale segment state")
+    except (OSError, ValueError):
+        state = {"size": size, "validator": validator, "done": [0] * len(ranges)}
+
+    if not os.path.exists(part_path) or os.path.getsize(part_path) != size:
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+        state["done"] = [0] * len(ranges)
+
+    lock = threading.Lock()
+
+    def save_state():
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    def fetch_segment(index):
+        start, end = ranges[index]
+        position = start + state["done"][index]
+        if position > end:
+            return
+
+        headers = {"Range": f"bytes={position}-{end}"}
+        with _open(url, headers) as response, open(part_path, "r+b") as f:
+            if response.status != 206:
+                raise DownloadError(f"Server ignored range request for {url}")
+            f.seek(position)
+            while chunk := response.read(CHUNK_SIZE):
+                f.write(chunk)
+                with lock:
+                    state["done"][index] += len(chunk)
+                    save_state()
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        for future in [executor.submit(fetch_segment, i) for i in range(len(ranges))]:
+            future.result()
+
+    os.remove(state_path)
+
+
+def fetch(url, sha256=None, cache_dir=None, segments=None, revalidate=True):
+    """Fetches `url` into the download cache. See `fetch_if_modified` for the arguments."""
+    return fetch_if_modified(url, sha256, cache_dir, segments, revalidate)[0]
+
+
+def fetch_if_modified(url, sha256=None, cache_dir=None, segments=None, revalidate=True):
+    """
+    Fetches `url` into the download cache and returns the path of the cached file, along with
+    whether new content was downloaded.
+
+    Args:
+        url (str): The URL to download.
+        sha256 (str): Optional pinned SHA-256 checksum. Pinned files are cached by content and
+            never downloaded again once present and valid.
+        cache_dir (str): Cache directory. Defaults to `DOWNLOAD_CACHE_DIR`.
+        segments (int): Number of concurrent range requests. By default, large files are split
+            into `DEFAULT_SEGMENTS` when the server supports ranges. Use 1 to disable splitting
+            (which also skips the initial HEAD request).
+        revalidate (bool): Whether unpinned cached files are revalidated with a conditional
+            request (ETag/Last-Modified). When False, any cached copy is used as is.
+
+    Returns:
+        tuple[str, bool]: Path of the verified file in the cache, and False when the cached copy
+            was used as is.
+
+    Raises:
+        DownloadError: If the download fails or the checksum doesn't match.
+    """
+    cache_dir = cache_dir or DOWNLOAD_CACHE_DIR
+    entry_path = _cache_entry_path(url, sha256, cache_dir)
+    part_path = f"{entry_path}.part"
+    os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+    # Unpinned entries are evicted along with their URL directory
+    record_use(entry_path if sha256 else os.path.dirname(entry_path))
+
+    if os.path.exists(entry_path):
+        if sha256:
+            if hash_file(entry_path) == sha256.lower():
+                Logger.info(f"Using cached {url}")
+                return entry_path, False
+            Logger.warning(f"Cached copy of {url} is corrupt, downloading it again")
+            os.remove(entry_path)
+        elif not revalidate:
+            Logger.info(f"Using cached {url}")
+            return entry_path, False
+
+    conditional_headers = {}
+    metadata = _read_metadata(entry_path) if os.path.exists(entry_path) else {}
+    if metadata.get("etag"):
+        conditional_headers["If-None-Match"] = metadata["etag"]
+    if metadata.get("last_modified"):
+        conditional_headers["If-Modified-Since"] = metadata["last_modified"]
+
+    started = time.monotonic()
+    try:
+        size, accepts_ranges, probe_headers = None, False, {}
+        if not conditional_headers and segments != 1:
+            size, accepts_ranges, probe_headers = _probe(url)
+        if segments is None:
+            segments = DEFAULT_SEGMENTS if (size or 0) >= SEGMENTED_DOWNLOAD_THRESHOLD else 1
+
+        if segments > 1 and size and accepts_ranges:
+            validator = probe_headers.get("ETag") or probe_headers.get("Last-Modified")
+            _download_segments(url, part_path, size, segments, validator)
+            # The range responses are parts, the validators of the whole content come from the probe
+            headers = probe_headers
+        else:
+            if os.path.exists(f"{part_path}.segments"):
+                # A preallocated segmented download can't be resumed sequentially
+                os.remove(f"{part_path}.segments")
+                os.remove(part_path)
+            headers, not_modified = _download_stream(url, part_path, conditional_headers)
+            if not_modified:
+                Logger.info(f"Cached copy of {url} is up to date")
+                return entry_path, False
+    except (HTTPError, URLError, OSError) as e:
+        raise DownloadError(f"Failed to download {url}: {e}") from e
+
+    if sha256:
+        digest = hash_file(part_path)
+        if digest != sha256.lower():
+            os.remove(part_path)
+            raise DownloadError(
+                f"Checksum mismatch for {url}: expected {sha256.lower()}, got {digest}"
+            )
+
+    os.replace(part_path, entry_path)
+    if os.path.exists(f"{part_path}.json"):
+        os.remove(f"{part_path}.json")
+    _write_metadata(
+        entry_path,
+        {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        },
+    )
+
+    elapsed = time.monotonic() - started
+    size_mb = os.path.getsize(entry_path) / (1 << 20)
+    Logger.info(f"Downloaded {url} ({size_mb:.1f} MiB in {elapsed:.1f}s)")
+    return entry_path, True
+
+
+def download(url, destination, step_description, sha256=None, segments=None, check=True):
+    """
+    Fetches `url` through the download cache and places a copy at `destination`, mirroring the
+    step reporting and error handling of `run_command`.
+
+    Raises:
+        DownloadError: If the download fails and `check` is True.
+
+    Returns:
+        bool: True on success, False on failure when `check` is False.
+    """
+    Logger.custom(f"\n--- Running step: {step_description} ---", Logger.BRIGHT_YELLOW)
+
+    if not sha256:
+        Logger.warning(f"No checksum pinned for {url}, the download will not be verified")
+
+    try:
+        with span(step_description, "download", url=url):
+            cached_path = fetch(url, sha256=sha256, segments=segments)
+            os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+            shutil.copyfile(cached_path, destination)
+    except (DownloadError, OSError) as e:
+        Logger.custom(f"Error downloading: {url}\n", Logger.RED, bold=True)
+        if check:
+            raise e if isinstance(e, DownloadError) else DownloadError(str(e)) from e
+        return False
+
+    Logger.custom(f"Download succeeded: {url} -> {destination}\n", Logger.GREEN, bold=True)
+    return True
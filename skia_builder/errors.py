@@ -0,0 +1,82 @@
+class SkiaBuilderError(Exception):
+    """Base class of the errors raised by skia-builder. `exit_code` is used by the CLI."""
+
+    exit_code = 1
+
+
+class UnsupportedPlatformError(SkiaBuilderError):
+    pass
+
+
+class UnsupportedArchitectureError(SkiaBuilderError):
+    pass
+
+
+class UnsupportedBuildProfileError(SkiaBuilderError):
+    pass
+
+
+class SysrootError(SkiaBuilderError):
+    pass
+
+
+class ArchitectureMismatchError(SkiaBuilderError):
+    pass
+
+
+class DebugSymbolsError(SkiaBuilderError):
+    pass
+
+
+class VariantsError(SkiaBuilderError):
+    pass
+
+
+class OutputExistsError(SkiaBuilderError):
+    def __init__(self, output_dir):
+        super().__init__(f"The directory '{output_dir}' already exists.")
+        self.output_dir = output_dir
+
+
+class CommandError(SkiaBuilderError):
+    def __init__(self, command_list, returncode, step_description=None):
+        super().__init__(
+            f"Step '{step_description or command_list[0]}' failed with exit code {returncode}: "
+            f"{' '.join(command_list)}"
+        )
+        self.command_list = command_list
+        self.returncode = returncode
+        self.step_description = step_description
+        self.exit_code = returncode if isinstance(returncode, int) and returncode > 0 else 1
+
+
+class DownloadError(SkiaBuilderError):
+    pass
+
+
+class ArchiveError(SkiaBuilderError):
+    pass
+
+
+class SnapshotError(SkiaBuilderError):
+    pass
+
+
+class InstallError(SkiaBuilderError):
+    pass
+
+
+class BisectError(SkiaBuilderError):
+    pass
+
+
+class BenchError(SkiaBuilderError):
+    pass
+
+
+class ClusterError(SkiaBuilderError):
+    pass
+
+
+class PGOError(SkiaBuilderError):
+    pass
@@ -0,0 +1,149 @@
+import os
+import shutil
+import stat
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from skia_builder.errors import ArchiveError
+from skia_builder.trace import traced
+
+COPY_BUFFER_SIZE = 1 << 20
+
+
+def _default_workers():
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def is_within(path, directory):
+    """Whether `path` is `directory` or below it (both absolute and normalized)."""
+    return os.path.commonpath([path, directory]) == directory
+
+
+def check_member(destination, name, link_name=None, hard_link=False):
+    """
+    Checks that an archive member extracts below `destination`, which must be a real path.
+
+    The path of the member is resolved with the links already extracted (unlike `abspath`), so
+    that a member can't be written through a link extracted before it. Links must also point
+    below `destination`: symbolic ones relative to their directory, hard ones (`hard_link`)
+    relative to `destination`.
+
+    Args:
+        destination (str): Real path of the extraction directory.
+        name (str): Name of the member in the archive.
+        link_name (str): Target of the member if it is a link.
+        hard_link (bool): Whether the member is a hard link.
+
+    Raises:
+        ArchiveError: If the member or its link target is outside of `destination`.
+
+    Returns:
+        str: The path the member extracts to.
+    """
+    target = os.path.realpath(os.path.join(destination, name))
+    if not is_within(target, destination):
+        raise ArchiveError(f"Refusing to extract {name!r} outside of {destination}")
+    if link_name is not None:
+        link_dir = destination if hard_link else os.path.dirname(target)
+        if not is_within(os.path.realpath(os.path.join(link_dir, link_name)), destination):
+            raise ArchiveError(
+                f"Refusing to extract {name!r}, a link to {link_name!r} outside of {destination}"
+            )
+    return target
+
+
+def _unix_mode(info):
+    return info.external_attr >> 16
+
+
+def _extract_zip_members(archive_path, destination, members):
+    # Each worker uses its own handle, since a ZipFile can't be read from several threads at once
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in members:
+            target = check_member(destination, info.filename)
+            if os.path.islink(target):
+                os.remove(target)
+
+            with archive.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+
+            mode = _unix_mode(info)
+            if mode and os.name != "nt":
+                os.chmod(target, stat.S_IMODE(mode))
+
+
+def _extract_zip_symlinks(archive_path, destination, members):
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in members:
+            # Created one at a time, each one checked against the ones created before it
+            link_name = archive.read(info).decode("utf-8")
+            target = check_member(destination, info.filename, link_name)
+            if os.path.islink(target):
+                os.remove(target)
+            elif os.path.lexists(target):
+                raise ArchiveError(f"{info.filename!r} is both a link and a file or directory")
+            os.symlink(link_name, target)
+
+
+@traced("extract_zip")
+def extract_zip(archive_path, destination, workers=None):
+    """
+    Extracts a zip archive using a pool of threads, streaming each member to disk.
+
+    Unlike `zipfile.ZipFile.extractall`, Unix permissions and symbolic links stored in the archive
+    are preserved (required for toolchains such as the Android NDK). Symbolic links are created
+    once every file is written, and only if they point inside `destination`.
+
+    Args:
+        archive_path (str): Path to the zip archive.
+        destination (str): Directory to extract into. Created if missing.
+        workers (int): Number of extraction threads. Defaults to a value based on the CPU count.
+
+    Raises:
+        ArchiveError: If a member or a link target is outside of `destination`.
+
+    Returns:
+        int: The number of extracted entries.
+    """
+    destination = os.path.realpath(destination)
+    os.makedirs(destination, exist_ok=True)
+
+    with zipfile.ZipFile(archive_path) as archive:
+        infos = archive.infolist()
+
+    files, symlinks = [], []
+    for info in infos:
+        target = check_member(destination, info.filename)
+        if info.is_dir():
+            os.makedirs(target, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            (symlinks if stat.S_ISLNK(_unix_mode(info)) else files).append(info)
+
+    # Spread members over the workers so that each one gets a similar amount of bytes
+    workers = max(1, min(workers or _default_workers(), len(files)))
+    buckets = [[] for _ in range(workers)]
+    loads = [0] * workers
+    for info in sorted(files, key=lambda i: i.file_size, reverse=True):
+        index = loads.index(min(loads))
+        buckets[index].append(info)
+        loads[index] += info.file_size
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_extract_zip_members, archive_path, destination, bucket)
+            for bucket in buckets
+        ]
+        for future in futures:
+            future.result()
+
+    _extract_zip_symlinks(archive_path, destination, symlinks)
+
+    # Directory permissions are applied last, so that read-only directories don't block extraction
+    if os.name != "nt":
+        for info in infos:
+            mode = _unix_mode(info)
+            if info.is_dir() and mode:
+                os.chmod(check_member(destination, info.filename), stat.S_IMODE(mode))
+
+    return len(infos)
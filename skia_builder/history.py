@@ -0,0 +1,439 @@
+"""
+History of the setups and builds of a workspace (`skia-builder history`), in a SQLite database.
+
+Every successful build records, under its build name, milestone and a fingerprint of its GN
+arguments, the duration and cache status of each of its phases (see `BuildResult.timings`), the
+number of edges ninja ran, the peak memory of its processes and the size of its artifacts. Setups
+record the duration of each of their steps. Builds distributed to agents (see coordinator.py) are
+recorded by the coordinator too, under their host independent arguments.
+
+The recent builds of a target are used to predict how long a build will take and which phases
+will be cache hits (`build --plan`), and to run the longest builds of a multi-target run first,
+so that the run doesn't end waiting for a long build started last. Recording is best effort: a
+database that can't be written is reported, but never fails a build.
+"""
+
+import datetime
+import hashlib
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from contextlib import closing, contextmanager
+
+from skia_builder.cleanup import format_size
+from skia_builder.config import HISTORY_DB, HISTORY_WINDOW
+from skia_builder.utils import Logger
+
+HISTORY_SCHEMA_VERSION = 1
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    target TEXT NOT NULL,
+    build_name TEXT NOT NULL,
+    skia_version TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    build_args TEXT NOT NULL,
+    duration REAL NOT NULL,
+    ninja_edges INTEGER,
+    peak_rss_kib INTEGER,
+    libraries_size INTEGER,
+    archive_size INTEGER,
+    debug_archive_size INTEGER,
+    agent TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_by_name ON builds (build_name, skia_version, time);
+CREATE TABLE IF NOT EXISTS build_steps (
+    build_id INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    duration REAL NOT NULL,
+    cache TEXT,
+    PRIMARY KEY (build_id, name)
+);
+CREATE TABLE IF NOT EXISTS setups (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    skia_version TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS setup_steps (
+    setup_id INTEGER NOT NULL REFERENCES setups (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    duration REAL NOT NULL,
+    PRIMARY KEY (setup_id, name)
+);
+"""
+
+# Concurrent builds of a process record one after the other (other processes wait on SQLite's lock)
+_write_lock = threading.Lock()
+
+
+def fingerprint(build_args):
+    """Returns a short fingerprint of GN arguments, identifying the builds made with them."""
+    return hashlib.sha256(build_args.encode("utf-8")).hexdigest()[:16]
+
+
+@contextmanager
+def _connect():
+    os.makedirs(os.path.dirname(os.path.abspath(HISTORY_DB)), exist_ok=True)
+    with closing(sqlite3.connect(HISTORY_DB, timeout=30)) as connection:
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys = ON")
+        if connection.execute("PRAGMA user_version").fetchone()[0] != HISTORY_SCHEMA_VERSION:
+            connection.executescript(HISTORY_SCHEMA)
+            connection.execute(f"PRAGMA user_version = {HISTORY_SCHEMA_VERSION}")
+        with connection:
+            yield connection
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path) if path else None
+    except OSError:
+        return None
+
+
+def record_build(
+    target,
+    build_name,
+    skia_version,
+    build_args,
+    duration,
+    timings,
+    cache,
+    ninja_edges=None,
+    peak_rss_kib=None,
+    sizes=None,
+    agent=None,
+):
+    """
+    Records a successful build.
+
+    Args:
+        timings (dict[str, float]): Duration of each phase, in seconds.
+        cache (dict[str, str]): Cache status (`hit` or `miss`) of the phases that have one.
+        sizes (dict[str, int]): Total size of the `libraries`, and sizes of the `archive` and
+            `debug_archive`, in bytes.
+        agent (str): Agent the build ran on, when distributed.
+    """
+    if not HISTORY_DB:
+        return
+    sizes = sizes or {}
+    try:
+        with _write_lock, _connect() as connection:
+            build_id = connection.execute(
+                "INSERT INTO builds (time, target, build_name, skia_version, fingerprint, "
+                "build_args, duration, ninja_edges, peak_rss_kib, libraries_size, archive_size, "
+                "debug_archive_size, agent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.time(),
+                    target,
+                    build_name,
+                    skia_version,
+                    fingerprint(build_args),
+                    build_args,
+                    duration,
+                    ninja_edges,
+                    peak_rss_kib,
+                    sizes.get("libraries"),
+                    sizes.get("archive"),
+                    sizes.get("debug_archive"),
+                    agent,
+                ),
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO build_steps (build_id, name, duration, cache) VALUES (?, ?, ?, ?)",
+                [(build_id, name, seconds, cache.get(name)) for name, seconds in timings.items()],
+            )
+    except (sqlite3.Error, OSError) as e:
+        Logger.warning(f"Unable to record the build of {build_name} in {HISTORY_DB}: {e}")
+
+
+def record_build_result(result, build_name):
+    """Records a successful build from its `BuildResult`."""
+    sizes = {
+        "libraries": sum(_file_size(path) or 0 for path in result.libraries),
+        "archive": _file_size(result.archive),
+        "debug_archive": _file_size(result.debug_archive),
+    }
+    record_build(
+        result.target,
+        build_name,
+        result.skia_version,
+        result.build_args,
+        result.duration,
+        result.timings,
+        result.cache,
+        result.ninja_edges,
+        result.peak_rss_kib,
+        sizes,
+    )
+
+
+def record_setup(skia_version, timings, duration):
+    """Records a successful setup, with the duration of each of its steps (by name)."""
+    if not HISTORY_DB:
+        return
+    try:
+        with _write_lock, _connect() as connection:
+            setup_id = connection.execute(
+                "INSERT INTO setups (time, skia_version, duration) VALUES (?, ?, ?)",
+                (time.time(), skia_version, duration),
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO setup_steps (setup_id, name, duration) VALUES (?, ?, ?)",
+                [(setup_id, name, seconds) for name, seconds in timings.items()],
+            )
+    except (sqlite3.Error, OSError) as e:
+        Logger.warning(f"Unable to record the setup in {HISTORY_DB}: {e}")
+
+
+def get_builds(target=None, skia_version=None, build_args=None, limit=HISTORY_WINDOW):
+    """
+    Returns the most recent builds, newest first.
+
+    Args:
+        target (str): Build target (e.g. `linux-x64`) or build name (e.g. `linux-x64-v3-speed`)
+            of the builds. All of them by default.
+        skia_version (str): Milestone of the builds. All of them by default.
+        build_args (str): GN arguments of the builds. Any by default.
+        limit (int): Maximum number of builds returned.
+
+    Returns:
+        list[dict]: The columns of each build, with its `steps` (`duration` and `cache` by name).
+    """
+    if not HISTORY_DB or not os.path.exists(HISTORY_DB):
+        return []
+    conditions, parameters = [], []
+    if target:
+        conditions.append("(target = ? OR build_name = ?)")
+        parameters += [target, target]
+    if skia_version:
+        conditions.append("skia_version = ?")
+        parameters.append(skia_version)
+    if build_args is not None:
+        conditions.append("fingerprint = ?")
+        parameters.append(fingerprint(build_args))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    try:
+        with _connect() as connection:
+            builds = [
+                dict(row)
+                for row in connection.execute(
+                    f"SELECT * FROM builds {where} ORDER BY time DESC, id DESC LIMIT ?",
+                    (*parameters, limit),
+                )
+            ]
+            for build in builds:
+                build["steps"] = {
+                    row["name"]: {"duration": row["duration"], "cache": row["cache"]}
+                    for row in connection.execute(
+                        "SELECT name, duration, cache FROM build_steps WHERE build_id = ? "
+                        "ORDER BY rowid",
+                        (build["id"],),
+                    )
+                }
+    except (sqlite3.Error, OSError) as e:
+        Logger.warning(f"Unable to read {HISTORY_DB}: {e}")
+        return []
+    return builds
+
+
+def get_setups(skia_version=None, limit=HISTORY_WINDOW):
+    """Returns the most recent setups, newest first, with the duration of their `steps`."""
+    if not HISTORY_DB or not os.path.exists(HISTORY_DB):
+        return []
+    where, parameters = ("WHERE skia_version = ?", [skia_version]) if skia_version else ("", [])
+    try:
+        with _connect() as connection:
+            setups = [
+                dict(row)
+                for row in connection.execute(
+                    f"SELECT * FROM setups {where} ORDER BY time DESC, id DESC LIMIT ?",
+                    (*parameters, limit),
+                )
+            ]
+            for setup in setups:
+                setup["steps"] = {
+                    row["name"]: row["duration"]
+                    for row in connection.execute(
+                        "SELECT name, duration FROM setup_steps WHERE setup_id = ? ORDER BY rowid",
+                        (setup["id"],),
+                    )
+                }
+    except (sqlite3.Error, OSError) as e:
+        Logger.warning(f"Unable to read {HISTORY_DB}: {e}")
+        return []
+    return setups
+
+
+def _hit_rate(statuses):
+    statuses = [status for status in statuses if status]
+    return statuses.count("hit") / len(statuses) if statuses else None
+
+
+def predict(build_name, skia_version, build_args, out_dir_exists=True, gn_up_to_date=True):
+    """
+    Predicts the duration of a build and the cache status of its phases from the recent builds
+    of the same build name and milestone, preferably the ones with the same GN arguments.
+
+    Args:
+        out_dir_exists (bool): Whether the out dir of the build exists (ninja builds everything
+            otherwise).
+        gn_up_to_date (bool): Whether the out dir was generated with `build_args` already (`gn
+            gen` is skipped, else ninja rebuilds what the arguments affect).
+
+    Returns:
+        dict: `basis` (`arguments` when based on builds with the same arguments, else
+            `target`), number of `samples`, predicted `duration` and `steps`, the expected `cache`
+            status, past `hit_rate` and predicted `duration` of each phase. None without history.
+    """
+    basis = "arguments"
+    builds = get_builds(build_name, skia_version, build_args)
+    if not builds:
+        basis = "target"
+        builds = [
+            build
+            for build in get_builds(build_name, skia_version)
+            if build["build_name"] == build_name
+        ]
+    if not builds:
+        return None
+
+    steps = {}
+    for name in dict.fromkeys(name for build in reversed(builds) for name in build["steps"]):
+        samples = [build["steps"][name] for build in builds if name in build["steps"]]
+        hit_rate = _hit_rate([sample["cache"] for sample in samples])
+        if name == "gn_gen":
+            expected = "hit" if gn_up_to_date else "miss"
+        elif name == "ninja" and not (out_dir_exists and gn_up_to_date):
+            expected = "miss"
+        elif hit_rate is not None:
+            expected = "hit" if hit_rate >= 0.5 else "miss"
+        else:
+            expected = None
+        durations = [
+            sample["duration"]
+            for sample in samples
+            if expected is None or sample["cache"] == expected
+        ] or [sample["duration"] for sample in samples]
+        steps[name] = {
+            "cache": expected,
+            "hit_rate": hit_rate,
+            "duration": statistics.median(durations),
+        }
+
+    # Time spent outside the recorded phases (e.g. provisioning a sysroot)
+    overhead = statistics.median(
+        max(0.0, build["duration"] - sum(step["duration"] for step in build["steps"].values()))
+        for build in builds
+    )
+    return {
+        "basis": basis,
+        "samples": len(builds),
+        "duration": overhead + sum(step["duration"] for step in steps.values()),
+        "steps": steps,
+    }
+
+
+def _format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
+
+
+def _format_build(build):
+    cache = " ".join(
+        f"{name} {step['cache']}" for name, step in build["steps"].items() if step["cache"]
+    )
+    details = [f"{build['duration']:.1f}s"]
+    if build["ninja_edges"] is not None:
+        details.append(f"{build['ninja_edges']} edges")
+    if build["peak_rss_kib"] is not None:
+        details.append(f"peak {format_size(build['peak_rss_kib'] * 1024)}")
+    if build["archive_size"] is not None:
+        details.append(f"archive {format_size(build['archive_size'])}")
+    elif build["libraries_size"]:
+        details.append(f"libraries {format_size(build['libraries_size'])}")
+    if cache:
+        details.append(cache)
+    if build["agent"]:
+        details.append(f"on {build['agent']}")
+    return (
+        f"{_format_time(build['time'])}  {build['build_name']} ({build['skia_version']}, "
+        f"args {build['fingerprint'][:8]})  {', '.join(details)}"
+    )
+
+
+def summarize_trends(builds):
+    """
+    Groups builds by build name, milestone and arguments and summarizes each group.
+
+    Returns:
+        list[dict]: `build_name`, `skia_version`, `fingerprint`, number of `builds`, `median` and
+            `latest` duration, relative `change` of the latest to the median of the previous ones
+            (None for a single build), and the `hit_rates` of the phases with a cache status.
+    """
+    groups = {}
+    for build in builds:
+        key = (build["build_name"], build["skia_version"], build["fingerprint"])
+        groups.setdefault(key, []).append(build)
+
+    trends = []
+    for (build_name, skia_version, key), group in groups.items():
+        durations = [build["duration"] for build in group]
+        previous = statistics.median(durations[1:]) if len(durations) > 1 else None
+        phases = dict.fromkeys(name for build in group for name in build["steps"])
+        hit_rates = {
+            name: _hit_rate([build["steps"].get(name, {}).get("cache") for build in group])
+            for name in phases
+        }
+        trends.append(
+            {
+                "build_name": build_name,
+                "skia_version": skia_version,
+                "fingerprint": key,
+                "builds": len(group),
+                "median": statistics.median(durations),
+                "latest": durations[0],
+                "change": (durations[0] - previous) / previous if previous else None,
+                "hit_rates": {name: rate for name, rate in hit_rates.items() if rate is not None},
+            }
+        )
+    return trends
+
+
+def report_history(target=None, skia_version=None, limit=20, setups=False):
+    """Logs the recent builds (or setups) of the workspace, and the trends of each build."""
+    if setups:
+        recent_setups = get_setups(skia_version, limit)
+        if not recent_setups:
+            Logger.info("No setup recorded yet.")
+        for setup in recent_setups:
+            steps = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in setup["steps"].items())
+            Logger.info(
+                f"{_format_time(setup['time'])}  setup {setup['skia_version']} in "
+                f"{setup['duration']:.1f}s ({steps})"
+            )
+        return recent_setups
+
+    builds = get_builds(target, skia_version, limit=limit)
+    if not builds:
+        Logger.info(f"No build{f' of {target}' if target else ''} recorded yet.")
+        return builds
+    for build in builds:
+        Logger.info(_format_build(build))
+
+    Logger.custom("\nTrends:", Logger.BRIGHT_YELLOW, bold=True)
+    for trend in summarize_trends(builds):
+        change = f" ({trend['change']:+.0%} from the median before)" if trend["change"] else ""
+        hit_rates = ", ".join(
+            f"{name} hits {rate:.0%}" for name, rate in trend["hit_rates"].items()
+        )
+        Logger.info(
+            f"{trend['build_name']} ({trend['skia_version']}, args {trend['fingerprint'][:8]}): "
+            f"{trend['builds']} build(s), median {trend['median']:.1f}s, latest "
+            f"{trend['latest']:.1f}s{change}" + (f", {hit_rates}" if hit_rates else "")
+        )
+    return builds
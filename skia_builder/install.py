@@ -0,0 +1,398 @@
+"""
+Installation of prebuilt archives (as produced by `build --archive`) into a project directory,
+for consumers that don't need to build Skia.
+
+Archives are looked up in an artifact source (`ARTIFACT_SOURCE` in config.py), an HTTP(S) server
+or a directory, at `ARTIFACT_PATH` next to their `.manifest.json`. The manifest pins the checksum
+of the archive, which is downloaded through the download cache, and the checksum of every file,
+which is checked while extracting. The installed manifest is kept in the project directory as
+`MANIFEST.json`, so that upgrades only extract the files that changed and remove the ones that
+no longer exist. Installed files modified locally since are never overwritten nor removed: they
+are kept, with a warning.
+"""
+
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import posixpath
+import stat
+import tarfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from skia_builder.api import resolve_target
+from skia_builder.config import ARTIFACT_PATH, ARTIFACT_SOURCE, DEFAULT_BUILD_PROFILE
+from skia_builder.download import fetch
+from skia_builder.errors import DownloadError, InstallError, VariantsError
+from skia_builder.manifest import (
+    MANIFEST_NAME,
+    MAX_PENDING_ARCHIVE_MEMBERS,
+    hash_file,
+    load_manifest,
+    write_manifest,
+)
+from skia_builder.trace import traced
+from skia_builder.utils import Logger
+from skia_builder.variants import VARIANTS_MANIFEST, pick_variant
+from skia_builder.workspace import SKIA_DIR, get_skia_path, get_skia_version
+
+# Suffix of the files being extracted, renamed once complete
+PARTIAL_SUFFIX = ".skia-builder-part"
+# Members up to this size are read into memory and written by the pool of threads, larger ones
+# are streamed to disk as they are decompressed, which bounds the memory held by the members
+# pending in the pool (at most `MAX_PENDING_ARCHIVE_MEMBERS` of them)
+MAX_POOLED_MEMBER_SIZE = 1 << 20
+COPY_BUFFER_SIZE = 1 << 20
+
+
+def _default_workers():
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _safe_join(destination, name):
+    target = os.path.abspath(os.path.join(destination, name))
+    if os.path.commonpath([target, destination]) != destination:
+        raise InstallError(f"Refusing to install {name!r} outside of {destination}")
+    return target
+
+
+def get_build_name(target, profile=None, x86_64_level=None):
+    """
+    Returns the build name of a target (see `get_build_name` of the platform managers), whichever
+    the host is.
+
+    Raises:
+        UnsupportedPlatformError: If the target platform is unknown.
+        UnsupportedArchitectureError: If the CPU is not supported by the target platform.
+    """
+    manager, target_cpu = resolve_target(target)
+    return manager.get_build_name(target_cpu, profile, x86_64_level)
+
+
+def _is_url(source):
+    return urlparse(source).scheme in ("http", "https", "file")
+
+
+def _fetch_artifact(source, path, sha256=None):
+    """
+    Returns the local path of an artifact of the source, downloading it into the download cache
+    if the source is a URL.
+
+    Raises:
+        DownloadError: If the download fails or the checksum doesn't match.
+        InstallError: If a file of a directory source is missing or doesn't match the checksum.
+    """
+    if _is_url(source):
+        return fetch(f"{source.rstrip('/')}/{path}", sha256=sha256)
+
+    local_path = os.path.join(source, *path.split("/"))
+    if not os.path.isfile(local_path):
+        raise InstallError(f"{path} not found in {source}")
+    if sha256 and hash_file(local_path) != sha256.lower():
+        raise InstallError(f"Checksum mismatch for {local_path}")
+    return local_path
+
+
+def _load_json_artifact(source, path):
+    with open(_fetch_artifact(source, path), "r", encoding="utf-8") as f:
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise InstallError(f"{path} from {source} is not valid JSON: {e}") from e
+
+
+def _resolve_artifact(source, skia_version, build_name, pick_level):
+    """
+    Returns the paths, relative to the source, of the archive and manifest to install. With
+    `pick_level`, the x86-64 level variant best suited to this CPU is picked from the variants
+    published alongside the build, if any.
+    """
+    archive_path = ARTIFACT_PATH.format(skia_version=skia_version, build_name=build_name)
+    manifest_path = f"{archive_path[: -len('.tar.gz')]}.manifest.json"
+    if not pick_level:
+        return archive_path, manifest_path
+
+    variants_dir = posixpath.dirname(
+        ARTIFACT_PATH.format(skia_version=skia_version, build_name=f"{build_name}-variants")
+    )
+    try:
+        variants = _load_json_artifact(source, f"{variants_dir}/{VARIANTS_MANIFEST}")
+        variant = pick_variant(variants)
+    except (DownloadError, InstallError, ValueError, VariantsError) as e:
+        Logger.info(f"No x86-64 level variant to pick ({e}), installing the baseline.")
+        return archive_path, manifest_path
+
+    level = f"x86-64-{variant['x86_64_level']}" if variant["x86_64_level"] else "baseline"
+    Logger.info(f"Picked {variant['name']} ({level}) for this CPU")
+    return f"{variants_dir}/{variant['archive']}", f"{variants_dir}/{variant['manifest']}"
+
+
+def _is_unchanged(destination, path, installed_manifest):
+    """Whether an installed file is still the one of the installed manifest."""
+    installed = (installed_manifest or {}).get("installed", {}).get(path)
+    if installed is None:
+        return False
+    try:
+        st = os.stat(_safe_join(destination, path))
+    except OSError:
+        return False
+    return [st.st_size, st.st_mtime_ns] == installed
+
+
+def _is_modified(destination, path, installed_manifest, installed_entries):
+    """
+    Whether a file of the previous installation was modified locally since: its size or mtime and
+    its content changed. Missing files, and files the previous installation doesn't have, are not.
+    """
+    entry = installed_entries.get(path)
+    target = _safe_join(destination, path)
+    if entry is None or not os.path.isfile(target):
+        return False
+    if _is_unchanged(destination, path, installed_manifest):
+        return False
+    return hash_file(target) != entry["sha256"]
+
+
+def _write_member(target, chunks, mode, sha256):
+    """
+    Writes an extracted file from its `chunks` of content, hashing them as they are written, and
+    installs it once its checksum is verified.
+
+    Raises:
+        InstallError: If the content doesn't match `sha256`, in which case `target` is left as is.
+
+    Returns:
+        list[int]: The size and mtime (in ns) of the installed file.
+    """
+    # Files are replaced atomically, so that consumers never see a partially written file
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial_path = f"{target}{PARTIAL_SUFFIX}"
+    digest = hashlib.sha256()
+    try:
+        with open(partial_path, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+        if digest.hexdigest() != sha256:
+            raise InstallError(
+                f"Checksum mismatch for {target}: expected {sha256}, got {digest.hexdigest()}"
+            )
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(partial_path)
+        raise
+
+    if os.name != "nt":
+        os.chmod(partial_path, mode)
+    os.replace(partial_path, target)
+    st = os.stat(target)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _extract(archive_path, destination, entries, workers):
+    """
+    Extracts the members of an archive listed in `entries` ({path: manifest entry}), decompressing
+    the archive once while verifying and writing the files with a pool of threads. Members larger
+    than `MAX_POOLED_MEMBER_SIZE` are streamed to disk by the reading thread instead.
+
+    Returns:
+        dict: `{path: [size, mtime_ns]}` of the extracted files.
+    """
+    extracted = {}
+    pending = {}
+
+    def collect(block=False):
+        if block:
+            done = list(pending)
+        else:
+            done_futures = wait(pending.values(), return_when=FIRST_COMPLETED).done
+            done = [path for path, future in pending.items() if future in done_futures]
+        for path in done:
+            extracted[path] = pending.pop(path).result()
+
+    with ThreadPoolExecutor(max_workers=workers or _default_workers()) as executor:
+        try:
+            with tarfile.open(archive_path, "r|*") as tar:
+                for member in tar:
+                    entry = entries.get(member.name)
+                    if entry is None or not member.isfile():
+                        continue
+                    target = _safe_join(destination, member.name)
+                    mode = stat.S_IMODE(member.mode)
+                    src = tar.extractfile(member)
+                    if member.size > MAX_POOLED_MEMBER_SIZE:
+                        chunks = iter(functools.partial(src.read, COPY_BUFFER_SIZE), b"")
+                        extracted[member.name] = _write_member(
+                            target, chunks, mode, entry["sha256"]
+                        )
+                        continue
+                    pending[member.name] = executor.submit(
+                        _write_member, target, [src.read()], mode, entry["sha256"]
+                    )
+                    if len(pending) >= MAX_PENDING_ARCHIVE_MEMBERS:
+                        collect()
+        finally:
+            collect(block=True)
+
+    if missing := sorted(set(entries) - set(extracted)):
+        raise InstallError(f"{len(missing)} files missing from {archive_path}: {missing[0]}, ...")
+    return extracted
+
+
+def _remove_stale_files(destination, installed_manifest, manifest, modified):
+    """
+    Removes the files of the previous installation that the new one doesn't have, except the
+    `modified` ones.
+    """
+    paths = {entry["path"] for entry in manifest["files"]}
+    removed = 0
+    for entry in (installed_manifest or {}).get("files", []):
+        path = entry["path"]
+        target = _safe_join(destination, path)
+        if path in paths or path in modified or not os.path.isfile(target):
+            continue
+        os.remove(target)
+        removed += 1
+
+        # Prune the directories left empty
+        directory = os.path.dirname(target)
+        while directory != destination and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+    return removed
+
+
+@traced("install")
+def install(
+    target,
+    destination,
+    source=None,
+    profile=None,
+    x86_64_level=None,
+    workers=None,
+):
+    """
+    Installs the prebuilt archive of a target into `destination`, without building.
+
+    Args:
+        target (str): Build target name, e.g. `linux-x64`.
+        destination (str): Project directory to extract into. Created if missing.
+        source (str): HTTP(S) base URL or directory of the artifacts. Defaults to
+            `ARTIFACT_SOURCE`.
+        profile (str): Build profile of the archive, e.g. `speed`. Defaults to `size`.
+        x86_64_level (str): x86-64 microarchitecture level of the archive, e.g. `v3`, or `auto`
+            to pick the variant best suited to this CPU. Defaults to the baseline.
+        workers (int): Number of extraction threads. Defaults to a value based on the CPU count.
+
+    Raises:
+        InstallError: If no source is configured, the destination is a Skia checkout, or the
+            archive is missing or corrupt.
+        DownloadError: If downloading the archive or its manifest fails.
+        UnsupportedPlatformError: If the target platform is unknown.
+        UnsupportedArchitectureError: If the CPU is not supported by the target platform.
+
+    Returns:
+        dict: Counts of the `extracted`, `unchanged` and `removed` files, the files `kept` since
+            they were modified locally, and the `build` description of the installed archive.
+    """
+    source = source or ARTIFACT_SOURCE
+    if not source:
+        raise InstallError(
+            "No artifact source to install from. Pass --source or set "
+            "SKIA_BUILDER_ARTIFACT_SOURCE to a base URL or directory."
+        )
+    pick_level = x86_64_level == "auto"
+    build_name = get_build_name(
+        target, profile or DEFAULT_BUILD_PROFILE, None if pick_level else x86_64_level
+    )
+    skia_version = get_skia_version()
+    archive_path, manifest_path = _resolve_artifact(source, skia_version, build_name, pick_level)
+
+    Logger.custom(
+        f"\n--- Running step: Installing {build_name} ({skia_version}) from {source} ---",
+        Logger.BRIGHT_YELLOW,
+    )
+    manifest = _load_json_artifact(source, manifest_path)
+    if "archive" not in manifest or "files" not in manifest:
+        raise InstallError(f"{manifest_path} is not an archive manifest")
+
+    destination = os.path.realpath(destination)
+    # Extracting, and removing stale files, would clobber a Skia checkout of the workspace
+    for checkout in {os.path.realpath(SKIA_DIR), os.path.realpath(get_skia_path())}:
+        if os.path.commonpath([destination, checkout]) == checkout:
+            raise InstallError(
+                f"Refusing to install into the Skia checkout {checkout}, pick another --dest"
+            )
+    os.makedirs(destination, exist_ok=True)
+    installed_manifest_path = os.path.join(destination, MANIFEST_NAME)
+    installed_manifest = None
+    if os.path.exists(installed_manifest_path):
+        try:
+            installed_manifest = load_manifest(installed_manifest_path)
+        except ValueError:
+            Logger.warning(f"Ignoring the unreadable {installed_manifest_path}")
+
+    # Files modified locally are kept, whether the archive changed or removed them
+    installed_entries = {
+        entry["path"]: entry for entry in (installed_manifest or {}).get("files", [])
+    }
+    modified = {
+        path
+        for path in installed_entries
+        if _is_modified(destination, path, installed_manifest, installed_entries)
+    }
+    for path in sorted(modified):
+        Logger.warning(f"Keeping {path}, which was modified since it was installed")
+
+    # Files are only extracted if the archive changed them, or if they are missing
+    unchanged = {
+        entry["path"]
+        for entry in manifest["files"]
+        if installed_entries.get(entry["path"], {}).get("sha256") == entry["sha256"]
+        and _is_unchanged(destination, entry["path"], installed_manifest)
+    }
+    to_extract = {
+        entry["path"]: entry
+        for entry in manifest["files"]
+        if entry["path"] not in unchanged and entry["path"] not in modified
+    }
+
+    extracted = {}
+    if to_extract:
+        archive = _fetch_artifact(source, archive_path, sha256=manifest["archive"]["sha256"])
+        extracted = _extract(archive, destination, to_extract, workers)
+    removed = _remove_stale_files(destination, installed_manifest, manifest, modified)
+
+    # Kept files keep the size and mtime they were installed with, so they stay modified
+    installed = {
+        path: (
+            extracted[path]
+            if path in extracted
+            else (installed_manifest or {}).get("installed", {}).get(path)
+        )
+        for path in (entry["path"] for entry in manifest["files"])
+    }
+    write_manifest(
+        {
+            **{key: value for key, value in manifest.items() if key != "archive"},
+            "installed": installed,
+        },
+        installed_manifest_path,
+    )
+
+    if not extracted and not removed:
+        Logger.info(f"{build_name} is up to date in {destination}")
+    else:
+        Logger.info(
+            f"Installed {build_name} in {destination}: {len(extracted)} files extracted, "
+            f"{len(unchanged)} unchanged, {removed} removed, {len(modified)} kept"
+        )
+    return {
+        "extracted": len(extracted),
+        "unchanged": len(unchanged),
+        "removed": removed,
+        "kept": sorted(modified),
+        "build": manifest.get("build"),
+    }
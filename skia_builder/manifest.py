@@ -0,0 +1,210 @@
+import hashlib
+import json
+import mmap
+import os
+import stat
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_NAME = "MANIFEST.json"
+MANIFEST_VERSION = 1
+# Files written next to the payload by `archive_build_output`, ignored when verifying a tree
+ARCHIVE_SUFFIXES = (".tar.gz", ".manifest.json")
+
+# Upper bound of archive members read ahead of the hashing pool while verifying a tarball
+MAX_PENDING_ARCHIVE_MEMBERS = 64
+
+
+def _default_workers():
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    """Returns the SHA-256 hex digest of a file, reading it through a memory map."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        # hashlib releases the GIL for large buffers, so this scales across threads
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def _iter_tree_files(root, exclude):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            full_path = os.path.join(dirpath, name)
+            rel_path = os.path.relpath(full_path, root).replace(os.sep, "/")
+            if rel_path in exclude:
+                continue
+            st = os.lstat(full_path)
+            if stat.S_ISREG(st.st_mode):
+                yield rel_path, full_path, st
+
+
+def build_manifest(root, exclude=(), workers=None, digest_cache=None):
+    """
+    Hashes every regular file below `root` using a thread pool.
+
+    Args:
+        root (str): Directory to describe.
+        exclude (Iterable[str]): Paths relative to `root` (POSIX separators) to leave out.
+        workers (int): Number of hashing threads. Defaults to a value based on the CPU count.
+        digest_cache (dict): Optional `{path: (size, mtime_ns, sha256)}` of previously hashed
+            files, updated in place. Files whose size and mtime are unchanged aren't hashed again.
+
+    Returns:
+        dict: The manifest, with one `{path, size, sha256, mode}` entry per file sorted by path.
+    """
+    exclude = set(exclude) | {MANIFEST_NAME}
+    files = list(_iter_tree_files(root, exclude))
+
+    def digest(item):
+        _, full_path, st = item
+        if digest_cache is None:
+            return hash_file(full_path)
+        cached = digest_cache.get(full_path)
+        if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+            return cached[2]
+        value = hash_file(full_path)
+        digest_cache[full_path] = (st.st_size, st.st_mtime_ns, value)
+        return value
+
+    with ThreadPoolExecutor(max_workers=workers or _default_workers()) as executor:
+        digests = list(executor.map(digest, files))
+
+    return {
+        "version": MANIFEST_VERSION,
+        "files": [
+            {
+                "path": rel_path,
+                "size": st.st_size,
+                "sha256": digest,
+                "mode": f"{stat.S_IMODE(st.st_mode):04o}",
+            }
+            for (rel_path, _, st), digest in zip(files, digests)
+        ],
+    }
+
+
+def write_manifest(manifest, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def load_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _compare(manifest, actual, check_mode=True):
+    """Compares manifest entries with `actual` ({path: (size, sha256, mode)})."""
+    mismatches = []
+    expected_paths = set()
+
+    for entry in manifest["files"]:
+        path = entry["path"]
+        expected_paths.add(path)
+        if path not in actual:
+            mismatches.append((path, "missing"))
+            continue
+
+        size, digest, mode = actual[path]
+        if size != entry["size"]:
+            mismatches.append((path, f"size {size} != {entry['size']}"))
+        elif digest != entry["sha256"]:
+            mismatches.append((path, "sha256 mismatch"))
+        elif check_mode and mode != entry["mode"]:
+            mismatches.append((path, f"mode {mode} != {entry['mode']}"))
+
+    for path in sorted(set(actual) - expected_paths):
+        mismatches.append((path, "unexpected file"))
+
+    return mismatches
+
+
+def verify_tree(root, manifest, workers=None):
+    """
+    Checks an extracted tree against a manifest.
+
+    Returns:
+        list[tuple[str, str]]: `(path, reason)` pairs, empty when the tree matches.
+    """
+    files = [
+        item
+        for item in _iter_tree_files(root, {MANIFEST_NAME})
+        if "/" in item[0] or not item[0].endswith(ARCHIVE_SUFFIXES)
+    ]
+
+    with ThreadPoolExecutor(max_workers=workers or _default_workers()) as executor:
+        digests = executor.map(hash_file, (full_path for _, full_path, _ in files))
+        actual = {
+            rel_path: (st.st_size, digest, f"{stat.S_IMODE(st.st_mode):04o}")
+            for (rel_path, _, st), digest in zip(files, digests)
+        }
+
+    # Permission bits are not meaningful on Windows filesystems
+    return _compare(manifest, actual, check_mode=os.name != "nt")
+
+
+def verify_archive(archive_path, manifest=None, workers=None):
+    """
+    Checks a tarball against a manifest while streaming it, hashing members in parallel.
+
+    The manifest embedded in the archive is used unless one is given explicitly.
+
+    Returns:
+        list[tuple[str, str]]: `(path, reason)` pairs, empty when the archive matches.
+    """
+    pending = {}
+    digests = {}
+    embedded_manifest = None
+
+    def collect(block=False):
+        for name in list(pending):
+            future, size, mode = pending[name]
+            if block or future.done():
+                digests[name] = (size, future.result(), mode)
+                del pending[name]
+
+    with ThreadPoolExecutor(max_workers=workers or _default_workers()) as executor:
+        with tarfile.open(archive_path, "r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                data = tar.extractfile(member).read()
+                if member.name == MANIFEST_NAME:
+                    embedded_manifest = json.loads(data)
+                    continue
+
+                pending[member.name] = (
+                    executor.submit(_sha256_bytes, data),
+                    member.size,
+                    f"{stat.S_IMODE(member.mode):04o}",
+                )
+                if len(pending) >= MAX_PENDING_ARCHIVE_MEMBERS:
+                    collect()
+                    if len(pending) >= MAX_PENDING_ARCHIVE_MEMBERS:
+                        collect(block=True)
+        collect(block=True)
+
+    manifest = manifest or embedded_manifest
+    if manifest is None:
+        raise ValueError(f"No {MANIFEST_NAME} found in {archive_path}")
+
+    return _compare(manifest, digests)
+
+
+def verify(path, manifest_path=None, workers=None):
+    """Verifies either an extracted tree or an archive, depending on what `path` points to."""
+    if os.path.isdir(path):
+        manifest_path = manifest_path or os.path.join(path, MANIFEST_NAME)
+        return verify_tree(path, load_manifest(manifest_path), workers=workers)
+
+    manifest = load_manifest(manifest_path) if manifest_path else None
+    return verify_archive(path, manifest, workers=workers)
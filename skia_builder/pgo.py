@@ -0,0 +1,316 @@
+"""
+Profile-guided optimization of the libraries (`skia-builder build --pgo`).
+
+A variant of the target instrumented with clang's `-fprofile-instr-generate` is built in its own
+out dir, and a training workload runs with it: by default nanobench on the CPU raster backend,
+built against the instrumented library, or a custom command, e.g. an application linked with the
+instrumented libraries of `SKIA_BUILDER_OUT_DIR`. The raw profiles the workload writes are merged
+with `llvm-profdata`, and the target is rebuilt optimized with the merged profile, as
+`<build name>-pgo`.
+
+Merged profiles are cached by milestone in `PGO_PROFILES_DIR`, named after their content so that a
+new profile changes the GN arguments of the final build (and ninja rebuilds with it). Later
+builds of the same target and workload reuse the cached profile and skip the training, until
+`--pgo-retrain`, or until the instrumented build changes: its resolved GN arguments or the commit
+of the checkout differ from the ones the profile was trained with.
+"""
+
+import asyncio
+import datetime
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+
+from skia_builder import history
+from skia_builder.api import SkiaBuilder
+from skia_builder.bench import run_nanobench
+from skia_builder.config import (
+    DEFAULT_BUILD_PROFILE,
+    NANOBENCH_CONFIG,
+    PGO_INSTRUMENT,
+    PGO_PROFILES_DIR,
+    PGO_TARGET_OS,
+    PGO_TRAINING_SAMPLES,
+)
+from skia_builder.errors import PGOError
+from skia_builder.manifest import hash_file
+from skia_builder.sysroot import get_host_cpu
+from skia_builder.trace import span
+from skia_builder.utils import Logger, run_command
+from skia_builder.workspace import get_skia_path, get_skia_version
+
+PGO_INDEX_VERSION = 2
+
+
+def find_llvm_profdata():
+    """
+    Returns the `llvm-profdata` merging the raw profiles: the one next to `clang` (whose profile
+    format it matches), `llvm-profdata` on the PATH, or its latest versioned name (as installed by
+    apt.llvm.org).
+
+    Raises:
+        PGOError: If no llvm-profdata is found.
+    """
+    if clang := shutil.which("clang"):
+        path = os.path.join(os.path.dirname(os.path.realpath(clang)), "llvm-profdata")
+        if os.path.isfile(path):
+            return path
+
+    if path := shutil.which("llvm-profdata"):
+        return path
+    versioned = {}
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        for path in glob.glob(os.path.join(directory, "llvm-profdata-*")):
+            if match := re.fullmatch(r"llvm-profdata-(\d+)", os.path.basename(path)):
+                versioned.setdefault(int(match.group(1)), path)
+    if versioned:
+        return versioned[max(versioned)]
+    raise PGOError("llvm-profdata is needed to merge the PGO profiles (install LLVM)")
+
+
+def describe_training(training_command=None, match=None):
+    """Returns the description of a training workload, which cached profiles are matched on."""
+    if training_command:
+        return training_command
+    match_args = ["--match", *match] if match else []
+    return " ".join(["nanobench", "--config", NANOBENCH_CONFIG, *match_args])
+
+
+def _get_index_path(build_name):
+    return os.path.join(PGO_PROFILES_DIR, get_skia_version(), f"{build_name}.json")
+
+
+def get_instrumented_build(
+    manager, target_cpu, override_args=None, profile=None, x86_64_level=None
+):
+    """
+    Returns what a cached profile of a build must have been trained with: the fingerprint of the
+    resolved GN arguments of its instrumented variant (`build_args`), and the commit of the
+    selected checkout (`skia_commit`, None if it can't be read).
+    """
+    build_args = manager.resolve_build_args(
+        target_cpu,
+        override_build_args=override_args,
+        profile=profile,
+        x86_64_level=x86_64_level,
+        pgo=PGO_INSTRUMENT,
+    )
+    commit = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=get_skia_path(), capture_output=True, text=True
+    ).stdout.strip()
+    return {"build_args": history.fingerprint(build_args), "skia_commit": commit or None}
+
+
+def load_cached_profile(build_name, training, instrumented_build):
+    """
+    Returns the merged profile cached for a build of the selected milestone, trained with the
+    `training` workload on the same instrumented build (see `get_instrumented_build`), or None.
+    """
+    try:
+        with open(_get_index_path(build_name), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get("version") != PGO_INDEX_VERSION or index.get("training") != training:
+        return None
+    if changed := [key for key, value in instrumented_build.items() if index.get(key) != value]:
+        reasons = {"build_args": "other GN arguments", "skia_commit": "another Skia commit"}
+        Logger.info(
+            f"The cached PGO profile of {build_name} was trained with "
+            f"{' and '.join(reasons[key] for key in changed)}, it needs training again"
+        )
+        return None
+    path = os.path.join(os.path.dirname(_get_index_path(build_name)), index["profile"])
+    return path if os.path.isfile(path) else None
+
+
+def _store_profile(build_name, training, instrumented_build, merged_path):
+    """Moves a merged profile into the cache of the selected milestone, and returns its path."""
+    index_path = _get_index_path(build_name)
+    profile_name = f"{build_name}-{hash_file(merged_path)[:12]}.profdata"
+    profile_path = os.path.join(os.path.dirname(index_path), profile_name)
+    os.replace(merged_path, profile_path)
+
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            previous = json.load(f).get("profile")
+    except (OSError, ValueError, AttributeError):
+        previous = None
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": PGO_INDEX_VERSION,
+                "profile": profile_name,
+                "training": training,
+                **instrumented_build,
+                "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            },
+            f,
+            indent=2,
+        )
+    if previous and previous != profile_name:
+        try:
+            os.remove(os.path.join(os.path.dirname(index_path), previous))
+        except OSError:
+            pass
+    return profile_path
+
+
+def train(
+    builder,
+    target,
+    raw_dir,
+    training_command=None,
+    match=None,
+    override_args=None,
+    profile=None,
+    x86_64_level=None,
+):
+    """
+    Builds the instrumented variant of a target and runs the training workload with it, which
+    writes its raw profiles to `raw_dir`.
+
+    Raises:
+        PGOError: If the workload wrote no profile.
+        CommandError: If the instrumented build or the workload fails.
+    """
+    env = {"LLVM_PROFILE_FILE": os.path.join(os.path.abspath(raw_dir), "skia-%p-%m.profraw")}
+    if training_command:
+        result = asyncio.run(
+            builder.build(
+                target,
+                override_args=override_args,
+                overwrite=True,
+                profile=profile,
+                x86_64_level=x86_64_level,
+                pgo=PGO_INSTRUMENT,
+            )
+        )
+        env["SKIA_BUILDER_SKIA_DIR"] = get_skia_path()
+        env["SKIA_BUILDER_OUT_DIR"] = result.out_dir
+        run_command(["/bin/sh", "-c", training_command], "Running the PGO training", env=env)
+    else:
+        manager, target_cpu = builder.resolve_target(target)
+        executable = asyncio.run(
+            manager.build_nanobench_async(
+                target_cpu, override_args, profile, x86_64_level, pgo=PGO_INSTRUMENT
+            )
+        )
+        run_nanobench(
+            executable,
+            get_skia_path(),
+            os.path.join(os.path.abspath(raw_dir), "nanobench.json"),
+            match,
+            PGO_TRAINING_SAMPLES,
+            env,
+        )
+
+    raw_profiles = sorted(glob.glob(os.path.join(raw_dir, "*.profraw")))
+    if not raw_profiles:
+        raise PGOError(
+            "The training workload wrote no profile (is it linked with the instrumented "
+            "libraries, and does it exit normally?)"
+        )
+    return raw_profiles
+
+
+def build_with_pgo(
+    target,
+    training_command=None,
+    match=None,
+    override_args=None,
+    archive=False,
+    overwrite=False,
+    profile=None,
+    x86_64_level=None,
+    debug_symbols=None,
+    retrain=False,
+    host_platform=None,
+):
+    """
+    Builds a target optimized with a PGO profile of a training workload, training it first unless
+    a profile of the same workload is cached for the selected milestone.
+
+    Args:
+        target (str): Build target, which must run on this host, e.g. `linux-x64`.
+        training_command (str): Shell command of the training workload, run with the instrumented
+            out dir in `SKIA_BUILDER_OUT_DIR` (and the Skia checkout in `SKIA_BUILDER_SKIA_DIR`).
+            Defaults to nanobench.
+        match (list[str]): nanobench `--match` patterns selecting the training benches (all by
+            default).
+        override_args (str): GN arguments overriding values of the default ones.
+        archive (bool): Whether the optimized build output is archived.
+        overwrite (bool): Whether an existing output directory is replaced.
+        profile (str): Build profile, e.g. `speed`. Defaults to `size`.
+        x86_64_level (str): x86-64 microarchitecture level to target, e.g. `v3`.
+        debug_symbols (str): Debug info mode of the optimized build, `none` or `split`.
+        retrain (bool): Whether to train again even if a profile is cached.
+        host_platform (str): Host platform name (e.g. "Linux"). Defaults to the current one.
+
+    Raises:
+        PGOError: If the target can't be trained on this host, llvm-profdata is missing, or the
+            training wrote no profile.
+        CommandError: If one of the builds, the training or the merge fails.
+
+    Returns:
+        BuildResult: The result of the optimized build.
+    """
+    builder = SkiaBuilder(host_platform)
+    manager, target_cpu = builder.resolve_target(target)
+    if manager.TARGET_PLATFORM.lowercase not in PGO_TARGET_OS or target_cpu != get_host_cpu():
+        raise PGOError(f"PGO trains on its host, {target} can't be trained here")
+
+    build_name = manager.get_build_name(target_cpu, profile or DEFAULT_BUILD_PROFILE, x86_64_level)
+    training = describe_training(training_command, match)
+    instrumented_build = get_instrumented_build(
+        manager, target_cpu, override_args, profile, x86_64_level
+    )
+    profile_path = (
+        None if retrain else load_cached_profile(build_name, training, instrumented_build)
+    )
+    if profile_path:
+        Logger.info(f"Reusing the PGO profile {profile_path} (train again with --pgo-retrain)")
+    else:
+        llvm_profdata = find_llvm_profdata()
+        raw_dir = os.path.join(PGO_PROFILES_DIR, get_skia_version(), f"{build_name}-raw")
+        shutil.rmtree(raw_dir, ignore_errors=True)
+        os.makedirs(raw_dir)
+        try:
+            with span(f"pgo training {build_name}", "pgo"):
+                Logger.custom(f"\n--- Training {build_name} ({training}) ---", Logger.BRIGHT_YELLOW)
+                raw_profiles = train(
+                    builder,
+                    target,
+                    raw_dir,
+                    training_command,
+                    match,
+                    override_args,
+                    profile,
+                    x86_64_level,
+                )
+                merged_path = os.path.join(raw_dir, "merged.profdata")
+                run_command(
+                    [llvm_profdata, "merge", "--output", merged_path, *raw_profiles],
+                    f"Merging {len(raw_profiles)} PGO profile(s)",
+                )
+                profile_path = _store_profile(build_name, training, instrumented_build, merged_path)
+        finally:
+            shutil.rmtree(raw_dir, ignore_errors=True)
+        Logger.info(f"PGO profile cached in {profile_path}")
+
+    Logger.custom(f"\n--- Building {build_name} with PGO ---", Logger.BRIGHT_YELLOW)
+    return asyncio.run(
+        builder.build(
+            target,
+            override_args=override_args,
+            archive=archive,
+            overwrite=overwrite,
+            profile=profile,
+            x86_64_level=x86_64_level,
+            debug_symbols=debug_symbols,
+            pgo=profile_path,
+        )
+    )
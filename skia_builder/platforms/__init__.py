@@ -0,0 +1,10 @@
+from skia_builder.platforms import android, ios, iossimulator, linux, macos, windows
+
+PLATFORM_MANAGERS = {
+    "Android": android.AndroidPlatformManager,
+    "iOS": ios.IOSPlatformManager,
+    "iOSSimulator": iossimulator.IOSSimulatorPlatformManager,
+    "Linux": linux.LinuxPlatformManager,
+    "macOS": macos.MacOSPlatformManager,
+    "Windows": windows.WindowsPlatformManager,
+}
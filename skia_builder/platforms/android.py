@@ -1,40 +1,76 @@
+import glob
 import os
+import shutil
+import tempfile
 
+from skia_builder.config import ANDROID_NDK_DIR
+from skia_builder.dag import Step
+from skia_builder.debuginfo import find_objcopy
+from skia_builder.download import download
+from skia_builder.errors import ArchiveError
+from skia_builder.extract import extract_zip
 from skia_builder.platforms.common import CommonSubPlatformManager, SubPlatform
+from skia_builder.platforms.linux import LinuxPlatformManager
 from skia_builder.platforms.windows import WindowsPlatformManager
-from skia_builder.utils import run_command
-from skia_builder.versions import ANDROID_NDK
+from skia_builder.utils import Logger
+from skia_builder.versions import ANDROID_NDK, ANDROID_NDK_SHA256
 
 
 class AndroidPlatformManager(CommonSubPlatformManager):
     @staticmethod
-    def _setup_env_host_windows(skip_llvm_instalation):
-        WindowsPlatformManager.setup_env(skip_llvm_instalation)
+    def _install_ndk(host):
+        """Downloads the NDK for `host` ("windows" or "linux") and extracts it in-process."""
+        ndk_path = os.path.join(ANDROID_NDK_DIR, ANDROID_NDK)
+        if os.path.exists(os.path.join(ndk_path, "source.properties")):
+            Logger.info(f"Android NDK already available at {ndk_path}")
+            return
 
-        os.makedirs("Android_NDK", exist_ok=True)
+        archive_name = f"{ANDROID_NDK}-{host}.zip"
+        archive_path = os.path.join(ANDROID_NDK_DIR, archive_name)
 
-        run_command(
-            [
-                "curl",
-                "-o",
-                f"Android_NDK/{ANDROID_NDK}-windows.zip",
-                f"https://dl.google.com/android/repository/{ANDROID_NDK}-windows.zip",
-            ],
+        download(
+            f"https://dl.google.com/android/repository/{archive_name}",
+            archive_path,
             "Downloading Android NDK",
+            sha256=ANDROID_NDK_SHA256[host],
         )
 
-        run_command(
-            [
-                "powershell",
-                "-Command",
-                f"Expand-Archive -Path 'Android_NDK/{ANDROID_NDK}-windows.zip' "
-                "-DestinationPath 'Android_NDK'",
-            ],
-            "Extracting Android NDK",
+        Logger.custom("\n--- Running step: Extracting Android NDK ---", Logger.BRIGHT_YELLOW)
+        # Extracted next to its final location and moved there once complete, so that an
+        # interrupted extraction is never taken for an installed NDK
+        staging_dir = tempfile.mkdtemp(prefix=f".{ANDROID_NDK}-", dir=ANDROID_NDK_DIR)
+        try:
+            entries = extract_zip(archive_path, staging_dir)
+            extracted_path = os.path.join(staging_dir, ANDROID_NDK)
+            if not os.path.isfile(os.path.join(extracted_path, "source.properties")):
+                raise ArchiveError(f"{archive_name} doesn't hold {ANDROID_NDK}")
+            # Left by an interrupted extraction of an earlier version of skia-builder
+            shutil.rmtree(ndk_path, ignore_errors=True)
+            os.replace(extracted_path, ndk_path)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        Logger.info(f"Extracted {entries} entries to {ndk_path}")
+
+    @classmethod
+    def get_objcopy(cls):
+        # The NDK's llvm-objcopy matches the clang the libraries were built with
+        toolchain_dirs = glob.glob(
+            os.path.join(ANDROID_NDK_DIR, ANDROID_NDK, "toolchains", "llvm", "prebuilt", "*", "bin")
         )
+        return find_objcopy(toolchain_dirs)
+
+    @staticmethod
+    def _setup_env_host_windows(skip_llvm_instalation):
+        ndk_step = Step("android-ndk", lambda: AndroidPlatformManager._install_ndk("windows"))
+        WindowsPlatformManager.setup_env(skip_llvm_instalation, [ndk_step])
+
+    @staticmethod
+    def _setup_env_host_linux(skip_llvm_instalation):
+        ndk_step = Step("android-ndk", lambda: AndroidPlatformManager._install_ndk("linux"))
+        LinuxPlatformManager.setup_env(skip_llvm_instalation, [ndk_step])
 
     HOST_PLATFORMS_ENV_SETUP = {
-        "Linux": None,
+        "Linux": _setup_env_host_linux,
         "macOS": None,
         "Windows": _setup_env_host_windows,
     }
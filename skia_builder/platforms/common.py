@@ -1,24 +1,66 @@
+import asyncio
+import functools
 import os
 import platform
 import shutil
-import sys
+import time
 from enum import Enum
 
-from skia_builder.config import get_build_args, parse_override_build_args
+from skia_builder import cleanup, debuginfo, history, prune, upgrade
+from skia_builder.config import (
+    DEFAULT_BUILD_PROFILE,
+    DEFAULT_DEBUG_SYMBOLS,
+    FULL_CHECKOUT,
+    NANOBENCH_BUILD_ARGS,
+    NINJA_STATUS,
+    PGO_INSTRUMENT,
+    SETUP_JOBS,
+    THINLTO_CACHE_DIR,
+    bin_extensions_by_platform,
+    get_build_args,
+    parse_override_build_args,
+)
+from skia_builder.dag import Step, run_steps
+from skia_builder.errors import (
+    CommandError,
+    OutputExistsError,
+    SkiaBuilderError,
+    UnsupportedPlatformError,
+)
+from skia_builder.results import BuildResult
+from skia_builder.trace import (
+    count_ninja_edges,
+    merge_ninja_log,
+    ninja_log_position,
+    span,
+)
 from skia_builder.utils import (
     Logger,
     archive_build_output,
+    get_files_with_extensions,
     run_command,
+    run_command_async,
     store_includes,
     store_skia_license,
 )
-from skia_builder.versions import SKIA_VERSION
+from skia_builder.versions import SKIA_COMMIT
+from skia_builder.workspace import (
+    SKIA_DIR,
+    get_output_dir,
+    get_skia_dir,
+    get_skia_path,
+    get_skia_version,
+    is_default_version,
+)
 
 
 PLATFORM_NAME_MAP = {
     "Darwin": "macOS",
 }
 
+# Written to the out dir with the arguments it was generated with
+BUILD_ARGS_STAMP = "skia_builder_args.txt"
+
 
 class Architecture(Enum):
     ARM = "arm"
@@ -93,12 +135,9 @@ class SubPlatform(BasePlatform, Enum):
         if self in (SubPlatform.IOS, SubPlatform.IOS_SIMULATOR):
             return current_host if current_host == HostPlatform.MACOS else None
         elif self == SubPlatform.ANDROID:
-            return current_host if current_host == HostPlatform.WINDOWS else None
-            # return (
-            #     current_platform
-            #     if current_platform in (HostPlatform.WINDOWS, HostPlatform.MACOS)
-            #     else None
-            # )  TODO: implement MACOS later
+            return (
+                current_host if current_host in (HostPlatform.WINDOWS, HostPlatform.LINUX) else None
+            )  # TODO: implement MACOS later
         else:
             raise ValueError(f"Unknown target platform: {self}")
 
@@ -136,81 +175,309 @@ class CommonPlatformManager:
     """
 
     @classmethod
-    def _setup_env(cls):
+    def _setup_env(cls, extra_steps=()):
         """
         Configures the Skia environment by cloning repositories, syncing dependencies,
         and optionally installing additional dependencies (specific to Linux).
+
+        The setup steps run concurrently as soon as the steps they depend on are done (see
+        dag.py), up to `SETUP_JOBS` at once.
+
+        Args:
+            extra_steps (Iterable[Step]): Host specific steps (e.g. installing LLVM) run
+                alongside the common ones.
         """
         if not cls.HOST_PLATFORM:
-            Logger.error("Unsupported platform")
-            sys.exit(1)
+            raise UnsupportedPlatformError("Unsupported platform")
 
-        run_command(
+        started = time.monotonic()
+        timings = {}
+        run_steps([*cls._get_setup_steps(), *extra_steps], SETUP_JOBS, timings)
+        history.record_setup(get_skia_version(), timings, time.monotonic() - started)
+
+    @classmethod
+    def _get_setup_steps(cls, revision=None):
+        """
+        Returns the graph of steps setting up depot_tools and the selected Skia checkout.
+
+        Args:
+            revision (str): Commit to check out instead of the one of the selected milestone.
+        """
+        # Only what the build targets of this host need is checked out and synced, see prune.py
+        prune_checkout = not FULL_CHECKOUT
+        pruned = prune.plan(cls._get_workspace_build_args())
+
+        main_skia_path = os.path.join(os.getcwd(), SKIA_DIR)
+        skia_path = get_skia_path()
+        skia_version = get_skia_version()
+        # Only the pinned milestone has a pinned commit, others track their branch head
+        commit = SKIA_COMMIT if is_default_version() else None
+        if revision:
+            checkout_description = f"commit {revision}"
+        else:
+            revision = commit or f"origin/chrome/{skia_version}"
+            checkout_description = f"Chrome/{skia_version} branch" + (
+                f" at {commit}" if commit else ""
+            )
+
+        async def setup_depot_tools():
+            if os.path.exists("depot_tools"):
+                Logger.info("depot_tools is already cloned, skipping.")
+            else:
+                await run_command_async(
+                    [
+                        "git",
+                        "clone",
+                        "https://chromium.googlesource.com/chromium/tools/depot_tools.git",
+                    ],
+                    "Cloning depot_tools",
+                )
+
+            gclient_executable = cls._get_executable_path(
+                "depot_tools",
+                executable_name="gclient",
+                windows_extension=".bat",
+            )
+            await run_command_async(
+                [gclient_executable],
+                "Verifying Depot Tools Installation",
+            )
+
+        async def clone_skia():
+            if os.path.exists(SKIA_DIR):
+                Logger.info("Skia is already cloned, skipping.")
+            else:
+                # Blobs of a pruned checkout are only downloaded for the files that are checked out
+                clone_options = ["--filter=blob:none", "--no-checkout"] if prune_checkout else []
+                await run_command_async(
+                    ["git", "clone", *clone_options, "https://skia.googlesource.com/skia.git"],
+                    "Cloning Skia Repository",
+                )
+
+            await run_command_async(
+                ["git", "fetch", "-v"],
+                "Fetching Skia Repository",
+                cwd=main_skia_path,
+            )
+
+        async def checkout_skia():
+            if not os.path.exists(skia_path):
+                # Worktrees share the object store of the main checkout
+                worktree_options = ["--no-checkout"] if prune_checkout else []
+                await run_command_async(
+                    ["git", "worktree", "add", "--detach", *worktree_options, skia_path, revision],
+                    f"Adding worktree for {checkout_description}",
+                    cwd=main_skia_path,
+                )
+            if prune_checkout:
+                await asyncio.to_thread(prune.apply_sparse_checkout, skia_path, pruned["dirs"])
+            await run_command_async(
+                ["git", "checkout", revision],
+                f"Checking out {checkout_description}",
+                cwd=skia_path,
+            )
+            if not prune_checkout and prune.load_state(skia_path):
+                await asyncio.to_thread(prune.restore_full_checkout, skia_path)
+
+        async def install_dependencies():
+            await run_command_async(
+                [os.path.join(skia_path, "tools", "install_dependencies.sh"), "-y"],
+                "Install Skia Extra Dependencies",
+                cwd=skia_path,
+            )
+
+        async def sync_dependencies():
+            sync_env = None
+            if prune_checkout:
+                pruned_deps_path, pruned["deps"] = prune.write_pruned_deps(
+                    skia_path, pruned["deps"]
+                )
+                sync_env = {"GIT_SYNC_DEPS_PATH": pruned_deps_path, "GIT_SYNC_DEPS_SKIP_EMSDK": "1"}
+                Logger.info(
+                    "Skipping dependencies not needed by the build targets: "
+                    f"{', '.join(pruned['deps']) or 'none'}"
+                )
+
+            await run_command_async(
+                ["python3", "tools/git-sync-deps"],
+                "Syncing Skia Dependencies",
+                cwd=skia_path,
+                env=sync_env,
+            )
+            if prune_checkout:
+                prune.save_state(skia_path, pruned)
+
+        async def fetch_ninja():
+            await run_command_async(
+                ["python3", "bin/fetch-ninja"],
+                "Fetching Ninja binary for Skia",
+                cwd=skia_path,
+            )
+
+        steps = [
+            Step("depot_tools", setup_depot_tools),
+            Step("skia-clone", clone_skia),
+            Step("skia-checkout", checkout_skia, requires=["skia-clone"]),
+            Step("skia-deps", sync_dependencies, requires=["skia-checkout"]),
+            Step("ninja", fetch_ninja, requires=["skia-checkout"]),
+        ]
+        if cls.HOST_PLATFORM == HostPlatform.LINUX:
+            # Shares the dpkg lock with the LLVM installation
+            steps.append(
+                Step(
+                    "skia-system-deps",
+                    install_dependencies,
+                    requires=["skia-checkout"],
+                    resources=["apt"],
+                )
+            )
+        return steps
+
+    @classmethod
+    def checkout_revision(cls, revision):
+        """
+        Checks out a commit of Skia in the selected checkout (adding its worktree if needed) and
+        syncs its dependencies, e.g. to build the candidates of a bisection. Skia is expected to be
+        cloned and fetched already, by `setup-env`.
+
+        Raises:
+            CommandError: If the commit can't be checked out or its dependencies synced.
+        """
+        steps = {step.name: step for step in cls._get_setup_steps(revision)}
+        run_steps(
             [
-                "git",
-                "clone",
-                "https://chromium.googlesource.com/chromium/tools/depot_tools.git",
+                Step("skia-checkout", steps["skia-checkout"].action),
+                steps["skia-deps"],
+                steps["ninja"],
             ],
-            "Cloning depot_tools",
+            SETUP_JOBS,
         )
 
-        gclient_executable = cls._get_executable_path(
-            "depot_tools",
-            executable_name="gclient",
-            windows_extension=".bat",
-        )
-        run_command(
-            [gclient_executable],
-            "Verifying Depot Tools Installation",
-        )
+    @classmethod
+    def upgrade_checkout(cls):
+        """
+        Upgrades the selected checkout in place to the revision of its milestone (its pinned
+        commit, or the head of its branch), e.g. after `SKIA_VERSION` was bumped. Only the branch of
+        the milestone is fetched, and only what changed since the checked out revision is
+        refreshed (see upgrade.py). Out dirs are kept.
 
-        run_command(
-            ["git", "clone", "https://skia.googlesource.com/skia.git"],
-            "Cloning Skia Repository",
-        )
+        Raises:
+            UnsupportedPlatformError: If the host platform is not supported.
+            SkiaBuilderError: If the checkout is not set up, or the revision can't be found.
+            CommandError: If the branch can't be fetched, or a refresh step fails.
 
-        skia_path = os.path.join(os.getcwd(), "skia")
+        Returns:
+            dict: The `old_revision` and `new_revision` of the checkout, and the `deps`,
+                `removed_deps` and `tools` of the upgrade (see `upgrade.plan_upgrade`).
+        """
+        if not cls.HOST_PLATFORM:
+            raise UnsupportedPlatformError("Unsupported platform")
+
+        main_skia_path = os.path.join(os.getcwd(), SKIA_DIR)
+        skia_path = get_skia_path()
+        skia_version = get_skia_version()
+        if not os.path.isdir(skia_path):
+            raise SkiaBuilderError(
+                f"Skia {skia_version} is not set up in this workspace. "
+                f"Run `skia-builder setup-env --skia-version {skia_version}` first."
+            )
 
-        run_command(
-            ["git", "fetch", "-v"],
-            "Fetching Skia Repository",
-            cwd=skia_path,
-        )
-        run_command(
-            ["git", "checkout", f"origin/chrome/{SKIA_VERSION}"],
-            f"Checking out Chrome/{SKIA_VERSION} branch",
-            cwd=skia_path,
+        # Only the pinned milestone has a pinned commit, others track their branch head
+        commit = SKIA_COMMIT if is_default_version() else None
+        branch = f"chrome/{skia_version}"
+        if commit is None or upgrade.resolve_revision(main_skia_path, commit) is None:
+            # Only the branch of the milestone, rather than every branch and tag of Skia
+            run_command(
+                ["git", "fetch", "origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}"],
+                f"Fetching the {branch} branch",
+                cwd=main_skia_path,
+            )
+        old_revision = upgrade.resolve_revision(skia_path, "HEAD")
+        new_revision = upgrade.resolve_revision(skia_path, commit or f"origin/{branch}")
+        if new_revision is None:
+            raise SkiaBuilderError(f"{commit or branch} was not found in the Skia repository")
+
+        if old_revision == new_revision:
+            Logger.info(f"{get_skia_dir()} is already at {new_revision[:12]}, nothing to upgrade.")
+            plan = {"deps": [], "removed_deps": [], "tools": []}
+            return {"old_revision": old_revision, "new_revision": new_revision, **plan}
+
+        plan = upgrade.plan_upgrade(skia_path, old_revision, new_revision)
+        Logger.info(
+            f"Upgrading {get_skia_dir()} from {old_revision[:12]} to {branch} at "
+            f"{new_revision[:12]}: {len(plan['deps'])} changed dependencies"
+            + (f", new {', '.join(plan['tools'])} pins" if plan["tools"] else "")
         )
+        if plan["removed_deps"]:
+            Logger.info(
+                f"Dependencies removed from DEPS, left on disk: {', '.join(plan['removed_deps'])}"
+            )
 
-        if cls.HOST_PLATFORM == HostPlatform.LINUX:
-            run_command(
-                [os.path.join(os.getcwd(), "skia", "tools", "install_dependencies.sh"), "-y"],
-                "Install Skia Extra Dependencies",
+        prune_checkout = not FULL_CHECKOUT
+        pruned = prune.plan(cls._get_workspace_build_args())
+        setup_steps = {step.name: step for step in cls._get_setup_steps(new_revision)}
+
+        async def sync_changed_dependencies():
+            _, deps = await asyncio.to_thread(prune.load_deps, os.path.join(skia_path, "DEPS"))
+            skipped_deps = pruned["deps"] if prune_checkout else []
+            synced = [dep for dep in plan["deps"] if dep not in skipped_deps]
+            if prune_checkout:
+                prune.save_state(
+                    skia_path,
+                    {"deps": [dep for dep in skipped_deps if dep in deps], "dirs": pruned["dirs"]},
+                )
+            if not synced:
+                Logger.info("No dependency of the build targets changed, skipping.")
+                return
+            # git-sync-deps syncs the entries of a DEPS file, one with only the changed ones
+            deps_path, _ = prune.write_pruned_deps(
+                skia_path, [dep for dep in deps if dep not in synced]
+            )
+            await run_command_async(
+                ["python3", "tools/git-sync-deps"],
+                f"Syncing {len(synced)} changed Skia Dependencies",
                 cwd=skia_path,
+                env={"GIT_SYNC_DEPS_PATH": deps_path, "GIT_SYNC_DEPS_SKIP_EMSDK": "1"},
             )
 
-        run_command(
-            ["python3", "tools/git-sync-deps"],
-            "Syncing Skia Dependencies",
-            cwd=skia_path,
-        )
+        async def fetch_gn():
+            await run_command_async(
+                ["python3", "bin/fetch-gn"],
+                "Fetching GN binary for Skia",
+                cwd=skia_path,
+            )
 
-        run_command(
-            ["python3", "bin/fetch-ninja"],
-            "Fetching Ninja binary for Skia",
-            cwd=skia_path,
+        steps = [
+            Step("skia-checkout", setup_steps["skia-checkout"].action),
+            Step("skia-deps", sync_changed_dependencies, requires=["skia-checkout"]),
+        ]
+        gn_executable = cls._get_executable_path(
+            get_skia_dir(), "bin", executable_name="gn", windows_extension=".exe"
         )
+        if "gn" in plan["tools"] or not os.path.exists(gn_executable):
+            steps.append(Step("gn", fetch_gn, requires=["skia-checkout"]))
+        for name in ("ninja", "skia-system-deps"):
+            if name in plan["tools"] and name in setup_steps:
+                steps.append(setup_steps[name])
+        run_steps(steps, SETUP_JOBS)
+        return {"old_revision": old_revision, "new_revision": new_revision, **plan}
 
     @classmethod
-    def _build(
+    async def _build_async(
         cls,
         target_cpu,
         custom_build_args=None,
         override_build_args=None,
         archive_output=False,
+        overwrite_output=False,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+        incremental=False,
+        pgo=None,
     ):
         """
-        Build Skia for a specified platform and CPU target.
+        Build Skia for a specified platform and CPU target, running gn/ninja asynchronously.
 
         Args:
             target_cpu (str): The target CPU architecture (e.g., "arm64", "x64").
@@ -218,93 +485,570 @@ class CommonPlatformManager:
             override_build_args (str): Optional build flags that override the default or custom
                 build flags.
             archive_output (bool): Whether to archive the build output.
+            overwrite_output (bool): Whether an existing output directory is replaced.
+            profile (str): Optional build profile (see `build_profiles` in config.py) layered onto
+                the default build flags.
+            x86_64_level (str): Optional x86-64 microarchitecture level (`v2`, `v3` or `v4`) the
+                default build flags of an x64 target are tuned for.
+            debug_symbols (str): Optional debug info mode (`none` or `split`). With `split`, the
+                archived libraries are stripped and their debug info is archived separately.
+            incremental (bool): Whether an existing output directory is refreshed in place, only
+                copying the files that changed, and only archived again if something did.
+            pgo (str): Optional PGO mode (see `resolve_build_args`), built in its own out dir.
+
+        Raises:
+            UnsupportedPlatformError: If the target platform is not supported.
+            SkiaBuilderError: If the selected Skia version is not set up in the workspace.
+            UnsupportedBuildProfileError: If the profile is not supported for the target.
+            UnsupportedArchitectureError: If the x86-64 level is not supported for the target.
+            DebugSymbolsError: If split debug symbols are not supported for the target, or the
+                libraries can't be stripped.
+            PGOError: If PGO is not supported for the target.
+            SysrootError: If the sysroot of a cross-compiled target can't be provisioned.
+            OutputExistsError: If the output directory exists and `overwrite_output` is False.
+            CommandError: If one of the build steps fails.
+            ArchitectureMismatchError: If the libraries weren't built for the target CPU.
+
+        Returns:
+            BuildResult: Paths of the produced artifacts, timings and cache status.
         """
         if not cls.TARGET_PLATFORM:
-            Logger.error("Unsupported target platform")
-            sys.exit(1)
+            raise UnsupportedPlatformError("Unsupported target platform")
+
+        started = time.monotonic()
+        timings = {}
+        cache = {}
 
         flags_mode = "custom" if custom_build_args else "default"
         Logger.info(f"Building with {flags_mode} flags.")
         if override_build_args:
             Logger.info(f"Overriding {flags_mode} build flags with: {override_build_args}.")
 
+        profile = profile or DEFAULT_BUILD_PROFILE
+        if custom_build_args and profile != DEFAULT_BUILD_PROFILE:
+            Logger.warning(f"The {profile} profile is not applied to custom build flags.")
+        else:
+            Logger.info(f"Using the {profile} build profile.")
+        if x86_64_level:
+            Logger.info(f"Targeting the x86-64-{x86_64_level} microarchitecture level.")
+        if pgo == PGO_INSTRUMENT:
+            Logger.info("Instrumenting the build for PGO training.")
+        elif pgo:
+            Logger.info(f"Optimizing with the PGO profile {pgo}.")
+        split_debug_symbols = debug_symbols == "split"
+        if split_debug_symbols:
+            if custom_build_args:
+                Logger.warning("Custom build flags are expected to enable debug info themselves.")
+            if not archive_output:
+                Logger.warning(
+                    "Debug info is only split out when archiving, the libraries of the out dir "
+                    "keep it."
+                )
+
         Logger.info(
             "Archiving build output." if archive_output else "Build output will not be archived."
         )
 
         platform = cls.TARGET_PLATFORM.lowercase
-        skia_path = os.path.join(os.getcwd(), "skia")
-        build_target = f"{platform}-{target_cpu}"
-        output_dir = os.path.join("output", build_target)
+        skia_path = get_skia_path()
+        build_target = cls.get_build_target(target_cpu)
+        build_name = cls.get_build_name(target_cpu, profile, x86_64_level, pgo)
+        out_dir = os.path.join(skia_path, "out", build_name)
+        output_dir = get_output_dir(build_name)
+
+        if not os.path.isdir(skia_path):
+            raise SkiaBuilderError(
+                f"Skia {get_skia_version()} is not set up in this workspace. "
+                f"Run `skia-builder setup-env --skia-version {get_skia_version()}` first."
+            )
 
         if os.path.exists(output_dir):
-            Logger.warning(f"The directory '{output_dir}' already exists.")
-            response = input("Do you want to overwrite it? [y/N]: ").strip().lower()
-            if response == "y":
+            if incremental:
+                Logger.info(f"Refreshing '{output_dir}' in place.")
+            elif not overwrite_output:
+                raise OutputExistsError(output_dir)
+            else:
                 shutil.rmtree(output_dir)
                 Logger.info(f"Directory '{output_dir}' has been removed. Continuing execution...")
-            else:
-                Logger.warning("Exiting without changes.")
-                exit(1)
 
+        # Recorded first, so that collections (e.g. of concurrent builds) leave this one alone
+        await asyncio.to_thread(cleanup.record_use, out_dir, output_dir)
+        if (gc_budget := cleanup.get_default_budget()) is not None:
+            phase_started = time.monotonic()
+            await asyncio.to_thread(
+                cleanup.collect_garbage, gc_budget, protected=[out_dir, output_dir]
+            )
+            timings["gc"] = time.monotonic() - phase_started
+
+        source_changes = 0
         if archive_output:
-            store_skia_license(skia_path, output_dir=output_dir)
-            store_includes(skia_path, output_dir=output_dir)
+            phase_started = time.monotonic()
+            await asyncio.to_thread(store_skia_license, skia_path, output_dir=output_dir)
+            source_changes = await asyncio.to_thread(
+                store_includes, skia_path, output_dir=output_dir, incremental=incremental
+            )
+            timings["store_includes"] = time.monotonic() - phase_started
 
-        build_args = custom_build_args or get_build_args(build_target)
-        if override_build_args:
-            build_args = parse_override_build_args(build_args, override_build_args)
+        build_args = cls.resolve_build_args(
+            target_cpu,
+            custom_build_args,
+            override_build_args,
+            profile,
+            x86_64_level,
+            debug_symbols,
+            pgo,
+        )
+        # Looked up before building, so that a missing objcopy doesn't waste a build
+        objcopy = cls.get_objcopy() if split_debug_symbols and archive_output else None
+        if THINLTO_CACHE_DIR in build_args:
+            os.makedirs(THINLTO_CACHE_DIR, exist_ok=True)
+        if not custom_build_args:
+            await asyncio.to_thread(cls.provision_sysroot, target_cpu)
+
+        if missing := prune.get_missing(skia_path, build_args):
+            Logger.warning(f"The build arguments need {', '.join(missing)}, skipped during setup.")
+            await asyncio.to_thread(prune.restore_full_checkout, skia_path)
+
+        phase_started = time.monotonic()
+        cache["gn_gen"] = await cls._generate_build_files(skia_path, build_name, build_args)
+        timings["gn_gen"] = time.monotonic() - phase_started
+
+        phase_started = time.monotonic()
+        cache["ninja"], ninja_edges, peak_rss_kib = await cls._run_ninja(skia_path, build_name)
+        timings["ninja"] = time.monotonic() - phase_started
+
+        result = BuildResult(
+            target=build_target,
+            skia_version=get_skia_version(),
+            profile=profile,
+            x86_64_level=x86_64_level,
+            build_args=build_args,
+            out_dir=out_dir,
+            output_dir=os.path.abspath(output_dir),
+            libraries=get_files_with_extensions(out_dir, bin_extensions_by_platform[platform]),
+            ninja_edges=ninja_edges,
+            peak_rss_kib=peak_rss_kib,
+        )
+        cls.verify_libraries(target_cpu, result.libraries)
+
+        if archive_output:
+            result.archive = os.path.join(result.output_dir, f"{build_name}.tar.gz")
+            result.manifest = os.path.join(result.output_dir, f"{build_name}.manifest.json")
+            debug_archive = os.path.join(
+                result.output_dir, f"{build_name}{debuginfo.DEBUG_ARCHIVE_SUFFIX}"
+            )
+            debug_libraries = result.libraries
+            output_bin_dir = os.path.join(result.output_dir, "bin")
+            result.libraries = [
+                os.path.join(output_bin_dir, os.path.basename(path)) for path in result.libraries
+            ]
+
+        # A refreshed output is only archived again when its sources or libraries changed
+        if (
+            archive_output
+            and incremental
+            and not source_changes
+            and cache["gn_gen"] == cache["ninja"] == "hit"
+            and os.path.exists(result.manifest)
+            and (not objcopy or os.path.exists(debug_archive))
+        ):
+            Logger.info(f"Archive of {build_name} is up to date, skipping archiving.")
+            cache["archive"] = "hit"
+            if objcopy:
+                result.debug_archive = debug_archive
+        elif archive_output:
+            phase_started = time.monotonic()
+            metadata = {
+                "target": build_target,
+                "skia_version": get_skia_version(),
+                "profile": profile,
+                "x86_64_level": x86_64_level,
+                "debug_symbols": debug_symbols or DEFAULT_DEBUG_SYMBOLS,
+                "build_args": build_args,
+            }
+            prepare_libraries = None
+            if objcopy:
+                prepare_libraries = functools.partial(debuginfo.strip_libraries, objcopy=objcopy)
+            await asyncio.to_thread(
+                archive_build_output,
+                out_dir,
+                platform,
+                output_dir=output_dir,
+                metadata=metadata,
+                prepare_libraries=prepare_libraries,
+                incremental=incremental,
+            )
+            timings["archive"] = time.monotonic() - phase_started
+            cache["archive"] = "miss"
+
+            if objcopy:
+                phase_started = time.monotonic()
+                result.debug_archive = await asyncio.to_thread(
+                    debuginfo.package_debug_symbols,
+                    debug_libraries,
+                    result.libraries,
+                    result.output_dir,
+                    build_name,
+                    metadata,
+                )
+                timings["debug_archive"] = time.monotonic() - phase_started
+
+        used_paths = [out_dir, output_dir]
+        if THINLTO_CACHE_DIR in build_args:
+            used_paths.append(THINLTO_CACHE_DIR)
+        await asyncio.to_thread(cleanup.record_use, *used_paths)
+
+        result.timings = timings
+        result.cache = cache
+        result.duration = time.monotonic() - started
+        await asyncio.to_thread(history.record_build_result, result, build_name)
+        return result
+
+    @classmethod
+    def plan_build(
+        cls,
+        target_cpu,
+        custom_build_args=None,
+        override_build_args=None,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+        pgo=None,
+    ):
+        """
+        Predicts what a build would do from the history of the workspace (see history.py),
+        without doing any work. Takes the same arguments as `build_async`.
+
+        Raises:
+            UnsupportedPlatformError: If the target platform is not supported.
+            UnsupportedBuildProfileError: If the profile is not supported for the target.
+            UnsupportedArchitectureError: If the x86-64 level is not supported for the target.
+
+        Returns:
+            dict: The `build_name`, `skia_version` and resolved `build_args` of the build, whether
+                its out dir exists (`out_dir_exists`) and was generated with these arguments
+                (`gn_up_to_date`), and the `prediction` of `history.predict` (None without
+                history).
+        """
+        if not cls.TARGET_PLATFORM:
+            raise UnsupportedPlatformError("Unsupported target platform")
+
+        profile = profile or DEFAULT_BUILD_PROFILE
+        build_name = cls.get_build_name(target_cpu, profile, x86_64_level, pgo)
+        build_args = cls.resolve_build_args(
+            target_cpu,
+            custom_build_args,
+            override_build_args,
+            profile,
+            x86_64_level,
+            debug_symbols,
+            pgo,
+        )
+        out_dir = os.path.join(get_skia_path(), "out", build_name)
+        out_dir_exists = os.path.isdir(out_dir)
+        gn_up_to_date = cls._build_files_up_to_date(out_dir, build_args)
+        return {
+            "build_name": build_name,
+            "skia_version": get_skia_version(),
+            "build_args": build_args,
+            "out_dir_exists": out_dir_exists,
+            "gn_up_to_date": gn_up_to_date,
+            "prediction": history.predict(
+                build_name, get_skia_version(), build_args, out_dir_exists, gn_up_to_date
+            ),
+        }
+
+    @classmethod
+    def _build_files_up_to_date(cls, out_dir, build_args):
+        """Returns whether `out_dir` was generated with `build_args` already."""
+        args_stamp_path = os.path.join(out_dir, BUILD_ARGS_STAMP)
+        return cls._read_args_stamp(args_stamp_path) == build_args and os.path.exists(
+            os.path.join(out_dir, "build.ninja")
+        )
+
+    @classmethod
+    async def _generate_build_files(cls, skia_path, build_name, build_args):
+        """
+        Runs `gn gen` for `out/<build_name>`, unless it was generated with `build_args` already.
 
+        Returns:
+            str: `hit` if the build files were up to date, else `miss`.
+        """
+        out_dir = os.path.join(skia_path, "out", build_name)
         gn_executable = cls._get_executable_path(
-            "skia",
+            get_skia_dir(),
             "bin",
             executable_name="gn",
             windows_extension=".exe",
         )
-        ninja_executable = cls._get_executable_path(
-            "depot_tools",
-            executable_name="ninja",
-            windows_extension=".bat",
-        )
 
-        run_command(
-            [
-                gn_executable,
-                "gen",
-                f"out/{build_target}",
-                f"--args={build_args}",
-            ],
-            "Generating Build Files",
-            cwd=skia_path,
-        )
-
-        run_command(
+        # Ninja regenerates the build files by itself when GN files change, so `gn gen` is only
+        # needed when the arguments differ from the ones the out dir was generated with
+        if cls._build_files_up_to_date(out_dir, build_args):
+            Logger.info(f"Build files for {build_name} are up to date, skipping generation.")
+            return "hit"
+
+        gn_gen_command = [
+            gn_executable,
+            "gen",
+            f"out/{build_name}",
+            f"--args={build_args}",
+        ]
+        try:
+            await run_command_async(gn_gen_command, "Generating Build Files", cwd=skia_path)
+        except CommandError:
+            # GN may reference something the pruned checkout doesn't have
+            if prune.load_state(skia_path) is None:
+                raise
+            Logger.warning("Generating build files failed on a pruned checkout, retrying.")
+            await asyncio.to_thread(prune.restore_full_checkout, skia_path)
+            await run_command_async(gn_gen_command, "Generating Build Files", cwd=skia_path)
+        with open(os.path.join(out_dir, BUILD_ARGS_STAMP), "w", encoding="utf-8") as f:
+            f.write(build_args)
+
+        await run_command_async(
             [
                 gn_executable,
                 "args",
                 "--list",
-                f"out/{build_target}",
+                f"out/{build_name}",
             ],
-            f"Listing current build arguments for {build_target}",
+            f"Listing current build arguments for {build_name}",
             cwd=skia_path,
         )
+        return "miss"
 
-        run_command(
-            [
-                ninja_executable,
-                "-C",
-                f"out/{build_target}",
-            ],
-            f"Building Skia for {build_target}",
-            cwd=skia_path,
+    @classmethod
+    async def _run_ninja(cls, skia_path, build_name, targets=()):
+        """
+        Runs ninja in `out/<build_name>`, building `targets` (everything by default).
+
+        Returns:
+            tuple[str, int, int]: `hit` if ninja had no work to do, else `miss`, the number of edges
+                it ran, and the peak RSS in KiB of the largest process it ran (ninja itself or e.g.
+                a compiler or linker), None where it isn't available.
+        """
+        ninja_executable = cls._get_executable_path(
+            "depot_tools",
+            executable_name="ninja",
+            windows_extension=".bat",
         )
+        ninja_output = []
+        ninja_usage = {}
+        ninja_log_path = os.path.join(skia_path, "out", build_name, ".ninja_log")
+        ninja_log_position_before = ninja_log_position(ninja_log_path)
+        with span(f"ninja {build_name}") as ninja_span:
+            await run_command_async(
+                [
+                    ninja_executable,
+                    "-C",
+                    f"out/{build_name}",
+                    *targets,
+                ],
+                f"Building {', '.join(targets) or 'Skia'} for {build_name}",
+                cwd=skia_path,
+                on_line=ninja_output.append,
+                env={"NINJA_STATUS": NINJA_STATUS},
+                on_usage=ninja_usage.update,
+            )
+        edge_count = count_ninja_edges(ninja_output)
+        # Per-edge timings from the ninja log, shown under the ninja step in the trace
+        merge_ninja_log(ninja_log_path, ninja_log_position_before, edge_count, ninja_span)
+        cache = "hit" if "ninja: no work to do." in ninja_output else "miss"
+        return cache, edge_count, ninja_usage.get("maxrss_kib")
 
-        if archive_output:
-            archive_build_output(
-                os.path.join(skia_path, "out", f"{build_target}"),
-                platform,
-                output_dir=output_dir,
+    @classmethod
+    async def build_nanobench_async(
+        cls, target_cpu, override_build_args=None, profile=None, x86_64_level=None, pgo=None
+    ):
+        """
+        Builds Skia's nanobench with the default build flags of the library plus the tools
+        (`NANOBENCH_BUILD_ARGS`), in its own `out/<build name>-nanobench` out dir. With `pgo`
+        (see `resolve_build_args`), nanobench is built instrumented, e.g. to train a PGO profile.
+
+        Raises:
+            UnsupportedPlatformError: If the target platform is not supported.
+            SkiaBuilderError: If the selected Skia version is not set up in the workspace.
+            UnsupportedBuildProfileError: If the profile is not supported for the target.
+            UnsupportedArchitectureError: If the x86-64 level is not supported for the target.
+            PGOError: If PGO is not supported for the target.
+            SysrootError: If the sysroot of a cross-compiled target can't be provisioned.
+            CommandError: If one of the build steps fails.
+
+        Returns:
+            str: The path of the nanobench executable.
+        """
+        if not cls.TARGET_PLATFORM:
+            raise UnsupportedPlatformError("Unsupported target platform")
+
+        skia_path = get_skia_path()
+        if not os.path.isdir(skia_path):
+            raise SkiaBuilderError(
+                f"Skia {get_skia_version()} is not set up in this workspace. "
+                f"Run `skia-builder setup-env --skia-version {get_skia_version()}` first."
+            )
+
+        build_name = f"{cls.get_build_name(target_cpu, profile, x86_64_level, pgo)}-nanobench"
+        build_args = parse_override_build_args(
+            cls.resolve_build_args(
+                target_cpu,
+                override_build_args=override_build_args,
+                profile=profile,
+                x86_64_level=x86_64_level,
+                pgo=pgo,
+            ),
+            NANOBENCH_BUILD_ARGS,
+        )
+        if THINLTO_CACHE_DIR in build_args:
+            os.makedirs(THINLTO_CACHE_DIR, exist_ok=True)
+        await asyncio.to_thread(cls.provision_sysroot, target_cpu)
+        # The tools need directories and dependencies that setup skips for the libraries
+        if missing := prune.get_missing(skia_path, build_args):
+            Logger.warning(f"nanobench needs {', '.join(missing)}, skipped during setup.")
+            await asyncio.to_thread(prune.restore_full_checkout, skia_path)
+
+        out_dir = os.path.join(skia_path, "out", build_name)
+        await asyncio.to_thread(cleanup.record_use, out_dir)
+        if (gc_budget := cleanup.get_default_budget()) is not None:
+            await asyncio.to_thread(cleanup.collect_garbage, gc_budget, protected=[out_dir])
+
+        await cls._generate_build_files(skia_path, build_name, build_args)
+        await cls._run_ninja(skia_path, build_name, ["nanobench"])
+        await asyncio.to_thread(cleanup.record_use, out_dir)
+        return cls._get_executable_path(
+            get_skia_dir(),
+            "out",
+            build_name,
+            executable_name="nanobench",
+            windows_extension=".exe",
+        )
+
+    @classmethod
+    def _build(
+        cls,
+        target_cpu,
+        custom_build_args=None,
+        override_build_args=None,
+        archive_output=False,
+        overwrite_output=False,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+    ):
+        """Synchronous wrapper of `_build_async`."""
+        return asyncio.run(
+            cls._build_async(
+                target_cpu,
+                custom_build_args,
+                override_build_args,
+                archive_output,
+                overwrite_output,
+                profile,
+                x86_64_level,
+                debug_symbols,
             )
+        )
+
+    @classmethod
+    def _get_workspace_build_args(cls):
+        """Returns the default build arguments of every target that can be built on this host."""
+        target_platforms = [
+            cls.HOST_PLATFORM,
+            *(sub for sub in SubPlatform if sub.host_platform == cls.HOST_PLATFORM),
+        ]
+        return [
+            get_build_args(f"{target_platform.lowercase}-{target_cpu}")
+            for target_platform in target_platforms
+            for target_cpu in target_platform.supported_architectures
+        ]
+
+    @staticmethod
+    def _read_args_stamp(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    @classmethod
+    def resolve_build_args(
+        cls,
+        target_cpu,
+        custom_build_args=None,
+        override_build_args=None,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+        pgo=None,
+    ):
+        """
+        Returns the GN arguments string a build of `target_cpu` would be generated with.
+
+        `pgo` is `instrument` (`PGO_INSTRUMENT`) for a variant instrumented for PGO training, or
+        the path of a merged profile to optimize with (see pgo.py).
+        """
+        build_args = custom_build_args or get_build_args(
+            cls.get_build_target(target_cpu),
+            profile,
+            x86_64_level,
+            cls.get_sysroot(target_cpu),
+            debug_symbols,
+            pgo,
+        )
+        if override_build_args:
+            build_args = parse_override_build_args(build_args, override_build_args)
+        return build_args
+
+    @classmethod
+    def get_sysroot(cls, target_cpu):
+        """Returns the sysroot a target is cross-compiled against, or None if not needed."""
+        return None
+
+    @classmethod
+    def provision_sysroot(cls, target_cpu):
+        """Makes the sysroot of a target available, if it needs one."""
+
+    @classmethod
+    def verify_libraries(cls, target_cpu, libraries):
+        """
+        Checks that built libraries match their target.
+
+        Raises:
+            ArchitectureMismatchError: If a library was built for another architecture.
+        """
+
+    @classmethod
+    def get_objcopy(cls):
+        """
+        Returns the objcopy stripping the libraries built with split debug symbols.
+
+        Raises:
+            DebugSymbolsError: If no objcopy is found.
+        """
+        return debuginfo.find_objcopy()
+
+    @classmethod
+    def get_build_target(cls, target_cpu):
+        """Returns the name of a build target, e.g. `linux-x64`."""
+        return f"{cls.TARGET_PLATFORM.lowercase}-{target_cpu}"
+
+    @classmethod
+    def get_build_name(cls, target_cpu, profile=None, x86_64_level=None, pgo=None):
+        """
+        Returns the name used for the out dir, output and archive of a build: the build target,
+        suffixed with the x86-64 level, the profile unless it is the default one and the PGO mode
+        (e.g. `linux-x64-v3-speed`, or `linux-x64-speed-pgo` when optimized with a profile).
+        """
+        parts = [cls.get_build_target(target_cpu)]
+        if x86_64_level:
+            parts.append(x86_64_level)
+        if profile and profile != DEFAULT_BUILD_PROFILE:
+            parts.append(profile)
+        if pgo == PGO_INSTRUMENT:
+            parts.append("pgo-instrumented")
+        elif pgo:
+            parts.append("pgo")
+        return "-".join(parts)
 
     @classmethod
     def _get_executable_path(cls, *path_parts, executable_name, windows_extension=None):
@@ -328,9 +1072,17 @@ class CommonPlatformManager:
         return os.path.join(os.getcwd(), *path_parts, executable_name)
 
     @classmethod
-    def setup_env(cls, skip_llvm_instalation=False):
-        """Sets up the environment. When overriding, call _setup_env() at the end."""
-        cls._setup_env()
+    def setup_env(cls, skip_llvm_instalation=False, extra_steps=()):
+        """
+        Sets up the environment. When overriding, call _setup_env() at the end, with the host
+        specific setup steps.
+
+        Args:
+            skip_llvm_instalation (bool): Whether the installation of LLVM is skipped.
+            extra_steps (Iterable[Step]): Steps of a sub-platform (e.g. installing the Android
+                NDK) run alongside the host setup.
+        """
+        cls._setup_env(extra_steps)
 
     @classmethod
     def build(
@@ -339,27 +1091,62 @@ class CommonPlatformManager:
         custom_build_args=None,
         override_build_args=None,
         archive_output=False,
+        overwrite_output=False,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
     ):
         """Builds Skia. When overriding, call _build() at the end."""
-        cls._build(
+        return cls._build(
+            target_cpu,
+            custom_build_args,
+            override_build_args,
+            archive_output,
+            overwrite_output,
+            profile,
+            x86_64_level,
+            debug_symbols,
+        )
+
+    @classmethod
+    async def build_async(
+        cls,
+        target_cpu,
+        custom_build_args=None,
+        override_build_args=None,
+        archive_output=False,
+        overwrite_output=False,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+        incremental=False,
+        pgo=None,
+    ):
+        """Builds Skia asynchronously. When overriding, await _build_async() at the end."""
+        return await cls._build_async(
             target_cpu,
             custom_build_args,
             override_build_args,
             archive_output,
+            overwrite_output,
+            profile,
+            x86_64_level,
+            debug_symbols,
+            incremental,
+            pgo,
         )
 
     @classmethod
     def list_build_arguments(cls):
         """List available build arguments by creating a temporary build configuration."""
         if not cls.TARGET_PLATFORM:
-            Logger.error("Unsupported target platform")
-            sys.exit(1)
+            raise UnsupportedPlatformError("Unsupported target platform")
 
-        skia_path = os.path.join(os.getcwd(), "skia")
+        skia_path = get_skia_path()
         dummy_dir = os.path.join(skia_path, "out", "dummy")
 
         gn_executable = cls._get_executable_path(
-            "skia",
+            get_skia_dir(),
             "bin",
             executable_name="gn",
             windows_extension=".exe",
@@ -397,8 +1184,7 @@ class CommonSubPlatformManager(CommonPlatformManager):
     @classmethod
     def _validate_host_platform(cls):
         if not cls.HOST_PLATFORM:
-            Logger.error("Unsupported host platform")
-            sys.exit(1)
+            raise UnsupportedPlatformError("Unsupported host platform")
 
     @classmethod
     def _get_host_setup_env(cls):
@@ -412,11 +1198,10 @@ class CommonSubPlatformManager(CommonPlatformManager):
                 name for name, config in supported_host_platforms.items() if config
             ]
 
-            Logger.error(
+            raise UnsupportedPlatformError(
                 f"Unsupported host platform: {current_platform}. "
                 f"Available host platforms: {', '.join(available_platforms) or 'none'}"
             )
-            sys.exit(1)
 
         return setup_env_host
 
@@ -433,11 +1218,47 @@ class CommonSubPlatformManager(CommonPlatformManager):
         custom_build_args=None,
         override_build_args=None,
         archive_output=False,
+        overwrite_output=False,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+    ):
+        cls._validate_host_platform()
+        return cls._build(
+            target_cpu,
+            custom_build_args,
+            override_build_args,
+            archive_output,
+            overwrite_output,
+            profile,
+            x86_64_level,
+            debug_symbols,
+        )
+
+    @classmethod
+    async def build_async(
+        cls,
+        target_cpu,
+        custom_build_args=None,
+        override_build_args=None,
+        archive_output=False,
+        overwrite_output=False,
+        profile=None,
+        x86_64_level=None,
+        debug_symbols=None,
+        incremental=False,
+        pgo=None,
     ):
         cls._validate_host_platform()
-        cls._build(
+        return await cls._build_async(
             target_cpu,
             custom_build_args,
             override_build_args,
             archive_output,
+            overwrite_output,
+            profile,
+            x86_64_level,
+            debug_symbols,
+            incremental,
+            pgo,
         )
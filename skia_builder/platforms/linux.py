@@ -1,5 +1,10 @@
+import asyncio
+
+from skia_builder import sysroot
+from skia_builder.dag import Step
+from skia_builder.download import download
 from skia_builder.platforms.common import CommonPlatformManager, HostPlatform
-from skia_builder.utils import Logger, run_command
+from skia_builder.utils import Logger, run_command_async
 
 
 class LinuxPlatformManager(CommonPlatformManager):
@@ -7,37 +12,61 @@ class LinuxPlatformManager(CommonPlatformManager):
     SUPPORTED_ARCHITECTURES = TARGET_PLATFORM.supported_architectures
 
     @classmethod
-    def setup_env(cls, skip_llvm_instalation=False):
+    def get_sysroot(cls, target_cpu):
+        # Targets of another CPU architecture than the host are cross-compiled
+        if not sysroot.needs_sysroot(target_cpu):
+            return None
+        return sysroot.get_sysroot_path(target_cpu)
+
+    @classmethod
+    def provision_sysroot(cls, target_cpu):
+        if sysroot.needs_sysroot(target_cpu):
+            sysroot.provision_sysroot(target_cpu)
+
+    @classmethod
+    def verify_libraries(cls, target_cpu, libraries):
+        sysroot.verify_architecture(libraries, target_cpu)
+
+    @classmethod
+    def setup_env(cls, skip_llvm_instalation=False, extra_steps=()):
+        extra_steps = list(extra_steps)
         if skip_llvm_instalation:
             Logger.info("Skipping LLVM installation")
         else:
-            run_command(
-                ["sudo", "apt-get", "update"],
-                "Updating package lists",
-            )
-            run_command(
-                ["wget", "https://apt.llvm.org/llvm.sh", "-O", "/tmp/llvm.sh"],
-                "Downloading LLVM installation script",
-            )
-            run_command(
-                ["sudo", "chmod", "+x", "/tmp/llvm.sh"],
-                "Making LLVM installation script executable",
-            )
-            run_command(
-                ["sudo", "bash", "/tmp/llvm.sh"],
-                "Running LLVM installation script",
-            )
-            run_command(
-                ["echo", "export PATH=/usr/lib/llvm-18/bin:$PATH", ">>", "~/.bashrc"],
-                "Adding LLVM to PATH",
-            )
-            run_command(
-                ["bash", "-i", "-c", "source ~/.bashrc"],
-                "Reloading .bashrc to apply PATH changes",
-            )
-            run_command(
-                ["clang", "--version"],
-                "Verifying clang installation",
-            )
-
-        cls._setup_env()
+            # Shares the dpkg lock with the installation of Skia's system dependencies
+            extra_steps.append(Step("llvm", cls._install_llvm, resources=["apt"]))
+
+        cls._setup_env(extra_steps)
+
+    @staticmethod
+    async def _install_llvm():
+        await run_command_async(
+            ["sudo", "apt-get", "update"],
+            "Updating package lists",
+        )
+        await asyncio.to_thread(
+            download,
+            "https://apt.llvm.org/llvm.sh",
+            "/tmp/llvm.sh",
+            "Downloading LLVM installation script",
+        )
+        await run_command_async(
+            ["sudo", "chmod", "+x", "/tmp/llvm.sh"],
+            "Making LLVM installation script executable",
+        )
+        await run_command_async(
+            ["sudo", "bash", "/tmp/llvm.sh"],
+            "Running LLVM installation script",
+        )
+        await run_command_async(
+            ["echo", "export PATH=/usr/lib/llvm-18/bin:$PATH", ">>", "~/.bashrc"],
+            "Adding LLVM to PATH",
+        )
+        await run_command_async(
+            ["bash", "-i", "-c", "source ~/.bashrc"],
+            "Reloading .bashrc to apply PATH changes",
+        )
+        await run_command_async(
+            ["clang", "--version"],
+            "Verifying clang installation",
+        )
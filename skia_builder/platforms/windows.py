@@ -1,7 +1,7 @@
-import sys
-
+from skia_builder.dag import Step
+from skia_builder.errors import SkiaBuilderError
 from skia_builder.platforms.common import CommonPlatformManager, HostPlatform
-from skia_builder.utils import Logger, run_command
+from skia_builder.utils import Logger, run_command_async
 
 
 class WindowsPlatformManager(CommonPlatformManager):
@@ -9,24 +9,28 @@ class WindowsPlatformManager(CommonPlatformManager):
     SUPPORTED_ARCHITECTURES = TARGET_PLATFORM.supported_architectures
 
     @classmethod
-    def setup_env(cls, skip_llvm_instalation=False):
+    def setup_env(cls, skip_llvm_instalation=False, extra_steps=()):
+        extra_steps = list(extra_steps)
         if skip_llvm_instalation:
             Logger.info("Skipping LLVM installation")
         else:
-            returncode = run_command(
-                ["choco", "--version"], "Verifying Chocolatey Installation", exit_on_error=False
-            )
-            if returncode == 0:
-                run_command(
-                    ["choco", "install", "llvm", "-y"],
-                    "Installing LLVM",
-                )
-            else:
-                Logger.error(
-                    "Chocolatey is not installed, and the installation of LLVM cannot proceed. "
-                    "Please install Chocolatey or manually install LLVM from "
-                    "'https://github.com/llvm/llvm-project/releases'"
-                )
-                sys.exit(1)
+            extra_steps.append(Step("llvm", cls._install_llvm))
+
+        cls._setup_env(extra_steps)
 
-        cls._setup_env()
+    @staticmethod
+    async def _install_llvm():
+        returncode = await run_command_async(
+            ["choco", "--version"], "Verifying Chocolatey Installation", check=False
+        )
+        if returncode == 0:
+            await run_command_async(
+                ["choco", "install", "llvm", "-y"],
+                "Installing LLVM",
+            )
+        else:
+            raise SkiaBuilderError(
+                "Chocolatey is not installed, and the installation of LLVM cannot proceed. "
+                "Please install Chocolatey or manually install LLVM from "
+                "'https://github.com/llvm/llvm-project/releases'"
+            )
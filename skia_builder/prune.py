@@ -0,0 +1,164 @@
+"""
+Flag-aware pruning of a Skia checkout.
+
+From the build arguments of the targets a workspace builds, setup only syncs the DEPS entries and
+checks out the Skia sources that are actually used (see `DEPS_REQUIRED_BY_ARGS` and
+`SKIA_DIRS_REQUIRED_BY_ARGS` in `config.py`). What was left out is recorded in `PRUNE_STATE`, so
+that builds needing it restore the full checkout first.
+"""
+
+import json
+import os
+import pprint
+import threading
+
+from skia_builder.config import (
+    DEPS_REQUIRED_BY_ARGS,
+    SKIA_DIRS_NOT_REQUIRED,
+    SKIA_DIRS_REQUIRED_BY_ARGS,
+)
+from skia_builder.utils import Logger, run_command
+
+# Written to the Skia checkout, next to the pruned copy of its DEPS file
+PRUNE_STATE = "skia_builder_prune.json"
+PRUNED_DEPS = "skia_builder_DEPS"
+
+_restore_lock = threading.Lock()
+
+
+def parse_build_args(build_args):
+    """Returns the GN arguments of a build arguments string as a dict of raw values."""
+    return dict(arg.split("=", 1) for arg in build_args.replace("'", '"').split() if "=" in arg)
+
+
+def _is_required(required_by, build_args_list):
+    # Arguments a build doesn't set keep their GN default, which may enable them
+    return any(
+        parse_build_args(build_args).get(name, "true") != "false"
+        for build_args in build_args_list
+        for name in required_by
+    )
+
+
+def plan(build_args_list):
+    """
+    Computes what a workspace building with `build_args_list` can leave out.
+
+    Returns:
+        dict: The `deps` (DEPS entries) and `dirs` (Skia directories) not needed by any build.
+    """
+    return {
+        "deps": sorted(
+            dep
+            for dep, required_by in DEPS_REQUIRED_BY_ARGS.items()
+            if not _is_required(required_by, build_args_list)
+        ),
+        "dirs": sorted(
+            [
+                *SKIA_DIRS_NOT_REQUIRED,
+                *(
+                    directory
+                    for directory, required_by in SKIA_DIRS_REQUIRED_BY_ARGS.items()
+                    if not _is_required(required_by, build_args_list)
+                ),
+            ]
+        ),
+    }
+
+
+def sparse_checkout_patterns(excluded_dirs):
+    """Returns sparse-checkout patterns excluding all but the GN files of `excluded_dirs`."""
+    patterns = ["/*"]
+    for directory in excluded_dirs:
+        patterns += [f"!/{directory}/**", f"/{directory}/**/*.gn", f"/{directory}/**/*.gni"]
+    return patterns
+
+
+def parse_deps(content, name="DEPS"):
+    """Evaluates the content of a DEPS file the way `tools/git-sync-deps` does."""
+    namespace = {}
+    namespace["Var"] = lambda name: namespace["vars"][name]
+    exec(compile(content, name, "exec"), namespace)
+    return namespace.get("vars", {}), namespace["deps"]
+
+
+def load_deps(deps_path):
+    """Evaluates a DEPS file the way `tools/git-sync-deps` does."""
+    with open(deps_path, "r", encoding="utf-8") as f:
+        return parse_deps(f.read(), deps_path)
+
+
+def write_pruned_deps(skia_path, pruned_deps):
+    """
+    Writes a copy of Skia's DEPS file without `pruned_deps`, for `GIT_SYNC_DEPS_PATH`.
+
+    Returns:
+        tuple[str, list]: The path of the pruned DEPS file, and the entries actually removed.
+    """
+    deps_vars, deps = load_deps(os.path.join(skia_path, "DEPS"))
+    removed = sorted(dep for dep in deps if dep in pruned_deps)
+    kept = {dep: value for dep, value in deps.items() if dep not in removed}
+
+    pruned_deps_path = os.path.join(skia_path, PRUNED_DEPS)
+    with open(pruned_deps_path, "w", encoding="utf-8") as f:
+        f.write(f"# Generated by skia-builder from DEPS, without: {', '.join(removed)}\n")
+        f.write(f"vars = {pprint.pformat(deps_vars)}\n\n")
+        f.write(f"deps = {pprint.pformat(kept)}\n")
+    return pruned_deps_path, removed
+
+
+def load_state(skia_path):
+    """Returns what was pruned from a checkout, or None if it is complete."""
+    try:
+        with open(os.path.join(skia_path, PRUNE_STATE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(skia_path, state):
+    with open(os.path.join(skia_path, PRUNE_STATE), "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+
+def get_missing(skia_path, build_args):
+    """Returns the pruned DEPS entries and directories that a build with `build_args` needs."""
+    state = load_state(skia_path)
+    if state is None:
+        return []
+    needed = plan([build_args])
+    return sorted(
+        [
+            *(dep for dep in state["deps"] if dep not in needed["deps"]),
+            *(directory for directory in state["dirs"] if directory not in needed["dirs"]),
+        ]
+    )
+
+
+def apply_sparse_checkout(skia_path, excluded_dirs):
+    run_command(
+        ["git", "sparse-checkout", "set", "--no-cone", *sparse_checkout_patterns(excluded_dirs)],
+        f"Configuring sparse checkout without {', '.join(excluded_dirs)}",
+        cwd=skia_path,
+    )
+
+
+def restore_full_checkout(skia_path):
+    """Checks out the full Skia tree and syncs every dependency of a pruned checkout."""
+    # Concurrent builds in the same checkout only restore it once
+    with _restore_lock:
+        if load_state(skia_path) is None:
+            return
+
+        Logger.warning(f"Restoring the full Skia checkout and dependencies in {skia_path}")
+        run_command(
+            ["git", "sparse-checkout", "disable"],
+            "Disabling sparse checkout",
+            cwd=skia_path,
+        )
+        run_command(
+            ["python3", "tools/git-sync-deps"],
+            "Syncing all Skia Dependencies",
+            cwd=skia_path,
+        )
+        os.remove(os.path.join(skia_path, PRUNE_STATE))
@@ -0,0 +1,66 @@
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass
+class BuildResult:
+    """Outcome of a successful build."""
+
+    target: str
+    """Build target name, e.g. `linux-x64`."""
+
+    skia_version: str
+    """Skia milestone the target was built from, e.g. `m141`."""
+
+    profile: str
+    """Build profile the default flags were tuned with, e.g. `size` or `speed`."""
+
+    x86_64_level: str
+    """x86-64 microarchitecture level the build targets (e.g. `v3`), or None for the baseline."""
+
+    build_args: str
+    """GN arguments the out dir was generated with."""
+
+    out_dir: str
+    """Ninja out dir inside the Skia checkout."""
+
+    output_dir: str
+    """Output directory of the build target (set for every build), which only receives the headers,
+    license, libraries and archives when archiving."""
+
+    libraries: list = field(default_factory=list)
+    """Paths of the built libraries (copies in `output_dir` when archiving)."""
+
+    archive: str = None
+    """Path of the `.tar.gz` archive, if the output was archived."""
+
+    manifest: str = None
+    """Path of the manifest written next to the archive, if the output was archived."""
+
+    debug_archive: str = None
+    """Path of the `.debug.tar.gz` archive of the debug info, if built with split debug symbols."""
+
+    timings: dict = field(default_factory=dict)
+    """Wall time in seconds of each phase (e.g. `gn_gen`, `ninja`, `archive`)."""
+
+    cache: dict = field(default_factory=dict)
+    """Cache status of each phase: `hit` when it was skipped or had nothing to do."""
+
+    ninja_edges: int = None
+    """Number of edges ninja ran (0 when the out dir was up to date)."""
+
+    peak_rss_kib: int = None
+    """Peak RSS of the largest process ninja ran (e.g. a compiler or linker) in KiB, if known."""
+
+    duration: float = 0.0
+    """Total wall time in seconds."""
+
+    @property
+    def artifacts(self):
+        """All files produced by the build."""
+        return [
+            *self.libraries,
+            *(path for path in (self.archive, self.manifest, self.debug_archive) if path),
+        ]
+
+    def to_dict(self):
+        return {**asdict(self), "artifacts": self.artifacts}
@@ -0,0 +1,437 @@
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+
+from skia_builder.config import (
+    DEBUG_SYMBOLS_MODES,
+    DEFAULT_BUILD_PROFILE,
+    DEFAULT_DEBUG_SYMBOLS,
+    X86_64_LEVELS,
+    build_profiles,
+    parse_custom_build_args,
+)
+from skia_builder.errors import SkiaBuilderError
+from skia_builder.platforms import PLATFORM_MANAGERS
+from skia_builder.utils import Logger, log_sink
+from skia_builder.workspace import (
+    SKIA_DIR,
+    get_skia_path,
+    get_skia_version,
+    parse_skia_version,
+    use_skia_version,
+)
+
+# Finished jobs kept around (with their logs) for clients polling for results
+MAX_FINISHED_JOBS = 100
+
+
+class BuildRequestError(ValueError):
+    pass
+
+
+class BuildJob:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    def __init__(self, fingerprint, manager, request):
+        self.id = uuid.uuid4().hex[:12]
+        self.fingerprint = fingerprint
+        self.manager = manager
+        self.request = request
+        self.build_target = manager.get_build_target(request["target_cpu"])
+        self.build_name = manager.get_build_name(
+            request["target_cpu"], request["profile"], request["x86_64_level"]
+        )
+        self.skia_version = request["skia_version"] or get_skia_version()
+        self.status = BuildJob.QUEUED
+        self.returncode = None
+        self.result = None
+        self.log = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (BuildJob.SUCCEEDED, BuildJob.FAILED)
+
+    def append_log(self, message):
+        with self._condition:
+            self.log.extend(message.splitlines() or [""])
+            self._condition.notify_all()
+
+    def set_status(self, status, returncode=None):
+        with self._condition:
+            self.status = status
+            if status == BuildJob.RUNNING:
+                self.started_at = time.time()
+            elif self.finished:
+                self.finished_at = time.time()
+                self.returncode = returncode
+            self._condition.notify_all()
+
+    def follow_log(self):
+        """Yields log lines as they are produced, until the job finishes."""
+        position = 0
+        while True:
+            with self._condition:
+                while position == len(self.log) and not self.finished:
+                    self._condition.wait()
+                lines = self.log[position:]
+                position += len(lines)
+                done = self.finished and position == len(self.log)
+            yield from lines
+            if done:
+                return
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "fingerprint": self.fingerprint,
+            "target": self.build_target,
+            "skia_version": self.skia_version,
+            "request": self.request,
+            "status": self.status,
+            "returncode": self.returncode,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+        }
+
+
+class BuildService:
+    """
+    Runs build requests in-process against the workspace of the current directory.
+
+    Identical in-flight requests (same target, resolved arguments and archive option) are
+    deduplicated, at most `max_concurrent_builds` builds run at once, and builds of the same
+    target are serialized since they share an out dir.
+    """
+
+    def __init__(self, host_platform, max_concurrent_builds=1):
+        self.host_platform = host_platform
+        self.jobs = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._target_locks = defaultdict(threading.Lock)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_builds)
+
+    def _parse_request(self, payload):
+        if not isinstance(payload, dict):
+            raise BuildRequestError("Request body must be a JSON object")
+
+        target_platform = payload.get("sub_env") or self.host_platform
+        manager = PLATFORM_MANAGERS.get(target_platform)
+        if manager is None:
+            raise BuildRequestError(f"Unsupported target platform: {target_platform}")
+
+        target_cpu = payload.get("target_cpu")
+        if target_cpu not in manager.SUPPORTED_ARCHITECTURES:
+            raise BuildRequestError(
+                f"Unsupported CPU architecture for {target_platform}: {target_cpu}. "
+                f"Supported architectures are: {', '.join(manager.SUPPORTED_ARCHITECTURES)}"
+            )
+
+        skia_version = payload.get("skia_version")
+        if skia_version:
+            parse_skia_version(skia_version)
+            if not os.path.isdir(get_skia_path(skia_version)):
+                raise BuildRequestError(
+                    f"Skia {skia_version} is not set up in this workspace. "
+                    f"Run `skia-builder setup-env --skia-version {skia_version}` first."
+                )
+
+        profile = payload.get("profile") or DEFAULT_BUILD_PROFILE
+        if profile not in build_profiles:
+            raise BuildRequestError(
+                f"Unknown build profile: {profile}. "
+                f"Available profiles are: {', '.join(build_profiles)}"
+            )
+
+        x86_64_level = payload.get("x86_64_level")
+        if x86_64_level and x86_64_level not in X86_64_LEVELS:
+            raise BuildRequestError(
+                f"Unknown x86-64 level: {x86_64_level}. "
+                f"Available levels are: {', '.join(X86_64_LEVELS)}"
+            )
+
+        debug_symbols = payload.get("debug_symbols") or DEFAULT_DEBUG_SYMBOLS
+        if debug_symbols not in DEBUG_SYMBOLS_MODES:
+            raise BuildRequestError(
+                f"Unknown debug symbols mode: {debug_symbols}. "
+                f"Available modes are: {', '.join(DEBUG_SYMBOLS_MODES)}"
+            )
+
+        custom_build_args, override_build_args = (
+            parse_custom_build_args(payload[key]) if payload.get(key) else None
+            for key in ("custom_build_args", "override_build_args")
+        )
+        try:
+            # e.g. an x86-64 level for another CPU, or a cross-compiled target without a sysroot
+            manager.resolve_build_args(
+                target_cpu,
+                custom_build_args,
+                override_build_args,
+                profile,
+                x86_64_level,
+                debug_symbols,
+            )
+        except SkiaBuilderError as e:
+            raise BuildRequestError(str(e)) from e
+
+        request = {
+            "skia_version": skia_version,
+            "sub_env": payload.get("sub_env"),
+            "target_cpu": target_cpu,
+            "custom_build_args": custom_build_args,
+            "override_build_args": override_build_args,
+            "archive": bool(payload.get("archive", False)),
+            "profile": profile,
+            "x86_64_level": x86_64_level or None,
+            "debug_symbols": debug_symbols,
+        }
+        return manager, request
+
+    @staticmethod
+    def fingerprint(manager, request):
+        resolved = {
+            "skia_version": request["skia_version"] or get_skia_version(),
+            "target": manager.get_build_target(request["target_cpu"]),
+            "profile": request["profile"],
+            "x86_64_level": request["x86_64_level"],
+            "debug_symbols": request["debug_symbols"],
+            "args": manager.resolve_build_args(
+                request["target_cpu"],
+                request["custom_build_args"],
+                request["override_build_args"],
+                request["profile"],
+                request["x86_64_level"],
+                request["debug_symbols"],
+            ),
+            "archive": request["archive"],
+        }
+        return hashlib.sha256(json.dumps(resolved, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def submit(self, payload):
+        """
+        Queues a build request.
+
+        Returns:
+            tuple[BuildJob, bool]: The job, and whether it was an already in-flight duplicate.
+        """
+        manager, request = self._parse_request(payload)
+        fingerprint = self.fingerprint(manager, request)
+
+        with self._lock:
+            if job := self._in_flight.get(fingerprint):
+                return job, True
+
+            job = BuildJob(fingerprint, manager, request)
+            self.jobs[job.id] = job
+            self._in_flight[fingerprint] = job
+            self._prune_finished_jobs()
+
+        Logger.info(f"Queued build {job.id} for {job.build_target} ({fingerprint[:12]})")
+        self._executor.submit(self._run, job)
+        return job, False
+
+    def _prune_finished_jobs(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    def _run(self, job):
+        request = job.request
+        token = log_sink.set(job.append_log)
+        # Anything short of a result fails the job, including a BaseException (e.g. SystemExit)
+        returncode = 1
+        try:
+            with self._target_locks[(job.skia_version, job.build_name)]:
+                job.set_status(BuildJob.RUNNING)
+                with use_skia_version(request["skia_version"]):
+                    result = job.manager.build(
+                        request["target_cpu"],
+                        request["custom_build_args"],
+                        request["override_build_args"],
+                        request["archive"],
+                        overwrite_output=True,
+                        profile=request["profile"],
+                        x86_64_level=request["x86_64_level"],
+                        debug_symbols=request["debug_symbols"],
+                    )
+            job.result = result.to_dict()
+            returncode = 0
+        except SkiaBuilderError as e:
+            Logger.error(str(e))
+            returncode = e.exit_code
+        except Exception as e:
+            Logger.error(f"Build failed: {e}")
+        finally:
+            log_sink.reset(token)
+            with self._lock:
+                self._in_flight.pop(job.fingerprint, None)
+            job.set_status(BuildJob.SUCCEEDED if returncode == 0 else BuildJob.FAILED, returncode)
+
+        Logger.info(f"Build {job.id} for {job.build_target} {job.status}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BuildRequestHandler(BaseHTTPRequestHandler):
+    """
+    Endpoints:
+        POST /builds                Queue a build ({"target_cpu", "sub_env", "skia_version",
+                                    "profile", "x86_64_level", "debug_symbols",
+                                    "custom_build_args", "override_build_args",
+                                    "archive"}).
+        GET  /builds                List known builds.
+        GET  /builds/<id>           Status and result of a build.
+        GET  /builds/<id>/log       Stream the build log until it finishes.
+    """
+
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        Logger.debug(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _get_job(self, job_id):
+        job = self.service.jobs.get(job_id)
+        if job is None:
+            self._send_json(404, {"error": f"Unknown build: {job_id}"})
+        return job
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/builds":
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job, deduplicated = self.service.submit(json.loads(self.rfile.read(length) or b"{}"))
+        except (BuildRequestError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        payload = {**job.to_dict(), "deduplicated": deduplicated}
+        self._send_json(200 if deduplicated else 202, payload)
+
+    def do_GET(self):
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+
+        if parts == ["builds"]:
+            self._send_json(200, [job.to_dict() for job in list(self.service.jobs.values())])
+        elif len(parts) == 2 and parts[0] == "builds":
+            if job := self._get_job(parts[1]):
+                self._send_json(200, job.to_dict())
+        elif len(parts) == 3 and parts[0] == "builds" and parts[2] == "log":
+            if job := self._get_job(parts[1]):
+                self._stream_log(job)
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint: {self.path}"})
+
+    def _stream_log(self, job):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            for line in job.follow_log():
+                write_chunk(f"{line}\n".encode("utf-8"))
+            write_chunk(f"\n=== Build {job.status} (exit code {job.returncode}) ===\n".encode())
+            write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class UnixHTTPServer(ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _validate_workspace(host_platform):
+    manager = PLATFORM_MANAGERS[host_platform]
+    gn_executable = manager._get_executable_path(
+        SKIA_DIR, "bin", executable_name="gn", windows_extension=".exe"
+    )
+    if not os.path.exists(gn_executable):
+        raise SkiaBuilderError(
+            f"No prepared Skia workspace found in {os.getcwd()} ({gn_executable} is missing). "
+            "Run `skia-builder setup-env` first."
+        )
+
+
+def _is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except OSError:
+        return False
+
+
+def serve(host_platform, host="127.0.0.1", port=8765, socket_path=None, max_concurrent_builds=1):
+    """
+    Serves build requests over HTTP, on a TCP port or a Unix socket, until interrupted.
+
+    Raises:
+        SkiaBuilderError: If the workspace isn't set up, or `socket_path` exists and isn't a
+            socket (e.g. a file given by mistake, which isn't replaced).
+    """
+    _validate_workspace(host_platform)
+    if socket_path and os.path.lexists(socket_path) and not _is_socket(socket_path):
+        raise SkiaBuilderError(f"{socket_path} already exists and is not a socket")
+
+    service = BuildService(host_platform, max_concurrent_builds)
+    handler = type("Handler", (BuildRequestHandler,), {"service": service})
+
+    if socket_path:
+        # Left by a server that didn't shut down cleanly
+        if _is_socket(socket_path):
+            os.remove(socket_path)
+        httpd = UnixHTTPServer(socket_path, handler)
+        address = f"unix:{socket_path}"
+    else:
+        httpd = ThreadingHTTPServer((host, port), handler)
+        address = f"http://{host}:{httpd.server_address[1]}"
+
+    Logger.info(
+        f"Serving build requests on {address} "
+        f"(max {max_concurrent_builds} concurrent build(s)). Press Ctrl+C to stop."
+    )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        Logger.info("Shutting down build server")
+    finally:
+        httpd.server_close()
+        service.shutdown()
+        if socket_path and _is_socket(socket_path):
+            os.remove(socket_path)
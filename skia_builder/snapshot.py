@@ -0,0 +1,351 @@
+"""
+Snapshots of a prepared workspace, to set up ephemeral machines without network access.
+
+A snapshot is a single uncompressed tar file holding a `SNAPSHOT.json` index followed by
+gzip-compressed tar shards of depot_tools, the Skia checkouts (git objects included) with their
+synced dependencies, gn and ninja, and the Android NDK. Shards are balanced by size and written
+and extracted in parallel; the index records the SHA-256 of each one, verified before restoring,
+and the key (Skia version, commit and host) a snapshot can be restored for.
+"""
+
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import os
+import platform
+import shutil
+import tarfile
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from skia_builder.config import ANDROID_NDK_DIR
+from skia_builder.errors import ArchiveError, SnapshotError
+from skia_builder.extract import check_member
+from skia_builder.manifest import hash_file
+from skia_builder.trace import traced
+from skia_builder.utils import Logger
+from skia_builder.versions import SKIA_COMMIT, SKIA_VERSION
+from skia_builder.workspace import SKIA_DIR, WORKTREES_DIR
+
+SNAPSHOT_INDEX = "SNAPSHOT.json"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DIRS = ["depot_tools", SKIA_DIR, WORKTREES_DIR, os.path.basename(ANDROID_NDK_DIR)]
+
+# Fast enough to keep up with the disk, most of the checkout being packed git objects anyway
+SNAPSHOT_COMPRESSLEVEL = 3
+COPY_BUFFER_SIZE = 1 << 20
+
+
+def _default_jobs():
+    return min(16, os.cpu_count() or 1)
+
+
+def get_snapshot_key(host_platform):
+    """Returns what a workspace snapshot depends on: the Skia version and the host."""
+    return {
+        "skia_version": SKIA_VERSION,
+        "skia_commit": SKIA_COMMIT,
+        "platform": host_platform,
+        "machine": platform.machine().lower(),
+    }
+
+
+def get_default_snapshot_name(host_platform):
+    key = get_snapshot_key(host_platform)
+    return f"skia-workspace-{key['skia_version']}-{key['platform'].lower()}-{key['machine']}.tar"
+
+
+def _is_excluded(rel_path):
+    # Build dirs aren't part of a prepared workspace
+    parts = rel_path.split("/")
+    return (parts[0] == SKIA_DIR and parts[1:2] == ["out"]) or (
+        parts[0] == WORKTREES_DIR and parts[2:3] == ["out"]
+    )
+
+
+def _list_workspace(workspace):
+    """Returns the directories and the (path, size) of the files of a workspace to snapshot."""
+    directories, files = [], []
+    for top in SNAPSHOT_DIRS:
+        if not os.path.isdir(os.path.join(workspace, top)):
+            continue
+        for dirpath, dirnames, filenames in os.walk(os.path.join(workspace, top)):
+            rel_dir = os.path.relpath(dirpath, workspace).replace(os.sep, "/")
+            dirnames[:] = sorted(name for name in dirnames if not _is_excluded(f"{rel_dir}/{name}"))
+            directories.append(rel_dir)
+            # Symbolic links to directories are listed in `dirnames` but not walked
+            for name in sorted(filenames) + [
+                name for name in dirnames if os.path.islink(os.path.join(dirpath, name))
+            ]:
+                rel_path = f"{rel_dir}/{name}"
+                files.append((rel_path, os.lstat(os.path.join(workspace, rel_path)).st_size))
+    return directories, files
+
+
+def _split_shards(files, count):
+    """Distributes files over `count` shards of about the same size, largest files first."""
+    heap = [(0, index) for index in range(count)]
+    shards = [[] for _ in range(count)]
+    for rel_path, size in sorted(files, key=lambda file: -file[1]):
+        total, index = heapq.heappop(heap)
+        shards[index].append(rel_path)
+        heapq.heappush(heap, (total + size, index))
+    return [sorted(shard) for shard in shards if shard]
+
+
+def _write_shard(workspace, rel_paths, shard_path):
+    with tarfile.open(shard_path, "w:gz", compresslevel=SNAPSHOT_COMPRESSLEVEL) as tar:
+        for rel_path in rel_paths:
+            full_path = os.path.join(workspace, rel_path)
+            info = tar.gettarinfo(full_path, rel_path)
+            if info.islnk():
+                # Hard links can't refer to a file stored in another shard
+                info.type = tarfile.REGTYPE
+                info.size = os.path.getsize(full_path)
+            if info.isreg():
+                with open(full_path, "rb") as f:
+                    tar.addfile(info, f)
+            else:
+                tar.addfile(info)
+    return hash_file(shard_path)
+
+
+@traced("create_snapshot")
+def create_snapshot(snapshot_path, host_platform, jobs=None):
+    """
+    Packs the prepared workspace in the current directory into a snapshot.
+
+    Args:
+        snapshot_path (str): Path of the snapshot to write.
+        host_platform (str): Host platform name (e.g. "Linux"), part of the snapshot key.
+        jobs (int): Number of shards, compressed in parallel. Defaults to the CPU count.
+
+    Raises:
+        SnapshotError: If the workspace isn't set up.
+
+    Returns:
+        dict: The snapshot index.
+    """
+    workspace = os.getcwd()
+    if not os.path.isdir(os.path.join(workspace, SKIA_DIR)):
+        raise SnapshotError(f"No Skia checkout in {workspace}, run `skia-builder setup-env` first")
+
+    directories, files = _list_workspace(workspace)
+    shards = _split_shards(files, jobs or _default_jobs())
+    Logger.info(
+        f"Packing {len(files)} files ({sum(size for _, size in files) / 2**20:.0f} MiB) "
+        f"into {len(shards)} shards"
+    )
+
+    snapshot_dir = os.path.dirname(os.path.abspath(snapshot_path))
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=snapshot_dir) as staging_dir:
+        shard_paths = [
+            os.path.join(staging_dir, f"shard-{index:02d}.tar.gz") for index in range(len(shards))
+        ]
+        with ThreadPoolExecutor(max_workers=len(shards) or 1) as executor:
+            checksums = list(
+                executor.map(lambda args: _write_shard(workspace, *args), zip(shards, shard_paths))
+            )
+
+        index = {
+            "version": SNAPSHOT_VERSION,
+            "key": get_snapshot_key(host_platform),
+            "directories": directories,
+            "shards": [
+                {
+                    "name": os.path.basename(shard_path),
+                    "files": len(shard),
+                    "size": os.path.getsize(shard_path),
+                    "sha256": checksum,
+                }
+                for shard, shard_path, checksum in zip(shards, shard_paths, checksums)
+            ],
+        }
+
+        partial_path = os.path.join(staging_dir, "snapshot.tar")
+        with tarfile.open(partial_path, "w") as snapshot:
+            data = json.dumps(index, indent=2).encode("utf-8")
+            info = tarfile.TarInfo(SNAPSHOT_INDEX)
+            info.size = len(data)
+            snapshot.addfile(info, io.BytesIO(data))
+            for shard_path in shard_paths:
+                snapshot.add(shard_path, os.path.basename(shard_path))
+        os.replace(partial_path, snapshot_path)
+
+    Logger.info(f"Workspace snapshot written to {snapshot_path}")
+    return index
+
+
+def load_snapshot_index(snapshot_path):
+    """
+    Reads the index of a snapshot, along with the offset of each shard in the snapshot file.
+
+    Raises:
+        SnapshotError: If the file isn't a workspace snapshot.
+    """
+    try:
+        with tarfile.open(snapshot_path, "r:") as snapshot:
+            index = json.load(snapshot.extractfile(SNAPSHOT_INDEX))
+            offsets = {member.name: member.offset_data for member in snapshot.getmembers()}
+    except (OSError, KeyError, ValueError, tarfile.TarError) as e:
+        raise SnapshotError(f"{snapshot_path} is not a workspace snapshot: {e}") from e
+    if index.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version: {index.get('version')}")
+    for shard in index["shards"]:
+        shard["offset"] = offsets[shard["name"]]
+    return index
+
+
+class _HashingReader(io.RawIOBase):
+    """Reads `size` bytes of a file from `offset`, hashing them."""
+
+    def __init__(self, f, offset, size):
+        self._f = f
+        self._remaining = size
+        self._hash = hashlib.sha256()
+        f.seek(offset)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._f.read(min(len(buffer), self._remaining))
+        self._remaining -= len(data)
+        self._hash.update(data)
+        buffer[: len(data)] = data
+        return len(data)
+
+    def hexdigest(self):
+        # The gzip trailer may not have been read by the decompressor
+        while self.read(COPY_BUFFER_SIZE):
+            pass
+        return self._hash.hexdigest()
+
+
+def _relocate_worktrees(workspace):
+    """Points the restored worktrees and the main checkout at each other's new location."""
+    worktrees_dir = os.path.join(workspace, WORKTREES_DIR)
+    if not os.path.isdir(worktrees_dir):
+        return
+    for name in sorted(os.listdir(worktrees_dir)):
+        worktree_path = os.path.join(worktrees_dir, name)
+        git_file = os.path.join(worktree_path, ".git")
+        if not os.path.isfile(git_file):
+            continue
+        with open(git_file, "r", encoding="utf-8") as f:
+            # e.g. "gitdir: /previous/workspace/skia/.git/worktrees/m142"
+            admin_name = os.path.basename(f.read().strip().split(": ", 1)[-1].rstrip("/\\"))
+        admin_dir = os.path.join(workspace, SKIA_DIR, ".git", "worktrees", admin_name)
+        with open(git_file, "w", encoding="utf-8") as f:
+            f.write(f"gitdir: {admin_dir}\n")
+        with open(os.path.join(admin_dir, "gitdir"), "w", encoding="utf-8") as f:
+            f.write(f"{git_file}\n")
+
+
+def _verify_shard(snapshot_path, shard):
+    """Raises SnapshotError if the bytes of a shard don't match its checksum."""
+    with open(snapshot_path, "rb") as f:
+        reader = _HashingReader(f, shard["offset"], shard["size"])
+        if reader.hexdigest() != shard["sha256"]:
+            raise SnapshotError(f"Checksum mismatch for {shard['name']} of {snapshot_path}")
+
+
+def _check_member(member, workspace):
+    """
+    Raises:
+        SnapshotError: If extracting `member` would write outside `workspace` (e.g. through a
+            symbolic link extracted before it), or it is a link pointing outside of it.
+    """
+    link_name = member.linkname if member.issym() or member.islnk() else None
+    try:
+        check_member(workspace, member.name, link_name, hard_link=member.islnk())
+    except ArchiveError as e:
+        raise SnapshotError(str(e)) from e
+
+
+def _extract_shard(snapshot_path, shard, workspace):
+    with open(snapshot_path, "rb") as f:
+        reader = _HashingReader(f, shard["offset"], shard["size"])
+        stream = io.BufferedReader(reader, COPY_BUFFER_SIZE)
+        with tarfile.open(fileobj=gzip.GzipFile(fileobj=stream), mode="r|") as tar:
+            for member in tar:
+                _check_member(member, workspace)
+                tar.extract(member, workspace)
+        # The shards are verified before extracting, this catches a snapshot modified since
+        if reader.hexdigest() != shard["sha256"]:
+            raise SnapshotError(f"Checksum mismatch for {shard['name']} of {snapshot_path}")
+    return shard["files"]
+
+
+@traced("restore_snapshot")
+def restore_snapshot(snapshot_path, host_platform, jobs=None, force=False):
+    """
+    Restores a workspace snapshot in the current directory, extracting its shards in parallel.
+
+    Args:
+        snapshot_path (str): Path of the snapshot.
+        host_platform (str): Host platform name (e.g. "Linux"), checked against the snapshot key.
+        jobs (int): Number of extraction threads. Defaults to the CPU count.
+        force (bool): Whether a snapshot with another key is restored, and existing workspace
+            directories replaced.
+
+    Raises:
+        SnapshotError: If the snapshot doesn't match this version or host, the workspace is
+            already set up (without `force`), or a shard is corrupted.
+    """
+    workspace = os.path.realpath(os.getcwd())
+    index = load_snapshot_index(snapshot_path)
+    jobs = jobs or _default_jobs()
+
+    expected_key = get_snapshot_key(host_platform)
+    if index["key"] != expected_key and not force:
+        raise SnapshotError(
+            f"The snapshot was made for {index['key']}, this workspace needs {expected_key}. "
+            "Use --force to restore it anyway."
+        )
+
+    # Every shard is verified before the workspace is touched, so that a corrupted or tampered
+    # snapshot doesn't leave it half restored
+    Logger.info(f"Verifying {len(index['shards'])} shards of {snapshot_path}")
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_verify_shard, snapshot_path, shard) for shard in index["shards"]
+        ]
+        try:
+            for future in futures:
+                future.result()
+        except OSError as e:
+            raise SnapshotError(f"Unable to read {snapshot_path}: {e}") from e
+
+    existing = [top for top in SNAPSHOT_DIRS if os.path.lexists(os.path.join(workspace, top))]
+    if existing:
+        if not force:
+            raise SnapshotError(
+                f"The workspace already has {', '.join(existing)}. Use --force to replace them."
+            )
+        for top in existing:
+            Logger.warning(f"Removing {top}")
+            shutil.rmtree(os.path.join(workspace, top))
+
+    # Created upfront, so that shards extracted concurrently don't race to create them
+    for directory in index["directories"]:
+        os.makedirs(os.path.join(workspace, directory), exist_ok=True)
+
+    Logger.info(f"Restoring {len(index['shards'])} shards from {snapshot_path}")
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_extract_shard, snapshot_path, shard, workspace)
+            for shard in index["shards"]
+        ]
+        try:
+            files = sum(future.result() for future in futures)
+        except (OSError, tarfile.TarError, EOFError, zlib.error) as e:
+            raise SnapshotError(f"Unable to restore {snapshot_path}: {e}") from e
+
+    _relocate_worktrees(workspace)
+
+    Logger.info(f"Restored {files} files of Skia {index['key']['skia_version']} to {workspace}")
@@ -0,0 +1,170 @@
+"""
+Statistics of repeated benchmark runs, used to tell a regression from noise (see bisection.py and
+bench.py).
+
+Samples are summarized by their median, which a few outliers (e.g. a run disturbed by another
+process) don't move. Two sets of samples are compared with a one-sided Mann-Whitney U test, and
+with a bootstrap confidence interval of the ratio of their medians, neither of which assumes the
+timings are normally distributed.
+"""
+
+import functools
+import math
+import random
+import statistics
+
+# Two-sided 95% quantiles of Student's t distribution, by degrees of freedom (the normal quantile
+# is used above 30)
+T_QUANTILES_95 = {
+    1: 12.706,
+    2: 4.303,
+    3: 3.182,
+    4: 2.776,
+    5: 2.571,
+    6: 2.447,
+    7: 2.365,
+    8: 2.306,
+    9: 2.262,
+    10: 2.228,
+    12: 2.179,
+    15: 2.131,
+    20: 2.086,
+    25: 2.060,
+    30: 2.042,
+}
+# Above this many samples in total, the U statistic is approximated by a normal distribution
+EXACT_U_MAX_SAMPLES = 40
+# Number of resamples of the bootstrap confidence intervals
+BOOTSTRAP_RESAMPLES = 2000
+
+
+def _t_quantile_95(degrees_of_freedom):
+    if degrees_of_freedom > max(T_QUANTILES_95):
+        return 1.960
+    # Rounded down to a tabulated value, which gives a slightly wider interval
+    return T_QUANTILES_95[max(df for df in T_QUANTILES_95 if df <= degrees_of_freedom)]
+
+
+def summarize(samples):
+    """
+    Returns the statistics of benchmark samples.
+
+    Returns:
+        dict: `runs`, `median`, `mean`, `stdev`, `min`, `max`, and `ci95`, the 95% confidence
+            interval of the mean (`stdev` and `ci95` are None for a single sample).
+    """
+    mean = statistics.fmean(samples)
+    summary = {
+        "runs": len(samples),
+        "median": statistics.median(samples),
+        "mean": mean,
+        "stdev": None,
+        "min": min(samples),
+        "max": max(samples),
+        "ci95": None,
+    }
+    if len(samples) > 1:
+        stdev = statistics.stdev(samples)
+        margin = _t_quantile_95(len(samples) - 1) * stdev / math.sqrt(len(samples))
+        summary.update(stdev=stdev, ci95=[mean - margin, mean + margin])
+    return summary
+
+
+@functools.lru_cache(maxsize=None)
+def _count_u(u, m, n):
+    """Number of orderings of `m` and `n` distinct samples whose U statistic is `u`."""
+    if u < 0 or u > m * n:
+        return 0
+    if m == 0 or n == 0:
+        return 1 if u == 0 else 0
+    return _count_u(u - n, m - 1, n) + _count_u(u, m, n - 1)
+
+
+def mann_whitney_u(baseline, candidate):
+    """
+    One-sided Mann-Whitney U test of whether `candidate` samples tend to be greater than
+    `baseline` ones.
+
+    The p-value is exact for small samples without ties, and otherwise uses the normal
+    approximation with tie and continuity corrections.
+
+    Returns:
+        tuple[float, float]: The U statistic of `candidate` and the p-value.
+    """
+    m, n = len(candidate), len(baseline)
+    ranked = sorted([(value, 0) for value in baseline] + [(value, 1) for value in candidate])
+    ranks, tie_sizes = [0.0] * len(ranked), []
+    start = 0
+    while start < len(ranked):
+        end = start
+        while end + 1 < len(ranked) and ranked[end + 1][0] == ranked[start][0]:
+            end += 1
+        for i in range(start, end + 1):
+            ranks[i] = (start + end) / 2 + 1
+        tie_sizes.append(end - start + 1)
+        start = end + 1
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 1)
+    u = rank_sum - m * (m + 1) / 2
+
+    if m + n <= EXACT_U_MAX_SAMPLES and all(size == 1 for size in tie_sizes):
+        at_least_u = sum(_count_u(value, m, n) for value in range(int(u), m * n + 1))
+        return u, at_least_u / math.comb(m + n, m)
+
+    total = m + n
+    tie_correction = sum(size**3 - size for size in tie_sizes) / (total * (total - 1))
+    variance = m * n / 12 * (total + 1 - tie_correction)
+    if variance == 0:
+        return u, 1.0
+    z = (u - m * n / 2 - 0.5) / math.sqrt(variance)
+    return u, 1 - statistics.NormalDist().cdf(z)
+
+
+def min_p_value(runs):
+    """Smallest p-value `mann_whitney_u` can reach when comparing `runs` samples to `runs`."""
+    return 1 / math.comb(2 * runs, runs)
+
+
+def compare(baseline, candidate, higher_is_better=False):
+    """
+    Compares the samples of a candidate to the ones of a baseline.
+
+    Args:
+        higher_is_better (bool): Whether greater values are better (e.g. a throughput) rather than
+            worse (e.g. a duration).
+
+    Returns:
+        dict: `change`, the relative change of the median (positive when the candidate is worse),
+            and `p_value`, the probability of the candidate looking this much worse by chance.
+    """
+    baseline_median = statistics.median(baseline)
+    candidate_median = statistics.median(candidate)
+    if higher_is_better:
+        _, p_value = mann_whitney_u(candidate, baseline)
+        difference = baseline_median - candidate_median
+    else:
+        _, p_value = mann_whitney_u(baseline, candidate)
+        difference = candidate_median - baseline_median
+    if baseline_median:
+        change = difference / abs(baseline_median)
+    else:
+        change = math.copysign(math.inf, difference) if difference else 0.0
+    return {"change": change, "p_value": p_value}
+
+
+def median_ratio_ci95(baseline, candidate, resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    """
+    Returns the 95% bootstrap confidence interval of the ratio of the median of `candidate` to
+    the one of `baseline`, or None if the baseline median is always zero. The resampling is
+    seeded, so that reports are reproducible.
+    """
+    rng = random.Random(seed)
+    ratios = []
+    for _ in range(resamples):
+        baseline_median = statistics.median(rng.choices(baseline, k=len(baseline)))
+        candidate_median = statistics.median(rng.choices(candidate, k=len(candidate)))
+        if baseline_median:
+            ratios.append(candidate_median / baseline_median)
+    if not ratios:
+        return None
+    ratios.sort()
+    return [ratios[int(0.025 * (len(ratios) - 1))], ratios[math.ceil(0.975 * (len(ratios) - 1))]]
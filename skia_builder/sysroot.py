@@ -0,0 +1,286 @@
+"""
+Sysroots of the Linux targets cross-compiled from a host of another CPU architecture (e.g.
+`linux-arm64` on an x64 host).
+
+The sysroot of a target CPU comes from `SYSROOT_SOURCES` in config.py: an extracted sysroot is used
+in place, while a tarball or a directory of Debian packages is extracted once into
+`SYSROOTS_DIR`, offline. Builds then pass `--target`/`--sysroot` to clang (see `apply_sysroot`),
+and the architecture of the built libraries is checked against the target.
+"""
+
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+
+from skia_builder.binaries import ELF_MACHINES, get_library_machine, iter_ar_members
+from skia_builder.cleanup import record_use
+from skia_builder.config import SYSROOT_PACKAGES, SYSROOT_SOURCES, SYSROOTS_DIR
+from skia_builder.errors import ArchitectureMismatchError, ArchiveError, SysrootError
+from skia_builder.extract import check_member
+from skia_builder.trace import traced
+from skia_builder.utils import Logger
+
+SYSROOT_STAMP = ".skia_builder_sysroot.json"
+
+# `platform.machine()` values of the supported hosts, and Debian architectures, by target CPU
+HOST_MACHINES = {
+    "x86_64": "x64",
+    "amd64": "x64",
+    "aarch64": "arm64",
+    "arm64": "arm64",
+}
+DEBIAN_ARCHITECTURES = {
+    "x64": "amd64",
+    "arm64": "arm64",
+}
+
+_provision_lock = threading.Lock()
+
+
+def get_host_cpu():
+    """Returns the target CPU name of the host (e.g. `x64`), or None if unknown."""
+    return HOST_MACHINES.get(platform.machine().lower())
+
+
+def needs_sysroot(target_cpu):
+    """Whether a Linux target is cross-compiled from this host."""
+    host_cpu = get_host_cpu()
+    return host_cpu is not None and host_cpu != target_cpu
+
+
+def _is_sysroot_dir(path):
+    return os.path.isdir(os.path.join(path, "usr", "include"))
+
+
+def get_sysroot_path(target_cpu):
+    """
+    Returns where the sysroot of a target CPU is, or will be once provisioned.
+
+    Raises:
+        SysrootError: If no sysroot source is configured for the target CPU.
+    """
+    source = SYSROOT_SOURCES.get(target_cpu)
+    if not source:
+        raise SysrootError(
+            f"Cross-compiling for {target_cpu} needs a sysroot. Set "
+            f"SKIA_BUILDER_SYSROOT_{target_cpu.upper()} to an extracted sysroot, a tarball of "
+            f"one, or a directory of {DEBIAN_ARCHITECTURES.get(target_cpu, target_cpu)} .deb "
+            "packages."
+        )
+    source = os.path.abspath(source)
+    if _is_sysroot_dir(source):
+        return source
+
+    # A new sysroot is provisioned when the source changes
+    try:
+        source_mtime = os.stat(source).st_mtime_ns
+    except OSError as e:
+        raise SysrootError(f"Sysroot source of {target_cpu} not found: {source}") from e
+    key = hashlib.sha256(f"{source}:{source_mtime}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(SYSROOTS_DIR, f"{target_cpu}-{key}")
+
+
+def _check_member(member, destination):
+    """
+    Raises:
+        SysrootError: If extracting `member` would write outside `destination` (e.g. through a
+            symbolic link extracted before it), or it is a link pointing outside of it.
+    """
+    link_name = member.linkname if member.issym() or member.islnk() else None
+    if member.issym() and os.path.isabs(link_name):
+        # Absolute links point inside the sysroot once relativized (see `_relativize_symlinks`).
+        # Until then, members below them resolve outside of `destination` and are rejected.
+        link_dir = os.path.dirname(os.path.join(destination, member.name))
+        link_name = os.path.relpath(destination + link_name, link_dir)
+    try:
+        check_member(destination, member.name, link_name, hard_link=member.islnk())
+    except ArchiveError as e:
+        raise SysrootError(str(e)) from e
+
+
+def _extract_tar(tar, destination):
+    destination = os.path.realpath(destination)
+    for member in tar:
+        if member.isdev():
+            continue
+        _check_member(member, destination)
+        tar.extract(member, destination, set_attrs=not member.isdir())
+
+
+def _extract_tarball(tarball_path, destination):
+    with tarfile.open(tarball_path, "r:*") as tar:
+        _extract_tar(tar, destination)
+
+    # Tarballs may hold the sysroot in a top-level directory
+    entries = os.listdir(destination)
+    if len(entries) == 1 and _is_sysroot_dir(os.path.join(destination, entries[0])):
+        nested = os.path.join(destination, entries[0])
+        for name in os.listdir(nested):
+            os.replace(os.path.join(nested, name), os.path.join(destination, name))
+        os.rmdir(nested)
+
+
+def _open_deb_data(deb_path):
+    for name, offset, size in iter_ar_members(deb_path):
+        if not name.startswith("data.tar"):
+            continue
+        with open(deb_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(size)
+        if name.endswith(".zst"):
+            # Not supported by the standard library
+            if shutil.which("zstd") is None:
+                raise SysrootError(f"zstd is needed to extract {deb_path}")
+            data = subprocess.run(
+                ["zstd", "-dc"], input=data, stdout=subprocess.PIPE, check=True
+            ).stdout
+        return tarfile.open(fileobj=io.BytesIO(data), mode="r:*")
+    raise SysrootError(f"{deb_path} is not a Debian package")
+
+
+def _version_key(file_name):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", file_name)]
+
+
+def _select_packages(packages_dir, target_cpu):
+    """Returns the latest .deb of each of `SYSROOT_PACKAGES` for the target CPU."""
+    architecture = DEBIAN_ARCHITECTURES[target_cpu]
+    debs = {}  # package name -> file names
+    for file_name in os.listdir(packages_dir):
+        parts = file_name[: -len(".deb")].split("_") if file_name.endswith(".deb") else []
+        if len(parts) == 3 and parts[2] in (architecture, "all"):
+            debs.setdefault(parts[0], []).append(file_name)
+
+    selected, missing = [], []
+    for pattern in SYSROOT_PACKAGES:
+        candidates = [
+            file_name
+            for name, file_names in debs.items()
+            if fnmatch.fnmatchcase(name, pattern)
+            for file_name in file_names
+        ]
+        if candidates:
+            selected.append(max(candidates, key=_version_key))
+        else:
+            missing.append(pattern)
+    if missing:
+        raise SysrootError(
+            f"Packages missing from {packages_dir} for a {architecture} sysroot: "
+            f"{', '.join(missing)}"
+        )
+    return [os.path.join(packages_dir, file_name) for file_name in selected]
+
+
+def _relativize_symlinks(root):
+    """Makes the absolute symbolic links of a sysroot relative, so that they resolve inside it."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            if not os.path.islink(path):
+                continue
+            target = os.readlink(path)
+            if os.path.isabs(target):
+                os.remove(path)
+                os.symlink(os.path.relpath(root + target, dirpath), path)
+
+
+@traced("provision_sysroot")
+def provision_sysroot(target_cpu):
+    """
+    Extracts the sysroot of a target CPU from its source, unless it already is.
+
+    Raises:
+        SysrootError: If the source is missing, incomplete, or not a sysroot.
+
+    Returns:
+        str: The path of the sysroot.
+    """
+    sysroot = get_sysroot_path(target_cpu)
+    source = os.path.abspath(SYSROOT_SOURCES[target_cpu])
+    if sysroot == source:
+        return sysroot
+    record_use(sysroot)
+
+    # Concurrent builds of the same target only provision its sysroot once
+    with _provision_lock:
+        if os.path.exists(os.path.join(sysroot, SYSROOT_STAMP)):
+            return sysroot
+
+        Logger.custom(
+            f"\n--- Running step: Provisioning {target_cpu} sysroot from {source} ---",
+            Logger.BRIGHT_YELLOW,
+        )
+        os.makedirs(SYSROOTS_DIR, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(dir=SYSROOTS_DIR)
+        try:
+            packages = []
+            try:
+                if os.path.isdir(source):
+                    packages = _select_packages(source, target_cpu)
+                    for deb_path in packages:
+                        with _open_deb_data(deb_path) as tar:
+                            _extract_tar(tar, staging_dir)
+                else:
+                    _extract_tarball(source, staging_dir)
+            except (OSError, ValueError, tarfile.TarError, subprocess.CalledProcessError) as e:
+                raise SysrootError(f"Unable to extract the {target_cpu} sysroot: {e}") from e
+
+            if not _is_sysroot_dir(staging_dir):
+                raise SysrootError(f"{source} has no usr/include, it is not a sysroot")
+            _relativize_symlinks(staging_dir)
+
+            with open(os.path.join(staging_dir, SYSROOT_STAMP), "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "source": source,
+                        "packages": [os.path.basename(deb_path) for deb_path in packages],
+                    },
+                    f,
+                    indent=2,
+                )
+            if os.path.exists(sysroot):
+                shutil.rmtree(sysroot)
+            os.replace(staging_dir, sysroot)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    Logger.info(f"Provisioned {target_cpu} sysroot in {sysroot}")
+    return sysroot
+
+
+def verify_architecture(libraries, target_cpu):
+    """
+    Checks that built libraries hold objects of the target CPU architecture.
+
+    Raises:
+        ArchitectureMismatchError: If a library was built for another architecture.
+    """
+    expected = ELF_MACHINES.get(target_cpu)
+    if expected is None:
+        return
+    mismatches, verified = [], 0
+    for library in libraries:
+        machine = get_library_machine(library)
+        if machine is None:
+            continue
+        verified += 1
+        if machine != expected:
+            machine_cpu = next(
+                (cpu for cpu, value in ELF_MACHINES.items() if value == machine), machine
+            )
+            mismatches.append(f"{os.path.basename(library)} ({machine_cpu})")
+    if mismatches:
+        raise ArchitectureMismatchError(
+            f"Libraries not built for {target_cpu}: {', '.join(mismatches)}"
+        )
+    if verified:
+        Logger.info(f"Verified that {verified} libraries target {target_cpu}")
@@ -0,0 +1,257 @@
+"""
+Chrome trace-event recording of the setup/build pipeline.
+
+When tracing is started (`skia-builder --trace out.json ...`), every `run_command` step and
+Python-side phase is recorded as a complete ("X") event, which can be loaded in Perfetto
+(https://ui.perfetto.dev) or chrome://tracing. Spans carry the CPU time used by child processes
+reaped while they were open and the peak RSS of the largest child so far, from
+`getrusage(RUSAGE_CHILDREN)`. Since these counters are process-wide, spans overlapping in time
+(e.g. concurrent builds) share them.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_active_tracer = None
+
+# Status line ninja prints before each edge it runs, as set by `config.NINJA_STATUS`
+NINJA_STATUS_LINE = re.compile(r"\[\d+/\d+\] ")
+
+
+class Span:
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+        self.tid = None
+
+
+class Tracer:
+    def __init__(self):
+        self.events = []
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._tids = {}
+
+    def now(self):
+        """Microseconds since the start of the trace."""
+        return (time.perf_counter() - self._started) * 1e6
+
+    def _lane(self, key, name):
+        with self._lock:
+            if key not in self._tids:
+                tid = len(self._tids) + 1
+                self._tids[key] = tid
+                self.events.append(
+                    {
+                        "ph": "M",
+                        "name": "thread_name",
+                        "pid": os.getpid(),
+                        "tid": tid,
+                        "args": {"name": name},
+                    }
+                )
+            return self._tids[key]
+
+    def _current_tid(self):
+        # Concurrent asyncio tasks get their own lane so that their slices don't overlap
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            return self._lane(("task", id(task)), task.get_name())
+        thread = threading.current_thread()
+        return self._lane(("thread", thread.ident), thread.name)
+
+    def add_complete(self, name, category, start, duration, tid, args=None):
+        event = {
+            "ph": "X",
+            "name": name,
+            "cat": category,
+            "ts": start,
+            "dur": duration,
+            "pid": os.getpid(),
+            "tid": tid,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name, category, args):
+        span = Span(name, category, args)
+        span.tid = self._current_tid()
+        usage_before = _children_usage()
+        span.start = self.now()
+        try:
+            yield span
+        finally:
+            duration = self.now() - span.start
+            usage_after = _children_usage()
+            args = dict(span.args)
+            if usage_after:
+                args["child_cpu_s"] = round(usage_after["cpu"] - usage_before["cpu"], 3)
+                args["child_peak_rss_kib"] = usage_after["maxrss_kib"]
+            self.add_complete(name, category, span.start, duration, span.tid, args)
+
+    def add_ninja_log(self, path, position, edge_count, parent):
+        """
+        Adds the `edge_count` edges ninja logged in its `.ninja_log` since `position` as slices
+        starting at `parent.start`, spread over as many lanes as edges ran in parallel.
+        """
+        edges = _read_ninja_log(path, position, edge_count)
+        lanes = []  # End time of the last edge of each lane
+        for start_ms, end_ms, outputs in sorted(edges):
+            for lane, lane_end in enumerate(lanes):
+                if lane_end <= start_ms:
+                    lanes[lane] = end_ms
+                    break
+            else:
+                lane = len(lanes)
+                lanes.append(end_ms)
+
+            tid = self._lane(("ninja", parent.tid, lane), f"{parent.name} [{lane + 1}]")
+            self.add_complete(
+                os.path.basename(outputs[0]),
+                "ninja",
+                parent.start + start_ms * 1000,
+                (end_ms - start_ms) * 1000,
+                tid,
+                {"outputs": outputs},
+            )
+        return len(edges)
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._lock:
+            payload = {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+
+def describe_usage(usage):
+    """
+    Returns the CPU time in seconds (`cpu`) and peak RSS in KiB (`maxrss_kib`) of a
+    `resource.struct_rusage`, e.g. the one `os.wait4` returns for a child process.
+    """
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    maxrss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return {"cpu": usage.ru_utime + usage.ru_stime, "maxrss_kib": maxrss}
+
+
+def _children_usage():
+    if resource is None:
+        return None
+    return describe_usage(resource.getrusage(resource.RUSAGE_CHILDREN))
+
+
+def ninja_log_position(path):
+    """
+    Returns where the next edges will be appended to a `.ninja_log`: its inode, size and header
+    line, or None if there is no log yet.
+    """
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            st = os.fstat(f.fileno())
+            return st.st_ino, st.st_size, f.readline()
+    except OSError:
+        return None
+
+
+def _read_ninja_log(path, position, edge_count):
+    """Returns (start_ms, end_ms, outputs) of the last `edge_count` edges logged past `position`."""
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            st = os.fstat(f.fileno())
+            header = f.readline()
+            # Ninja recompacts its log by renaming a new file over it, in which case it is read
+            # entirely and only its last edges (appended after the recompacted ones) are kept
+            appended = position is not None and (
+                (position[0], position[2]) == (st.st_ino, header) and position[1] <= st.st_size
+            )
+            f.seek(position[1] if appended else 0)
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+
+    edges = {}
+    for line in lines:
+        fields = line.split("\t")
+        if line.startswith("#") or len(fields) < 5:
+            continue
+        start_ms, end_ms, _, output, command_hash = fields[:5]
+        # Edges with several outputs have one line per output
+        key = (int(start_ms), int(end_ms), command_hash)
+        edges.setdefault(key, []).append(output)
+    edges = [(start, end, outputs) for (start, end, _), outputs in edges.items()]
+    return edges[max(0, len(edges) - edge_count) :]
+
+
+def count_ninja_edges(output_lines):
+    """Returns the number of edges ninja ran, from the `NINJA_STATUS` lines of its output."""
+    return sum(1 for line in output_lines if NINJA_STATUS_LINE.match(line))
+
+
+def start_tracing():
+    global _active_tracer
+    _active_tracer = Tracer()
+    return _active_tracer
+
+
+def stop_tracing(path):
+    """Writes the recorded trace to `path` and stops tracing."""
+    global _active_tracer
+    tracer, _active_tracer = _active_tracer, None
+    if tracer is not None:
+        tracer.write(path)
+
+
+@contextmanager
+def span(name, category="phase", **args):
+    """
+    Records the enclosed code as a trace slice when tracing is active.
+
+    Yields:
+        Span | None: The open span, or None when not tracing.
+    """
+    if _active_tracer is None:
+        yield None
+        return
+    with _active_tracer.span(name, category, args) as current_span:
+        yield current_span
+
+
+def traced(name):
+    """Decorator recording each call of a function as a trace slice."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def merge_ninja_log(path, position, edge_count, parent):
+    """Adds the ninja edges of a build as slices nested in time under `parent` (if tracing)."""
+    if _active_tracer is None or parent is None:
+        return 0
+    return _active_tracer.add_ninja_log(path, position, edge_count, parent)
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from xml.etree import ElementTree
+
+from skia_builder.download import fetch_if_modified
+from skia_builder.errors import DownloadError
+from skia_builder.manifest import hash_file
+from skia_builder.utils import Logger
+
+CHROMIUM_RELEASES_URL = (
+    "https://chromiumdash.appspot.com/fetch_releases?channel=Stable&platform=Windows&num=1"
+)
+RELEASE_NOTES_URL = "https://raw.githubusercontent.com/google/skia/main/RELEASE_NOTES.md"
+# Gitiles serves commit metadata as JSON prefixed with an XSSI guard
+BRANCH_HEAD_URL = "https://skia.googlesource.com/skia/+/refs/heads/chrome/m{milestone}?format=JSON"
+GITILES_XSSI_PREFIX = ")]}'"
+ANDROID_REPOSITORY_URL = "https://dl.google.com/android/repository"
+# Google's SDK repository manifest, which publishes the SHA-1 of every NDK archive
+ANDROID_REPOSITORY_MANIFEST = "repository2-3.xml"
+VERSIONS_FILE_PATH = Path(__file__).parent / "versions.py"
+README_FILE_PATH = Path(__file__).parent.parent / "README.md"
+
+
+def _read_cached(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def parse_release_note_milestones(release_notes):
+    """Returns the milestones that have a section in Skia's RELEASE_NOTES.md."""
+    return {int(m) for m in re.findall(r"^#*\s*Milestone (\d+)", release_notes, re.MULTILINE)}
+
+
+def resolve_branch_head(milestone, cache_dir=None, branch_head_url=BRANCH_HEAD_URL):
+    """Resolves `chrome/m<milestone>` to the commit currently at the head of the branch."""
+    path, _ = fetch_if_modified(
+        branch_head_url.format(milestone=milestone), cache_dir=cache_dir, segments=1
+    )
+    payload = _read_cached(path)
+    if payload.startswith(GITILES_XSSI_PREFIX):
+        payload = payload[len(GITILES_XSSI_PREFIX) :]
+    return json.loads(payload)["commit"]
+
+
+def parse_published_sha1(repository_xml, archive_name):
+    """Returns the SHA-1 the SDK repository manifest publishes for an archive, or None."""
+    for element in ElementTree.fromstring(repository_xml).iter():
+        if element.tag.rsplit("}", 1)[-1] != "complete":
+            continue
+        fields = {child.tag.rsplit("}", 1)[-1]: (child.text or "").strip() for child in element}
+        if fields.get("url") == archive_name and fields.get("checksum"):
+            return fields["checksum"].lower()
+    return None
+
+
+def _hash_file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pin_ndk_checksums(cache_dir=None, repository_url=ANDROID_REPOSITORY_URL):
+    """
+    Pins the SHA-256 checksums of the NDK archives left unpinned (None) in versions.py.
+
+    Google publishes the SHA-1 of the NDK archives, while downloads are verified with SHA-256:
+    each unpinned archive is downloaded, checked against the SHA-1 of the SDK repository
+    manifest, and its SHA-256 is written to versions.py.
+
+    Returns:
+        dict: The SHA-256 checksums pinned, by host.
+    """
+    versions_content = VERSIONS_FILE_PATH.read_text(encoding="utf-8")
+    ndk = re.search(r'ANDROID_NDK = "([^"]+)"', versions_content)
+    pins = re.search(r"ANDROID_NDK_SHA256 = \{(.*?)\}", versions_content, re.DOTALL)
+    if not ndk or not pins:
+        Logger.error("No ANDROID_NDK/ANDROID_NDK_SHA256 entry found in versions.py.")
+        sys.exit(1)
+    unpinned = re.findall(r'"(\w+)": None', pins.group(1))
+    if not unpinned:
+        Logger.info(f"The {ndk.group(1)} archives are already pinned.")
+        return {}
+
+    try:
+        manifest_path, _ = fetch_if_modified(
+            f"{repository_url}/{ANDROID_REPOSITORY_MANIFEST}", cache_dir=cache_dir, segments=1
+        )
+        repository_xml = _read_cached(manifest_path)
+    except DownloadError as e:
+        Logger.error(f"Failed to fetch the SDK repository manifest. Error: {e}")
+        sys.exit(1)
+
+    pinned = {}
+    for host in unpinned:
+        archive_name = f"{ndk.group(1)}-{host}.zip"
+        try:
+            published_sha1 = parse_published_sha1(repository_xml, archive_name)
+        except ElementTree.ParseError as e:
+            Logger.error(f"Unexpected format of the SDK repository manifest. Error: {e}")
+            sys.exit(1)
+        if published_sha1 is None:
+            Logger.error(f"No checksum is published for {archive_name}.")
+            sys.exit(1)
+        try:
+            archive_path, _ = fetch_if_modified(
+                f"{repository_url}/{archive_name}", cache_dir=cache_dir, revalidate=False
+            )
+        except DownloadError as e:
+            Logger.error(f"Failed to download {archive_name}. Error: {e}")
+            sys.exit(1)
+        if _hash_file_sha1(archive_path) != published_sha1:
+            Logger.error(f"{archive_name} doesn't match its published SHA-1 {published_sha1}.")
+            sys.exit(1)
+        pinned[host] = hash_file(archive_path)
+        versions_content = re.sub(
+            rf'"{host}": None', f'"{host}": "{pinned[host]}"', versions_content, count=1
+        )
+
+    VERSIONS_FILE_PATH.write_text(versions_content, encoding="utf-8")
+    Logger.info(f"Pinned the SHA-256 of the {ndk.group(1)} archives for {', '.join(pinned)}.")
+
+    # NOTE: In GitHub Actions, this flags the pinned checksums for the pull request step.
+    github_env_file = os.getenv("GITHUB_ENV")
+    if github_env_file:
+        with open(github_env_file, "a") as env_file:
+            env_file.write("NDK_CHECKSUMS_PINNED=1\n")
+    return pinned
+
+
+def check_update_skia_version(
+    cache_dir=None,
+    chromium_url=CHROMIUM_RELEASES_URL,
+    release_notes_url=RELEASE_NOTES_URL,
+    branch_head_url=BRANCH_HEAD_URL,
+):
+    versions_file_path = VERSIONS_FILE_PATH
+    readme_file_path = README_FILE_PATH
+    versions_file = versions_file_path.name
+    readme_file = readme_file_path.name
+
+    if not versions_file_path.exists():
+        Logger.error(f"{versions_file} not found in the expected location. Update cannot proceed.")
+        sys.exit(1)
+
+    try:
+        versions_content = versions_file_path.read_text(encoding="utf-8")
+    except Exception as e:
+        Logger.error(f"Error reading {versions_file}: {e}. Unable to proceed with version update.")
+        sys.exit(1)
+
+    current_version = re.search(r'SKIA_VERSION = "(m\d+)"', versions_content)
+    current_commit = re.search(r'SKIA_COMMIT = "([0-9a-f]+)"', versions_content)
+    current_version = current_version.group(1) if current_version else None
+    current_commit = current_commit.group(1) if current_commit else None
+
+    # Fetch Chromium dash data, Skia release notes and the head of the branch of the pinned
+    # milestone (the usual outcome) concurrently, revalidating cached copies with conditional
+    # requests
+    pinned_milestone = int(current_version[1:]) if current_version else None
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = {
+            name: executor.submit(fetch_if_modified, url, cache_dir=cache_dir, segments=1)
+            for name, url in (("chromium", chromium_url), ("release_notes", release_notes_url))
+        }
+        pinned_head = None
+        if pinned_milestone is not None:
+            pinned_head = executor.submit(
+                resolve_branch_head, pinned_milestone, cache_dir, branch_head_url
+            )
+        try:
+            results = {name: future.result() for name, future in futures.items()}
+        except DownloadError as e:
+            Logger.error(f"Failed to fetch release data. Error: {e}")
+            sys.exit(1)
+
+    chromium_path, _ = results["chromium"]
+    notes_path, _ = results["release_notes"]
+
+    try:
+        milestone = json.loads(_read_cached(chromium_path))[0]["milestone"]
+    except (IndexError, KeyError, ValueError):
+        Logger.error("Unexpected format when extracting the milestone from the fetched data.")
+        sys.exit(1)
+
+    if milestone not in parse_release_note_milestones(_read_cached(notes_path)):
+        if current_version is None:
+            Logger.info(
+                f"No new stable Skia milestone found (expected {milestone}). "
+                "Skia update is not required."
+            )
+            sys.exit(0)
+        # Keep following the branch of the pinned milestone until the next one has release notes
+        Logger.info(f"No release notes for milestone {milestone} yet, keeping {current_version}.")
+        milestone = pinned_milestone
+
+    # Within a milestone, the pinned commit follows the head of its branch, which gets the fixes
+    # merged back into the milestone. The head of a new milestone is only fetched once it's known.
+    try:
+        if milestone == pinned_milestone:
+            commit = pinned_head.result()
+        else:
+            commit = resolve_branch_head(milestone, cache_dir, branch_head_url)
+    except (DownloadError, KeyError, ValueError) as e:
+        Logger.error(f"Failed to resolve the head of chrome/m{milestone}. Error: {e}")
+        sys.exit(1)
+
+    if current_version == f"m{milestone}" and current_commit == commit:
+        Logger.info(f"Skia is already pinned to the head of chrome/m{milestone} ({commit}).")
+        sys.exit(0)
+
+    Logger.info(
+        f"Found Skia stable milestone {milestone} (chrome/m{milestone} at {commit}). "
+        f"Proceeding with updates to {versions_file} and {readme_file}."
+    )
+
+    # Updating version and commit in versions.py
+    new_versions_content, _ = re.subn(
+        r'SKIA_VERSION = "m\d+"', f'SKIA_VERSION = "m{milestone}"', versions_content
+    )
+    new_versions_content, _ = re.subn(
+        r'SKIA_COMMIT = (None|"[0-9a-f]*")', f'SKIA_COMMIT = "{commit}"', new_versions_content
+    )
+
+    if versions_content == new_versions_content:
+        Logger.warning(f"No SKIA_VERSION/SKIA_COMMIT entry found in {versions_file} to update.")
+    else:
+        try:
+            versions_file_path.write_text(new_versions_content, encoding="utf-8")
+            Logger.info(
+                f"Successfully updated {versions_file}: Set SKIA_VERSION to 'm{milestone}' "
+                f"and SKIA_COMMIT to '{commit}'."
+            )
+        except Exception as e:
+            Logger.error(
+                f"Error writing to {versions_file}: {e}. Update of {versions_file} failed."
+            )
+            sys.exit(1)
+
+    # Updating README.md
+    try:
+        readme_content = readme_file_path.read_text(encoding="utf-8")
+    except Exception as e:
+        Logger.error(f"Error reading {readme_file}: {e}. Unable to proceed with README update.")
+        sys.exit(1)
+
+    # Replacing version in the badge
+    new_readme_content, _ = re.subn(
+        r"!\[SKIA_VERSION\]\(https://img.shields.io/badge/Skia_version-m\d+-blue\?style=flat-square\)",
+        f"![SKIA_VERSION](https://img.shields.io/badge/Skia_version-m{milestone}-blue?style=flat-square)",
+        readme_content,
+    )
+
+    if readme_content == new_readme_content:
+        if current_version != f"m{milestone}":
+            Logger.warning(f"No SKIA_VERSION badge found in {readme_file} to update.")
+    else:
+        try:
+            readme_file_path.write_text(new_readme_content, encoding="utf-8")
+            Logger.info(
+                f"Successfully updated {readme_file}: Updated SKIA_VERSION badge to 'm{milestone}'."
+            )
+        except Exception as e:
+            Logger.error(f"Error writing to {readme_file}: {e}. Update of {readme_file} failed.")
+            sys.exit(1)
+
+    # NOTE: In GitHub Actions, this code appends NEW_SKIA_VERSION to the env file for later steps.
+    github_env_file = os.getenv("GITHUB_ENV")
+    if github_env_file:
+        with open(github_env_file, "a") as env_file:
+            if versions_content != new_versions_content and current_version == f"m{milestone}":
+                env_file.write(f"NEW_SKIA_VERSION=m{milestone} at {commit[:12]}\n")
+            elif versions_content != new_versions_content:
+                env_file.write(f"NEW_SKIA_VERSION=m{milestone}\n")
+            else:
+                env_file.write("NEW_SKIA_VERSION=''\n")
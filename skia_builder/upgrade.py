@@ -0,0 +1,77 @@
+"""
+In-place upgrade of a Skia checkout (`skia-builder upgrade`), e.g. after bumping `SKIA_VERSION`
+in versions.py, instead of setting the workspace up again.
+
+Only the branch of the milestone (or the pinned commit) is fetched. The DEPS files of the checked
+out and the new revision are then compared, and only the entries whose URL or revision changed
+are synced again. gn, ninja and the system dependencies are refreshed only if the files pinning
+them changed (see `TOOL_PINS`). Out dirs are kept, so the next build only rebuilds what the new
+revision changed.
+"""
+
+import subprocess
+
+from skia_builder.prune import parse_deps
+
+# Files of the Skia checkout pinning a tool fetched during setup, by setup step
+TOOL_PINS = {
+    "gn": "bin/fetch-gn",
+    "ninja": "bin/fetch-ninja",
+    "skia-system-deps": "tools/install_dependencies.sh",
+}
+
+
+def _git_output(skia_path, *args):
+    """Returns the output of a git command, or None if it fails (e.g. an unknown path)."""
+    completed = subprocess.run(
+        ["git", *args], cwd=skia_path, capture_output=True, text=True, encoding="utf-8"
+    )
+    return completed.stdout if completed.returncode == 0 else None
+
+
+def resolve_revision(skia_path, revision):
+    """Returns the commit of a revision of the checkout, or None if it is unknown."""
+    output = _git_output(skia_path, "rev-parse", "--verify", "--quiet", f"{revision}^{{commit}}")
+    return output.strip() if output else None
+
+
+def load_revision_deps(skia_path, revision):
+    """Returns the DEPS entries of a revision (none if it has no DEPS file)."""
+    content = _git_output(skia_path, "show", f"{revision}:DEPS")
+    if content is None:
+        return {}
+    return parse_deps(content, f"{revision[:12]}:DEPS")[1]
+
+
+def diff_deps(old_deps, new_deps):
+    """
+    Compares the DEPS entries of two revisions.
+
+    Returns:
+        tuple[list, list]: The entries added or changed (URL, revision or condition), and the
+            entries removed.
+    """
+    changed = sorted(dep for dep, value in new_deps.items() if old_deps.get(dep) != value)
+    removed = sorted(dep for dep in old_deps if dep not in new_deps)
+    return changed, removed
+
+
+def plan_upgrade(skia_path, old_revision, new_revision):
+    """
+    Computes what an upgrade of a checkout from `old_revision` to `new_revision` refreshes.
+
+    Returns:
+        dict: The `deps` to sync again, the `removed_deps` (left on disk), and the `tools` (setup
+            steps of `TOOL_PINS`) whose pin changed.
+    """
+    changed, removed = diff_deps(
+        load_revision_deps(skia_path, old_revision),
+        load_revision_deps(skia_path, new_revision),
+    )
+    tools = [
+        step
+        for step, path in TOOL_PINS.items()
+        if _git_output(skia_path, "rev-parse", f"{old_revision}:{path}")
+        != _git_output(skia_path, "rev-parse", f"{new_revision}:{path}")
+    ]
+    return {"deps": changed, "removed_deps": removed, "tools": tools}
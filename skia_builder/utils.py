@@ -1,17 +1,64 @@
-import json
+import asyncio
+import contextvars
 import os
-import re
 import shutil
 import signal
 import subprocess
 import sys
 import tarfile
 import threading
-from pathlib import Path
-from urllib.error import URLError
-from urllib.request import urlopen
+from contextlib import contextmanager, suppress
 
 from skia_builder.config import DEFAULT_OUTPUT_DIR, INCLUDE_DIRS, bin_extensions_by_platform
+from skia_builder.errors import CommandError
+from skia_builder.manifest import (
+    ARCHIVE_SUFFIXES,
+    MANIFEST_NAME,
+    build_manifest,
+    hash_file,
+    write_manifest,
+)
+from skia_builder.trace import describe_usage, span, traced
+
+# Longest output line `run_command_async` accepts from a child process
+PIPE_LINE_LIMIT = 1 << 20
+
+# Digests of the archived files (see `build_manifest`), reused when refreshing an output directory
+# in place while their size and mtime are unchanged
+_output_digests = {}
+
+# When set, receives every line printed by `Logger` and `run_command` instead of stdout/stderr
+# (e.g. to capture the log of a single build running in a worker thread)
+log_sink = contextvars.ContextVar("log_sink", default=None)
+
+
+def _emit(message, file=None):
+    sink = log_sink.get()
+    if sink is not None:
+        sink(message)
+    else:
+        print(message, file=file or sys.stdout, flush=True)
+
+
+@contextmanager
+def log_prefix(prefix):
+    """Prefixes every line logged in the current context with `[prefix]`."""
+    parent_sink = log_sink.get()
+
+    def sink(message):
+        message = "\n".join(
+            f"{Logger.CYAN}[{prefix}]{Logger.RESET} {line}" for line in message.split("\n")
+        )
+        if parent_sink is not None:
+            parent_sink(message)
+        else:
+            print(message, flush=True)
+
+    token = log_sink.set(sink)
+    try:
+        yield
+    finally:
+        log_sink.reset(token)
 
 
 class Logger:
@@ -38,19 +85,19 @@ class Logger:
 
     @staticmethod
     def info(message):
-        print(f"{Logger.GREEN}[INFO]{Logger.RESET} {message}", flush=True)
+        _emit(f"{Logger.GREEN}[INFO]{Logger.RESET} {message}")
 
     @staticmethod
     def warning(message):
-        print(f"{Logger.YELLOW}[WARNING]{Logger.RESET} {message}", flush=True)
+        _emit(f"{Logger.YELLOW}[WARNING]{Logger.RESET} {message}")
 
     @staticmethod
     def error(message):
-        print(f"{Logger.RED}[ERROR]{Logger.RESET} {message}", flush=True)
+        _emit(f"{Logger.RED}[ERROR]{Logger.RESET} {message}")
 
     @staticmethod
     def debug(message):
-        print(f"{Logger.BLUE}[DEBUG]{Logger.RESET} {message}", flush=True)
+        _emit(f"{Logger.BLUE}[DEBUG]{Logger.RESET} {message}")
 
     @staticmethod
     def custom(message, color, bold=False):
@@ -63,10 +110,36 @@ class Logger:
         if message.endswith("\n"):
             formatted_message += "\n"
 
-        print(formatted_message, flush=True)
+        _emit(formatted_message)
+
+
+def _log_command_result(command_list, returncode, check):
+    if returncode == 0:
+        message = f"Command succeeded: {' '.join(command_list)}\n"
+        color = Logger.GREEN
+    else:
+        message = f"Error executing command: {' '.join(command_list)}\n"
+        color = Logger.RED
+    Logger.custom(message, color, bold=True)
+
+    if returncode != 0 and check:
+        Logger.error(f"Exit code: {returncode}\n")
 
 
-def run_command(command_list, step_description, cwd=None, exit_on_error=True):
+def run_command(command_list, step_description, cwd=None, check=True, env=None):
+    """
+    Runs a command, streaming its output.
+
+    Args:
+        env (dict): Optional environment variables set for the command, on top of the current
+            environment.
+
+    Raises:
+        CommandError: If the command fails and `check` is True.
+
+    Returns:
+        int: The exit code of the command.
+    """
     Logger.custom(f"\n--- Running step: {step_description} ---", Logger.BRIGHT_YELLOW)
 
     process = None
@@ -78,64 +151,182 @@ def run_command(command_list, step_description, cwd=None, exit_on_error=True):
         if process:
             process.terminate()
 
-    signal.signal(signal.SIGTERM, handle_sigterm)
+    # Signal handlers can only be installed from the main thread
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, handle_sigterm)
 
-    try:
-        process = subprocess.Popen(
-            command_list,
-            cwd=cwd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-        )
+    with span(step_description, "command", command=" ".join(command_list)):
+        try:
+            process = subprocess.Popen(
+                command_list,
+                cwd=cwd,
+                env={**os.environ, **env} if env else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            )
+
+            def print_output(pipe, log_function):
+                for line in iter(pipe.readline, ""):
+                    if stop_event.is_set():
+                        break
+                    log_function(line.strip())
 
-        def print_output(pipe, log_function):
-            for line in iter(pipe.readline, ""):
+            # Each reader thread runs in a copy of the current context so that it honors `log_sink`
+            stdout_thread = threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(print_output, process.stdout, _emit),
+            )
+            stderr_thread = threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(print_output, process.stderr, lambda line: _emit(line, sys.stderr)),
+            )
+
+            stdout_thread.start()
+            stderr_thread.start()
+
+            while stdout_thread.is_alive() or stderr_thread.is_alive():
+                stdout_thread.join(timeout=0.1)
+                stderr_thread.join(timeout=0.1)
                 if stop_event.is_set():
                     break
-                log_function(line.strip())
 
-        stdout_thread = threading.Thread(target=print_output, args=(process.stdout, print))
-        stderr_thread = threading.Thread(
-            target=print_output,
-            args=(process.stderr, lambda line: print(line, file=sys.stderr)),
-        )
+            process.stdout.close()
+            process.stderr.close()
 
-        stdout_thread.start()
-        stderr_thread.start()
+            if not stop_event.is_set():
+                returncode = process.wait()
+        except Exception as e:
+            Logger.error(f"Failed to start process: {e}")
+            returncode = 1
+        finally:
+            if process and process.poll() is None:
+                process.kill()
+                process.wait()
+
+    _log_command_result(command_list, returncode, check)
+
+    if returncode != 0 and check:
+        raise CommandError(command_list, returncode, step_description)
 
-        while stdout_thread.is_alive() or stderr_thread.is_alive():
-            stdout_thread.join(timeout=0.1)
-            stderr_thread.join(timeout=0.1)
-            if stop_event.is_set():
-                break
+    return returncode
 
-        process.stdout.close()
-        process.stderr.close()
 
-        if not stop_event.is_set():
-            returncode = process.wait()
-    except Exception as e:
-        Logger.error(f"Failed to start process: {e}")
-        returncode = 1
+async def _run(command_list, cwd, env, print_output):
+    process = await asyncio.create_subprocess_exec(
+        *command_list,
+        cwd=cwd,
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=PIPE_LINE_LIMIT,
+    )
+    try:
+        await asyncio.gather(
+            print_output(process.stdout, _emit, is_stdout=True),
+            print_output(process.stderr, lambda line: _emit(line, sys.stderr)),
+        )
+        return await process.wait()
     finally:
-        if process and process.poll() is None:
+        if process.returncode is None:
             process.kill()
-            process.wait()
+            await process.wait()
 
-    if returncode == 0:
-        message = f"Command succeeded: {' '.join(command_list)}\n"
-        color = Logger.GREEN
-    else:
-        message = f"Error executing command: {' '.join(command_list)}\n"
-        color = Logger.RED
-    Logger.custom(message, color, bold=True)
 
-    if returncode != 0 and exit_on_error:
-        Logger.error(f"Exit code: {returncode}\n")
-        sys.exit(returncode)
+def _wait_with_usage(pid):
+    _, status, usage = os.wait4(pid, 0)
+    return os.waitstatus_to_exitcode(status), describe_usage(usage)
+
+
+async def _run_with_usage(command_list, cwd, env, print_output):
+    """
+    Runs a command like `run_command_async`, reaping it with `os.wait4` to get the resource usage
+    of the command and of the descendants it waited for (e.g. the compilers ninja ran).
+
+    Returns:
+        tuple[int, dict]: The exit code, and the usage (see `describe_usage`).
+    """
+    loop = asyncio.get_running_loop()
+    process = subprocess.Popen(
+        command_list, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    waiter = loop.run_in_executor(None, _wait_with_usage, process.pid)
+    transports = []
+    try:
+        streams = []
+        for pipe in (process.stdout, process.stderr):
+            stream = asyncio.StreamReader(limit=PIPE_LINE_LIMIT)
+            transport, _ = await loop.connect_read_pipe(
+                lambda stream=stream: asyncio.StreamReaderProtocol(stream), pipe
+            )
+            transports.append(transport)
+            streams.append(stream)
+        await asyncio.gather(
+            print_output(streams[0], _emit, is_stdout=True),
+            print_output(streams[1], lambda line: _emit(line, sys.stderr)),
+        )
+        await asyncio.shield(waiter)
+    finally:
+        for transport in transports:
+            transport.close()
+        if not waiter.done():
+            # Not `process.kill()`, which may reap the process before `os.wait4` does
+            with suppress(ProcessLookupError):
+                os.kill(process.pid, signal.SIGKILL)
+        # Reaped by `os.wait4`, `Popen` must not wait for it again
+        process.returncode, usage = await waiter
+    return process.returncode, usage
+
+
+async def run_command_async(
+    command_list, step_description, cwd=None, check=True, on_line=None, env=None, on_usage=None
+):
+    """
+    Asynchronous counterpart of `run_command`, so that many commands can run concurrently from a
+    single event loop. The child process is killed if the calling task is cancelled.
+
+    Args:
+        env (dict): Optional environment variables set for the command, on top of the current
+            environment.
+        on_line (Callable[[str], None]): Optional callback receiving every stdout line, in addition
+            to it being logged.
+        on_usage (Callable[[dict], None]): Optional callback receiving the CPU time (`cpu`) and
+            peak RSS (`maxrss_kib`) of the command and of the descendants it waited for, once it
+            exited. Not called where they aren't available (Windows).
+
+    Raises:
+        CommandError: If the command fails and `check` is True.
+
+    Returns:
+        int: The exit code of the command.
+    """
+    Logger.custom(f"\n--- Running step: {step_description} ---", Logger.BRIGHT_YELLOW)
+
+    async def print_output(stream, log_function, is_stdout=False):
+        while line := await stream.readline():
+            line = line.decode("utf-8", errors="replace").strip()
+            log_function(line)
+            if on_line and is_stdout:
+                on_line(line)
+
+    env = {**os.environ, **env} if env else None
+    with span(step_description, "command", command=" ".join(command_list)):
+        try:
+            if on_usage is not None and hasattr(os, "wait4"):
+                returncode, usage = await _run_with_usage(command_list, cwd, env, print_output)
+                on_usage(usage)
+            else:
+                returncode = await _run(command_list, cwd, env, print_output)
+        except OSError as e:
+            Logger.error(f"Failed to start process: {e}")
+            returncode = 1
+
+    _log_command_result(command_list, returncode, check)
+
+    if returncode != 0 and check:
+        raise CommandError(command_list, returncode, step_description)
 
     return returncode
 
@@ -159,6 +350,7 @@ def _ensure_output_dir(output_dir):
     return output_dir
 
 
+@traced("store_skia_license")
 def store_skia_license(skia_dir, output_dir=None):
     output_dir = _ensure_output_dir(output_dir)
 
@@ -172,21 +364,102 @@ def store_skia_license(skia_dir, output_dir=None):
         Logger.error(f"LICENSE file not found at {src_license}")
 
 
-def store_includes(skia_dir, output_dir=None):
+def _sync_tree(src_dir, dest_dir):
+    """
+    Makes `dest_dir` a copy of `src_dir`, only copying the files whose size or mtime differ and
+    removing the ones that no longer exist.
+
+    Returns:
+        int: The number of files copied or removed.
+    """
+    changes = 0
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        rel_dir = os.path.relpath(dirpath, src_dir)
+        dest_dirpath = os.path.normpath(os.path.join(dest_dir, rel_dir))
+        os.makedirs(dest_dirpath, exist_ok=True)
+
+        # Remove what was deleted from the source since the last copy
+        for name in os.listdir(dest_dirpath):
+            if name not in dirnames and name not in filenames:
+                dest_path = os.path.join(dest_dirpath, name)
+                if os.path.isdir(dest_path) and not os.path.islink(dest_path):
+                    shutil.rmtree(dest_path)
+                else:
+                    os.remove(dest_path)
+                changes += 1
+
+        for name in filenames:
+            src_path = os.path.join(dirpath, name)
+            dest_path = os.path.join(dest_dirpath, name)
+            src_stat = os.stat(src_path)
+            try:
+                dest_stat = os.stat(dest_path)
+            except FileNotFoundError:
+                dest_stat = None
+            if dest_stat is not None and (dest_stat.st_size, dest_stat.st_mtime_ns) == (
+                src_stat.st_size,
+                src_stat.st_mtime_ns,
+            ):
+                continue
+            shutil.copy2(src_path, dest_path)
+            changes += 1
+    return changes
+
+
+@traced("store_includes")
+def store_includes(skia_dir, output_dir=None, incremental=False):
+    """
+    Copies the headers and sources of Skia to `output_dir`.
+
+    Args:
+        incremental (bool): Whether a previous copy is refreshed in place, copying only the files
+            that changed.
+
+    Returns:
+        int: The number of files copied or removed.
+    """
     output_dir = _ensure_output_dir(output_dir)
 
+    changes = 0
     for folder in INCLUDE_DIRS:
         src_folder = os.path.join(skia_dir, folder)
         dest_folder = os.path.join(output_dir, folder)
 
-        if os.path.exists(src_folder):
+        if not os.path.exists(src_folder):
+            Logger.error(f"{src_folder} does not exist.")
+        elif incremental and os.path.isdir(dest_folder):
+            folder_changes = _sync_tree(src_folder, dest_folder)
+            if folder_changes:
+                Logger.info(f"Refreshed {folder_changes} files in {dest_folder}")
+            changes += folder_changes
+        else:
             shutil.copytree(src_folder, dest_folder)
             Logger.info(f"Copied {src_folder} to {dest_folder}")
-        else:
-            Logger.error(f"{src_folder} does not exist.")
-
-
-def archive_build_output(build_input_src, target_platform, output_dir=None):
+            changes += 1
+    return changes
+
+
+@traced("archive_build_output")
+def archive_build_output(
+    build_input_src,
+    target_platform,
+    output_dir=None,
+    metadata=None,
+    prepare_libraries=None,
+    incremental=False,
+):
+    """
+    Copies the built libraries to `output_dir` and archives it, along with a manifest.
+
+    Args:
+        metadata (dict): Optional description of the build (e.g. target, profile and build
+            arguments), recorded as `build` in the manifests.
+        prepare_libraries (Callable[[list[str]], None]): Optional callback receiving the paths of
+            the copied libraries before they are hashed and archived (e.g. to strip them).
+        incremental (bool): Whether a previous output is refreshed in place: only the libraries
+            rebuilt since they were copied are copied again, and the files that didn't change
+            aren't hashed again.
+    """
     output_dir = _ensure_output_dir(output_dir)
 
     if not os.path.exists(build_input_src):
@@ -206,129 +479,52 @@ def archive_build_output(build_input_src, target_platform, output_dir=None):
     )
 
     # Copy each matching file to the output_bin_dir
+    copied_files = []
     for file_path in matching_files:
+        dest_path = os.path.join(output_bin_dir, os.path.basename(file_path))
+        # Copies are newer than their source, even once prepared (which changes their size)
+        if incremental and os.path.exists(dest_path):
+            if os.stat(dest_path).st_mtime_ns >= os.stat(file_path).st_mtime_ns:
+                continue
         shutil.copy(file_path, output_bin_dir)
+        copied_files.append(dest_path)
         Logger.info(f"Copied {file_path} to {output_bin_dir}")
+    if prepare_libraries and copied_files:
+        prepare_libraries(copied_files)
+
+    archive_name = os.path.basename(build_input_src)
+    tar_path = os.path.join(output_dir, f"{archive_name}.tar.gz")
+    sidecar_manifest_path = os.path.join(output_dir, f"{archive_name}.manifest.json")
+
+    # Archives and manifests next to the payload (e.g. of a previous refresh) are not part of it
+    excluded = {
+        os.path.basename(tar_path),
+        os.path.basename(sidecar_manifest_path),
+        *(name for name in os.listdir(output_dir) if name.endswith(ARCHIVE_SUFFIXES)),
+    }
+    manifest = build_manifest(
+        output_dir, exclude=excluded, digest_cache=_output_digests if incremental else None
+    )
+    if metadata:
+        manifest["build"] = metadata
+    write_manifest(manifest, os.path.join(output_dir, MANIFEST_NAME))
+    Logger.info(f"Generated manifest for {len(manifest['files'])} files")
 
-    tar_path = os.path.join(output_dir, f"{os.path.basename(build_input_src)}.tar.gz")
     with tarfile.open(tar_path, "w:gz") as tar:
-        for name in os.listdir(output_dir):
+        # The manifest goes first so that streaming consumers see it before the payload
+        tar.add(os.path.join(output_dir, MANIFEST_NAME), arcname=MANIFEST_NAME)
+        for name in sorted(os.listdir(output_dir)):
+            if name == MANIFEST_NAME or name in excluded:
+                continue
             full_path = os.path.join(output_dir, name)
             tar.add(full_path, arcname=name)
 
-    Logger.info(f"Build output archived to {tar_path}")
-
-
-def check_update_skia_version():
-    chromium_url = (
-        "https://chromiumdash.appspot.com/fetch_releases?channel=Stable&platform=Windows&num=1"
-    )
-    release_notes_url = "https://raw.githubusercontent.com/google/skia/main/RELEASE_NOTES.md"
-    versions_file = "versions.py"
-    readme_file = "README.md"
-
-    # Fetch Chromium dash data and extract the milestone
-    try:
-        with urlopen(chromium_url) as response:
-            if response.status != 200:
-                raise URLError(f"HTTP Status {response.status}")
-            data = json.load(response)
-    except URLError as e:
-        Logger.error(f"Failed to fetch Chromium release data from {chromium_url}. Error: {e}")
-        sys.exit(1)
-
-    try:
-        milestone = data[0]["milestone"]
-    except (IndexError, KeyError):
-        Logger.error("Unexpected format when extracting the milestone from the fetched data.")
-        sys.exit(1)
+    manifest["archive"] = {
+        "name": os.path.basename(tar_path),
+        "size": os.path.getsize(tar_path),
+        "sha256": hash_file(tar_path),
+    }
+    write_manifest(manifest, sidecar_manifest_path)
 
-    # Fetch Skia release notes
-    try:
-        with urlopen(release_notes_url) as response:
-            if response.status != 200:
-                raise URLError(f"HTTP Status {response.status}")
-            release_notes = response.read().decode("utf-8")
-    except URLError as e:
-        Logger.error(f"Failed to fetch Skia release notes from {release_notes_url}. Error: {e}")
-        sys.exit(1)
-
-    milestone_pattern = f"Milestone {milestone}"
-    if milestone_pattern not in release_notes:
-        Logger.info(
-            f"No new stable Skia milestone found (expected {milestone}). "
-            "Skia update is not required."
-        )
-        sys.exit(0)
-
-    Logger.info(
-        f"Found new Skia stable milestone {milestone}. "
-        f"Proceeding with updates to {versions_file} and {readme_file}."
-    )
-
-    versions_file_path = Path(__file__).parent / versions_file
-    readme_file_path = Path(__file__).parent.parent / readme_file
-
-    if not versions_file_path.exists():
-        Logger.error(f"{versions_file} not found in the expected location. Update cannot proceed.")
-        sys.exit(1)
-
-    try:
-        versions_content = versions_file_path.read_text(encoding="utf-8")
-    except Exception as e:
-        Logger.error(f"Error reading {versions_file}: {e}. Unable to proceed with version update.")
-        sys.exit(1)
-
-    # Updating version in versions.py
-    new_versions_content, _ = re.subn(
-        r'SKIA_VERSION = "m\d+"', f'SKIA_VERSION = "m{milestone}"', versions_content
-    )
-
-    if versions_content == new_versions_content:
-        Logger.warning(f"No SKIA_VERSION entry found in {versions_file} to update.")
-    else:
-        try:
-            versions_file_path.write_text(new_versions_content, encoding="utf-8")
-            Logger.info(
-                f"Successfully updated {versions_file}: Set SKIA_VERSION to 'm{milestone}'."
-            )
-        except Exception as e:
-            Logger.error(
-                f"Error writing to {versions_file}: {e}. Update of {versions_file} failed."
-            )
-            sys.exit(1)
-
-    # Updating README.md
-    try:
-        readme_content = readme_file_path.read_text(encoding="utf-8")
-    except Exception as e:
-        Logger.error(f"Error reading {readme_file}: {e}. Unable to proceed with README update.")
-        sys.exit(1)
-
-    # Replacing version in the badge
-    new_readme_content, _ = re.subn(
-        r"!\[SKIA_VERSION\]\(https://img.shields.io/badge/Skia_version-m\d+-blue\?style=flat-square\)",
-        f"![SKIA_VERSION](https://img.shields.io/badge/Skia_version-m{milestone}-blue?style=flat-square)",
-        readme_content,
-    )
-
-    if readme_content == new_readme_content:
-        Logger.warning(f"No SKIA_VERSION badge found in {readme_file} to update.")
-    else:
-        try:
-            readme_file_path.write_text(new_readme_content, encoding="utf-8")
-            Logger.info(
-                f"Successfully updated {readme_file}: Updated SKIA_VERSION badge to 'm{milestone}'."
-            )
-        except Exception as e:
-            Logger.error(f"Error writing to {readme_file}: {e}. Update of {readme_file} failed.")
-            sys.exit(1)
-
-    # NOTE: In GitHub Actions, this code appends NEW_SKIA_VERSION to the env file for later steps.
-    github_env_file = os.getenv("GITHUB_ENV")
-    if github_env_file:
-        with open(github_env_file, "a") as env_file:
-            if versions_content != new_versions_content and readme_content != new_readme_content:
-                env_file.write(f"NEW_SKIA_VERSION=m{milestone}\n")
-            else:
-                env_file.write("NEW_SKIA_VERSION=''\n")
+    Logger.info(f"Build output archived to {tar_path}")
+    Logger.info(f"Archive manifest written to {sidecar_manifest_path}")
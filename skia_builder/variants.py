@@ -0,0 +1,143 @@
+"""
+Packaging of x86-64 microarchitecture level variants of a build target.
+
+The archives of the baseline build and of its `v2`/`v3`/`v4` variants are gathered in
+`output/<target>-variants/`, along with a `VARIANTS.json` manifest describing the CPU features
+each one requires, so that the best variant for a machine can be picked when installing.
+"""
+
+import json
+import os
+import shutil
+
+from skia_builder.config import get_x86_64_level_features
+from skia_builder.cpu import get_cpu_features
+from skia_builder.errors import VariantsError
+from skia_builder.manifest import hash_file
+from skia_builder.utils import Logger
+
+VARIANTS_MANIFEST = "VARIANTS.json"
+VARIANTS_MANIFEST_VERSION = 1
+
+
+def _link_or_copy(source, destination):
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def package_variants(results):
+    """
+    Gathers the archives of a baseline build and its x86-64 level variants.
+
+    Args:
+        results (list[BuildResult]): Archived builds of the same target, including the baseline.
+
+    Returns:
+        str: Path of the written `VARIANTS.json`.
+    """
+    baseline = next(result for result in results if result.x86_64_level is None)
+    baseline_name = os.path.basename(baseline.output_dir)
+    package_dir = os.path.join(os.path.dirname(baseline.output_dir), f"{baseline_name}-variants")
+    os.makedirs(package_dir, exist_ok=True)
+
+    variants = []
+    for result in sorted(results, key=lambda result: result.x86_64_level or ""):
+        for path in (result.archive, result.manifest, result.debug_archive):
+            if path:
+                _link_or_copy(path, os.path.join(package_dir, os.path.basename(path)))
+
+        variants.append(
+            {
+                "name": os.path.basename(result.output_dir),
+                "x86_64_level": result.x86_64_level,
+                "features": (
+                    get_x86_64_level_features(result.x86_64_level) if result.x86_64_level else []
+                ),
+                "archive": os.path.basename(result.archive),
+                "manifest": os.path.basename(result.manifest),
+                "debug_archive": (
+                    os.path.basename(result.debug_archive) if result.debug_archive else None
+                ),
+                "size": os.path.getsize(result.archive),
+                "sha256": hash_file(result.archive),
+            }
+        )
+
+    manifest_path = os.path.join(package_dir, VARIANTS_MANIFEST)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"version": VARIANTS_MANIFEST_VERSION, "target": baseline.target, "variants": variants},
+            f,
+            indent=2,
+        )
+    Logger.info(f"Packaged {len(variants)} variants of {baseline.target} in {package_dir}")
+    return manifest_path
+
+
+def _check_manifest(manifest):
+    """
+    Raises:
+        VariantsError: If `manifest` is not a `VARIANTS.json` of this version.
+    """
+    if not isinstance(manifest, dict):
+        raise VariantsError("Malformed variants manifest: not a JSON object")
+    if manifest.get("version") != VARIANTS_MANIFEST_VERSION:
+        raise VariantsError(f"Unsupported variants manifest version: {manifest.get('version')}")
+    variants = manifest.get("variants")
+    if not isinstance(manifest.get("target"), str) or not isinstance(variants, list):
+        raise VariantsError("Malformed variants manifest: missing its target or variants")
+    for variant in variants:
+        if (
+            not isinstance(variant, dict)
+            or not all(isinstance(variant.get(key), str) for key in ("name", "archive", "manifest"))
+            or not isinstance(variant.get("features"), list)
+            or "x86_64_level" not in variant
+        ):
+            raise VariantsError(
+                f"Malformed variants manifest of {manifest['target']}: invalid variant {variant}"
+            )
+
+
+def load_variants_manifest(path):
+    """
+    Loads a `VARIANTS.json`, given its path or the directory containing it.
+
+    Raises:
+        VariantsError: If the manifest is malformed or of another version.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, VARIANTS_MANIFEST)
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    _check_manifest(manifest)
+    return manifest
+
+
+def pick_variant(manifest, features=None):
+    """
+    Picks the variant of a `VARIANTS.json` best suited to a CPU: the one requiring the most
+    features, all of which the CPU supports.
+
+    Args:
+        manifest (dict): The loaded variants manifest.
+        features (set): CPU feature flags. Defaults to the ones of the current CPU.
+
+    Raises:
+        VariantsError: If the manifest is malformed, or no variant is supported by the CPU.
+
+    Returns:
+        dict: The entry of the picked variant.
+    """
+    _check_manifest(manifest)
+    if features is None:
+        features = get_cpu_features()
+    supported = [
+        variant for variant in manifest["variants"] if set(variant["features"]) <= features
+    ]
+    if not supported:
+        raise VariantsError(f"No variant of {manifest['target']} is supported by this CPU")
+    return max(supported, key=lambda variant: len(variant["features"]))
@@ -1,2 +1,12 @@
 ANDROID_NDK = "android-ndk-r27c"
+# SHA-256 checksums of the NDK archives published at https://dl.google.com/android/repository/,
+# keyed by host, pinned by the scheduled updater after checking the archives against their published
+# SHA-1 (`pin_ndk_checksums`). Unpinned (None) archives are still cached, but not verified.
+ANDROID_NDK_SHA256 = {
+    "windows": None,
+    "linux": None,
+}
 SKIA_VERSION = "m141"
+# Commit of the chrome/<SKIA_VERSION> branch the build is pinned to, moved to the branch head by the
+# scheduled updater as fixes land on the branch (None tracks the branch head until it is pinned)
+SKIA_COMMIT = None
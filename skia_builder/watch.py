@@ -0,0 +1,294 @@
+"""
+Watch mode of `skia-builder build --watch`: rebuilds and refreshes the output of a build whenever
+the Skia sources change.
+
+Changes are detected with inotify on Linux (through ctypes, without third-party dependencies) and
+by polling file mtimes on other hosts. Bursts of changes (e.g. a rebase or a "save all") are
+debounced into a single rebuild, which only runs ninja since the GN arguments are unchanged, and
+refreshes `output/<build>` in place.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from skia_builder.config import WATCH_DEBOUNCE, WATCH_DIRS, WATCH_IGNORED
+from skia_builder.utils import Logger
+
+# Interval between two scans of `PollingWatcher`, in seconds
+POLL_INTERVAL = 1.0
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# Reported in place of the changed paths when the kernel queue overflowed
+OVERFLOW = "*"
+
+
+def _is_ignored(name):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in WATCH_IGNORED)
+
+
+def _iter_watched_dirs(root, dirs):
+    for top_name in dirs:
+        top = os.path.join(root, top_name)
+        for dirpath, dirnames, _ in os.walk(top):
+            dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            yield dirpath
+
+
+class InotifyWatcher:
+    """Reports the files changed below directories of a tree, using inotify."""
+
+    def __init__(self, root, dirs):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self._paths = {}  # watch descriptor -> directory
+        # Watch descriptors of the directories whose new subdirectories are watched too
+        self._recursive = set()
+
+        # Top-level files (e.g. BUILD.gn) are watched, not the other top-level directories
+        self._add_watch(root, recursive=False)
+        for dirpath in _iter_watched_dirs(root, dirs):
+            self._add_watch(dirpath)
+
+        # Written to by `stop()` to wake up a `read_changes()` waiting in another thread
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._stopped = threading.Event()
+
+    def _add_watch(self, path, recursive=True):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), INOTIFY_MASK | IN_ONLYDIR)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise OSError(
+                    error, "Too many directories to watch, raise fs.inotify.max_user_watches"
+                )
+            # The directory may already be gone again
+            return
+        self._paths[wd] = path
+        if recursive:
+            self._recursive.add(wd)
+
+    def _add_tree(self, path, changes):
+        """Watches a new directory, reporting the files created in it before it was watched."""
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            self._add_watch(dirpath)
+            changes.update(
+                os.path.join(dirpath, name) for name in filenames if not _is_ignored(name)
+            )
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def read_changes(self, timeout=None):
+        """
+        Waits up to `timeout` seconds (indefinitely if None) for changes, or until stopped.
+
+        Returns:
+            set[str]: Paths of the changed files, or `{OVERFLOW}` if events were lost.
+        """
+        ready, _, _ = select.select([self._fd, self._wakeup_read], [], [], timeout)
+        if self.stopped or self._fd not in ready:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changes = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_size = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset : offset + name_size].rstrip(b"\0").decode("utf-8", "replace")
+            offset += name_size
+
+            if mask & IN_Q_OVERFLOW:
+                return {OVERFLOW}
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                self._recursive.discard(wd)
+                continue
+            directory = self._paths.get(wd)
+            if directory is None or not name or _is_ignored(name):
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if wd in self._recursive and not name.startswith("."):
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._add_tree(path, changes)
+                    else:
+                        changes.add(path)
+                continue
+            if mask & IN_CREATE:
+                # Reported again once written and closed
+                continue
+            changes.add(path)
+        return changes
+
+    def stop(self):
+        """Makes `read_changes()` return at once, now and from then on."""
+        self._stopped.set()
+        os.write(self._wakeup_write, b"\0")
+
+    def close(self):
+        for fd in (self._fd, self._wakeup_read, self._wakeup_write):
+            os.close(fd)
+
+
+class PollingWatcher:
+    """Reports the files changed below directories of a tree, by comparing their mtimes."""
+
+    def __init__(self, root, dirs):
+        self.root = root
+        self._dirs = dirs
+        self._state = self._scan()
+        self._stopped = threading.Event()
+
+    def _scan(self):
+        state = {}
+        for dirpath in [self.root, *_iter_watched_dirs(self.root, self._dirs)]:
+            try:
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and not _is_ignored(entry.name):
+                    try:
+                        state[entry.path] = entry.stat(follow_symlinks=False).st_mtime_ns
+                    except OSError:
+                        pass
+        return state
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def read_changes(self, timeout=None):
+        if self._stopped.wait(POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)):
+            return set()
+        state = self._scan()
+        changes = {
+            path
+            for path in state.keys() | self._state.keys()
+            if state.get(path) != self._state.get(path)
+        }
+        self._state = state
+        return changes
+
+    def stop(self):
+        self._stopped.set()
+
+    def close(self):
+        pass
+
+
+def create_watcher(root, dirs=None):
+    """Returns an `InotifyWatcher` of `root` on Linux, else a `PollingWatcher`."""
+    dirs = WATCH_DIRS if dirs is None else dirs
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root, dirs)
+        except (AttributeError, OSError) as e:
+            Logger.warning(f"inotify is not available ({e}), polling for changes instead.")
+    return PollingWatcher(root, dirs)
+
+
+def wait_for_changes(watcher, debounce=WATCH_DEBOUNCE):
+    """
+    Blocks until files change, then until no change happened for `debounce` seconds. The wait
+    ends early once `watcher.stop()` is called (e.g. from another thread).
+
+    Returns:
+        list[str]: Paths of the changed files relative to the watched root, or `[OVERFLOW]` if
+            changes were lost. Empty if the wait was stopped.
+    """
+    changes = set()
+    while not changes:
+        if watcher.stopped:
+            return []
+        changes = watcher.read_changes()
+    while new_changes := watcher.read_changes(timeout=debounce):
+        changes |= new_changes
+    if watcher.stopped:
+        return []
+    if OVERFLOW in changes:
+        return [OVERFLOW]
+    return sorted(os.path.relpath(path, watcher.root) for path in changes)
+
+
+def _describe_changes(changes, limit=5):
+    if changes == [OVERFLOW]:
+        return "Too many changes to list"
+    listed = ", ".join(changes[:limit])
+    more = f" and {len(changes) - limit} more" if len(changes) > limit else ""
+    return f"{len(changes)} files changed: {listed}{more}"
+
+
+async def watch_builds(builder, builds, skia_path, on_results=None, debounce=WATCH_DEBOUNCE):
+    """
+    Rebuilds builds whenever the Skia checkout they are built from changes, until cancelled.
+
+    The builds are expected to have run once already: they are only rebuilt incrementally
+    (`incremental=True`), refreshing their output in place.
+
+    Args:
+        builder (SkiaBuilder): Builder running the builds.
+        builds (list[dict]): `SkiaBuilder.build()` keyword arguments of each build.
+        skia_path (str): Skia checkout the builds are made from.
+        on_results (Callable[[list[BuildResult]], None]): Optional callback receiving the
+            results of the successful builds of each rebuild.
+        debounce (float): Seconds without changes after which a burst of changes is rebuilt.
+    """
+    watcher = await asyncio.to_thread(create_watcher, skia_path)
+    # Waits in a thread of its own, joined before the watcher is closed
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="watch")
+    try:
+        while True:
+            Logger.info(f"Watching {skia_path} for changes (press Ctrl+C to stop)...")
+            changes = await asyncio.wrap_future(
+                executor.submit(wait_for_changes, watcher, debounce)
+            )
+            Logger.info(_describe_changes(changes))
+
+            started = time.monotonic()
+            results = await builder.build_many(
+                [{**spec, "incremental": True} for spec in builds], return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    Logger.error(f"Rebuild failed: {result}")
+            if on_results:
+                on_results([result for result in results if not isinstance(result, Exception)])
+            Logger.info(f"Rebuilt in {time.monotonic() - started:.1f}s")
+    finally:
+        # Wakes the waiting thread up at once, e.g. when the watch is cancelled by Ctrl+C
+        watcher.stop()
+        executor.shutdown(wait=True)
+        watcher.close()
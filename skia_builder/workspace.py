@@ -0,0 +1,99 @@
+"""
+Locations of the Skia checkouts of a workspace.
+
+The milestone pinned in `versions.py` lives in `./skia`, which also owns the git object store.
+Other milestones are git worktrees of it under `./skia-worktrees/<milestone>`, each with its own
+synced dependencies and `out/` dirs, so that several milestones can be set up and built side by
+side while only storing the objects that differ. Their outputs go to `output/<milestone>/`.
+
+Checkouts that don't track a milestone (e.g. the one `bisect` moves between commits) are named
+worktrees selected with `use_skia_checkout`, outputting to `output/<name>/`.
+"""
+
+import contextvars
+import os
+import re
+from contextlib import contextmanager
+
+from skia_builder.versions import SKIA_VERSION
+
+SKIA_DIR = "skia"
+WORKTREES_DIR = "skia-worktrees"
+
+# Milestone used by the setup and build steps of the current context (None is `SKIA_VERSION`)
+skia_version = contextvars.ContextVar("skia_version", default=None)
+# Named worktree used instead of the checkout of the milestone (None is the milestone checkout)
+skia_checkout = contextvars.ContextVar("skia_checkout", default=None)
+
+
+def parse_skia_version(value):
+    """
+    Validates a milestone name such as `m142`.
+
+    Raises:
+        ValueError: If `value` is not a milestone name.
+    """
+    if not re.fullmatch(r"m\d+", value or ""):
+        raise ValueError(f"Invalid Skia version: {value!r} (expected a milestone such as m142)")
+    return value
+
+
+@contextmanager
+def use_skia_version(version):
+    """
+    Selects the milestone checkout used by the enclosed setup and build steps. With no
+    `version`, the current selection is kept.
+    """
+    token = skia_version.set(parse_skia_version(version) if version else skia_version.get())
+    try:
+        yield
+    finally:
+        skia_version.reset(token)
+
+
+@contextmanager
+def use_skia_checkout(name):
+    """
+    Selects a named worktree of `./skia-worktrees` as the checkout used by the enclosed setup and
+    build steps, in place of the one of the selected milestone.
+    """
+    token = skia_checkout.set(name)
+    try:
+        yield
+    finally:
+        skia_checkout.reset(token)
+
+
+def get_skia_version():
+    return skia_version.get() or SKIA_VERSION
+
+
+def is_default_version(version=None):
+    return (version or get_skia_version()) == SKIA_VERSION
+
+
+def get_skia_dir(version=None):
+    """
+    Returns the checkout directory of a milestone, or of the selected named checkout if no
+    milestone is given, relative to the workspace.
+    """
+    if version is None and (checkout := skia_checkout.get()):
+        return os.path.join(WORKTREES_DIR, checkout)
+    version = version or get_skia_version()
+    if is_default_version(version):
+        return SKIA_DIR
+    return os.path.join(WORKTREES_DIR, version)
+
+
+def get_skia_path(version=None):
+    return os.path.join(os.getcwd(), get_skia_dir(version))
+
+
+def get_output_dir(build_target, version=None):
+    """Returns the output directory of a build target, relative to the workspace."""
+    if version is None and (checkout := skia_checkout.get()):
+        return os.path.join("output", checkout, build_target)
+    version = version or get_skia_version()
+    if is_default_version(version):
+        return os.path.join("output", build_target)
+    return os.path.join("output", version, build_target)
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# The cache settings are read from the environment when skia_builder is imported: keep the caches,
+# usage index and build history the tests write out of the working tree
+if "skia_builder.config" in sys.modules and "SKIA_BUILDER_CACHE_DIR" not in os.environ:
+    # e.g. `unittest discover` from the repository root, which imports skia_builder first
+    raise ImportError(
+        "skia_builder was imported before the tests, its caches would be written to the working "
+        "tree. Run `python -m unittest discover -s tests -t .`, or set SKIA_BUILDER_CACHE_DIR."
+    )
+os.environ.setdefault("SKIA_BUILDER_CACHE_DIR", tempfile.mkdtemp(prefix="skia-builder-tests-"))
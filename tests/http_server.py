@@ -0,0 +1,103 @@
+import hashlib
+import re
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FileServer:
+    """
+    HTTP server of in-memory files on 127.0.0.1, answering HEAD, range (and If-Range) and
+    conditional (ETag) requests like a CDN would. Every request is recorded in `requests`, as
+    (method, path, headers).
+    """
+
+    LAST_MODIFIED = formatdate(0, usegmt=True)
+
+    def __init__(self, files=None, ranges=True):
+        self.files = dict(files or {})
+        self.ranges = ranges
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def url(self, path=""):
+        return f"http://127.0.0.1:{self._server.server_port}/{path.lstrip('/')}"
+
+    def requests_to(self, path, method="GET"):
+        with self._lock:
+            return [headers for m, p, headers in self.requests if m == method and p == path]
+
+    @staticmethod
+    def etag(content):
+        return f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _serve(self, send_body):
+                path = self.path.lstrip("/")
+                with server._lock:
+                    server.requests.append((self.command, path, dict(self.headers)))
+                content = server.files.get(path)
+                if content is None:
+                    self.send_error(404)
+                    return
+
+                etag = server.etag(content)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                status, body = 200, content
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                # A range of content that changed since `If-Range` is answered with all of it
+                if_range = self.headers.get("If-Range")
+                if if_range is not None and if_range not in (etag, server.LAST_MODIFIED):
+                    match = None
+                if match and server.ranges:
+                    start = int(match.group(1))
+                    end = int(match.group(2)) if match.group(2) else len(content) - 1
+                    if start >= len(content):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(content)}")
+                        self.end_headers()
+                        return
+                    status, body = 206, content[start : end + 1]
+
+                self.send_response(status)
+                if status == 206:
+                    self.send_header(
+                        "Content-Range", f"bytes {start}-{start + len(body) - 1}/{len(content)}"
+                    )
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", server.LAST_MODIFIED)
+                if server.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+        return Handler
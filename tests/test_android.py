@@ -0,0 +1,61 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from skia_builder.platforms import android
+from skia_builder.platforms.android import AndroidPlatformManager
+from skia_builder.versions import ANDROID_NDK
+from tests.test_extract import make_zip
+
+
+class InstallNdkTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.ndk_dir = os.path.join(os.path.realpath(temp_dir.name), "android-ndk")
+        self.ndk_path = os.path.join(self.ndk_dir, ANDROID_NDK)
+        self.enterContext(mock.patch.object(android, "ANDROID_NDK_DIR", self.ndk_dir))
+
+        self.zip_path = os.path.join(temp_dir.name, "ndk.zip")
+        make_zip(
+            self.zip_path,
+            [
+                (f"{ANDROID_NDK}/source.properties", b"Pkg.Revision = 27.2", stat.S_IFREG | 0o644),
+                (f"{ANDROID_NDK}/ndk-build", b"#!/bin/sh", stat.S_IFREG | 0o755),
+            ],
+        )
+
+        def download(url, destination, *args, **kwargs):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copy(self.zip_path, destination)
+
+        self.enterContext(mock.patch.object(android, "download", download))
+
+    def test_installs_the_ndk(self):
+        AndroidPlatformManager._install_ndk("linux")
+
+        self.assertTrue(os.path.isfile(os.path.join(self.ndk_path, "source.properties")))
+        self.assertEqual(
+            sorted(os.listdir(self.ndk_dir)), sorted([ANDROID_NDK, f"{ANDROID_NDK}-linux.zip"])
+        )
+
+    def test_interrupted_extraction_isnt_installed(self):
+        with mock.patch.object(android, "extract_zip", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                AndroidPlatformManager._install_ndk("linux")
+
+        self.assertEqual(os.listdir(self.ndk_dir), [f"{ANDROID_NDK}-linux.zip"])
+
+    def test_replaces_a_partial_ndk(self):
+        os.makedirs(os.path.join(self.ndk_path, "toolchains"))
+
+        AndroidPlatformManager._install_ndk("linux")
+
+        self.assertEqual(sorted(os.listdir(self.ndk_path)), ["ndk-build", "source.properties"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import contextlib
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from benchmarks.tree import create_workspace
+from skia_builder import agent
+from skia_builder.coordinator import ClusterJob, coordinate
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ["linux-x64", "linux-x64-v2", "linux-x64-v3"]
+AGENTS = ["agent-1", "agent-2"]
+TIMEOUT = 120
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git(*args, cwd):
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "skia-builder",
+        "GIT_AUTHOR_EMAIL": "skia-builder@localhost",
+        "GIT_COMMITTER_NAME": "skia-builder",
+        "GIT_COMMITTER_EMAIL": "skia-builder@localhost",
+    }
+    subprocess.run(["git", *args], cwd=cwd, env=env, check=True, capture_output=True)
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "The fake build tools target Linux")
+class ClusterTest(unittest.TestCase):
+    """Builds several targets with a coordinator and two agents, each in its own workspace."""
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = os.path.realpath(temp_dir.name)
+
+        self.workspace = create_workspace(os.path.join(self.root, "coordinator"), scale=0.002)
+        skia_path = os.path.join(self.workspace, "skia")
+        git("init", "-q", cwd=skia_path)
+        git("add", "-A", cwd=skia_path)
+        git("commit", "-q", "-m", "Synthetic checkout", cwd=skia_path)
+        for name in AGENTS:
+            shutil.copytree(self.workspace, os.path.join(self.root, name), symlinks=True)
+
+    def start_agent(self, name, url):
+        workspace = os.path.join(self.root, name)
+        env = {
+            **os.environ,
+            "PYTHONPATH": ROOT_DIR,
+            "SKIA_BUILDER_CACHE_DIR": os.path.join(workspace, ".skia-builder-cache"),
+            "SKIA_BUILDER_AGENT_POLL_INTERVAL": "0.2",
+            "FAKE_NINJA_EDGES": "3",
+            "FAKE_NINJA_LIBRARY_SIZE": "4096",
+        }
+        log = open(os.path.join(self.root, f"{name}.log"), "wb")
+        self.addCleanup(log.close)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "skia_builder.cli", "agent", url, "--name", name],
+            cwd=workspace,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        self.addCleanup(process.kill)
+        return process
+
+    def read_log(self, name):
+        with open(os.path.join(self.root, f"{name}.log"), errors="replace") as f:
+            return f.read()
+
+    def test_agents_build_every_target(self):
+        port = free_port()
+        # Agents wait for the coordinator to come up
+        agents = [self.start_agent(name, f"http://127.0.0.1:{port}") for name in AGENTS]
+
+        outcome = {}
+
+        def run_coordinator():
+            try:
+                outcome["jobs"] = coordinate(TARGETS, port=port)
+            except Exception as e:
+                outcome["error"] = e
+
+        with contextlib.chdir(self.workspace):
+            thread = threading.Thread(target=run_coordinator, daemon=True)
+            thread.start()
+            thread.join(TIMEOUT)
+        self.assertFalse(thread.is_alive(), "The coordinator didn't finish in time")
+        self.assertNotIn("error", outcome, "\n".join(map(self.read_log, AGENTS)))
+
+        for process, name in zip(agents, AGENTS):
+            self.assertEqual(process.wait(TIMEOUT), 0, self.read_log(name))
+
+        jobs = outcome["jobs"]
+        self.assertEqual(sorted(job["build_name"] for job in jobs), TARGETS)
+        for job in jobs:
+            self.assertEqual(job["status"], ClusterJob.SUCCEEDED)
+            self.assertIn(job["result"]["agent"], AGENTS)
+            if hasattr(os, "wait4"):
+                self.assertGreater(job["result"]["peak_rss_kib"], 0)
+            for path in job["result"]["artifacts"]:
+                self.assertTrue(path.startswith(os.path.join(self.workspace, "output", "")))
+                self.assertTrue(os.path.isfile(path), path)
+
+
+class RunJobTest(unittest.TestCase):
+    JOB = {
+        "id": "job",
+        "lease": "lease",
+        "build_name": "linux-x64",
+        "skia_version": "m141",
+        "skia_commit": "0" * 40,
+    }
+
+    def run_job(self, error):
+        client = mock.Mock()
+        client.request.return_value = (200, {})
+        with mock.patch.object(agent, "_build_job", side_effect=error):
+            agent.run_job(client, "agent", dict(self.JOB), "Linux")
+        method, path, report = client.request.call_args.args
+        self.assertEqual((method, path), ("POST", "/jobs/job/result"))
+        return report
+
+    def test_reports_build_errors(self):
+        report = self.run_job(OSError("No space left on device"))
+
+        self.assertEqual(report["status"], "failed")
+        self.assertEqual(report["error"], "No space left on device")
+
+    def test_reports_unexpected_errors(self):
+        report = self.run_job(KeyError("x86_64_level"))
+
+        self.assertEqual(report["status"], "failed")
+        self.assertEqual(report["lease"], "lease")
+        self.assertEqual(report["error"], "Unexpected error: KeyError: 'x86_64_level'")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import asyncio
+import sys
+import time
+import unittest
+
+from skia_builder.dag import Step, run_steps, sort_steps
+from skia_builder.errors import CommandError
+from skia_builder.utils import run_command_async
+
+
+class Concurrency:
+    """Records how many of the steps it runs overlap."""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+
+    def step(self, name, result=None, **kwargs):
+        async def action():
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await asyncio.sleep(0.05)
+            self.running -= 1
+            return result
+
+        return Step(name, action, **kwargs)
+
+
+class RunStepsTest(unittest.TestCase):
+    def test_runs_steps_after_the_ones_they_require(self):
+        order = []
+
+        def step(name, requires=()):
+            return Step(name, lambda: order.append(name) or name.upper(), requires)
+
+        timings = {}
+        results = run_steps(
+            [step("build", ["gn", "deps"]), step("deps", ["clone"]), step("gn"), step("clone")],
+            timings=timings,
+        )
+
+        self.assertEqual(results, {"build": "BUILD", "deps": "DEPS", "gn": "GN", "clone": "CLONE"})
+        self.assertLess(order.index("clone"), order.index("deps"))
+        self.assertEqual(order[-1], "build")
+        self.assertEqual(set(timings), set(results))
+
+    def test_first_failure_cancels_the_other_steps(self):
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                cancelled.append("slow")
+                raise
+
+        async def command():
+            await run_command_async([sys.executable, "-c", "import time; time.sleep(30)"], "Sleep")
+
+        async def fail():
+            await asyncio.sleep(0.1)
+            raise CommandError(["fetch"], 2, "Fetching")
+
+        started = time.monotonic()
+        with self.assertRaisesRegex(CommandError, "Fetching"):
+            run_steps([Step("slow", slow), Step("command", command), Step("fail", fail)])
+
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertEqual(cancelled, ["slow"])
+
+    def test_dependents_of_a_failed_step_dont_run(self):
+        ran = []
+
+        def fail():
+            raise RuntimeError("Clone failed")
+
+        with self.assertRaisesRegex(RuntimeError, "Clone failed"):
+            run_steps(
+                [
+                    Step("clone", fail),
+                    Step("deps", lambda: ran.append("deps"), ["clone"]),
+                    Step("build", lambda: ran.append("build"), ["deps"]),
+                ]
+            )
+        self.assertEqual(ran, [])
+
+    def test_steps_sharing_a_resource_dont_overlap(self):
+        shared, independent = Concurrency(), Concurrency()
+
+        run_steps(
+            [shared.step(f"apt {i}", resources=["apt"]) for i in range(3)]
+            + [independent.step(f"download {i}") for i in range(3)]
+        )
+
+        self.assertEqual((shared.peak, independent.peak), (1, 3))
+
+    def test_max_parallel(self):
+        concurrency = Concurrency()
+
+        results = run_steps(
+            [concurrency.step(f"step {i}", result=i) for i in range(6)], max_parallel=2
+        )
+
+        self.assertEqual(concurrency.peak, 2)
+        self.assertEqual(results, {f"step {i}": i for i in range(6)})
+
+
+class SortStepsTest(unittest.TestCase):
+    def test_invalid_graphs(self):
+        cases = {
+            "cycle": ([Step("a", None, ["b"]), Step("b", None, ["a"])], "a -> b -> a"),
+            "unknown": ([Step("a", None, ["missing"])], "a requires unknown step missing"),
+            "duplicate": ([Step("a", None), Step("a", None)], "Duplicate step: a"),
+        }
+        for case, (steps, message) in cases.items():
+            with self.subTest(case):
+                with self.assertRaisesRegex(ValueError, message):
+                    sort_steps(steps)
+                with self.assertRaisesRegex(ValueError, message):
+                    run_steps(steps)
+
+
+if __name__ == "__main__":
+    unittest.main()
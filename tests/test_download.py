@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+
+from skia_builder import download
+from skia_builder.errors import DownloadError
+from tests.http_server import FileServer
+
+PAYLOAD = bytes(range(256)) * 1024
+
+
+class FetchTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cache_dir = temp_dir.name
+        self.server = self.enterContext(FileServer({"ndk.zip": PAYLOAD}))
+        self.url = self.server.url("ndk.zip")
+
+    def write_partial(self, content, validator):
+        entry_path = download._cache_entry_path(self.url, None, self.cache_dir)
+        os.makedirs(os.path.dirname(entry_path))
+        with open(f"{entry_path}.part", "wb") as f:
+            f.write(content)
+        if validator:
+            with open(f"{entry_path}.part.json", "w", encoding="utf-8") as f:
+                json.dump({"validator": validator}, f)
+
+    def test_resumes_a_partial_download(self):
+        self.write_partial(PAYLOAD[:1000], FileServer.etag(PAYLOAD))
+
+        path, modified = download.fetch_if_modified(self.url, cache_dir=self.cache_dir, segments=1)
+
+        self.assertTrue(modified)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+        request = self.server.requests_to("ndk.zip")[0]
+        self.assertEqual(request["Range"], "bytes=1000-")
+        self.assertEqual(request["If-Range"], FileServer.etag(PAYLOAD))
+        self.assertFalse(os.path.exists(f"{path}.part.json"))
+
+    def test_restarts_a_partial_download_of_changed_content(self):
+        old_payload = bytes(1000)
+        self.write_partial(old_payload[:500], FileServer.etag(old_payload))
+
+        path, _ = download.fetch_if_modified(self.url, cache_dir=self.cache_dir, segments=1)
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["etag"], FileServer.etag(PAYLOAD))
+
+    def test_restarts_a_partial_download_without_validator(self):
+        self.write_partial(bytes(500), None)
+
+        path, _ = download.fetch_if_modified(self.url, cache_dir=self.cache_dir, segments=1)
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+        self.assertNotIn("Range", self.server.requests_to("ndk.zip")[0])
+
+    def test_segmented_download_keeps_validators(self):
+        path, modified = download.fetch_if_modified(self.url, cache_dir=self.cache_dir, segments=4)
+
+        self.assertTrue(modified)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+        ranges = sorted(headers["Range"] for headers in self.server.requests_to("ndk.zip"))
+        self.assertEqual(len(ranges), 4)
+        with open(f"{path}.json", "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["etag"], FileServer.etag(PAYLOAD))
+
+        # The cached copy is revalidated rather than downloaded again
+        path, modified = download.fetch_if_modified(self.url, cache_dir=self.cache_dir, segments=4)
+        self.assertFalse(modified)
+        last_request = self.server.requests_to("ndk.zip")[-1]
+        self.assertEqual(last_request["If-None-Match"], FileServer.etag(PAYLOAD))
+
+    def test_resumes_an_interrupted_segmented_download(self):
+        entry_path = download._cache_entry_path(self.url, None, self.cache_dir)
+        os.makedirs(os.path.dirname(entry_path))
+        part_path = f"{entry_path}.part"
+        segment_size = len(PAYLOAD) // 2
+        with open(part_path, "wb") as f:
+            f.write(PAYLOAD[:segment_size] + bytes(len(PAYLOAD) - segment_size))
+        with open(f"{part_path}.segments", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "size": len(PAYLOAD),
+                    "validator": FileServer.etag(PAYLOAD),
+                    "done": [segment_size, 0],
+                },
+                f,
+            )
+
+        path, _ = download.fetch_if_modified(self.url, cache_dir=self.cache_dir, segments=2)
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+        self.assertEqual(
+            [headers["Range"] for headers in self.server.requests_to("ndk.zip")],
+            [f"bytes={segment_size}-{len(PAYLOAD) - 1}"],
+        )
+
+    def test_pinned_download_is_verified(self):
+        sha256 = hashlib.sha256(PAYLOAD).hexdigest()
+        path = download.fetch(self.url, sha256=sha256, cache_dir=self.cache_dir, segments=4)
+        self.assertEqual(path, os.path.join(self.cache_dir, "sha256", sha256))
+
+        # Pinned files are used from the cache without any request
+        requests = len(self.server.requests)
+        self.assertEqual(download.fetch(self.url, sha256=sha256, cache_dir=self.cache_dir), path)
+        self.assertEqual(len(self.server.requests), requests)
+
+    def test_checksum_mismatch(self):
+        sha256 = hashlib.sha256(b"something else").hexdigest()
+        for segments in (1, 4):
+            with self.subTest(segments=segments):
+                with self.assertRaisesRegex(DownloadError, "Checksum mismatch"):
+                    download.fetch(
+                        self.url, sha256=sha256, cache_dir=self.cache_dir, segments=segments
+                    )
+                entry_path = download._cache_entry_path(self.url, sha256, self.cache_dir)
+                self.assertFalse(os.path.exists(entry_path))
+                self.assertFalse(os.path.exists(f"{entry_path}.part"))
+
+    def test_missing_file(self):
+        with self.assertRaises(DownloadError):
+            download.fetch(self.server.url("missing.zip"), cache_dir=self.cache_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
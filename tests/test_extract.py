@@ -0,0 +1,87 @@
+import os
+import stat
+import tempfile
+import unittest
+import zipfile
+
+from skia_builder.errors import ArchiveError
+from skia_builder.extract import extract_zip
+
+
+def make_zip(path, members):
+    """Writes a zip of `members`: (name, content, mode) with the Unix mode of the member."""
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content, mode in members:
+            info = zipfile.ZipInfo(name)
+            info.external_attr = mode << 16
+            archive.writestr(info, content)
+
+
+@unittest.skipIf(os.name == "nt", "Unix permissions and symbolic links")
+class ExtractZipTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = os.path.realpath(temp_dir.name)
+        self.archive = os.path.join(self.root, "archive.zip")
+        self.destination = os.path.join(self.root, "out")
+
+    def extract(self, members, workers=4):
+        make_zip(self.archive, members)
+        return extract_zip(self.archive, self.destination, workers)
+
+    def path(self, name):
+        return os.path.join(self.destination, name)
+
+    def test_preserves_permissions_and_symlinks(self):
+        entries = self.extract(
+            [
+                ("ndk/", b"", stat.S_IFDIR | 0o755),
+                ("ndk/bin/clang-18", b"clang", stat.S_IFREG | 0o755),
+                ("ndk/bin/clang", b"clang-18", stat.S_IFLNK | 0o777),
+                ("ndk/lib/libc++.so", b"library", stat.S_IFREG | 0o644),
+                ("ndk/lib/libc++.so.1", b"libc++.so", stat.S_IFLNK | 0o777),
+                ("ndk/sysroot", b"lib", stat.S_IFLNK | 0o777),
+            ]
+        )
+
+        self.assertEqual(entries, 6)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path("ndk/bin/clang-18")).st_mode), 0o755)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path("ndk/lib/libc++.so")).st_mode), 0o644)
+        self.assertEqual(os.readlink(self.path("ndk/bin/clang")), "clang-18")
+        with open(self.path("ndk/bin/clang"), "rb") as f:
+            self.assertEqual(f.read(), b"clang")
+        with open(self.path("ndk/sysroot/libc++.so.1"), "rb") as f:
+            self.assertEqual(f.read(), b"library")
+
+    def test_rejects_path_traversal(self):
+        for name in ("../escape", "ndk/../../escape", "/tmp/escape"):
+            with self.subTest(name=name):
+                with self.assertRaisesRegex(ArchiveError, "outside"):
+                    self.extract([(name, b"x", stat.S_IFREG | 0o644)])
+        self.assertFalse(os.path.exists(os.path.join(self.root, "escape")))
+
+    def test_rejects_symlinks_pointing_outside(self):
+        for link_name in ("/etc", "../..", "ndk/../../outside"):
+            with self.subTest(link_name=link_name):
+                with self.assertRaisesRegex(ArchiveError, "a link to"):
+                    self.extract([("link", link_name.encode(), stat.S_IFLNK | 0o777)])
+                self.assertFalse(os.path.lexists(self.path("link")))
+
+    def test_doesnt_write_through_symlinks(self):
+        outside = os.path.join(self.root, "outside")
+        os.makedirs(outside)
+
+        with self.assertRaises(ArchiveError):
+            self.extract(
+                [
+                    ("a", outside.encode(), stat.S_IFLNK | 0o777),
+                    ("a/x", b"x", stat.S_IFREG | 0o644),
+                ]
+            )
+        self.assertEqual(os.listdir(outside), [])
+        self.assertFalse(os.path.islink(self.path("a")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import contextlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+from skia_builder import download
+from skia_builder import install as install_module
+from skia_builder.errors import DownloadError, InstallError
+from skia_builder.install import install
+from skia_builder.manifest import MANIFEST_NAME, build_manifest, hash_file, load_manifest
+from skia_builder.workspace import SKIA_DIR
+from tests.http_server import FileServer
+
+ARCHIVE_PATH = "m141/linux-x64/linux-x64.tar.gz"
+MANIFEST_PATH = "m141/linux-x64/linux-x64.manifest.json"
+
+
+def make_release(files):
+    """Returns the archive and manifest of a build output holding `files` ({path: content})."""
+    with tempfile.TemporaryDirectory() as output_dir:
+        for path, content in files.items():
+            os.makedirs(os.path.join(output_dir, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(output_dir, path), "wb") as f:
+                f.write(content)
+        manifest = build_manifest(output_dir)
+
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+            for path in sorted(files):
+                tar.add(os.path.join(output_dir, path), arcname=path)
+        tar_path = os.path.join(output_dir, "archive.tar.gz")
+        with open(tar_path, "wb") as f:
+            f.write(archive.getvalue())
+        manifest["archive"] = {"name": "linux-x64.tar.gz", "sha256": hash_file(tar_path)}
+    return archive.getvalue(), manifest
+
+
+class InstallTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.workspace = os.path.realpath(temp_dir.name)
+        self.enterContext(contextlib.chdir(self.workspace))
+        self.destination = os.path.join(self.workspace, "project")
+        self.server = self.enterContext(FileServer())
+        # Archives are cached by checksum, tests publishing the same files must not share them
+        cache_dir = os.path.join(self.workspace, "cache")
+        self.enterContext(mock.patch.object(download, "DOWNLOAD_CACHE_DIR", cache_dir))
+
+    def publish(self, files):
+        archive, manifest = make_release(files)
+        self.server.files[ARCHIVE_PATH] = archive
+        self.server.files[MANIFEST_PATH] = json.dumps(manifest).encode()
+
+    def install(self, destination=None):
+        return install("linux-x64", destination or self.destination, source=self.server.url())
+
+    def read(self, path):
+        with open(os.path.join(self.destination, path), "rb") as f:
+            return f.read()
+
+    def write(self, path, content):
+        with open(os.path.join(self.destination, path), "wb") as f:
+            f.write(content)
+
+    def test_installs_and_upgrades(self):
+        self.publish({"lib/libskia.a": b"v1", "include/core/SkCanvas.h": b"h", "LICENSE": b"l"})
+
+        result = self.install()
+
+        self.assertEqual((result["extracted"], result["removed"]), (3, 0))
+        self.assertEqual(self.read("lib/libskia.a"), b"v1")
+        installed = load_manifest(os.path.join(self.destination, MANIFEST_NAME))
+        self.assertEqual(len(installed["installed"]), 3)
+
+        self.publish({"lib/libskia.a": b"v2", "include/core/SkCanvas.h": b"h", "NOTICE": b"n"})
+        result = self.install()
+
+        self.assertEqual((result["extracted"], result["unchanged"]), (2, 1))
+        self.assertEqual(result["removed"], 1)
+        self.assertEqual(self.read("lib/libskia.a"), b"v2")
+        self.assertFalse(os.path.exists(os.path.join(self.destination, "LICENSE")))
+
+    def test_up_to_date_installation_skips_the_archive(self):
+        self.publish({"lib/libskia.a": b"v1"})
+        self.install()
+        archive_requests = len(self.server.requests_to(ARCHIVE_PATH))
+
+        result = self.install()
+
+        self.assertEqual((result["extracted"], result["unchanged"]), (0, 1))
+        self.assertEqual(len(self.server.requests_to(ARCHIVE_PATH)), archive_requests)
+
+    def test_restores_missing_files(self):
+        self.publish({"lib/libskia.a": b"v1", "LICENSE": b"l"})
+        self.install()
+        os.remove(os.path.join(self.destination, "LICENSE"))
+
+        result = self.install()
+
+        self.assertEqual(result["extracted"], 1)
+        self.assertEqual(self.read("LICENSE"), b"l")
+
+    def test_keeps_locally_modified_files(self):
+        self.publish({"lib/libskia.a": b"v1", "LICENSE": b"l", "NOTICE": b"n"})
+        self.install()
+        self.write("lib/libskia.a", b"patched locally")
+        self.write("NOTICE", b"edited notice")
+
+        # The archive changes one modified file and removes the other
+        self.publish({"lib/libskia.a": b"v2", "LICENSE": b"l2"})
+        result = self.install()
+
+        self.assertEqual(result["kept"], ["NOTICE", "lib/libskia.a"])
+        self.assertEqual(result["extracted"], 1)
+        self.assertEqual(self.read("lib/libskia.a"), b"patched locally")
+        self.assertEqual(self.read("NOTICE"), b"edited notice")
+        self.assertEqual(self.read("LICENSE"), b"l2")
+
+        # It is still kept by the next upgrade
+        self.publish({"lib/libskia.a": b"v3", "LICENSE": b"l2"})
+        self.assertEqual(self.install()["kept"], ["lib/libskia.a"])
+        self.assertEqual(self.read("lib/libskia.a"), b"patched locally")
+
+    def test_refuses_to_install_into_the_skia_checkout(self):
+        self.publish({"lib/libskia.a": b"v1"})
+        os.makedirs(os.path.join(self.workspace, SKIA_DIR, "src"))
+
+        for destination in (SKIA_DIR, os.path.join(SKIA_DIR, "src")):
+            with self.subTest(destination=destination):
+                with self.assertRaisesRegex(InstallError, "Skia checkout"):
+                    self.install(destination)
+        self.assertFalse(os.path.exists(os.path.join(self.workspace, SKIA_DIR, MANIFEST_NAME)))
+
+    def test_streams_large_members(self):
+        files = {"lib/libskia.a": os.urandom(3000), "include/core/SkCanvas.h": b"h"}
+        self.publish(files)
+
+        with mock.patch.object(install_module, "MAX_POOLED_MEMBER_SIZE", 1024):
+            with mock.patch.object(install_module, "COPY_BUFFER_SIZE", 1000):
+                result = self.install()
+
+        self.assertEqual(result["extracted"], 2)
+        for path, content in files.items():
+            self.assertEqual(self.read(path), content)
+
+    def test_refuses_members_not_matching_the_manifest(self):
+        self.publish({"lib/libskia.a": b"v1"})
+        self.install()
+        self.publish({"lib/libskia.a": os.urandom(3000)})
+        manifest = json.loads(self.server.files[MANIFEST_PATH])
+        manifest["files"][0]["sha256"] = "0" * 64
+        self.server.files[MANIFEST_PATH] = json.dumps(manifest).encode()
+
+        for max_pooled_member_size in (1024, 1 << 20):
+            with self.subTest(max_pooled_member_size=max_pooled_member_size):
+                with mock.patch.object(
+                    install_module, "MAX_POOLED_MEMBER_SIZE", max_pooled_member_size
+                ):
+                    with self.assertRaisesRegex(InstallError, "Checksum mismatch"):
+                        self.install()
+                self.assertEqual(self.read("lib/libskia.a"), b"v1")
+                self.assertEqual(os.listdir(os.path.join(self.destination, "lib")), ["libskia.a"])
+
+    def test_corrupt_archive(self):
+        self.publish({"lib/libskia.a": b"v1"})
+        archive = self.server.files[ARCHIVE_PATH]
+        self.server.files[ARCHIVE_PATH] = archive[:-1] + bytes([archive[-1] ^ 1])
+
+        with self.assertRaisesRegex(DownloadError, "Checksum mismatch"):
+            self.install()
+        self.assertFalse(os.path.exists(os.path.join(self.destination, "lib", "libskia.a")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+from skia_builder.manifest import (
+    MANIFEST_NAME,
+    hash_file,
+    load_manifest,
+    verify,
+    verify_archive,
+    verify_tree,
+)
+from skia_builder.utils import archive_build_output
+
+FILES = {
+    "bin/libskia.a": b"skia" * 1000,
+    "bin/libsvg.a": b"svg",
+    "include/core/SkCanvas.h": b"class SkCanvas;",
+}
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = os.path.realpath(temp_dir.name)
+        self.output_dir = os.path.join(self.root, "output", "linux-x64")
+        build_dir = os.path.join(self.root, "out", "linux-x64")
+        os.makedirs(build_dir)
+        for path, content in FILES.items():
+            directory = build_dir if path.startswith("bin/") else self.output_dir
+            name = os.path.basename(path) if path.startswith("bin/") else path
+            self.write(os.path.join(directory, name), content)
+
+        archive_build_output(build_dir, "linux", self.output_dir, metadata={"target": "linux-x64"})
+        self.archive_path = os.path.join(self.output_dir, "linux-x64.tar.gz")
+        self.sidecar = load_manifest(os.path.join(self.output_dir, "linux-x64.manifest.json"))
+
+    @staticmethod
+    def write(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+    def rewrite_archive(self, changes):
+        """Returns a copy of the archive with `changes` ({name: content, or None to remove})."""
+        members = {}
+        with tarfile.open(self.archive_path, "r:gz") as tar:
+            for member in tar:
+                if member.isfile():
+                    members[member.name] = (member, tar.extractfile(member).read())
+
+        path = os.path.join(self.root, "rewritten.tar.gz")
+        with tarfile.open(path, "w:gz") as tar:
+            for name, content in changes.items():
+                members[name] = (members.get(name, (tarfile.TarInfo(name), None))[0], content)
+            for member, content in members.values():
+                if content is not None:
+                    member.size = len(content)
+                    tar.addfile(member, io.BytesIO(content))
+        return path
+
+    def test_matching_archive_and_tree(self):
+        self.assertEqual(verify_archive(self.archive_path), [])
+        self.assertEqual(verify_archive(self.archive_path, self.sidecar), [])
+        self.assertEqual(verify(self.output_dir), [])
+
+        embedded = load_manifest(os.path.join(self.output_dir, MANIFEST_NAME))
+        self.assertEqual(sorted(entry["path"] for entry in embedded["files"]), sorted(FILES))
+        self.assertEqual(embedded["build"], {"target": "linux-x64"})
+        self.assertEqual({**embedded, "archive": self.sidecar["archive"]}, self.sidecar)
+        self.assertEqual(self.sidecar["archive"]["sha256"], hash_file(self.archive_path))
+
+    def test_tampered_member(self):
+        tampered = b"SKIA" + FILES["bin/libskia.a"][4:]
+        path = self.rewrite_archive({"bin/libskia.a": tampered})
+        self.assertEqual(verify_archive(path), [("bin/libskia.a", "sha256 mismatch")])
+        self.assertEqual(
+            verify_archive(self.rewrite_archive({"bin/libsvg.a": b"svg!"}), self.sidecar),
+            [("bin/libsvg.a", "size 4 != 3")],
+        )
+
+        self.write(os.path.join(self.output_dir, "bin/libskia.a"), tampered)
+        self.assertEqual(verify(self.output_dir), [("bin/libskia.a", "sha256 mismatch")])
+
+    def test_missing_member(self):
+        path = self.rewrite_archive({"bin/libsvg.a": None})
+        self.assertEqual(verify_archive(path, self.sidecar), [("bin/libsvg.a", "missing")])
+
+        os.remove(os.path.join(self.output_dir, "bin/libsvg.a"))
+        self.assertEqual(verify_tree(self.output_dir, self.sidecar), [("bin/libsvg.a", "missing")])
+
+    def test_extra_member(self):
+        path = self.rewrite_archive({"bin/libextra.a": b"extra"})
+        self.assertEqual(verify_archive(path), [("bin/libextra.a", "unexpected file")])
+
+        self.write(os.path.join(self.output_dir, "bin/libextra.a"), b"extra")
+        self.assertEqual(verify(self.output_dir), [("bin/libextra.a", "unexpected file")])
+
+    def test_archive_without_a_manifest(self):
+        path = self.rewrite_archive({MANIFEST_NAME: None})
+
+        with self.assertRaisesRegex(ValueError, MANIFEST_NAME):
+            verify_archive(path)
+        self.assertEqual(verify_archive(path, self.sidecar), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import contextlib
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from skia_builder import pgo
+from skia_builder.platforms import PLATFORM_MANAGERS
+from skia_builder.workspace import SKIA_DIR
+
+TRAINING = pgo.describe_training(match=["blit"])
+
+
+def git(*args, cwd):
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "skia-builder",
+        "GIT_AUTHOR_EMAIL": "skia-builder@localhost",
+        "GIT_COMMITTER_NAME": "skia-builder",
+        "GIT_COMMITTER_EMAIL": "skia-builder@localhost",
+    }
+    subprocess.run(["git", *args], cwd=cwd, env=env, check=True, capture_output=True)
+
+
+class CachedProfileTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.workspace = os.path.realpath(temp_dir.name)
+        self.enterContext(contextlib.chdir(self.workspace))
+        profiles_dir = os.path.join(self.workspace, "pgo")
+        self.enterContext(mock.patch.object(pgo, "PGO_PROFILES_DIR", profiles_dir))
+
+        self.skia_path = os.path.join(self.workspace, SKIA_DIR)
+        os.makedirs(self.skia_path)
+        git("init", "-q", cwd=self.skia_path)
+        self.commit("m141")
+
+        self.manager = PLATFORM_MANAGERS["Linux"]
+        self.build_name = self.manager.get_build_name("x64", "speed")
+        self.instrumented = pgo.get_instrumented_build(self.manager, "x64", profile="speed")
+        self.profile_path = self.store()
+
+    def commit(self, message):
+        git("commit", "-q", "--allow-empty", "-m", message, cwd=self.skia_path)
+
+    def store(self):
+        os.makedirs(os.path.dirname(pgo._get_index_path(self.build_name)), exist_ok=True)
+        merged_path = os.path.join(self.workspace, "merged.profdata")
+        with open(merged_path, "wb") as f:
+            f.write(b"profile")
+        return pgo._store_profile(self.build_name, TRAINING, self.instrumented, merged_path)
+
+    def load(self, training=TRAINING, override_args=None, profile="speed"):
+        instrumented = pgo.get_instrumented_build(
+            self.manager, "x64", override_args, profile=profile
+        )
+        return pgo.load_cached_profile(self.build_name, training, instrumented)
+
+    def test_reuses_the_profile_of_the_same_instrumented_build(self):
+        self.assertEqual(self.load(), self.profile_path)
+
+    def test_retrains_for_another_workload(self):
+        self.assertIsNone(self.load(training=pgo.describe_training(match=["draw"])))
+
+    def test_retrains_when_the_gn_arguments_change(self):
+        self.assertIsNone(self.load(override_args="skia_use_gl=false"))
+        self.assertIsNone(self.load(profile="size"))
+
+    def test_retrains_when_the_checkout_moves(self):
+        self.commit("Next commit")
+
+        self.assertIsNone(self.load())
+
+    def test_retrains_with_an_index_of_an_earlier_version(self):
+        with open(pgo._get_index_path(self.build_name), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": 1,
+                    "profile": os.path.basename(self.profile_path),
+                    "training": TRAINING,
+                },
+                f,
+            )
+
+        self.assertIsNone(self.load())
+
+
+if __name__ == "__main__":
+    unittest.main()
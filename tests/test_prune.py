@@ -0,0 +1,127 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from skia_builder import prune
+
+DEPS = """
+use_relative_paths = True
+
+vars = {
+  "checkout_chromium": False,
+  "dawn_revision": "d" * 40,
+}
+
+deps = {
+  "buildtools": "https://chromium.googlesource.com/chromium/src/buildtools.git@" + "b" * 40,
+  "third_party/externals/dawn": "https://dawn.googlesource.com/dawn.git@" + Var("dawn_revision"),
+  "third_party/externals/imgui": "https://skia.googlesource.com/external/imgui@" + "i" * 40,
+  "third_party/externals/vulkan-headers": {
+    "url": "https://chromium.googlesource.com/external/vulkan-headers@" + "v" * 40,
+    "condition": "not checkout_chromium",
+  },
+}
+"""
+
+DEPS_REQUIRED_BY_ARGS = {
+    "third_party/externals/dawn": ["skia_use_dawn"],
+    "third_party/externals/imgui": ["skia_enable_tools"],
+    "third_party/externals/vulkan-headers": ["skia_use_vulkan", "skia_use_dawn"],
+}
+SKIA_DIRS_REQUIRED_BY_ARGS = {
+    "gm": ["skia_enable_tools"],
+    "resources": ["skia_enable_tools", "skia_compile_sksl_tests"],
+}
+
+NO_GPU = "skia_use_dawn=false skia_use_vulkan=false skia_enable_tools=false"
+
+
+class PruneTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.skia_path = temp_dir.name
+        with open(os.path.join(self.skia_path, "DEPS"), "w", encoding="utf-8") as f:
+            f.write(DEPS)
+
+        self.enterContext(mock.patch.object(prune, "DEPS_REQUIRED_BY_ARGS", DEPS_REQUIRED_BY_ARGS))
+        self.enterContext(
+            mock.patch.object(prune, "SKIA_DIRS_REQUIRED_BY_ARGS", SKIA_DIRS_REQUIRED_BY_ARGS)
+        )
+        self.enterContext(mock.patch.object(prune, "SKIA_DIRS_NOT_REQUIRED", ["docs"]))
+
+    def test_plan_leaves_out_what_no_build_enables(self):
+        self.assertEqual(
+            prune.plan([f"{NO_GPU} skia_compile_sksl_tests=false"]),
+            {
+                "deps": sorted(DEPS_REQUIRED_BY_ARGS),
+                "dirs": ["docs", "gm", "resources"],
+            },
+        )
+        # Arguments left unset keep their GN default, which may enable them
+        self.assertEqual(
+            prune.plan([NO_GPU]), {"deps": sorted(DEPS_REQUIRED_BY_ARGS), "dirs": ["docs", "gm"]}
+        )
+        # A dependency is kept if any build needs it
+        self.assertEqual(
+            prune.plan([NO_GPU, NO_GPU.replace("skia_use_vulkan=false", "skia_use_vulkan=true")]),
+            {
+                "deps": ["third_party/externals/dawn", "third_party/externals/imgui"],
+                "dirs": ["docs", "gm"],
+            },
+        )
+
+    def test_sparse_checkout_patterns_keep_gn_files(self):
+        self.assertEqual(
+            prune.sparse_checkout_patterns(["docs", "gm"]),
+            [
+                "/*",
+                "!/docs/**",
+                "/docs/**/*.gn",
+                "/docs/**/*.gni",
+                "!/gm/**",
+                "/gm/**/*.gn",
+                "/gm/**/*.gni",
+            ],
+        )
+
+    def test_pruned_deps_round_trip(self):
+        deps_vars, deps = prune.load_deps(os.path.join(self.skia_path, "DEPS"))
+
+        pruned = ["third_party/externals/dawn", "third_party/externals/vulkan-headers", "unknown"]
+        path, removed = prune.write_pruned_deps(self.skia_path, pruned)
+
+        self.assertEqual(path, os.path.join(self.skia_path, prune.PRUNED_DEPS))
+        self.assertEqual(removed, pruned[:2])
+        with open(path, encoding="utf-8") as f:
+            pruned_vars, pruned_deps = prune.parse_deps(f.read())
+        self.assertEqual(pruned_vars, deps_vars)
+        self.assertEqual(
+            pruned_deps, {dep: value for dep, value in deps.items() if dep not in removed}
+        )
+        self.assertEqual(
+            pruned_deps["third_party/externals/imgui"],
+            "https://skia.googlesource.com/external/imgui@" + "i" * 40,
+        )
+
+    def test_get_missing(self):
+        self.assertEqual(prune.get_missing(self.skia_path, "skia_use_dawn=true"), [])
+
+        prune.save_state(self.skia_path, prune.plan([f"{NO_GPU} skia_compile_sksl_tests=false"]))
+
+        self.assertEqual(
+            prune.get_missing(self.skia_path, f"{NO_GPU} skia_compile_sksl_tests=false"), []
+        )
+        self.assertEqual(
+            prune.get_missing(self.skia_path, NO_GPU.replace("skia_use_dawn=false", "")),
+            ["resources", "third_party/externals/dawn", "third_party/externals/vulkan-headers"],
+        )
+        self.assertEqual(
+            prune.get_missing(self.skia_path, f"{NO_GPU} skia_enable_tools=true"),
+            ["gm", "resources", "third_party/externals/imgui"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
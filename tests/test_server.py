@@ -0,0 +1,151 @@
+import contextlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+from benchmarks.tree import create_workspace
+from skia_builder import server
+from skia_builder.errors import SkiaBuilderError
+from skia_builder.platforms import PLATFORM_MANAGERS
+from skia_builder.server import BuildJob, BuildRequestHandler, BuildService
+
+TIMEOUT = 60
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "The fake build tools target Linux")
+class BuildServerTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.workspace = create_workspace(os.path.realpath(temp_dir.name), scale=0.002)
+        self.enterContext(contextlib.chdir(self.workspace))
+        self.enterContext(
+            mock.patch.dict(
+                os.environ, {"FAKE_NINJA_EDGES": "3", "FAKE_NINJA_LIBRARY_SIZE": "4096"}
+            )
+        )
+
+        self.service = BuildService("Linux", max_concurrent_builds=2)
+        self.addCleanup(self.service.shutdown)
+        handler = type("Handler", (BuildRequestHandler,), {"service": self.service})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.addCleanup(self.httpd.server_close)
+        thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.httpd.shutdown)
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{self.httpd.server_port}{path}", data=data, method=method
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def wait(self, job_id):
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            status, body = self.request("GET", f"/builds/{job_id}")
+            job = json.loads(body)
+            if job["status"] in (BuildJob.SUCCEEDED, BuildJob.FAILED):
+                return job
+            time.sleep(0.05)
+        self.fail(f"Build {job_id} didn't finish in time")
+
+    def test_builds_and_deduplicates_requests(self):
+        manager = PLATFORM_MANAGERS["Linux"]
+        release = threading.Event()
+        build = manager.build
+
+        def held_build(*args, **kwargs):
+            release.wait(TIMEOUT)
+            return build(*args, **kwargs)
+
+        with mock.patch.object(manager, "build", held_build):
+            status, body = self.request("POST", "/builds", {"target_cpu": "x64", "archive": True})
+            self.assertEqual(status, 202)
+            job_id = json.loads(body)["id"]
+
+            status, body = self.request("POST", "/builds", {"target_cpu": "x64", "archive": True})
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)["id"], job_id)
+            self.assertTrue(json.loads(body)["deduplicated"])
+
+            release.set()
+            job = self.wait(job_id)
+
+        self.assertEqual((job["status"], job["returncode"]), (BuildJob.SUCCEEDED, 0))
+        self.assertTrue(os.path.isfile(job["result"]["archive"]))
+        self.assertEqual(job["result"]["ninja_edges"], 3)
+        status, log = self.request("GET", f"/builds/{job_id}/log")
+        self.assertEqual(status, 200)
+        self.assertIn(b"=== Build succeeded (exit code 0) ===", log)
+
+    def test_rejects_invalid_requests(self):
+        for payload in ({"target_cpu": "mips"}, {"target_cpu": "x64", "profile": "fastest"}):
+            with self.subTest(payload=payload):
+                status, body = self.request("POST", "/builds", payload)
+                self.assertEqual(status, 400)
+                self.assertIn("error", json.loads(body))
+        self.assertEqual(self.request("GET", "/builds/unknown")[0], 404)
+
+    def test_build_errors_fail_the_job(self):
+        manager = PLATFORM_MANAGERS["Linux"]
+        for error in (SkiaBuilderError("Broken"), RuntimeError("Bug"), SystemExit(0)):
+            with self.subTest(error=error):
+                # Run inline, not by the executor, which swallows BaseExceptions
+                _, request = self.service._parse_request({"target_cpu": "x64"})
+                job = BuildJob(BuildService.fingerprint(manager, request), manager, request)
+                with mock.patch.object(manager, "build", side_effect=error):
+                    with contextlib.suppress(SystemExit):
+                        self.service._run(job)
+
+                self.assertEqual((job.status, job.returncode), (BuildJob.FAILED, 1))
+                self.assertIsNone(job.result)
+
+
+@unittest.skipIf(os.name == "nt", "Unix sockets")
+class ServeSocketTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.workspace = create_workspace(os.path.realpath(temp_dir.name), scale=0.002)
+        self.enterContext(contextlib.chdir(self.workspace))
+
+    def test_doesnt_replace_a_file_at_the_socket_path(self):
+        path = os.path.join(self.workspace, "notes.txt")
+        with open(path, "w") as f:
+            f.write("keep me")
+
+        with self.assertRaisesRegex(SkiaBuilderError, "not a socket"):
+            server.serve("Linux", socket_path=path)
+        with open(path) as f:
+            self.assertEqual(f.read(), "keep me")
+
+    def test_replaces_a_stale_socket(self):
+        path = os.path.join(self.workspace, "build.sock")
+        stale = socket.socket(socket.AF_UNIX)
+        stale.bind(path)
+        stale.close()
+
+        with mock.patch.object(
+            server.UnixHTTPServer, "serve_forever", side_effect=KeyboardInterrupt
+        ):
+            server.serve("Linux", socket_path=path)
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
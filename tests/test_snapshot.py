@@ -0,0 +1,152 @@
+import contextlib
+import os
+import subprocess
+import tarfile
+import tempfile
+import unittest
+
+from benchmarks.tree import create_workspace
+from skia_builder import snapshot
+from skia_builder.errors import SnapshotError
+from skia_builder.workspace import SKIA_DIR, WORKTREES_DIR
+from tests.test_cluster import git
+
+
+def list_tree(root):
+    """Returns {path: content, or the target of links} of the files below `root`."""
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames + [
+            name for name in dirnames if os.path.islink(os.path.join(dirpath, name))
+        ]:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                tree[os.path.relpath(path, root)] = os.readlink(path)
+            else:
+                with open(path, "rb") as f:
+                    tree[os.path.relpath(path, root)] = f.read()
+    return tree
+
+
+@unittest.skipIf(os.name == "nt", "Symbolic links and git worktrees")
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = os.path.realpath(temp_dir.name)
+        self.source = create_workspace(os.path.join(self.root, "source"), scale=0.002)
+        self.target = os.path.join(self.root, "target")
+        os.makedirs(self.target)
+        self.snapshot_path = os.path.join(self.root, "workspace.tar")
+
+        skia_path = os.path.join(self.source, SKIA_DIR)
+        git("init", "-q", cwd=skia_path)
+        git("add", "-A", cwd=skia_path)
+        git("commit", "-q", "-m", "Skia", cwd=skia_path)
+        git("worktree", "add", "-q", f"../{WORKTREES_DIR}/m142", cwd=skia_path)
+        os.symlink("bin/gn", os.path.join(skia_path, "gn"))
+        os.symlink("bin", os.path.join(skia_path, "tools-bin"))
+        # Build dirs aren't snapshotted
+        os.makedirs(os.path.join(skia_path, "out", "linux-x64"))
+
+        with contextlib.chdir(self.source):
+            snapshot.create_snapshot(self.snapshot_path, "Linux", jobs=3)
+
+    def restore(self):
+        with contextlib.chdir(self.target):
+            snapshot.restore_snapshot(self.snapshot_path, "Linux", jobs=3)
+
+    def test_round_trip(self):
+        self.restore()
+
+        expected = {
+            path: content
+            for path, content in list_tree(self.source).items()
+            if path.split(os.sep)[0] in snapshot.SNAPSHOT_DIRS
+        }
+        restored = list_tree(self.target)
+        # Only the paths of the worktree links differ
+        worktree_files = {
+            os.path.join(WORKTREES_DIR, "m142", ".git"),
+            os.path.join(SKIA_DIR, ".git", "worktrees", "m142", "gitdir"),
+        }
+        self.assertEqual(
+            {path: content for path, content in restored.items() if path not in worktree_files},
+            {path: content for path, content in expected.items() if path not in worktree_files},
+        )
+        self.assertEqual(restored[os.path.join(SKIA_DIR, "gn")], "bin/gn")
+        self.assertEqual(restored[os.path.join(SKIA_DIR, "tools-bin")], "bin")
+        self.assertFalse(os.path.exists(os.path.join(self.target, SKIA_DIR, "out")))
+
+        worktree = os.path.join(self.target, WORKTREES_DIR, "m142")
+        listed = subprocess.run(
+            ["git", "worktree", "list", "--porcelain"],
+            cwd=os.path.join(self.target, SKIA_DIR),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        self.assertIn(f"worktree {worktree}\n", listed)
+        self.assertNotIn(self.source, listed)
+        status = subprocess.run(
+            ["git", "status", "--porcelain"], cwd=worktree, capture_output=True, text=True
+        )
+        self.assertEqual((status.returncode, status.stdout), (0, ""))
+
+    def test_tampered_shard_is_rejected(self):
+        shard = snapshot.load_snapshot_index(self.snapshot_path)["shards"][0]
+        with open(self.snapshot_path, "r+b") as f:
+            f.seek(shard["offset"] + shard["size"] // 2)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        with self.assertRaisesRegex(SnapshotError, "Checksum mismatch"):
+            self.restore()
+        # Shards are verified before the workspace is touched
+        self.assertEqual(os.listdir(self.target), [])
+
+
+@unittest.skipIf(os.name == "nt", "Symbolic links")
+class CheckMemberTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = os.path.realpath(temp_dir.name)
+        self.workspace = os.path.join(self.root, "workspace")
+        os.makedirs(os.path.join(self.workspace, SKIA_DIR, "bin"))
+        os.makedirs(os.path.join(self.root, "outside"))
+        os.symlink("../../outside", os.path.join(self.workspace, SKIA_DIR, "escape"))
+
+    @staticmethod
+    def member(name, link_type=None, link_name=""):
+        info = tarfile.TarInfo(name)
+        if link_type is not None:
+            info.type, info.linkname = link_type, link_name
+        return info
+
+    def test_accepts_members_within_the_workspace(self):
+        for member in (
+            self.member("skia/bin/gn"),
+            self.member("skia/gn", tarfile.SYMTYPE, "bin/gn"),
+            self.member("skia/bin/gn2", tarfile.LNKTYPE, "skia/bin/gn"),
+        ):
+            with self.subTest(member.name):
+                snapshot._check_member(member, self.workspace)
+
+    def test_rejects_members_outside_the_workspace(self):
+        cases = {
+            "traversal": self.member("../outside/x"),
+            "symbolic link": self.member("skia/link", tarfile.SYMTYPE, "../../outside"),
+            "absolute link": self.member("skia/link", tarfile.SYMTYPE, self.root),
+            "hard link": self.member("skia/bin/x", tarfile.LNKTYPE, "../outside/x"),
+            "through a link": self.member("skia/escape/x"),
+        }
+        for case, member in cases.items():
+            with self.subTest(case):
+                with self.assertRaisesRegex(SnapshotError, "outside"):
+                    snapshot._check_member(member, self.workspace)
+
+
+if __name__ == "__main__":
+    unittest.main()
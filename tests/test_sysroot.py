@@ -0,0 +1,71 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+
+from skia_builder import sysroot
+from skia_builder.errors import SysrootError
+
+
+def make_tar(members):
+    """Returns an open tar of `members`: (name, content) for files, (name, None, link) for links."""
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w") as tar:
+        for name, content, *link in members:
+            info = tarfile.TarInfo(name)
+            if link:
+                info.type, info.linkname = tarfile.SYMTYPE, link[0]
+                tar.addfile(info)
+            else:
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+    data.seek(0)
+    return tarfile.open(fileobj=data, mode="r")
+
+
+@unittest.skipIf(os.name == "nt", "Symbolic links")
+class ExtractTarTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = os.path.realpath(temp_dir.name)
+        self.destination = os.path.join(self.root, "sysroot")
+        os.makedirs(self.destination)
+
+    def extract(self, members):
+        with make_tar(members) as tar:
+            sysroot._extract_tar(tar, self.destination)
+
+    def test_keeps_absolute_links_of_the_sysroot(self):
+        self.extract(
+            [
+                ("usr/lib/libc.so.6", b"libc"),
+                ("usr/lib/libc.so", None, "/usr/lib/libc.so.6"),
+                ("lib", None, "usr/lib"),
+            ]
+        )
+        sysroot._relativize_symlinks(self.destination)
+
+        with open(os.path.join(self.destination, "usr/lib/libc.so"), "rb") as f:
+            self.assertEqual(f.read(), b"libc")
+        self.assertTrue(os.path.isfile(os.path.join(self.destination, "lib", "libc.so.6")))
+
+    def test_rejects_members_outside(self):
+        outside = os.path.join(self.root, "outside")
+        os.makedirs(outside)
+
+        cases = {
+            "traversal": [("../outside/x", b"x")],
+            "relative link": [("escape", None, "../outside")],
+            "write through an absolute link": [("etc", None, outside), ("etc/x", b"x")],
+        }
+        for case, members in cases.items():
+            with self.subTest(case):
+                with self.assertRaises(SysrootError):
+                    self.extract(members)
+        self.assertEqual(os.listdir(outside), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
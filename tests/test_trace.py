@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from skia_builder import trace
+
+
+def log_line(index):
+    return f"{index * 10}\t{index * 10 + 5}\t0\tobj/source{index}.o\t{index:016x}\n"
+
+
+class NinjaLogTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, ".ninja_log")
+
+    def write(self, path, indices, mode="w"):
+        with open(path, mode) as f:
+            if mode == "w":
+                f.write("# ninja log v6\n")
+            f.writelines(log_line(i) for i in indices)
+
+    def outputs(self, position, edge_count):
+        edges = trace._read_ninja_log(self.path, position, edge_count)
+        return [outputs for _, _, outputs in edges]
+
+    def test_reads_appended_edges(self):
+        self.write(self.path, range(3))
+        position = trace.ninja_log_position(self.path)
+        self.write(self.path, range(3, 5), mode="a")
+
+        self.assertEqual(self.outputs(position, 2), [["obj/source3.o"], ["obj/source4.o"]])
+
+    def test_reads_the_last_edges_of_a_recompacted_log(self):
+        self.write(self.path, range(100))
+        position = trace.ninja_log_position(self.path)
+
+        # Recompacted to fewer lines than before, then the edges of the build appended
+        recompacted = f"{self.path}.recompact"
+        self.write(recompacted, [*range(50, 100), 100, 101])
+        os.replace(recompacted, self.path)
+
+        self.assertEqual(self.outputs(position, 2), [["obj/source100.o"], ["obj/source101.o"]])
+        self.assertEqual(self.outputs(None, 1), [["obj/source101.o"]])
+
+    def test_counts_edges_from_status_lines(self):
+        output = [
+            "ninja: Entering directory `out/linux-x64'",
+            "[1/3] compile ../../src/core/SkA.cpp",
+            "../../src/core/SkA.cpp:1:1: warning: [2/3] in a diagnostic",
+            "[2/3] compile ../../src/core/SkB.cpp",
+            "[3/3] link libskia.a",
+        ]
+
+        self.assertEqual(trace.count_ninja_edges(output), 3)
+        self.assertEqual(trace.count_ninja_edges(["ninja: no work to do."]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
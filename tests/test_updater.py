@@ -0,0 +1,199 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from skia_builder import updater
+from tests.http_server import FileServer
+
+NDK_ARCHIVE = b"PK\x05\x06" + bytes(18)
+
+REPOSITORY_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<sdk:sdk-repository xmlns:sdk="http://schemas.android.com/sdk/android/repo/repository2/03">
+  <remotePackage path="ndk;27.2.12479018">
+    <archives>
+      <archive>
+        <complete>
+          <size>22</size>
+          <checksum type="sha1">{linux_sha1}</checksum>
+          <url>android-ndk-r27c-linux.zip</url>
+        </complete>
+        <host-os>linux</host-os>
+      </archive>
+      <archive>
+        <complete>
+          <size>22</size>
+          <checksum type="sha1">{windows_sha1}</checksum>
+          <url>android-ndk-r27c-windows.zip</url>
+        </complete>
+        <host-os>windows</host-os>
+      </archive>
+    </archives>
+  </remotePackage>
+</sdk:sdk-repository>
+"""
+
+BADGE = "![SKIA_VERSION](https://img.shields.io/badge/Skia_version-{}-blue?style=flat-square)"
+PINNED_COMMIT = "1" * 40
+HEAD_COMMIT = "2" * 40
+
+VERSIONS = """ANDROID_NDK = "android-ndk-r27c"
+ANDROID_NDK_SHA256 = {
+    "windows": None,
+    "linux": None,
+}
+SKIA_VERSION = "m141"
+SKIA_COMMIT = None
+"""
+
+
+class UpdaterTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = Path(temp_dir.name)
+        self.versions_path = self.temp_dir / "versions.py"
+        self.versions_path.write_text(VERSIONS, encoding="utf-8")
+        self.enterContext(mock.patch.object(updater, "VERSIONS_FILE_PATH", self.versions_path))
+        self.readme_path = self.temp_dir / "README.md"
+        self.readme_path.write_text(BADGE.format("m141"), encoding="utf-8")
+        self.enterContext(mock.patch.object(updater, "README_FILE_PATH", self.readme_path))
+        self.github_env_path = self.temp_dir / "github_env"
+        self.github_env_path.touch()
+        self.enterContext(mock.patch.dict(os.environ, {"GITHUB_ENV": str(self.github_env_path)}))
+
+    def cache_dir(self):
+        cache_dir = self.temp_dir / "cache"
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return str(cache_dir)
+
+    def serve_ndk(self, published_sha1):
+        return self.enterContext(
+            FileServer(
+                {
+                    "repository2-3.xml": REPOSITORY_XML.format(
+                        linux_sha1=published_sha1, windows_sha1=published_sha1
+                    ).encode(),
+                    "android-ndk-r27c-linux.zip": NDK_ARCHIVE,
+                    "android-ndk-r27c-windows.zip": NDK_ARCHIVE,
+                }
+            )
+        )
+
+    def test_pins_ndk_checksums_matching_the_published_sha1(self):
+        server = self.serve_ndk(hashlib.sha1(NDK_ARCHIVE).hexdigest())
+
+        pinned = updater.pin_ndk_checksums(self.cache_dir(), server.url().rstrip("/"))
+
+        sha256 = hashlib.sha256(NDK_ARCHIVE).hexdigest()
+        self.assertEqual(pinned, {"windows": sha256, "linux": sha256})
+        versions = self.versions_path.read_text(encoding="utf-8")
+        self.assertIn(f'"linux": "{sha256}"', versions)
+        self.assertIn(f'"windows": "{sha256}"', versions)
+        self.assertEqual(updater.pin_ndk_checksums(self.cache_dir(), server.url().rstrip("/")), {})
+
+    def test_refuses_archives_not_matching_the_published_sha1(self):
+        server = self.serve_ndk(hashlib.sha1(b"another archive").hexdigest())
+
+        with self.assertRaises(SystemExit):
+            updater.pin_ndk_checksums(self.cache_dir(), server.url().rstrip("/"))
+        self.assertEqual(self.versions_path.read_text(encoding="utf-8"), VERSIONS)
+
+    def check_update(self, stable_milestone, release_note_milestones, branch_heads):
+        """Runs the updater against canned Chromium dash data, release notes and branch heads."""
+        files = {
+            "releases.json": f'[{{"milestone": {stable_milestone}}}]'.encode(),
+            "RELEASE_NOTES.md": "\n".join(
+                f"Milestone {milestone}\n-------------\n" for milestone in release_note_milestones
+            ).encode(),
+        }
+        for milestone, commit in branch_heads.items():
+            files[f"chrome/m{milestone}.json"] = (
+                f'{updater.GITILES_XSSI_PREFIX}\n{{"commit": "{commit}"}}'.encode()
+            )
+        with FileServer(files) as server:
+            self.server = server
+            updater.check_update_skia_version(
+                self.cache_dir(),
+                server.url("releases.json"),
+                server.url("RELEASE_NOTES.md"),
+                server.url("chrome/m{milestone}.json"),
+            )
+
+    def branch_head_requests(self, milestone):
+        return len(self.server.requests_to(f"chrome/m{milestone}.json"))
+
+    def pin_versions(self, version, commit):
+        self.versions_path.write_text(
+            VERSIONS.replace('"m141"', f'"{version}"').replace(
+                "SKIA_COMMIT = None", f'SKIA_COMMIT = "{commit}"'
+            ),
+            encoding="utf-8",
+        )
+
+    def test_moves_to_a_new_stable_milestone(self):
+        self.pin_versions("m141", PINNED_COMMIT)
+
+        self.check_update(142, [141, 142], {142: HEAD_COMMIT})
+
+        versions = self.versions_path.read_text(encoding="utf-8")
+        self.assertIn('SKIA_VERSION = "m142"', versions)
+        self.assertIn(f'SKIA_COMMIT = "{HEAD_COMMIT}"', versions)
+        self.assertEqual(self.readme_path.read_text(encoding="utf-8"), BADGE.format("m142"))
+        self.assertEqual(self.github_env_path.read_text(), "NEW_SKIA_VERSION=m142\n")
+        self.assertEqual((self.branch_head_requests(141), self.branch_head_requests(142)), (1, 1))
+
+    def test_follows_the_branch_head_of_the_milestone(self):
+        self.pin_versions("m141", PINNED_COMMIT)
+
+        self.check_update(141, [141], {141: HEAD_COMMIT})
+
+        versions = self.versions_path.read_text(encoding="utf-8")
+        self.assertIn('SKIA_VERSION = "m141"', versions)
+        self.assertIn(f'SKIA_COMMIT = "{HEAD_COMMIT}"', versions)
+        self.assertEqual(self.readme_path.read_text(encoding="utf-8"), BADGE.format("m141"))
+        self.assertEqual(
+            self.github_env_path.read_text(), f"NEW_SKIA_VERSION=m141 at {HEAD_COMMIT[:12]}\n"
+        )
+        # Fetched once, concurrently with the release data
+        self.assertEqual(self.branch_head_requests(141), 1)
+
+    def test_pins_an_unpinned_milestone(self):
+        self.check_update(141, [141], {141: HEAD_COMMIT})
+
+        self.assertIn(f'SKIA_COMMIT = "{HEAD_COMMIT}"', self.versions_path.read_text("utf-8"))
+
+    def test_keeps_the_milestone_until_the_next_one_has_release_notes(self):
+        self.pin_versions("m141", PINNED_COMMIT)
+
+        self.check_update(142, [141], {141: HEAD_COMMIT, 142: "3" * 40})
+
+        versions = self.versions_path.read_text(encoding="utf-8")
+        self.assertIn('SKIA_VERSION = "m141"', versions)
+        self.assertIn(f'SKIA_COMMIT = "{HEAD_COMMIT}"', versions)
+
+    def test_nothing_to_update(self):
+        self.pin_versions("m141", HEAD_COMMIT)
+        versions = self.versions_path.read_text(encoding="utf-8")
+
+        with self.assertRaises(SystemExit) as raised:
+            self.check_update(141, [141], {141: HEAD_COMMIT})
+
+        self.assertEqual(raised.exception.code, 0)
+        self.assertEqual(self.versions_path.read_text(encoding="utf-8"), versions)
+        self.assertEqual(self.github_env_path.read_text(), "")
+
+    def test_malformed_release_data(self):
+        with FileServer({"releases.json": b"{}", "RELEASE_NOTES.md": b""}) as server:
+            with self.assertRaises(SystemExit) as raised:
+                updater.check_update_skia_version(
+                    self.cache_dir(), server.url("releases.json"), server.url("RELEASE_NOTES.md")
+                )
+        self.assertEqual(raised.exception.code, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
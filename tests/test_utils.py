@@ -0,0 +1,90 @@
+import asyncio
+import contextlib
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+from skia_builder.errors import CommandError
+from skia_builder.utils import log_sink, run_command_async
+
+# Allocates and touches the given number of MiB, then spawns a child doing the same if asked
+ALLOCATE = """
+import subprocess, sys
+data = bytearray(int(sys.argv[1]) << 20)
+for i in range(0, len(data), 4096):
+    data[i] = 1
+if len(sys.argv) > 2:
+    subprocess.run([sys.executable, "-c", sys.argv[2], sys.argv[3]], check=True)
+"""
+
+
+@unittest.skipUnless(hasattr(os, "wait4"), "Resource usage of commands needs os.wait4")
+class RunCommandUsageTest(unittest.TestCase):
+    def setUp(self):
+        token = log_sink.set(lambda message: None)
+        self.addCleanup(log_sink.reset, token)
+
+    def peak_rss_kib(self, *args):
+        usage = {}
+        command = [sys.executable, "-c", ALLOCATE, *args]
+        asyncio.run(run_command_async(command, "allocate", on_usage=usage.update))
+        return usage["maxrss_kib"]
+
+    def test_peak_rss_is_measured_per_command(self):
+        large = self.peak_rss_kib("256")
+        # A command run after a larger one reports its own peak, not the largest of the process
+        small = self.peak_rss_kib("16")
+
+        self.assertGreater(large, 256 << 10)
+        self.assertLess(small, 256 << 10)
+
+    def test_peak_rss_includes_the_descendants(self):
+        peak = self.peak_rss_kib("16", ALLOCATE, "256")
+
+        self.assertGreater(peak, 256 << 10)
+
+    def test_reports_failures(self):
+        usage = {}
+        command = [sys.executable, "-c", "raise SystemExit(3)"]
+
+        with self.assertRaises(CommandError) as context:
+            asyncio.run(run_command_async(command, "fail", on_usage=usage.update))
+        self.assertEqual(context.exception.returncode, 3)
+        self.assertIn("maxrss_kib", usage)
+
+    def test_cancellation_kills_the_command(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pid_path = os.path.join(temp_dir, "pid")
+            command = [
+                sys.executable,
+                "-c",
+                "import os, sys, time; open(sys.argv[1], 'w').write(str(os.getpid())); "
+                "time.sleep(60)",
+                pid_path,
+            ]
+
+            async def cancel():
+                task = asyncio.create_task(
+                    run_command_async(command, "sleep", on_usage=lambda usage: None)
+                )
+                while not os.path.exists(pid_path) or not os.path.getsize(pid_path):
+                    await asyncio.sleep(0.05)
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+
+            started = time.monotonic()
+            asyncio.run(cancel())
+            with open(pid_path) as f:
+                pid = int(f.read())
+
+        self.assertLess(time.monotonic() - started, 30)
+        # Reaped, not only killed
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from skia_builder import watch
+from skia_builder.watch import InotifyWatcher, PollingWatcher
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = os.path.realpath(temp_dir.name)
+        os.makedirs(os.path.join(self.root, "src", "core"))
+
+    def watchers(self):
+        watchers = [PollingWatcher]
+        if sys.platform.startswith("linux"):
+            watchers.append(InotifyWatcher)
+        for watcher_class in watchers:
+            with self.subTest(watcher=watcher_class.__name__):
+                watcher = watcher_class(self.root, ["src"])
+                try:
+                    yield watcher
+                finally:
+                    watcher.close()
+
+    def test_reports_changed_files(self):
+        for watcher in self.watchers():
+            path = os.path.join(self.root, "src", "core", "SkA.cpp")
+            with open(path, "w") as f:
+                f.write(watcher.__class__.__name__)
+
+            changes = watch.wait_for_changes(watcher, debounce=0.1)
+
+            self.assertEqual(changes, [os.path.join("src", "core", "SkA.cpp")])
+
+    def test_stop_wakes_a_waiting_thread_at_once(self):
+        for watcher in self.watchers():
+            changes = []
+            thread = threading.Thread(
+                target=lambda: changes.append(watch.wait_for_changes(watcher, debounce=0.1))
+            )
+            thread.start()
+            time.sleep(0.1)
+
+            started = time.monotonic()
+            watcher.stop()
+            thread.join(timeout=5)
+
+            self.assertFalse(thread.is_alive())
+            self.assertLess(time.monotonic() - started, watch.POLL_INTERVAL)
+            self.assertEqual(changes, [[]])
+
+    def test_cancelled_watch_closes_the_watcher_once_the_wait_ended(self):
+        for watcher in self.watchers():
+            close = watcher.close
+            calls = []
+            watcher.close = lambda: calls.append(("close", watcher.stopped))
+
+            async def cancel_watch():
+                task = asyncio.create_task(watch.watch_builds(None, [], self.root))
+                await asyncio.sleep(0.1)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+            wait_for_changes = watch.wait_for_changes
+
+            def waiting(*args):
+                try:
+                    return wait_for_changes(*args)
+                finally:
+                    calls.append(("waited", watcher.stopped))
+
+            with (
+                mock.patch.object(watch, "create_watcher", return_value=watcher),
+                mock.patch.object(watch, "wait_for_changes", waiting),
+            ):
+                asyncio.run(cancel_watch())
+            watcher.close = close
+
+            self.assertEqual(calls, [("waited", True), ("close", True)])
+
+
+if __name__ == "__main__":
+    unittest.main()